@@ -55,14 +55,17 @@
 from __future__ import print_function
 
 import argparse
+import collections
 import os
 import sys
+import time
 
 import decorator
 import netaddr
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
+from oslo_serialization import jsonutils
 from oslo_utils import importutils
 import six
 
@@ -673,7 +676,7 @@ class VmCommands(object):
                                              _('index'))))
 
         if host is None:
-            instances = objects.InstanceList.get_by_filters(
+            instances = objects.InstanceList.iter_by_filters(
                 context.get_admin_context(), {}, expected_attrs=['flavor'])
         else:
             instances = objects.InstanceList.get_by_host(
@@ -916,7 +919,23 @@ class DbCommands(object):
 
     @args('--max_rows', metavar='<number>',
             help='Maximum number of deleted rows to archive')
-    def archive_deleted_rows(self, max_rows):
+    @args('--chunk_size', metavar='<number>',
+          help='Number of deleted rows to archive per transaction')
+    @args('--sleep', metavar='<seconds>', dest='chunk_sleep',
+          help='Seconds to sleep between the transactions archiving the '
+               'rows of a table')
+    @args('--workers', metavar='<number>',
+          help='Number of tables to archive concurrently')
+    @args('--checkpoint', metavar='<file>',
+          help='File recording the progress of the archiving, from which '
+               'an interrupted archiving resumes. It is removed once no '
+               'deleted row is left to archive.')
+    @args('--verbose', action='store_true', dest='verbose', default=False,
+          help='Print the number of rows archived per table and the '
+               'throughput')
+    def archive_deleted_rows(self, max_rows, chunk_size=None,
+                             chunk_sleep=None, workers=None, checkpoint=None,
+                             verbose=False):
         """Move up to max_rows deleted rows from production tables to shadow
         tables.
         """
@@ -925,8 +944,59 @@ class DbCommands(object):
             if max_rows < 0:
                 print(_("Must supply a positive value for max_rows"))
                 return(1)
+        if chunk_size is not None:
+            chunk_size = int(chunk_size)
+            if chunk_size <= 0:
+                print(_("Must supply a positive value for chunk_size"))
+                return(1)
+        if chunk_sleep is not None:
+            chunk_sleep = float(chunk_sleep)
+            if chunk_sleep < 0:
+                print(_("Must supply a positive value for sleep"))
+                return(1)
+        if workers is not None:
+            workers = int(workers)
+            if workers <= 0:
+                print(_("Must supply a positive value for workers"))
+                return(1)
+
+        state = {}
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = jsonutils.load(f)
+        table_rows = collections.Counter()
+
+        def _progress(tablename, rows):
+            table_rows[tablename] += rows
+            if checkpoint:
+                with open(checkpoint, 'w') as f:
+                    jsonutils.dump(state, f)
+
         admin_context = context.get_admin_context()
-        db.archive_deleted_rows(admin_context, max_rows)
+        start = time.time()
+        rows_archived = db.archive_deleted_rows(
+            admin_context, max_rows, chunk_size=chunk_size,
+            chunk_sleep=chunk_sleep, workers=workers, checkpoint=state,
+            progress=_progress)
+        duration = time.time() - start
+
+        if checkpoint:
+            if ((max_rows is None or rows_archived < max_rows) and
+                    all(table['done'] for table in state.values())):
+                if os.path.exists(checkpoint):
+                    os.remove(checkpoint)
+            else:
+                with open(checkpoint, 'w') as f:
+                    jsonutils.dump(state, f)
+
+        if verbose:
+            print("%-40s %12s" % (_('Table'), _('Rows')))
+            for tablename, rows in sorted(table_rows.items()):
+                print("%-40s %12d" % (tablename, rows))
+            print(_("Archived %(rows)d rows in %(duration).1f seconds, "
+                    "%(rate).1f rows per second") %
+                  {'rows': rows_archived, 'duration': duration,
+                   'rate': rows_archived / duration if duration else 0.0})
 
     @args('--delete', action='store_true', dest='delete',
           help='If specified, automatically delete any records found where '
@@ -0,0 +1,50 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar views over lists of objects.
+
+Meant to be used by weighers which can evaluate all the objects at once
+from a few of their attributes, instead of being called once per object.
+"""
+
+import operator
+
+
+class ObjectColumns(object):
+    """Columnar view over a list of objects.
+
+    A column is the list of the values of one attribute across all the
+    objects, in the order of the objects. Columns are extracted on first
+    access and cached, so weighers reading the same attribute share the
+    work.
+
+    The objects must not be modified while the view is in use, besides by
+    the weighers themselves, as the cached columns would then be out of
+    date.
+    """
+
+    def __init__(self, objs):
+        self.objs = list(objs)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.objs)
+
+    def __getitem__(self, name):
+        """Return the column of the given attribute."""
+        try:
+            return self._columns[name]
+        except KeyError:
+            getter = operator.attrgetter(name)
+            column = self._columns[name] = [getter(obj) for obj in self.objs]
+            return column
@@ -2040,20 +2040,21 @@ class API(base.Base):
                     except ValueError:
                         return []
 
-        # IP address filtering cannot be applied at the DB layer, remove any DB
-        # limit so that it can be applied after the IP filter.
+        # IP address filtering cannot be applied at the DB layer, the
+        # instances are filtered as they are loaded from the DB, in chunks,
+        # until the limit is reached.
         filter_ip = 'ip6' in filters or 'ip' in filters
-        orig_limit = limit
-        if filter_ip and limit:
-            LOG.debug('Removing limit for DB query due to IP filter')
-            limit = None
-
-        inst_models = self._get_instances_by_filters(context, filters,
-                limit=limit, marker=marker, expected_attrs=expected_attrs,
-                sort_keys=sort_keys, sort_dirs=sort_dirs)
-
         if filter_ip:
-            inst_models = self._ip_filter(inst_models, filters, orig_limit)
+            LOG.debug('Iterating over the instances due to IP filter')
+            inst_models = self._ip_filter(
+                self._iter_instances_by_filters(context, filters,
+                    marker=marker, expected_attrs=expected_attrs,
+                    sort_keys=sort_keys, sort_dirs=sort_dirs),
+                filters, limit)
+        else:
+            inst_models = self._get_instances_by_filters(context, filters,
+                    limit=limit, marker=marker, expected_attrs=expected_attrs,
+                    sort_keys=sort_keys, sort_dirs=sort_dirs)
 
         if want_objects:
             return inst_models
@@ -2091,17 +2092,30 @@ class API(base.Base):
                     break
         return objects.InstanceList(objects=result_objs)
 
-    def _get_instances_by_filters(self, context, filters,
-                                  limit=None, marker=None, expected_attrs=None,
-                                  sort_keys=None, sort_dirs=None):
+    @staticmethod
+    def _get_instance_list_fields(expected_attrs):
         fields = ['metadata', 'system_metadata', 'info_cache',
                   'security_groups']
         if expected_attrs:
             fields.extend(expected_attrs)
+        return fields
+
+    def _get_instances_by_filters(self, context, filters,
+                                  limit=None, marker=None, expected_attrs=None,
+                                  sort_keys=None, sort_dirs=None):
+        fields = self._get_instance_list_fields(expected_attrs)
         return objects.InstanceList.get_by_filters(
             context, filters=filters, limit=limit, marker=marker,
             expected_attrs=fields, sort_keys=sort_keys, sort_dirs=sort_dirs)
 
+    def _iter_instances_by_filters(self, context, filters, marker=None,
+                                   expected_attrs=None, sort_keys=None,
+                                   sort_dirs=None):
+        fields = self._get_instance_list_fields(expected_attrs)
+        return objects.InstanceList.iter_by_filters(
+            context, filters=filters, marker=marker, expected_attrs=fields,
+            sort_keys=sort_keys, sort_dirs=sort_dirs)
+
     # NOTE(melwitt): We don't check instance lock for backup because lock is
     #                intended to prevent accidental change/delete of instances
     @wrap_check_policy
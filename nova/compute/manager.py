@@ -126,6 +126,11 @@ compute_opts = [
     cfg.IntOpt('max_concurrent_builds',
                default=10,
                help='Maximum number of instance builds to run concurrently'),
+    cfg.IntOpt('max_concurrent_resource_updates',
+               default=10,
+               help='Maximum number of nodes whose resources are updated '
+                    'concurrently, for the virt drivers managing several '
+                    'nodes. 0 updates all the nodes concurrently'),
     cfg.IntOpt('block_device_allocate_retries',
                default=60,
                help='Number of times to retry block device'
@@ -245,6 +250,9 @@ CONF.import_opt('destroy_after_evacuate', 'nova.utils', group='workarounds')
 
 LOG = logging.getLogger(__name__)
 
+# The number of deleted instances whose cleanup attempts are saved at once
+_CLEAN_ATTEMPTS_BATCH_SIZE = 50
+
 get_notifier = functools.partial(rpc.get_notifier, service='compute')
 wrap_exception = functools.partial(exception.wrap_exception,
                                    get_notifier=get_notifier)
@@ -5397,7 +5405,8 @@ class ComputeManager(manager.Manager):
             # The list of instances to heal is empty so rebuild it
             LOG.debug('Rebuilding the list of instances to heal')
             db_instances = objects.InstanceList.get_by_host(
-                context, self.host, expected_attrs=[], use_slave=True)
+                context, self.host, expected_attrs=[], use_slave=True,
+                columns=['vm_state', 'task_state'])
             for inst in db_instances:
                 # We don't want to refresh the cache for instances
                 # which are building or deleting so don't put them
@@ -5474,7 +5483,8 @@ class ComputeManager(manager.Manager):
                         task_states.REBOOT_PENDING],
                        'host': self.host}
             rebooting = objects.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[], use_slave=True)
+                context, filters, expected_attrs=[], use_slave=True,
+                columns=['updated_at'])
 
             to_poll = []
             for instance in rebooting:
@@ -6085,9 +6095,15 @@ class ComputeManager(manager.Manager):
         nodenames = set(self.driver.get_available_nodes())
         for nodename in nodenames:
             rt = self._get_resource_tracker(nodename)
-            rt.update_available_resource(context)
             new_resource_tracker_dict[nodename] = rt
 
+        if len(new_resource_tracker_dict) > 1:
+            self._update_available_resource_of_nodes(
+                context, new_resource_tracker_dict)
+        else:
+            for rt in new_resource_tracker_dict.values():
+                rt.update_available_resource(context)
+
         # Delete orphan compute node not reported by driver but still in db
         compute_nodes_in_db = self._get_compute_nodes_in_db(context,
                                                             use_slave=True)
@@ -6099,6 +6115,62 @@ class ComputeManager(manager.Manager):
 
         self._resource_tracker_dict = new_resource_tracker_dict
 
+    def _update_available_resource_of_nodes(self, context,
+                                            resource_trackers):
+        """Update the resources of the nodes of a multi-node virt driver.
+
+        When the usage of any node is due for an audit, the instances and
+        the in-progress migrations of all the nodes are fetched at once.
+        Then the nodes are updated concurrently, as most of the update of a
+        node is spent waiting for the driver to report its resources.
+
+        :param resource_trackers: dict of the resource trackers of the nodes,
+                                  keyed by node name
+        """
+        # The instances and the migrations of each node, when fetched for all
+        # the nodes, the resource trackers fetching them otherwise
+        instances = {}
+        migrations = {}
+        if any(rt._audit_due() for rt in six.itervalues(resource_trackers)):
+            for rt in six.itervalues(resource_trackers):
+                rt.forget_changes()
+            instances = {nodename: [] for nodename in resource_trackers}
+            for instance in objects.InstanceList.get_by_host(
+                    context, self.host,
+                    expected_attrs=['system_metadata', 'numa_topology']):
+                if instance.node in instances:
+                    instances[instance.node].append(instance)
+
+            host_migrations = (
+                self.conductor_api.migration_get_in_progress_by_host(
+                    context, self.host))
+            if host_migrations is not None:
+                migrations = {nodename: [] for nodename in resource_trackers}
+                for migration in host_migrations:
+                    nodenames = set()
+                    if migration['source_compute'] == self.host:
+                        nodenames.add(migration['source_node'])
+                    if migration['dest_compute'] == self.host:
+                        nodenames.add(migration['dest_node'])
+                    for nodename in nodenames:
+                        if nodename in migrations:
+                            migrations[nodename].append(migration)
+
+        def _update(nodename, rt):
+            try:
+                rt.update_available_resource(
+                    context, instances=instances.get(nodename),
+                    migrations=migrations.get(nodename))
+            except Exception:
+                LOG.exception(_LE("Error updating the resources of node "
+                                  "%s."), nodename)
+
+        pool = eventlet.GreenPool(CONF.max_concurrent_resource_updates or
+                                  len(resource_trackers))
+        for nodename, rt in six.iteritems(resource_trackers):
+            pool.spawn_n(_update, nodename, rt)
+        pool.waitall()
+
     def _get_compute_nodes_in_db(self, context, use_slave=False):
         try:
             return objects.ComputeNodeList.get_all_by_host(context, self.host,
@@ -6335,21 +6407,49 @@ class ComputeManager(manager.Manager):
                 context, filters, expected_attrs=attrs, use_slave=True)
         LOG.debug('There are %d instances to clean', len(instances))
 
-        for instance in instances:
-            attempts = int(instance.system_metadata.get('clean_attempts', '0'))
-            LOG.debug('Instance has had %(attempts)s of %(max)s '
-                      'cleanup attempts',
-                      {'attempts': attempts,
-                       'max': CONF.maximum_instance_delete_attempts},
-                      instance=instance)
-            if attempts < CONF.maximum_instance_delete_attempts:
-                success = self.driver.delete_instance_files(instance)
+        # NOTE: The attempts are saved in batches, so that few of them are
+        # lost if the service stops while deleting files.
+        attempted = []
+        try:
+            for instance in instances:
+                attempts = int(instance.system_metadata.get('clean_attempts',
+                                                            '0'))
+                LOG.debug('Instance has had %(attempts)s of %(max)s '
+                          'cleanup attempts',
+                          {'attempts': attempts,
+                           'max': CONF.maximum_instance_delete_attempts},
+                          instance=instance)
+                if attempts < CONF.maximum_instance_delete_attempts:
+                    success = self.driver.delete_instance_files(instance)
+
+                    instance.system_metadata['clean_attempts'] = str(
+                        attempts + 1)
+                    if success:
+                        instance.cleaned = True
+                    attempted.append(instance)
+                    if len(attempted) >= _CLEAN_ATTEMPTS_BATCH_SIZE:
+                        self._save_clean_attempts(context, attempted)
+                        attempted = []
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                try:
+                    self._save_clean_attempts(context, attempted)
+                except Exception:
+                    LOG.exception(_LE('Failed to save the cleanup attempts '
+                                      'of deleted instances'))
+        self._save_clean_attempts(context, attempted)
 
-                instance.system_metadata['clean_attempts'] = str(attempts + 1)
-                if success:
-                    instance.cleaned = True
-                with utils.temporary_mutation(context, read_deleted='yes'):
-                    instance.save()
+    def _save_clean_attempts(self, context, instances):
+        """Save the cleanup attempts of deleted instances at once."""
+        if not instances:
+            return
+        instances = objects.InstanceList(context, objects=instances)
+        with utils.temporary_mutation(context, read_deleted='yes'):
+            conflicts = instances.save_all()
+        for instance_uuid, reason in conflicts.items():
+            LOG.warning(_LW('Failed to save the cleanup attempt of instance '
+                            '%(instance_uuid)s: %(reason)s'),
+                        {'instance_uuid': instance_uuid, 'reason': reason})
 
     @messaging.expected_exceptions(exception.InstanceQuiesceNotSupported,
                                    exception.NovaException,
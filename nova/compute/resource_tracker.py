@@ -18,12 +18,16 @@ Track resources like memory and disk for a compute host.  Provides the
 scheduler with useful information about availability through the ComputeNode
 model.
 """
-import copy
+import collections
+import functools
+import hashlib
 
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import importutils
+from oslo_utils import timeutils
+import six
 
 from nova.compute import claims
 from nova.compute import flavors
@@ -55,6 +59,16 @@ resource_tracker_opts = [
     cfg.ListOpt('compute_resources',
                 default=['vcpu'],
                 help='The names of the extra resources to track.'),
+    cfg.IntOpt('resource_audit_interval',
+               default=0,
+               help='Number of seconds between the audits of the resource '
+                    'usage of a compute node, which recompute it from the '
+                    'hypervisor, the instances, the migrations and the '
+                    'orphans of the node. Between the audits, the usage is '
+                    'only updated in place by the claims, the drops and the '
+                    'deletions of instances, and the periodic update of the '
+                    'available resources only reports the metrics of the '
+                    'node. 0 audits the node on every periodic update.'),
 ]
 
 CONF = cfg.CONF
@@ -63,6 +77,46 @@ CONF.register_opts(resource_tracker_opts)
 LOG = logging.getLogger(__name__)
 COMPUTE_RESOURCE_SEMAPHORE = "compute_resources"
 
+# The usage of a compute node compared before and after its audits
+AUDITED_USAGE = ('memory_mb_used', 'local_gb_used', 'vcpus_used',
+                 'running_vms')
+
+# The usage of a compute node which the scheduler can claim on its record,
+# see nova.db.api.compute_node_claim()
+CLAIMED_USAGE = ('free_ram_mb', 'memory_mb_used', 'free_disk_gb',
+                 'local_gb_used', 'vcpus_used')
+
+
+def _digest(value):
+    """Digest a compute node field to tell whether it changed.
+
+    The strings, like the JSON of the stats, NUMA topology and PCI stats of
+    the node, and the collections are digested rather than kept.
+    """
+    if isinstance(value, (dict, list, tuple)):
+        value = jsonutils.dumps(value, sort_keys=True)
+    if isinstance(value, six.text_type):
+        value = value.encode('utf-8')
+    if isinstance(value, six.binary_type):
+        return hashlib.sha1(value).digest()
+    return value
+
+
+def _synchronized(function):
+    """Serialize a method of the resource tracker with the other methods
+    changing the resource usage of its node.
+
+    The resource trackers of the other nodes of the host are not blocked.
+    """
+    @functools.wraps(function)
+    def inner(self, *args, **kwargs):
+        @utils.synchronized('%s-%s' % (COMPUTE_RESOURCE_SEMAPHORE,
+                                       self.nodename))
+        def _locked():
+            return function(self, *args, **kwargs)
+        return _locked()
+    return inner
+
 CONF.import_opt('my_ip', 'nova.netconf')
 
 
@@ -86,10 +140,19 @@ class ResourceTracker(object):
         self.monitors = monitor_handler.choose_monitors(self)
         self.ext_resources_handler = \
             ext_resources.ResourceHandler(CONF.compute_resources)
-        self.old_resources = {}
+        # The digests of the fields of the compute node as last written
+        self.compute_node_digests = {}
+        self.compute_node_writes = 0
+        self.compute_node_writes_skipped = 0
         self.scheduler_client = scheduler_client.SchedulerClient()
-
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+        self.last_audit = None
+        # The instances claimed, aborted or updated and whether resizes were
+        # claimed or dropped since the instances and the migrations of the
+        # node were last fetched for an audit
+        self._changed_instances = {}
+        self._migrations_changed = False
+
+    @_synchronized
     def instance_claim(self, context, instance_ref, limits=None):
         """Indicate that some resources are needed for an upcoming compute
         instance build operation.
@@ -137,6 +200,7 @@ class ResourceTracker(object):
         # Mark resources in-use and update stats
         self._update_usage_from_instance(context, self.compute_node,
                                          instance_ref)
+        self._changed_instances[instance_ref['uuid']] = instance_ref
 
         elevated = context.elevated()
         # persist changes to the compute node:
@@ -144,7 +208,7 @@ class ResourceTracker(object):
 
         return claim
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def resize_claim(self, context, instance, instance_type,
                      image_meta=None, limits=None):
         """Indicate that resources are needed for a resize operation to this
@@ -186,6 +250,7 @@ class ResourceTracker(object):
         # compute host:
         self._update_usage_from_migration(context, instance_ref, image_meta,
                                               self.compute_node, migration)
+        self._migrations_changed = True
         elevated = context.elevated()
         self._update(elevated, self.compute_node)
 
@@ -223,22 +288,24 @@ class ResourceTracker(object):
         instance_ref['launched_on'] = self.host
         instance_ref['node'] = self.nodename
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def abort_instance_claim(self, context, instance):
         """Remove usage from the given instance."""
         # flag the instance as deleted to revert the resource usage
         # and associated stats:
         instance['vm_state'] = vm_states.DELETED
         self._update_usage_from_instance(context, self.compute_node, instance)
+        self._changed_instances[instance['uuid']] = instance
 
         self._update(context.elevated(), self.compute_node)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def drop_resize_claim(self, context, instance, instance_type=None,
                           image_meta=None, prefix='new_'):
         """Remove usage for an incoming/outgoing migration."""
         if instance['uuid'] in self.tracked_migrations:
             migration, itype = self.tracked_migrations.pop(instance['uuid'])
+            self._migrations_changed = True
 
             if not instance_type:
                 ctxt = context.elevated()
@@ -262,7 +329,7 @@ class ResourceTracker(object):
                 ctxt = context.elevated()
                 self._update(ctxt, self.compute_node)
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
+    @_synchronized
     def update_usage(self, context, instance):
         """Update the resource usage and stats after a change in an
         instance
@@ -277,6 +344,7 @@ class ResourceTracker(object):
         if uuid in self.tracked_instances:
             self._update_usage_from_instance(context, self.compute_node,
                                              instance)
+            self._changed_instances[uuid] = instance
             self._update(context.elevated(), self.compute_node)
 
     @property
@@ -303,14 +371,38 @@ class ResourceTracker(object):
             notifier.info(context, 'compute.metrics.update', metrics_info)
         return metrics
 
-    def update_available_resource(self, context):
+    def forget_changes(self):
+        """Forget the instances and migrations changed so far, the instances
+        and the migrations of the node being about to be fetched.
+        """
+        self._changed_instances.clear()
+        self._migrations_changed = False
+
+    def update_available_resource(self, context, instances=None,
+                                  migrations=None):
         """Override in-memory calculations of compute node resource usage based
         on data audited from the hypervisor layer.
 
         Add in resource claims in progress to account for operations that have
         declared a need for resources, but not necessarily retrieved them from
         the hypervisor layer yet.
+
+        The audit only runs every CONF.resource_audit_interval seconds, the
+        metrics of the node being reported in between. The instances, the
+        migrations and the metrics of the node are fetched without locking
+        its resources, the claims made meanwhile being merged into them
+        once locked.
+
+        :param instances: the instances of the node, if already fetched along
+                          with the instances of the other nodes of the host,
+                          forget_changes() having been called right before
+        :param migrations: the in-progress migrations from or to the node, if
+                           already fetched along with the migrations of the
+                           other nodes of the host
         """
+        if not self._audit_due():
+            return self._update_metrics(context)
+
         LOG.info(_LI("Auditing locally available compute resources for "
                      "node %(node)s"),
                  {'node': self.nodename})
@@ -340,10 +432,100 @@ class ResourceTracker(object):
 
         self._report_hypervisor_resource_view(resources)
 
-        return self._update_available_resource(context, resources)
+        # Grab all instances assigned to this node:
+        if instances is None:
+            self.forget_changes()
+            instances = objects.InstanceList.get_by_host_and_node(
+                context, self.host, self.nodename,
+                expected_attrs=['system_metadata',
+                                'numa_topology'])
+
+        # Grab all in-progress migrations:
+        if migrations is None:
+            self._migrations_changed = False
+            capi = self.conductor_api
+            migrations = capi.migration_get_in_progress_by_host_and_node(
+                context, self.host, self.nodename)
+
+        metrics = self._get_host_metrics(context, self.nodename)
+
+        return self._update_available_resource(context, resources, instances,
+                                               migrations, metrics)
+
+    def _audit_due(self):
+        """Check whether the resource usage needs a full audit."""
+        return (not CONF.resource_audit_interval or
+                self.compute_node is None or
+                self.last_audit is None or
+                timeutils.is_older_than(self.last_audit,
+                                        CONF.resource_audit_interval))
+
+    def _update_metrics(self, context):
+        """Report the metrics of the node between the audits of its usage.
+
+        The usage itself is kept up to date by the claims and drops of
+        resources, so the compute node is only updated if the metrics
+        changed.
+        """
+        LOG.debug("Updating the metrics of node %(node)s, the last audit "
+                  "of its resources was at %(last_audit)s",
+                  {'node': self.nodename, 'last_audit': self.last_audit})
+        metrics = self._get_host_metrics(context, self.nodename)
+        self._report_metrics(context, metrics)
+
+    @_synchronized
+    def _report_metrics(self, context, metrics):
+        self._update(context, {'metrics': jsonutils.dumps(metrics)})
+
+    def _report_drift(self, previous_usage):
+        """Log the usage corrected by an audit.
+
+        :param previous_usage: dict of the AUDITED_USAGE of the node as
+                               tracked before the audit
+        """
+        drift = {}
+        for key in AUDITED_USAGE:
+            previous = previous_usage.get(key)
+            audited = self.compute_node.get(key)
+            if previous is not None and audited is not None and (
+                    previous != audited):
+                drift[key] = audited - previous
+        if drift:
+            # NOTE: the usage of the migrations out of the node is only
+            # tracked from the audit following the resize claim on their
+            # destination, so some drift is expected.
+            LOG.info(_LI("The audit of node %(node)s corrected the resource "
+                         "usage tracked since %(last_audit)s by %(drift)s"),
+                     {'node': self.nodename, 'last_audit': self.last_audit,
+                      'drift': drift})
+        return drift
+
+    def _merge_changed_instances(self, instances):
+        """Merge the instances claimed, aborted or updated since the
+        instances of the node were fetched.
+
+        The changes are forgotten whenever the instances are fetched, so
+        that only the changes made since are merged.
+        """
+        merged = collections.OrderedDict(
+            (instance['uuid'], instance) for instance in instances)
+        for uuid, instance in six.iteritems(self._changed_instances):
+            if (instance['vm_state'] == vm_states.DELETED or
+                    instance['host'] != self.host or
+                    instance['node'] != self.nodename):
+                merged.pop(uuid, None)
+            else:
+                merged[uuid] = instance
+        return list(merged.values())
+
+    @_synchronized
+    def _update_available_resource(self, context, resources, instances,
+                                   migrations, metrics):
+        previous_usage = None
+        if self.compute_node:
+            previous_usage = {key: self.compute_node.get(key)
+                              for key in AUDITED_USAGE}
 
-    @utils.synchronized(COMPUTE_RESOURCE_SEMAPHORE)
-    def _update_available_resource(self, context, resources):
         if 'pci_passthrough_devices' in resources:
             if not self.pci_tracker:
                 self.pci_tracker = pci_manager.PciDevTracker()
@@ -359,20 +541,19 @@ class ResourceTracker(object):
 
             self.pci_tracker.set_hvdevs(devs)
 
-        # Grab all instances assigned to this node:
-        instances = objects.InstanceList.get_by_host_and_node(
-            context, self.host, self.nodename,
-            expected_attrs=['system_metadata',
-                            'numa_topology'])
+        instances = self._merge_changed_instances(instances)
+        if self._migrations_changed:
+            # NOTE: a resize was claimed or dropped since the migrations were
+            # fetched, which is rare enough to fetch them again.
+            capi = self.conductor_api
+            migrations = capi.migration_get_in_progress_by_host_and_node(
+                context, self.host, self.nodename)
+        self._changed_instances.clear()
+        self._migrations_changed = False
 
         # Now calculate usage based on instance utilization:
         self._update_usage_from_instances(context, resources, instances)
 
-        # Grab all in-progress migrations:
-        capi = self.conductor_api
-        migrations = capi.migration_get_in_progress_by_host_and_node(context,
-                self.host, self.nodename)
-
         self._update_usage_from_migrations(context, resources, migrations)
 
         # Detect and account for orphaned instances that may exist on the
@@ -392,10 +573,19 @@ class ResourceTracker(object):
 
         self._report_final_resource_view(resources)
 
-        metrics = self._get_host_metrics(context, self.nodename)
         resources['metrics'] = jsonutils.dumps(metrics)
+        # NOTE: The usage claimed by the scheduler for an instance which
+        # never reached the node is only dropped by writing the audited
+        # usage, so write it even if it did not change since last written.
+        for key in CLAIMED_USAGE:
+            self.compute_node_digests.pop(key, None)
         self._sync_compute_node(context, resources)
 
+        if self.compute_node:
+            if previous_usage:
+                self._report_drift(previous_usage)
+            self.last_audit = timeutils.utcnow()
+
     def _sync_compute_node(self, context, resources):
         """Create or update the compute node DB record."""
         if not self.compute_node:
@@ -408,6 +598,8 @@ class ResourceTracker(object):
             cn = self._get_compute_node(context)
             if cn:
                 self.compute_node = cn
+                self.compute_node_digests = {
+                    key: _digest(value) for key, value in six.iteritems(cn)}
                 if self.pci_tracker:
                     self.pci_tracker.set_compute_node_id(cn['id'])
 
@@ -465,6 +657,11 @@ class ResourceTracker(object):
 
         self.compute_node = self.conductor_api.compute_node_create(context,
                                                                    values)
+        self.compute_node_digests = {
+            key: _digest(value)
+            for key, value in six.iteritems(self.compute_node)}
+        self.compute_node_digests.update(
+            (key, _digest(value)) for key, value in six.iteritems(values))
         # NOTE(sbauza): We don't want to miss the first creation event
         self._update_resource_stats(context, values)
 
@@ -550,30 +747,55 @@ class ResourceTracker(object):
                   'used_vcpus': ucpu,
                   'pci_stats': pci_stats})
 
-    def _resource_change(self, resources):
-        """Check to see if any resouces have changed."""
-        if cmp(resources, self.old_resources) != 0:
-            self.old_resources = copy.deepcopy(resources)
-            return True
-        return False
+    def _resource_changes(self, resources):
+        """Get the resources which changed since they were last written.
+
+        :returns: tuple of the dict of the changed resources and of the dict
+                  of their digests, to be recorded once they are written
+        """
+        changes = {}
+        digests = {}
+        for key, value in six.iteritems(resources):
+            digest = _digest(value)
+            if (key not in self.compute_node_digests or
+                    self.compute_node_digests[key] != digest):
+                changes[key] = value
+                digests[key] = digest
+        return changes, digests
 
     def _update(self, context, values):
-        """Update partial stats locally and populate them to Scheduler."""
+        """Update partial stats locally and populate them to Scheduler.
+
+        Only the values which changed since they were last written are
+        sent.
+        """
         self._write_ext_resources(values)
         # NOTE(pmurray): the stats field is stored as a json string. The
         # json conversion will be done automatically by the ComputeNode object
         # so this can be removed when using ComputeNode.
         values['stats'] = jsonutils.dumps(values['stats'])
 
-        if not self._resource_change(values):
-            return
         if "service" in self.compute_node:
             del self.compute_node['service']
+        values.pop('service', None)
+        changes, digests = self._resource_changes(values)
+        if not changes:
+            self.compute_node_writes_skipped += 1
+            return
+        self.compute_node_writes += 1
+        LOG.debug("Updating %(changes)s of node %(node)s, %(writes)d "
+                  "writes of the node done and %(skipped)d skipped",
+                  {'changes': sorted(changes), 'node': self.nodename,
+                   'writes': self.compute_node_writes,
+                   'skipped': self.compute_node_writes_skipped})
         # NOTE(sbauza): Now the DB update is asynchronous, we need to locally
         #               update the values
         self.compute_node.update(values)
         # Persist the stats to the Scheduler
-        self._update_resource_stats(context, values)
+        self._update_resource_stats(context, changes)
+        # NOTE: Only recorded once written, so that the changes which failed
+        # to be written are sent again by the next update.
+        self.compute_node_digests.update(digests)
         if self.pci_tracker:
             self.pci_tracker.save(context)
 
@@ -770,7 +992,7 @@ class ResourceTracker(object):
         self.ext_resources_handler.reset_resources(resources, self.driver)
 
         for instance in instances:
-            if instance.vm_state != vm_states.DELETED:
+            if instance['vm_state'] != vm_states.DELETED:
                 self._update_usage_from_instance(context, resources, instance)
 
     def _find_orphaned_instances(self):
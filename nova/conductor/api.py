@@ -78,6 +78,12 @@ class LocalAPI(object):
         return self._manager.migration_get_in_progress_by_host_and_node(
             context, host, node)
 
+    def migration_get_in_progress_by_host(self, context, host):
+        """Returns the in-progress migrations from or to all the nodes of a
+        host, or None if the conductor is too old to return them.
+        """
+        return self._manager.migration_get_in_progress_by_host(context, host)
+
     def aggregate_metadata_get_by_host(self, context, host,
                                        key='availability_zone'):
         return self._manager.aggregate_metadata_get_by_host(context,
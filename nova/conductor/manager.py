@@ -78,7 +78,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    target = messaging.Target(version='2.1')
+    target = messaging.Target(version='2.2')
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -161,6 +161,10 @@ class ConductorManager(manager.Manager):
             context, host, node)
         return jsonutils.to_primitive(migrations)
 
+    def migration_get_in_progress_by_host(self, context, host):
+        migrations = self.db.migration_get_in_progress_by_host(context, host)
+        return jsonutils.to_primitive(migrations)
+
     @messaging.expected_exceptions(exception.AggregateHostExists)
     def aggregate_host_add(self, context, aggregate, host):
         host_ref = self.db.aggregate_host_add(context.elevated(),
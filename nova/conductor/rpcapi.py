@@ -157,6 +157,8 @@ class ConductorAPI(object):
     existing methods in 2.x after that point should be done such
     that they can handle the version_cap being set to 2.0.
 
+    * 2.2  - Added migration_get_in_progress_by_host()
+
     """
 
     VERSION_ALIASES = {
@@ -192,6 +194,15 @@ class ConductorAPI(object):
                           'migration_get_in_progress_by_host_and_node',
                           host=host, node=node)
 
+    def migration_get_in_progress_by_host(self, context, host):
+        # NOTE: Returns None if the conductor is too old to get the
+        # migrations of all the nodes of the host at once.
+        if not self.client.can_send_version('2.2'):
+            return None
+        cctxt = self.client.prepare(version='2.2')
+        return cctxt.call(context, 'migration_get_in_progress_by_host',
+                          host=host)
+
     def aggregate_metadata_get_by_host(self, context, host, key):
         cctxt = self.client.prepare()
         return cctxt.call(context, 'aggregate_metadata_get_by_host',
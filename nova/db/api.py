@@ -209,6 +209,18 @@ def compute_node_get_all(context):
     return IMPL.compute_node_get_all(context)
 
 
+def compute_node_get_all_changed_since(context, since):
+    """Get all computeNodes created, updated or deleted since a time.
+
+    :param context: The security context (admin)
+    :param since: Naive UTC datetime; rows touched at or after it are
+                  returned, including soft-deleted ones
+
+    :returns: List of dictionaries each containing compute node properties
+    """
+    return IMPL.compute_node_get_all_changed_since(context, since)
+
+
 def compute_node_get_all_by_host(context, host, use_slave=False):
     """Get compute nodes by host name
 
@@ -259,6 +271,31 @@ def compute_node_update(context, compute_id, values):
     return IMPL.compute_node_update(context, compute_id, values)
 
 
+def compute_node_claim(context, compute_id, expected, memory_mb, local_gb,
+                       vcpus):
+    """Atomically consume resources on a compute node, if its resource usage
+    is still the expected one.
+
+    :param context: The security context
+    :param compute_id: ID of the compute node
+    :param expected: Dictionary of the compute node properties the claim was
+                     decided on, like free_ram_mb, compared with the current
+                     ones in the same update
+    :param memory_mb: Memory to consume
+    :param local_gb: Disk to consume
+    :param vcpus: VCPUs to consume
+
+    :returns: Dictionary-like object containing the properties of the updated
+              compute node
+
+    Raises ComputeHostClaimConflict if the compute node properties don't
+    match the expected ones, or ComputeHostNotFound if the compute node with
+    the given ID doesn't exist.
+    """
+    return IMPL.compute_node_claim(context, compute_id, expected, memory_mb,
+                                   local_gb, vcpus)
+
+
 def compute_node_delete(context, compute_id):
     """Delete a compute node from the database.
 
@@ -479,9 +516,20 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
     return IMPL.migration_get_in_progress_by_host_and_node(context, host, node)
 
 
-def migration_get_all_by_filters(context, filters):
+def migration_get_in_progress_by_host(context, host):
+    """Finds all migrations for the given host, whatever their nodes, that
+    are not yet confirmed or reverted.
+    """
+    return IMPL.migration_get_in_progress_by_host(context, host)
+
+
+def migration_get_all_by_filters(context, filters, limit=None, marker=None,
+                                 sort_keys=None, sort_dirs=None):
     """Finds all migrations in progress."""
-    return IMPL.migration_get_all_by_filters(context, filters)
+    return IMPL.migration_get_all_by_filters(context, filters, limit=limit,
+                                             marker=marker,
+                                             sort_keys=sort_keys,
+                                             sort_dirs=sort_dirs)
 
 
 ####################
@@ -664,7 +712,8 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None, use_slave=False):
+                                columns_to_join=None, use_slave=False,
+                                columns=None):
     """Get all instances that match all filters."""
     # Note: This function exists for backwards compatibility since calls to
     # the instance layer coming in over RPC may specify the single sort
@@ -674,13 +723,14 @@ def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                             sort_dir, limit=limit,
                                             marker=marker,
                                             columns_to_join=columns_to_join,
-                                            use_slave=use_slave)
+                                            use_slave=use_slave,
+                                            columns=columns)
 
 
 def instance_get_all_by_filters_sort(context, filters, limit=None,
                                      marker=None, columns_to_join=None,
                                      use_slave=False, sort_keys=None,
-                                     sort_dirs=None):
+                                     sort_dirs=None, columns=None):
     """Get all instances that match all filters sorted by multiple keys.
 
     sort_keys and sort_dirs must be a list of strings.
@@ -688,7 +738,21 @@ def instance_get_all_by_filters_sort(context, filters, limit=None,
     return IMPL.instance_get_all_by_filters_sort(
         context, filters, limit=limit, marker=marker,
         columns_to_join=columns_to_join, use_slave=use_slave,
-        sort_keys=sort_keys, sort_dirs=sort_dirs)
+        sort_keys=sort_keys, sort_dirs=sort_dirs, columns=columns)
+
+
+def instance_get_all_by_filters_chunked(context, filters, chunk_size,
+                                        limit=None, marker=None,
+                                        columns_to_join=None,
+                                        use_slave=False, sort_keys=None,
+                                        sort_dirs=None, columns=None):
+    """Iterate over the lists of at most chunk_size instances that match all
+    filters sorted by multiple keys.
+    """
+    return IMPL.instance_get_all_by_filters_chunked(
+        context, filters, chunk_size, limit=limit, marker=marker,
+        columns_to_join=columns_to_join, use_slave=use_slave,
+        sort_keys=sort_keys, sort_dirs=sort_dirs, columns=columns)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
@@ -707,11 +771,13 @@ def instance_get_active_by_window_joined(context, begin, end=None,
 
 
 def instance_get_all_by_host(context, host,
-                             columns_to_join=None, use_slave=False):
+                             columns_to_join=None, use_slave=False,
+                             columns=None):
     """Get all instances belonging to a host."""
     return IMPL.instance_get_all_by_host(context, host,
                                          columns_to_join,
-                                         use_slave=use_slave)
+                                         use_slave=use_slave,
+                                         columns=columns)
 
 
 def instance_get_all_by_host_and_node(context, host, node,
@@ -780,6 +846,23 @@ def instance_update_and_get_original(context, instance_uuid, values,
     return rv
 
 
+def instance_bulk_update(context, values_by_uuid, columns_to_join=None):
+    """Set the given properties on several instances and update them in one
+    transaction.
+
+    :param context: = request context object
+    :param values_by_uuid: = dict of the dicts of column values of the
+                             instances, by instance uuid
+
+    :returns: a tuple of a dict of the (old_instance_ref, new_instance_ref)
+              tuples of the updated instances and of a dict of the
+              exceptions raised for the instances which were not updated,
+              both by instance uuid
+    """
+    return IMPL.instance_bulk_update(context, values_by_uuid,
+                                     columns_to_join=columns_to_join)
+
+
 def instance_add_security_group(context, instance_id, security_group_id):
     """Associate the given security group with the given instance."""
     return IMPL.instance_add_security_group(context, instance_id,
@@ -1835,9 +1918,9 @@ def action_finish(context, values):
     return IMPL.action_finish(context, values)
 
 
-def actions_get(context, uuid):
+def actions_get(context, uuid, limit=None, marker=None):
     """Get all instance actions for the provided instance."""
-    return IMPL.actions_get(context, uuid)
+    return IMPL.actions_get(context, uuid, limit=limit, marker=marker)
 
 
 def action_get_by_request_id(context, uuid, request_id):
@@ -1933,23 +2016,35 @@ def task_log_get(context, task_name, period_beginning,
 ####################
 
 
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows(context, max_rows=None, chunk_size=None,
+                         chunk_sleep=None, workers=None, checkpoint=None,
+                         progress=None):
     """Move up to max_rows rows from production tables to corresponding shadow
     tables.
 
     :returns: number of rows archived.
     """
-    return IMPL.archive_deleted_rows(context, max_rows=max_rows)
+    return IMPL.archive_deleted_rows(context, max_rows=max_rows,
+                                     chunk_size=chunk_size,
+                                     chunk_sleep=chunk_sleep,
+                                     workers=workers, checkpoint=checkpoint,
+                                     progress=progress)
 
 
-def archive_deleted_rows_for_table(context, tablename, max_rows=None):
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   chunk_size=None, chunk_sleep=None,
+                                   checkpoint=None, progress=None):
     """Move up to max_rows rows from tablename to corresponding shadow
     table.
 
     :returns: number of rows archived.
     """
     return IMPL.archive_deleted_rows_for_table(context, tablename,
-                                               max_rows=max_rows)
+                                               max_rows=max_rows,
+                                               chunk_size=chunk_size,
+                                               chunk_sleep=chunk_sleep,
+                                               checkpoint=checkpoint,
+                                               progress=progress)
 
 
 def migrate_flavor_data(context, max_count, flavor_cache):
@@ -25,7 +25,9 @@ import sys
 import threading
 import time
 import uuid
+import weakref
 
+import eventlet
 from oslo_config import cfg
 from oslo_db import exception as db_exc
 from oslo_db.sqlalchemy import session as db_session
@@ -41,9 +43,11 @@ from sqlalchemy.exc import NoSuchTableError
 from sqlalchemy import MetaData
 from sqlalchemy import or_
 from sqlalchemy.orm import aliased
+from sqlalchemy.orm import class_mapper
 from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import noload
 from sqlalchemy.orm import undefer
 from sqlalchemy.schema import Table
@@ -70,6 +74,19 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('archive_chunk_size',
+               default=1000,
+               help='Number of deleted rows moved to the shadow tables in '
+                    'each transaction when archiving the deleted rows.'),
+    cfg.FloatOpt('archive_chunk_sleep',
+                 default=0.0,
+                 help='Seconds to sleep between the transactions archiving '
+                      'the deleted rows of a table, to limit the lag of the '
+                      'replicas of the database.'),
+    cfg.IntOpt('archive_workers',
+               default=1,
+               help='Number of tables whose deleted rows are archived '
+                    'concurrently.'),
 ]
 
 CONF = cfg.CONF
@@ -531,6 +548,15 @@ def compute_node_get_all(context):
     return model_query(context, models.ComputeNode, read_deleted='no').all()
 
 
+@require_admin_context
+def compute_node_get_all_changed_since(context, since):
+    return model_query(context, models.ComputeNode, read_deleted='yes').\
+            filter(or_(models.ComputeNode.created_at >= since,
+                       models.ComputeNode.updated_at >= since,
+                       models.ComputeNode.deleted_at >= since)).\
+            all()
+
+
 @require_admin_context
 def compute_node_search_by_hypervisor(context, hypervisor_match):
     field = models.ComputeNode.hypervisor_hostname
@@ -573,6 +599,39 @@ def compute_node_update(context, compute_id, values):
     return compute_ref
 
 
+@require_admin_context
+@_retry_on_deadlock
+def compute_node_claim(context, compute_id, expected, memory_mb, local_gb,
+                       vcpus):
+    """Consume resources on a ComputeNode record if its usage didn't change.
+
+    The comparison and the update happen in a single UPDATE statement, so
+    that concurrent schedulers can't both claim the same resources.
+    """
+    session = get_session()
+    with session.begin():
+        query = model_query(context, models.ComputeNode, session=session,
+                            read_deleted="no").\
+                filter_by(id=compute_id)
+        for key, value in expected.iteritems():
+            query = query.filter(getattr(models.ComputeNode, key) == value)
+        model = models.ComputeNode
+        result = query.update(
+            {'free_ram_mb': model.free_ram_mb - memory_mb,
+             'memory_mb_used': model.memory_mb_used + memory_mb,
+             'free_disk_gb': model.free_disk_gb - local_gb,
+             'local_gb_used': model.local_gb_used + local_gb,
+             'vcpus_used': model.vcpus_used + vcpus,
+             'updated_at': timeutils.utcnow()},
+            synchronize_session=False)
+        # Raises ComputeHostNotFound if the record is gone
+        compute_ref = _compute_node_get(context, compute_id, session=session)
+        if not result:
+            raise exception.ComputeHostClaimConflict(compute_id=compute_id)
+
+    return compute_ref
+
+
 @require_admin_context
 def compute_node_delete(context, compute_id):
     """Delete a ComputeNode record."""
@@ -1714,7 +1773,8 @@ def _build_instance_get(context, session=None,
 
 
 def _instances_fill_metadata(context, instances,
-                             manual_joins=None, use_slave=False):
+                             manual_joins=None, use_slave=False,
+                             columns=None):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1723,6 +1783,8 @@ def _instances_fill_metadata(context, instances,
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param columns: list of the columns the instances were loaded with, or
+                    None if they were loaded with all of them
     """
     uuids = [inst['uuid'] for inst in instances]
 
@@ -1748,7 +1810,13 @@ def _instances_fill_metadata(context, instances,
 
     filled_instances = []
     for inst in instances:
-        inst = dict(inst.iteritems())
+        if columns is None:
+            inst = dict(inst.iteritems())
+        else:
+            # NOTE: Only copy what was loaded, reading the other columns
+            # would load them one instance at a time.
+            inst = {key: value for key, value in six.iteritems(inst.__dict__)
+                    if not key.startswith('_')}
         inst['system_metadata'] = sys_meta[inst['uuid']]
         inst['metadata'] = meta[inst['uuid']]
         if 'pci_devices' in manual_joins:
@@ -1805,7 +1873,7 @@ def instance_get_all(context, columns_to_join=None):
 @require_context
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                 limit=None, marker=None, columns_to_join=None,
-                                use_slave=False):
+                                use_slave=False, columns=None):
     """Return instances matching all filters sorted by the primary key.
 
     See instance_get_all_by_filters_sort for more information.
@@ -1817,13 +1885,15 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                                             columns_to_join=columns_to_join,
                                             use_slave=use_slave,
                                             sort_keys=[sort_key],
-                                            sort_dirs=[sort_dir])
+                                            sort_dirs=[sort_dir],
+                                            columns=columns)
 
 
 @require_context
 def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
                                      columns_to_join=None, use_slave=False,
-                                     sort_keys=None, sort_dirs=None):
+                                     sort_keys=None, sort_dirs=None,
+                                     columns=None):
     """Return instances that match all filters sorted the the given keys.
     Deleted instances will be returned by default, unless there's a filter that
     says otherwise.
@@ -1874,6 +1944,9 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     |        'tag-any: [some-any-tag, some-another-any-tag]
     |    }
 
+    Only the columns of the instances table listed in columns are loaded,
+    or all of them if columns is None.
+
     """
     # NOTE(mriedem): If the limit is 0 there is no point in even going
     # to the database since nothing is going to be returned anyway.
@@ -1889,6 +1962,111 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
 
     session = get_session(use_slave=use_slave)
 
+    query_prefix, manual_joins, deleted = _instances_by_filters_query(
+        context, session, filters, columns_to_join, columns)
+
+    # paginate query
+    try:
+        if marker is not None:
+            marker = _instance_get_marker(context, session, marker, deleted,
+                                          sort_keys)
+        query_prefix = _paginate_query(query_prefix, models.Instance, limit,
+                                       sort_keys, marker=marker,
+                                       sort_dirs=sort_dirs)
+    except db_exc.InvalidSortKey:
+        raise exception.InvalidSortKey()
+
+    return _instances_fill_metadata(context, query_prefix.all(), manual_joins,
+                                    columns=columns)
+
+
+@require_context
+def instance_get_all_by_filters_chunked(context, filters, chunk_size,
+                                        limit=None, marker=None,
+                                        columns_to_join=None,
+                                        use_slave=False, sort_keys=None,
+                                        sort_dirs=None, columns=None):
+    """Yield the instances that match all filters in chunks of at most
+    chunk_size instances.
+
+    The instances are filtered and sorted as by
+    instance_get_all_by_filters_sort. Each chunk is fetched by its own
+    query, which starts after the last instance of the previous chunk, and
+    the metadata are joined to the instances of the chunk only, so that the
+    instances are never all loaded at once.
+    """
+    sort_keys, sort_dirs = process_sort_params(sort_keys,
+                                               sort_dirs,
+                                               default_dir='desc')
+
+    if CONF.database.slave_connection == '':
+        use_slave = False
+
+    if columns is not None:
+        # NOTE: The sort keys of the last instance of a chunk are read to
+        # fetch the next one.
+        columns = list(set(columns) | set(sort_keys))
+
+    session = get_session(use_slave=use_slave)
+
+    query_prefix, manual_joins, deleted = _instances_by_filters_query(
+        context, session, filters, columns_to_join, columns)
+
+    try:
+        if marker is not None:
+            marker = _instance_get_marker(context, session, marker, deleted,
+                                          sort_keys)
+    except db_exc.InvalidSortKey:
+        raise exception.InvalidSortKey()
+    while limit is None or limit > 0:
+        chunk_limit = chunk_size if limit is None else min(chunk_size, limit)
+        try:
+            chunk = _paginate_query(query_prefix, models.Instance,
+                                    chunk_limit, sort_keys, marker=marker,
+                                    sort_dirs=sort_dirs).all()
+        except db_exc.InvalidSortKey:
+            raise exception.InvalidSortKey()
+        if chunk:
+            yield _instances_fill_metadata(context, chunk, manual_joins,
+                                           columns=columns)
+        if len(chunk) < chunk_limit:
+            return
+        # NOTE: The last instance of the chunk is the marker of the next
+        # one, even if it was deleted since.
+        marker = chunk[-1]
+        if limit is not None:
+            limit -= len(chunk)
+
+
+def _instance_get_marker(context, session, marker, deleted, sort_keys):
+    """Get the values of the sort keys of the instance of the uuid given as
+    marker to paginate a query.
+
+    Only the sort keys are read, not the whole instance and its joins.
+
+    :raise db_exc.InvalidSortKey: if a sort key is not a column of instances
+    """
+    if deleted:
+        context = context.elevated(read_deleted='yes')
+    result = model_query(context, models.Instance,
+                         _sort_columns(models.Instance, sort_keys),
+                         session=session, project_only=True).\
+                filter_by(uuid=marker).\
+                first()
+    if not result:
+        raise exception.MarkerNotFound(marker)
+    return result
+
+
+def _instances_by_filters_query(context, session, filters, columns_to_join,
+                                columns=None):
+    """Build the query of the instances that match all filters, see
+    instance_get_all_by_filters_sort.
+
+    :returns: tuple of the query, of the columns to join manually with
+              _instances_fill_metadata and of whether deleted instances
+              are queried
+    """
     if columns_to_join is None:
         columns_to_join_new = ['info_cache', 'security_groups']
         manual_joins = ['metadata', 'system_metadata']
@@ -1896,15 +2074,16 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
         manual_joins, columns_to_join_new = (
             _manual_join_columns(columns_to_join))
 
-    query_prefix = session.query(models.Instance)
+    query_prefix = _instance_load_only(session.query(models.Instance),
+                                       columns)
     for column in columns_to_join_new:
         if 'extra.' in column:
             query_prefix = query_prefix.options(undefer(column))
         else:
             query_prefix = query_prefix.options(joinedload(column))
 
-    # Note: order_by is done in the sqlalchemy.utils.py paginate_query(),
-    # no need to do it here as well
+    # Note: order_by is done in _paginate_query(), no need to do it here as
+    # well
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1990,28 +2169,7 @@ def instance_get_all_by_filters_sort(context, filters, limit=None, marker=None,
     query_prefix = _regex_instance_filter(query_prefix, filters)
     query_prefix = _tag_instance_filter(context, query_prefix, filters)
 
-    # paginate query
-    if marker is not None:
-        try:
-            if deleted:
-                marker = _instance_get_by_uuid(
-                    context.elevated(read_deleted='yes'), marker,
-                    session=session)
-            else:
-                marker = _instance_get_by_uuid(context,
-                                               marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
-    try:
-        query_prefix = sqlalchemyutils.paginate_query(query_prefix,
-                               models.Instance, limit,
-                               sort_keys,
-                               marker=marker,
-                               sort_dirs=sort_dirs)
-    except db_exc.InvalidSortKey:
-        raise exception.InvalidSortKey()
-
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix, manual_joins, deleted
 
 
 def _tag_instance_filter(context, query, filters):
@@ -2234,6 +2392,95 @@ def process_sort_params(sort_keys, sort_dirs,
     return result_keys, result_dirs
 
 
+def _sort_columns(model, sort_keys):
+    """Get the columns of the model to sort by.
+
+    :raise db_exc.InvalidSortKey: if a sort key is not a column of the model
+    """
+    mapper_columns = class_mapper(model).columns
+    for key in sort_keys:
+        if key not in mapper_columns:
+            raise db_exc.InvalidSortKey()
+    return [getattr(model, key) for key in sort_keys]
+
+
+def _paginate_query(query, model, limit, sort_keys, marker=None,
+                    sort_dirs=None):
+    """Return the query sorted by the sort keys and limited to the rows that
+    come after the marker.
+
+    This is a keyset (seek) pagination: the rows of the previous pages are
+    not skipped but the query starts right after the values of the sort keys
+    of the marker, with the condition::
+
+        k1 >= m1 AND (k1 > m1 OR (k1 = m1 AND (k2 > m2 OR (k2 = m2 AND ...))))
+
+    for ascending keys, and the reverse comparisons for descending ones.
+    Unlike a bare disjunction of the conditions on each key, the leading
+    range on the first sort key lets the database seek into an index whose
+    columns are the equality filters of the query followed by the sort keys,
+    e.g. (project_id, deleted, created_at, id) for the instances of a
+    project, and read each page from the index in order, whatever the depth
+    of the page.
+
+    The last sort key must be unique, e.g. id, so that the order of the rows
+    is total and no row is skipped or repeated across pages.
+
+    :param query: the query to paginate
+    :param model: the model of the rows of the query
+    :param limit: the maximum number of rows to return, or None
+    :param sort_keys: the names of the columns to sort by
+    :param marker: the last row of the previous page, or any object with the
+                   values of the sort keys as attributes
+    :param sort_dirs: the directions of the sort keys, 'asc' or 'desc';
+                      ascending by default
+    :raise ValueError: if a sort direction is neither 'asc' nor 'desc'
+    :raise db_exc.InvalidSortKey: if a sort key is not a column of the model
+    """
+    if sort_dirs is None:
+        sort_dirs = ['asc'] * len(sort_keys)
+    assert len(sort_dirs) == len(sort_keys)
+
+    sort_columns = _sort_columns(model, sort_keys)
+    for sort_column, sort_dir in zip(sort_columns, sort_dirs):
+        if sort_dir == 'asc':
+            query = query.order_by(sort_column.asc())
+        elif sort_dir == 'desc':
+            query = query.order_by(sort_column.desc())
+        else:
+            raise ValueError(_("Unknown sort direction, "
+                               "must be 'desc' or 'asc'"))
+
+    if marker is not None:
+        # NOTE: Build the condition from the last sort key to the first one,
+        # each key nesting the condition on the following keys.
+        criteria = None
+        for key, sort_column, sort_dir in reversed(
+                list(zip(sort_keys, sort_columns, sort_dirs))):
+            marker_value = getattr(marker, key)
+            if sort_dir == 'asc':
+                after = sort_column > marker_value
+            else:
+                after = sort_column < marker_value
+            if criteria is not None:
+                after = or_(after, and_(sort_column == marker_value,
+                                        criteria))
+            criteria = after
+        marker_value = getattr(marker, sort_keys[0])
+        if len(sort_keys) > 1:
+            if sort_dirs[0] == 'asc':
+                leading_range = sort_columns[0] >= marker_value
+            else:
+                leading_range = sort_columns[0] <= marker_value
+            criteria = and_(leading_range, criteria)
+        query = query.filter(criteria)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    return query
+
+
 @require_context
 def instance_get_active_by_window_joined(context, begin, end=None,
                                          project_id=None, host=None,
@@ -2268,8 +2515,19 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     return _instances_fill_metadata(context, query.all(), manual_joins)
 
 
+def _instance_load_only(query, columns):
+    """Only load the columns of the instances table listed in columns, along
+    with those the joins of the instances refer to, or all of them if
+    columns is None.
+    """
+    if columns is None:
+        return query
+    columns = set(columns) | set(['id', 'uuid', 'deleted'])
+    return query.options(load_only(*columns))
+
+
 def _instance_get_all_query(context, project_only=False,
-                            joins=None, use_slave=False):
+                            joins=None, use_slave=False, columns=None):
     if joins is None:
         joins = ['info_cache', 'security_groups']
 
@@ -2277,6 +2535,7 @@ def _instance_get_all_query(context, project_only=False,
                         models.Instance,
                         project_only=project_only,
                         use_slave=use_slave)
+    query = _instance_load_only(query, columns)
     for column in joins:
         if 'extra.' in column:
             query = query.options(undefer(column))
@@ -2288,12 +2547,13 @@ def _instance_get_all_query(context, project_only=False,
 @require_admin_context
 def instance_get_all_by_host(context, host,
                              columns_to_join=None,
-                             use_slave=False):
+                             use_slave=False, columns=None):
     return _instances_fill_metadata(context,
       _instance_get_all_query(context,
-                              use_slave=use_slave).filter_by(host=host).all(),
+                              use_slave=use_slave,
+                              columns=columns).filter_by(host=host).all(),
                               manual_joins=columns_to_join,
-                              use_slave=use_slave)
+                              use_slave=use_slave, columns=columns)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2420,6 +2680,67 @@ def _instance_metadata_update_in_place(context, instance, metadata_type, model,
         instance[metadata_type].append(newitem)
 
 
+@require_context
+@_retry_on_deadlock
+def instance_bulk_update(context, values_by_uuid, columns_to_join=None):
+    """Set the given properties on several instances and update them in one
+    transaction.
+
+    :param context: = request context object
+    :param values_by_uuid: = dict of the dicts of column values of the
+                             instances, by instance uuid
+
+    As by instance_update_and_get_original, the "expected_task_state" and
+    "expected_vm_state" of the values of an instance are checked against the
+    task and vm states of that instance before updating it. An instance
+    which does not exist or whose values cannot be set is not updated, but
+    the other instances are.
+
+    :returns: a tuple of a dict of the (old_instance_ref, new_instance_ref)
+              tuples of the updated instances and of a dict of the
+              exceptions raised for the instances which were not updated,
+              both by instance uuid
+    """
+    updated = {}
+    conflicts = {}
+    uuids = []
+    for instance_uuid in values_by_uuid:
+        if uuidutils.is_uuid_like(instance_uuid):
+            uuids.append(instance_uuid)
+        else:
+            conflicts[instance_uuid] = exception.InvalidUUID(
+                uuid=instance_uuid)
+
+    session = get_session()
+    with session.begin():
+        instance_refs = {}
+        if uuids:
+            query = _build_instance_get(context, session=session,
+                                        columns_to_join=columns_to_join).\
+                        filter(models.Instance.uuid.in_(uuids))
+            instance_refs = {instance_ref['uuid']: instance_ref
+                             for instance_ref in query}
+        for instance_uuid in uuids:
+            instance_ref = instance_refs.get(instance_uuid)
+            if instance_ref is None:
+                conflicts[instance_uuid] = exception.InstanceNotFound(
+                    instance_id=instance_uuid)
+                continue
+            # NOTE: Copy the values, they are popped from and the
+            # transaction may be retried.
+            values = dict(values_by_uuid[instance_uuid])
+            try:
+                updated[instance_uuid] = _instance_update_ref(
+                    context, session, instance_ref, values,
+                    copy_old_instance=True)
+            except (exception.UnexpectedTaskStateError,
+                    exception.UnexpectedVMStateError,
+                    exception.InstanceExists) as e:
+                conflicts[instance_uuid] = e
+
+    return (updated, conflicts)
+
+
 @_retry_on_deadlock
 def _instance_update(context, instance_uuid, values, copy_old_instance=False,
                      columns_to_join=None):
@@ -2432,59 +2753,70 @@ def _instance_update(context, instance_uuid, values, copy_old_instance=False,
         instance_ref = _instance_get_by_uuid(context, instance_uuid,
                                              session=session,
                                              columns_to_join=columns_to_join)
-        if "expected_task_state" in values:
-            # it is not a db column so always pop out
-            expected = values.pop("expected_task_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["task_state"]
-            if actual_state not in expected:
-                if actual_state == task_states.DELETING:
-                    raise exception.UnexpectedDeletingTaskStateError(
-                            actual=actual_state, expected=expected)
-                else:
-                    raise exception.UnexpectedTaskStateError(
-                            actual=actual_state, expected=expected)
-        if "expected_vm_state" in values:
-            expected = values.pop("expected_vm_state")
-            if not isinstance(expected, (tuple, list, set)):
-                expected = (expected,)
-            actual_state = instance_ref["vm_state"]
-            if actual_state not in expected:
-                raise exception.UnexpectedVMStateError(actual=actual_state,
-                                                       expected=expected)
-
-        instance_hostname = instance_ref['hostname'] or ''
-        if ("hostname" in values and
-                values["hostname"].lower() != instance_hostname.lower()):
-                _validate_unique_server_name(context,
-                                             session,
-                                             values['hostname'])
-
-        if copy_old_instance:
-            old_instance_ref = copy.copy(instance_ref)
-        else:
-            old_instance_ref = None
+        return _instance_update_ref(context, session, instance_ref, values,
+                                    copy_old_instance=copy_old_instance)
 
-        metadata = values.get('metadata')
-        if metadata is not None:
-            _instance_metadata_update_in_place(context, instance_ref,
-                                               'metadata',
-                                               models.InstanceMetadata,
-                                               values.pop('metadata'),
-                                               session)
-
-        system_metadata = values.get('system_metadata')
-        if system_metadata is not None:
-            _instance_metadata_update_in_place(context, instance_ref,
-                                               'system_metadata',
-                                               models.InstanceSystemMetadata,
-                                               values.pop('system_metadata'),
-                                               session)
-
-        _handle_objects_related_type_conversions(values)
-        instance_ref.update(values)
-        session.add(instance_ref)
+
+def _instance_update_ref(context, session, instance_ref, values,
+                         copy_old_instance=False):
+    """Check the expected states of the instance and set the given values on
+    it, within the transaction of the session.
+
+    :returns: a tuple of the form (old_instance_ref, new_instance_ref)
+    """
+    if "expected_task_state" in values:
+        # it is not a db column so always pop out
+        expected = values.pop("expected_task_state")
+        if not isinstance(expected, (tuple, list, set)):
+            expected = (expected,)
+        actual_state = instance_ref["task_state"]
+        if actual_state not in expected:
+            if actual_state == task_states.DELETING:
+                raise exception.UnexpectedDeletingTaskStateError(
+                        actual=actual_state, expected=expected)
+            else:
+                raise exception.UnexpectedTaskStateError(
+                        actual=actual_state, expected=expected)
+    if "expected_vm_state" in values:
+        expected = values.pop("expected_vm_state")
+        if not isinstance(expected, (tuple, list, set)):
+            expected = (expected,)
+        actual_state = instance_ref["vm_state"]
+        if actual_state not in expected:
+            raise exception.UnexpectedVMStateError(actual=actual_state,
+                                                   expected=expected)
+
+    instance_hostname = instance_ref['hostname'] or ''
+    if ("hostname" in values and
+            values["hostname"].lower() != instance_hostname.lower()):
+            _validate_unique_server_name(context,
+                                         session,
+                                         values['hostname'])
+
+    if copy_old_instance:
+        old_instance_ref = copy.copy(instance_ref)
+    else:
+        old_instance_ref = None
+
+    metadata = values.get('metadata')
+    if metadata is not None:
+        _instance_metadata_update_in_place(context, instance_ref,
+                                           'metadata',
+                                           models.InstanceMetadata,
+                                           values.pop('metadata'),
+                                           session)
+
+    system_metadata = values.get('system_metadata')
+    if system_metadata is not None:
+        _instance_metadata_update_in_place(context, instance_ref,
+                                           'system_metadata',
+                                           models.InstanceSystemMetadata,
+                                           values.pop('system_metadata'),
+                                           session)
+
+    _handle_objects_related_type_conversions(values)
+    instance_ref.update(values)
+    session.add(instance_ref)
 
     return (old_instance_ref, instance_ref)
 
@@ -4347,7 +4679,26 @@ def migration_get_in_progress_by_host_and_node(context, host, node):
 
 
 @require_admin_context
-def migration_get_all_by_filters(context, filters):
+def migration_get_in_progress_by_host(context, host):
+
+    return model_query(context, models.Migration).\
+            filter(or_(models.Migration.source_compute == host,
+                       models.Migration.dest_compute == host)).\
+            filter(~models.Migration.status.in_(['confirmed', 'reverted',
+                                                 'error'])).\
+            options(joinedload_all('instance.system_metadata')).\
+            all()
+
+
+@require_admin_context
+def migration_get_all_by_filters(context, filters, limit=None, marker=None,
+                                 sort_keys=None, sort_dirs=None):
+    """Get the migrations that match the filters, sorted by the sort keys
+    (newest first by default) and paginated after the migration of the id
+    given as marker.
+    """
+    sort_keys, sort_dirs = process_sort_params(sort_keys, sort_dirs,
+                                               default_dir='desc')
     query = model_query(context, models.Migration)
     if "status" in filters:
         query = query.filter(models.Migration.status == filters["status"])
@@ -4355,6 +4706,20 @@ def migration_get_all_by_filters(context, filters):
         host = filters["host"]
         query = query.filter(or_(models.Migration.source_compute == host,
                                  models.Migration.dest_compute == host))
+    try:
+        if marker is not None:
+            marker_row = model_query(context, models.Migration,
+                                     _sort_columns(models.Migration,
+                                                   sort_keys)).\
+                            filter_by(id=marker).\
+                            first()
+            if not marker_row:
+                raise exception.MarkerNotFound(marker)
+            marker = marker_row
+        query = _paginate_query(query, models.Migration, limit, sort_keys,
+                                marker=marker, sort_dirs=sort_dirs)
+    except db_exc.InvalidSortKey:
+        raise exception.InvalidSortKey()
     return query.all()
 
 
@@ -4586,10 +4951,9 @@ def flavor_get_all(context, inactive=False, filters=None,
         if not marker_row:
             raise exception.MarkerNotFound(marker)
 
-    query = sqlalchemyutils.paginate_query(query, models.InstanceTypes, limit,
-                                           [sort_key, 'id'],
-                                           marker=marker_row,
-                                           sort_dir=sort_dir)
+    query = _paginate_query(query, models.InstanceTypes, limit,
+                            [sort_key, 'id'], marker=marker_row,
+                            sort_dirs=[sort_dir, sort_dir])
 
     inst_types = query.all()
 
@@ -5584,12 +5948,26 @@ def action_finish(context, values):
         return query.one()
 
 
-def actions_get(context, instance_uuid):
-    """Get all instance actions for the provided uuid."""
-    actions = model_query(context, models.InstanceAction).\
-                          filter_by(instance_uuid=instance_uuid).\
-                          order_by(desc("created_at"), desc("id")).\
-                          all()
+def actions_get(context, instance_uuid, limit=None, marker=None):
+    """Get the instance actions for the provided uuid, newest first, after
+    the action of the request id given as marker.
+    """
+    sort_keys = ['created_at', 'id']
+    sort_dirs = ['desc', 'desc']
+    query = model_query(context, models.InstanceAction).\
+                        filter_by(instance_uuid=instance_uuid)
+    if marker is not None:
+        marker_row = model_query(context, models.InstanceAction,
+                                 _sort_columns(models.InstanceAction,
+                                               sort_keys)).\
+                        filter_by(instance_uuid=instance_uuid).\
+                        filter_by(request_id=marker).\
+                        first()
+        if not marker_row:
+            raise exception.MarkerNotFound(marker)
+        marker = marker_row
+    actions = _paginate_query(query, models.InstanceAction, limit, sort_keys,
+                              marker=marker, sort_dirs=sort_dirs).all()
     return actions
 
 
@@ -5794,29 +6172,87 @@ def task_log_end_task(context, task_name, period_beginning, period_ending,
             raise exception.TaskNotRunning(task_name=task_name, host=host)
 
 
-@require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
-    """Move up to max_rows rows from one tables to the corresponding
-    shadow table. The context argument is only used for the decorator.
+# NOTE: The tables to archive and their shadow tables are reflected once per
+# engine.
+_ARCHIVE_TABLES = weakref.WeakKeyDictionary()
+_ARCHIVE_TABLES_LOCK = threading.Lock()
 
-    :returns: number of rows archived
+
+def _get_archive_tables(engine, tablename):
+    """Get the table and its shadow table, or None if it has none."""
+    with _ARCHIVE_TABLES_LOCK:
+        metadata, tables = _ARCHIVE_TABLES.setdefault(engine,
+                                                      (MetaData(), {}))
+        if tablename not in tables:
+            table = Table(tablename, metadata, autoload=True,
+                          autoload_with=engine)
+            try:
+                shadow_table = Table(_SHADOW_TABLE_PREFIX + tablename,
+                                     metadata, autoload=True,
+                                     autoload_with=engine)
+            except NoSuchTableError:
+                shadow_table = None
+            tables[tablename] = (table, shadow_table)
+        return tables[tablename]
+
+
+def _archive_deleted_criterion(table, tablename):
+    """Get the criterion of the soft-deleted rows of the table."""
+    deleted_column = table.c.deleted
+    # NOTE: Reflected columns have no default, so take the value of the live
+    # rows from the model of the table.
+    model_table = models.BASE.metadata.tables.get(tablename)
+    if (model_table is not None and
+            model_table.c.deleted.default is not None):
+        return deleted_column != model_table.c.deleted.default.arg
+    return deleted_column != deleted_column.default
+
+
+def _archive_deleted_rows_chunk(conn, table, shadow_table, column, criterion,
+                                marker, max_rows):
+    """Move up to max_rows deleted rows whose key follows the marker to the
+    shadow table, in one transaction.
+
+    :returns: tuple of the number of rows archived and of the key of the last
+              one, which is None if no deleted row follows the marker
     """
-    # NOTE(guochbo): There is a circular import, nova.db.sqlalchemy.utils
-    # imports nova.db.sqlalchemy.api.
-    from nova.db.sqlalchemy import utils as db_utils
+    if marker is not None:
+        criterion = and_(criterion, column > marker)
+    last = conn.execute(sql.select([column], criterion).
+                        order_by(column).limit(max_rows)).fetchall()
+    if not last:
+        return 0, None
+    criterion = and_(criterion, column <= last[-1][0])
+
+    # NOTE: The chunk is bound by a range of the key rather than by the list
+    # of the keys, which keeps the statements small whatever the size of the
+    # chunk and lets them use the index of the key.
+    insert_statement = sqlalchemyutils.InsertFromSelect(
+        shadow_table, sql.select([table], criterion))
+    delete_statement = table.delete().where(criterion)
+    # Group the insert and delete in a transaction.
+    with conn.begin():
+        conn.execute(insert_statement)
+        result_delete = conn.execute(delete_statement)
+    return result_delete.rowcount, last[-1][0]
+
+
+def _archive_deleted_rows_for_table(tablename, budget, chunk_size,
+                                    chunk_sleep, checkpoint, progress):
+    """Move the deleted rows of one table to its shadow table in chunks,
+    taking the number of rows of each chunk from the budget.
 
+    A table resumed from the marker of its checkpoint is scanned once more
+    from its first row before being done, for the rows deleted behind the
+    marker meanwhile.
+
+    :returns: number of rows archived
+    """
     engine = get_engine()
-    conn = engine.connect()
-    metadata = MetaData()
-    metadata.bind = engine
-    table = Table(tablename, metadata, autoload=True)
-    shadow_tablename = _SHADOW_TABLE_PREFIX + tablename
-    rows_archived = 0
-    try:
-        shadow_table = Table(shadow_tablename, metadata, autoload=True)
-    except NoSuchTableError:
+    table, shadow_table = _get_archive_tables(engine, tablename)
+    if shadow_table is None:
         # No corresponding shadow table; skip it.
-        return rows_archived
+        return 0
 
     if tablename == "dns_domains":
         # We have one table (dns_domains) where the key is called
@@ -5824,58 +6260,165 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
         column = table.c.domain
     else:
         column = table.c.id
-    # NOTE(guochbo): Use InsertFromSelect and DeleteFromSelect to avoid
-    # database's limit of maximum parameter in one SQL statement.
-    deleted_column = table.c.deleted
-    query_insert = sql.select([table],
-                          deleted_column != deleted_column.default).\
-                          order_by(column).limit(max_rows)
-    query_delete = sql.select([column],
-                          deleted_column != deleted_column.default).\
-                          order_by(column).limit(max_rows)
+    criterion = _archive_deleted_criterion(table, tablename)
 
-    insert_statement = sqlalchemyutils.InsertFromSelect(
-        shadow_table, query_insert)
-    delete_statement = db_utils.DeleteFromSelect(table, query_delete, column)
+    state = checkpoint.setdefault(tablename, {'marker': None, 'done': False})
+    if state['done']:
+        return 0
+    rescan = state['marker'] is not None
+
+    rows_archived = 0
+    conn = engine.connect()
     try:
-        # Group the insert and delete in a transaction.
-        with conn.begin():
-            conn.execute(insert_statement)
-            result_delete = conn.execute(delete_statement)
-    except db_exc.DBError:
-        # TODO(ekudryashova): replace by DBReferenceError when db layer
-        # raise it.
-        # A foreign key constraint keeps us from deleting some of
-        # these rows until we clean up a dependent table.  Just
-        # skip this table for now; we'll come back to it later.
-        msg = _("IntegrityError detected when archiving table %s") % tablename
-        LOG.warn(msg)
-        return rows_archived
+        while budget[0] is None or budget[0] > 0:
+            limit = chunk_size
+            if budget[0] is not None:
+                limit = min(limit, budget[0])
+                budget[0] -= limit
+            try:
+                rows, marker = _archive_deleted_rows_chunk(
+                    conn, table, shadow_table, column, criterion,
+                    state['marker'], limit)
+            except db_exc.DBError:
+                # TODO(ekudryashova): replace by DBReferenceError when db
+                # layer raise it.
+                # A foreign key constraint keeps us from deleting some of
+                # these rows until we clean up a dependent table.  Just
+                # skip this table for now; we'll come back to it later.
+                LOG.warning(_LW("IntegrityError detected when archiving "
+                                "table %s"), tablename)
+                if budget[0] is not None:
+                    budget[0] += limit
+                break
+            if budget[0] is not None:
+                budget[0] += limit - rows
+            if marker is None:
+                state['marker'] = None
+                if rescan:
+                    rescan = False
+                    continue
+                state['done'] = True
+                break
+            state['marker'] = marker
+            rows_archived += rows
+            if progress:
+                progress(tablename, rows)
+            if chunk_sleep:
+                time.sleep(chunk_sleep)
+    finally:
+        conn.close()
+    return rows_archived
 
-    rows_archived = result_delete.rowcount
 
-    return rows_archived
+def _archive_table_groups(tablenames):
+    """Group the tables to archive so that the tables referencing a table
+    by a foreign key are in an earlier group than it, the tables of a group
+    being independent.
+    """
+    tablenames = set(tablenames)
+    referencing = collections.defaultdict(set)
+    for table in models.BASE.metadata.tables.values():
+        for foreign_key in table.foreign_keys:
+            referenced = foreign_key.target_fullname.split('.')[0]
+            if referenced != table.name:
+                referencing[referenced].add(table.name)
+
+    levels = {}
+
+    def _level(tablename, path=()):
+        if tablename not in levels:
+            levels[tablename] = 1 + max(
+                [_level(name, path + (tablename,))
+                 for name in referencing[tablename] if name not in path] or
+                [-1])
+        return levels[tablename]
+
+    groups = collections.defaultdict(list)
+    for tablename in tablenames:
+        groups[_level(tablename)].append(tablename)
+    return [sorted(groups[level]) for level in sorted(groups)]
 
 
 @require_admin_context
-def archive_deleted_rows(context, max_rows=None):
+def archive_deleted_rows_for_table(context, tablename, max_rows=None,
+                                   chunk_size=None, chunk_sleep=None,
+                                   checkpoint=None, progress=None):
+    """Move up to max_rows rows from one tables to the corresponding
+    shadow table. The context argument is only used for the decorator.
+
+    The rows are moved in chunks of chunk_size rows, in the order of their
+    key, each chunk in its own transaction, sleeping chunk_sleep seconds
+    between the chunks.
+
+    If checkpoint is given, the archiving starts after the key recorded in
+    it for the table, see archive_deleted_rows.
+
+    :returns: number of rows archived
+    """
+    if chunk_size is None:
+        chunk_size = CONF.archive_chunk_size
+    if chunk_sleep is None:
+        chunk_sleep = CONF.archive_chunk_sleep
+    if checkpoint is None:
+        checkpoint = {}
+    return _archive_deleted_rows_for_table(tablename, [max_rows], chunk_size,
+                                           chunk_sleep, checkpoint, progress)
+
+
+@require_admin_context
+def archive_deleted_rows(context, max_rows=None, chunk_size=None,
+                         chunk_sleep=None, workers=None, checkpoint=None,
+                         progress=None):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
+    The rows of each table are moved in chunks of chunk_size rows, in the
+    order of their key, each chunk in its own transaction, sleeping
+    chunk_sleep seconds between the chunks to limit the lag of the replicas
+    of the database. The tables referencing a table are archived before
+    it, and up to workers tables which do not reference each other are
+    archived concurrently.
+
+    If checkpoint is given, it is a dict updated after each chunk with the
+    key of the last row archived of the table, by table name, and with
+    whether no deleted row is left after it. Passing the checkpoint of an
+    interrupted archiving resumes it after those keys and skips the tables
+    done.
+
+    :param progress: function called after each chunk with the name of the
+                     table and the number of rows archived
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
+    if chunk_size is None:
+        chunk_size = CONF.archive_chunk_size
+    if chunk_sleep is None:
+        chunk_sleep = CONF.archive_chunk_sleep
+    if workers is None:
+        workers = CONF.archive_workers
+    if checkpoint is None:
+        checkpoint = {}
     tablenames = []
     for model_class in models.__dict__.itervalues():
         if hasattr(model_class, "__tablename__"):
             tablenames.append(model_class.__tablename__)
-    rows_archived = 0
-    for tablename in tablenames:
-        rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
-            break
-    return rows_archived
+
+    budget = [max_rows]
+    rows_archived = []
+
+    def _archive(tablename):
+        rows_archived.append(_archive_deleted_rows_for_table(
+            tablename, budget, chunk_size, chunk_sleep, checkpoint,
+            progress))
+
+    pool = eventlet.GreenPool(max(workers, 1))
+    for group in _archive_table_groups(tablenames):
+        for tablename in group:
+            if budget[0] is not None and budget[0] <= 0:
+                break
+            pool.spawn_n(_archive, tablename)
+        pool.waitall()
+    return sum(rows_archived)
 
 
 def _augment_flavor_to_migrate(flavor_to_migrate, db_flavor):
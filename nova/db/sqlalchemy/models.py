@@ -197,6 +197,8 @@ class Instance(BASE, NovaBase):
         Index('uuid', 'uuid', unique=True),
         Index('instances_project_id_deleted_idx',
               'project_id', 'deleted'),
+        Index('instances_project_id_deleted_created_at_id_idx',
+              'project_id', 'deleted', 'created_at', 'id'),
         Index('instances_reservation_id_idx',
               'reservation_id'),
         Index('instances_terminated_at_launched_at_idx',
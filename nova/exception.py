@@ -905,6 +905,11 @@ class ComputeHostNotFound(HostNotFound):
     msg_fmt = _("Compute host %(host)s could not be found.")
 
 
+class ComputeHostClaimConflict(NovaException):
+    msg_fmt = _("The resource usage of compute node %(compute_id)s changed "
+                "since it was read.")
+
+
 class ComputeHostNotCreated(HostNotFound):
     msg_fmt = _("Compute host %(name)s needs to be created first"
                 " before updating.")
@@ -17,10 +17,13 @@
 Filter support
 """
 
+import time
+
 from oslo_log import log as logging
 
 from nova.i18n import _LI
 from nova import loadables
+from nova.scheduler import profiling
 
 LOG = logging.getLogger(__name__)
 
@@ -44,6 +47,26 @@ class BaseFilter(object):
             if self._filter_one(obj, filter_properties):
                 yield obj
 
+    # Set to true in a subclass implementing cache_key()
+    cacheable = False
+
+    def cache_key(self, filter_properties):
+        """Return the fingerprint of the request inputs the filter uses.
+
+        Only called when the cacheable attribute is set. Override in a
+        subclass whose result for an object only depends on the static
+        attributes of the object and on a few of the filter_properties,
+        so that results can be cached in a FilterResultCache: return a
+        hashable value which is equal for all the requests leading to the
+        same results, or None to not use the cache for this request.
+        """
+        return None
+
+    # Set to true in a subclass whose result for an object neither depends
+    # on the other objects being filtered nor on the filters run before,
+    # so that a FilterOrder can move it among the other stateless filters
+    stateless = False
+
     # Set to true in a subclass if a filter only needs to be run once
     # for each request rather than for each instance
     run_filter_once_per_request = False
@@ -58,6 +81,143 @@ class BaseFilter(object):
         else:
             return True
 
+    def dirty_on_consume(self, filter_properties):
+        """Return True if consuming an object can change the result of the
+        filter for the other objects.
+
+        When placing multiple instances of a request, the objects are only
+        filtered again for the next instance after one of them was picked
+        and consumed for the current one. By default, only the consumed
+        object is filtered again, as its result is the only one which can
+        change. Override this in a subclass if the result for an object
+        also depends on the other objects or on the objects picked so far,
+        so that all of them are filtered again. This is called before the
+        picked object is consumed.
+        """
+        return False
+
+
+class FilterResultCache(object):
+    """Cache of the results of cacheable filters for each object.
+
+    Results are keyed by the filter class name and the cache key the
+    filter gives for the request, and stored separately for each object
+    so that the results of an object can be dropped once its static
+    attributes changed. The owner of the cache is responsible for calling
+    invalidate() then.
+    """
+
+    def __init__(self, obj_key, max_size):
+        """:param obj_key: callable returning a hashable key for an object
+        :param max_size: maximum number of results cached for an object
+        """
+        self._obj_key = obj_key
+        self._max_size = max_size
+        self._results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, obj=None):
+        """Drop the cached results of an object, or of all the objects."""
+        if obj is None:
+            self._results.clear()
+        else:
+            self._results.pop(self._obj_key(obj), None)
+
+    def filter_all(self, filter, cache_key, objs, filter_properties):
+        """Return the list of objects passing the filter, only running the
+        filter for the objects without a cached result.
+        """
+        key = (filter.__class__.__name__, cache_key)
+        results = []
+        misses = []
+        for obj in objs:
+            obj_results = self._results.setdefault(self._obj_key(obj), {})
+            passes = obj_results.get(key)
+            if passes is None:
+                misses.append(obj)
+            results.append((obj, obj_results, passes))
+        self.hits += len(results) - len(misses)
+        self.misses += len(misses)
+
+        if misses:
+            passed = filter.filter_all(misses, filter_properties)
+            if passed is None:
+                return None
+            passed = set(id(obj) for obj in passed)
+        list_objs = []
+        for obj, obj_results, passes in results:
+            if passes is None:
+                passes = id(obj) in passed
+                if len(obj_results) >= self._max_size:
+                    obj_results.clear()
+                obj_results[key] = passes
+            if passes:
+                list_objs.append(obj)
+        return list_objs
+
+
+class FilterOrder(object):
+    """Order of the filters adapted to their measured cost and selectivity.
+
+    As an object must pass all the filters, running first the filters
+    which are cheap and reject many objects saves running the expensive
+    ones on objects which would be rejected anyway. The cost per object and
+    the pass rate of each filter are tracked as moving averages, and the
+    filters are sorted by the ratio of their cost per object to their
+    rejection rate, which is the order giving the lowest expected cost for
+    independent filters.
+
+    Only stateless filters are moved, and only among the consecutive
+    stateless filters around them, so that the objects passing all the
+    filters are the same as with the configured order. Filters which were
+    never measured keep their configured order and run first, to get
+    measured.
+    """
+
+    def __init__(self, decay=0.1):
+        """:param decay: weight of a new measure in the moving averages"""
+        self._decay = decay
+        # [cost per object, pass rate] keyed by filter class name
+        self._stats = {}
+
+    def record(self, filter, elapsed, objs_in, objs_out):
+        """Record one run of a filter."""
+        if not objs_in:
+            return
+        cost = float(elapsed) / objs_in
+        pass_rate = float(objs_out) / objs_in
+        stats = self._stats.get(filter.__class__.__name__)
+        if stats is None:
+            self._stats[filter.__class__.__name__] = [cost, pass_rate]
+        else:
+            stats[0] += self._decay * (cost - stats[0])
+            stats[1] += self._decay * (pass_rate - stats[1])
+
+    def _rank(self, filter):
+        stats = self._stats.get(filter.__class__.__name__)
+        if stats is None:
+            return -1.0
+        cost, pass_rate = stats
+        if pass_rate >= 1.0:
+            return float('inf')
+        return cost / (1.0 - pass_rate)
+
+    def order(self, filters):
+        """Return the filters in the order they should run."""
+        ordered = []
+        # Consecutive stateless filters, which can be reordered
+        run = []
+        for filter in filters:
+            if filter.stateless:
+                run.append(filter)
+            else:
+                ordered.extend(sorted(run, key=self._rank))
+                run = []
+                ordered.append(filter)
+        ordered.extend(sorted(run, key=self._rank))
+        return ordered
+
 
 class BaseFilterHandler(loadables.BaseLoader):
     """Base class to handle loading filter classes.
@@ -65,17 +225,45 @@ class BaseFilterHandler(loadables.BaseLoader):
     This class should be subclassed where one needs to use filters.
     """
 
-    def get_filtered_objects(self, filters, objs, filter_properties, index=0):
+    def get_filtered_objects(self, filters, objs, filter_properties, index=0,
+                             cache=None, profiler=None, order=None):
+        """Return the objects passing all the filters.
+
+        If a FilterResultCache is given, it is used for the filters which
+        are cacheable. If a profiler is given, the time spent in each filter
+        and the number of objects it got and returned are recorded in it.
+        If a FilterOrder is given, the filters run in the order it gives.
+        """
+        if order is not None:
+            filters = order.order(filters)
         list_objs = list(objs)
         LOG.debug("Starting with %d host(s)", len(list_objs))
         for filter in filters:
             if filter.run_filter_for_index(index):
                 cls_name = filter.__class__.__name__
-                objs = filter.filter_all(list_objs, filter_properties)
-                if objs is None:
+                objs_in = len(list_objs)
+                start = time.time()
+                cache_key = None
+                if cache is not None and filter.cacheable:
+                    cache_key = filter.cache_key(filter_properties)
+                if cache_key is not None:
+                    objs = cache.filter_all(filter, cache_key, list_objs,
+                                            filter_properties)
+                else:
+                    objs = filter.filter_all(list_objs, filter_properties)
+                # The filter says to stop filtering when returning None
+                stop = objs is None
+                list_objs = [] if stop else list(objs)
+                if profiler is not None or order is not None:
+                    elapsed = time.time() - start
+                    if profiler is not None:
+                        profiler.record(profiling.FILTER, cls_name, elapsed,
+                                        objs_in, len(list_objs))
+                    if order is not None:
+                        order.record(filter, elapsed, objs_in, len(list_objs))
+                if stop:
                     LOG.debug("Filter %s says to stop filtering", cls_name)
                     return
-                list_objs = list(objs)
                 if not list_objs:
                     LOG.info(_LI("Filter %s returned 0 hosts"), cls_name)
                     break
@@ -83,3 +271,16 @@ class BaseFilterHandler(loadables.BaseLoader):
                           "%(obj_len)d host(s)",
                           {'cls_name': cls_name, 'obj_len': len(list_objs)})
         return list_objs
+
+    def all_dirty_on_consume(self, filters, filter_properties, index):
+        """Return True if all the objects must be filtered again for the
+        "index-th" instance in a request, instead of only the object
+        consumed for the previous one.
+        """
+        for filter in filters:
+            if not filter.run_filter_for_index(index):
+                continue
+            if (not filter.run_filter_for_index(index - 1) or
+                    filter.dirty_on_consume(filter_properties)):
+                return True
+        return False
@@ -13,6 +13,7 @@
 #    under the License.
 
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 
 from nova import db
 from nova import exception
@@ -37,7 +38,8 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
     # Version 1.8: Added get_by_host_and_nodename()
     # Version 1.9: Added pci_device_pools
     # Version 1.10: Added get_first_node_by_host_for_old_compat()
-    VERSION = '1.10'
+    # Version 1.11: Added claim()
+    VERSION = '1.11'
 
     fields = {
         'id': fields.IntegerField(read_only=True),
@@ -228,7 +230,11 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
     def _convert_pci_stats_to_db_format(updates):
         pools = updates.pop('pci_device_pools', None)
         if pools:
-            updates['pci_stats'] = jsonutils.dumps(pools.obj_to_primitive())
+            # NOTE: the pools are stored as a list of dicts rather than as
+            # the primitive of the list, which is several times larger and
+            # slower to load. from_pci_stats() reads both formats.
+            updates['pci_stats'] = jsonutils.dumps(
+                [pool.to_dict() for pool in pools])
 
     @base.remotable
     def create(self, context):
@@ -258,6 +264,20 @@ class ComputeNode(base.NovaPersistentObject, base.NovaObject,
         db_compute = db.compute_node_update(context, self.id, updates)
         self._from_db_object(context, self, db_compute)
 
+    @base.remotable
+    def claim(self, context, memory_mb, local_gb, vcpus):
+        """Consume resources on the compute node, if its free RAM, free disk
+        and used VCPUs are still the ones of this object, and refresh it.
+
+        Raises ComputeHostClaimConflict if they changed in the meantime.
+        """
+        expected = {'free_ram_mb': self.free_ram_mb,
+                    'free_disk_gb': self.free_disk_gb,
+                    'vcpus_used': self.vcpus_used}
+        db_compute = db.compute_node_claim(context, self.id, expected,
+                                           memory_mb, local_gb, vcpus)
+        self._from_db_object(context, self, db_compute)
+
     @base.remotable
     def destroy(self, context):
         db.compute_node_delete(context, self.id)
@@ -283,7 +303,9 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
     # Version 1.8 ComputeNode version 1.8 + add get_all_by_host()
     # Version 1.9 ComputeNode version 1.9
     # Version 1.10 ComputeNode version 1.10
-    VERSION = '1.10'
+    # Version 1.11 Add get_all_changed_since()
+    # Version 1.12 ComputeNode version 1.11
+    VERSION = '1.12'
     fields = {
         'objects': fields.ListOfObjectsField('ComputeNode'),
         }
@@ -300,6 +322,8 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
         '1.8': '1.8',
         '1.9': '1.9',
         '1.10': '1.10',
+        '1.11': '1.10',
+        '1.12': '1.11',
         }
 
     @base.remotable_classmethod
@@ -308,6 +332,32 @@ class ComputeNodeList(base.ObjectListBase, base.NovaObject):
         return base.obj_make_list(context, cls(context), objects.ComputeNode,
                                   db_computes)
 
+    @base.remotable_classmethod
+    def _get_all_changed_since(cls, context, since):
+        # NOTE: The timestamp string is converted back to a naive UTC
+        # datetime for the DB API call.
+        since = timeutils.normalize_time(timeutils.parse_isotime(since))
+        db_computes = db.compute_node_get_all_changed_since(context, since)
+        return base.obj_make_list(context, cls(context), objects.ComputeNode,
+                                  db_computes)
+
+    @classmethod
+    def get_all_changed_since(cls, context, since):
+        """Get compute nodes created, updated or deleted since a time.
+
+        Soft-deleted compute nodes are included so that callers keeping
+        a cache of compute nodes can drop them.
+
+        :param context: nova request context
+        :param since: datetime watermark
+        :returns: ComputeNodeList
+        """
+        # NOTE: The datetime is converted to a string primitive for the
+        # remote call.
+        return cls._get_all_changed_since(context,
+                                          timeutils.isotime(since,
+                                                            subsecond=True))
+
     @base.remotable_classmethod
     def get_by_hypervisor(cls, context, hypervisor_match):
         db_computes = db.compute_node_search_by_hypervisor(context,
@@ -13,6 +13,7 @@
 #    under the License.
 
 import copy
+import re
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -93,6 +94,23 @@ def _expected_cols(expected_attrs):
     return simple_cols + complex_cols
 
 
+def _expected_columns(columns):
+    """Return the columns of the instances table to load for the fields
+    listed in columns, or None to load all of them.
+
+    The columns the name of the instance is built from are always loaded,
+    along with the id and the uuid the other columns are lazy-loaded by.
+    """
+    if columns is None:
+        return None
+    columns = set(columns) | set(['id', 'uuid'])
+    columns.update(key for key in re.findall(r'%\((\w+)\)',
+                                             CONF.instance_name_template)
+                   if key in Instance.fields and
+                   key not in INSTANCE_OPTIONAL_ATTRS)
+    return sorted(columns)
+
+
 def compat_instance(instance):
     """Create a dict-like instance structure from an objects.Instance.
 
@@ -269,6 +287,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
     def __init__(self, *args, **kwargs):
         super(Instance, self).__init__(*args, **kwargs)
         self._reset_metadata_tracking()
+        # NOTE: The columns loaded from the instances table when a projection
+        # left the others out, to be lazy-loaded, or None.
+        self._loaded_columns = None
 
     def _reset_metadata_tracking(self, fields=None):
         if fields is None or 'system_metadata' in fields:
@@ -296,8 +317,22 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         self = super(Instance, cls)._obj_from_primitive(context, objver,
                                                         primitive)
         self._reset_metadata_tracking()
+        # NOTE: An instance from the database is sent with all its columns,
+        # unless a projection left some out.
+        if self.obj_attr_is_set('id') and self.obj_attr_is_set('uuid'):
+            columns = [field for field in self.fields
+                       if field not in INSTANCE_OPTIONAL_ATTRS]
+            loaded = [field for field in columns
+                      if self.obj_attr_is_set(field)]
+            if len(loaded) < len(columns):
+                self._loaded_columns = sorted(loaded)
         return self
 
+    def __deepcopy__(self, memo):
+        nobj = super(Instance, self).__deepcopy__(memo)
+        nobj._loaded_columns = self._loaded_columns
+        return nobj
+
     def obj_make_compatible(self, primitive, target_version):
         super(Instance, self).obj_make_compatible(primitive, target_version)
         target_version = utils.convert_version_to_tuple(target_version)
@@ -468,18 +503,25 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         return migrated_flavor
 
     @staticmethod
-    def _from_db_object(context, instance, db_inst, expected_attrs=None):
+    def _from_db_object(context, instance, db_inst, expected_attrs=None,
+                        columns=None):
         """Method to help with migration to objects.
 
-        Converts a database entity to a formal object.
+        Converts a database entity to a formal object. If columns lists the
+        columns the entity was loaded with, the other fields are left unset
+        and lazy-loaded.
         """
         instance._context = context
         if expected_attrs is None:
             expected_attrs = []
+        if columns is not None:
+            instance._loaded_columns = list(columns)
         # Most of the field names match right now, so be quick
         for field in instance.fields:
             if field in INSTANCE_OPTIONAL_ATTRS:
                 continue
+            elif columns is not None and field not in db_inst:
+                continue
             elif field == 'deleted':
                 instance.deleted = db_inst['deleted'] == db_inst['id']
             elif field == 'cleaned':
@@ -777,6 +819,27 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         else:
             stale_instance = None
 
+        updates = self._save_updates(context, expected_vm_state,
+                                     expected_task_state)
+        if not updates:
+            if stale_instance:
+                _handle_cell_update_from_api()
+            return
+
+        expected_attrs = self._save_expected_attrs()
+        old_ref, inst_ref = db.instance_update_and_get_original(
+                context, self.uuid, updates, update_cells=False,
+                columns_to_join=_expected_cols(expected_attrs))
+
+        self._save_updated(context, old_ref, inst_ref, expected_attrs,
+                           _handle_cell_update_from_api if stale_instance
+                           else None)
+
+    def _save_updates(self, context, expected_vm_state=None,
+                      expected_task_state=None):
+        """Save the object fields of the instance and get the updates of its
+        columns, with the expected states, if any column changed.
+        """
         self._maybe_upgrade_flavor()
         updates = {}
         changes = self.obj_what_changed()
@@ -795,9 +858,7 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
                 updates[field] = self[field]
 
         if not updates:
-            if stale_instance:
-                _handle_cell_update_from_api()
-            return
+            return updates
 
         # Cleaned needs to be turned back into an int here
         if 'cleaned' in updates:
@@ -817,7 +878,10 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             updates['expected_task_state'] = expected_task_state
         if expected_vm_state is not None:
             updates['expected_vm_state'] = expected_vm_state
+        return updates
 
+    def _save_expected_attrs(self):
+        """Get the attributes to refresh from the updated instance."""
         expected_attrs = [attr for attr in _INSTANCE_OPTIONAL_JOINED_FIELDS
                                if self.obj_attr_is_set(attr)]
         if 'pci_devices' in expected_attrs:
@@ -832,10 +896,13 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         if 'system_metadata' not in expected_attrs:
             expected_attrs.append('system_metadata')
             expected_attrs.append('flavor')
-        old_ref, inst_ref = db.instance_update_and_get_original(
-                context, self.uuid, updates, update_cells=False,
-                columns_to_join=_expected_cols(expected_attrs))
+        return expected_attrs
 
+    def _save_updated(self, context, old_ref, inst_ref, expected_attrs,
+                      handle_cell_update_from_api=None):
+        """Refresh the instance from its updated database copy, and notify
+        the cells and the listeners of the update.
+        """
         self._from_db_object(context, self, inst_ref,
                              expected_attrs=expected_attrs)
 
@@ -844,9 +911,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         # make a copy of the instance for notifications first.
         new_ref = self.obj_clone()
 
-        if stale_instance:
-            _handle_cell_update_from_api()
-        elif cell_type == 'compute':
+        if handle_cell_update_from_api:
+            handle_cell_update_from_api()
+        elif cells_opts.get_cell_type() == 'compute':
             cells_api = cells_rpcapi.CellsAPI()
             cells_api.instance_update_at_top(context,
                                              base.obj_to_primitive(new_ref))
@@ -946,6 +1013,21 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
         instance.system_metadata.update(self.get('system_metadata', {}))
         self.system_metadata = instance.system_metadata
 
+    def _load_columns(self):
+        # NOTE: Load all the columns left out by a projection at once,
+        # rather than one column per query.
+        with utils.temporary_mutation(self._context, read_deleted='yes'):
+            instance = self.__class__.get_by_uuid(self._context,
+                                                  uuid=self.uuid,
+                                                  expected_attrs=[])
+        columns = [field for field in self.fields
+                   if field not in INSTANCE_OPTIONAL_ATTRS and
+                   not self.obj_attr_is_set(field)]
+        for field in columns:
+            setattr(self, field, getattr(instance, field))
+        self.obj_reset_changes(columns)
+        self._loaded_columns = None
+
     def _load_vcpu_model(self, db_vcpu_model=None):
         if db_vcpu_model is None:
             self.vcpu_model = objects.VirtCPUModel.get_by_instance_uuid(
@@ -956,7 +1038,12 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
                 db_vcpu_model)
 
     def obj_load_attr(self, attrname):
-        if attrname not in INSTANCE_OPTIONAL_ATTRS:
+        # NOTE: The columns left out by a projection are lazy-loadable too,
+        # but for the id and the uuid they are lazy-loaded by.
+        if (attrname not in INSTANCE_OPTIONAL_ATTRS and
+                not (self._loaded_columns is not None and
+                     attrname in self.fields and
+                     attrname not in ('id', 'uuid'))):
             raise exception.ObjectActionError(
                 action='obj_load_attr',
                 reason='attribute %s not lazy-loadable' % attrname)
@@ -993,6 +1080,9 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             self._load_vcpu_model()
         elif 'flavor' in attrname:
             self._load_flavor()
+        elif attrname not in INSTANCE_OPTIONAL_ATTRS:
+            self._load_columns()
+            return
         else:
             # FIXME(comstud): This should be optimized to only load the attr.
             self._load_generic(attrname)
@@ -1046,7 +1136,8 @@ class Instance(base.NovaPersistentObject, base.NovaObject,
             self.obj_reset_changes(['metadata'])
 
 
-def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
+def _make_instance_list(context, inst_list, db_inst_list, expected_attrs,
+                        columns=None):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
     if get_fault:
@@ -1063,7 +1154,7 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     for db_inst in db_inst_list:
         inst_obj = objects.Instance._from_db_object(
                 context, objects.Instance(context), db_inst,
-                expected_attrs=expected_attrs)
+                expected_attrs=expected_attrs, columns=columns)
         if get_fault:
             inst_obj.fault = inst_faults.get(inst_obj.uuid, None)
         inst_list.objects.append(inst_obj)
@@ -1089,7 +1180,9 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     # Version 1.13: Instance <= version 1.17
     # Version 1.14: Instance <= version 1.18
     # Version 1.15: Instance <= version 1.19
-    VERSION = '1.15'
+    # Version 1.16: Added columns to get_by_filters and get_by_host
+    # Version 1.17: Added save_all
+    VERSION = '1.17'
 
     fields = {
         'objects': fields.ListOfObjectsField('Instance'),
@@ -1111,33 +1204,102 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         '1.13': '1.17',
         '1.14': '1.18',
         '1.15': '1.19',
+        '1.16': '1.19',
+        '1.17': '1.19',
         }
 
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
                        marker=None, expected_attrs=None, use_slave=False,
-                       sort_keys=None, sort_dirs=None):
+                       sort_keys=None, sort_dirs=None, columns=None):
+        """Get the instances that match the filters.
+
+        If columns lists fields of Instance, only those are loaded from
+        the instances table and the others are lazy-loaded.
+        """
+        columns = _expected_columns(columns)
         if sort_keys or sort_dirs:
             db_inst_list = db.instance_get_all_by_filters_sort(
                 context, filters, limit=limit, marker=marker,
                 columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs)
+                use_slave=use_slave, sort_keys=sort_keys, sort_dirs=sort_dirs,
+                columns=columns)
         else:
             db_inst_list = db.instance_get_all_by_filters(
                 context, filters, sort_key, sort_dir, limit=limit,
                 marker=marker, columns_to_join=_expected_cols(expected_attrs),
-                use_slave=use_slave)
+                use_slave=use_slave, columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
+
+    @classmethod
+    def iter_by_filters(cls, context, filters,
+                        sort_key='created_at', sort_dir='desc', limit=None,
+                        marker=None, expected_attrs=None, use_slave=False,
+                        sort_keys=None, sort_dirs=None, chunk_size=1000,
+                        columns=None):
+        """Iterate over the instances that match the filters of
+        get_by_filters, loading chunk_size instances at a time.
+
+        Through the conductor, each chunk is a call to get_by_filters, with
+        the last instance of the previous chunk as marker.
+        """
+        sort_keys = sort_keys or [sort_key]
+        sort_dirs = sort_dirs or [sort_dir]
+        if cls.indirection_api:
+            chunks = cls._get_chunks_by_filters(
+                context, filters, limit, marker, expected_attrs, use_slave,
+                sort_keys, sort_dirs, chunk_size, columns)
+        else:
+            columns = _expected_columns(columns)
+            chunks = (
+                _make_instance_list(context, cls(), db_inst_list,
+                                    expected_attrs and list(expected_attrs),
+                                    columns=columns)
+                for db_inst_list in db.instance_get_all_by_filters_chunked(
+                    context, filters, chunk_size, limit=limit,
+                    marker=marker,
+                    columns_to_join=_expected_cols(expected_attrs),
+                    use_slave=use_slave, sort_keys=sort_keys,
+                    sort_dirs=sort_dirs, columns=columns))
+        for chunk in chunks:
+            for instance in chunk:
+                yield instance
+
+    @classmethod
+    def _get_chunks_by_filters(cls, context, filters, limit, marker,
+                               expected_attrs, use_slave, sort_keys,
+                               sort_dirs, chunk_size, columns):
+        while limit is None or limit > 0:
+            chunk_limit = (chunk_size if limit is None
+                           else min(chunk_size, limit))
+            chunk = cls.get_by_filters(
+                context, filters, limit=chunk_limit, marker=marker,
+                expected_attrs=expected_attrs and list(expected_attrs),
+                use_slave=use_slave, sort_keys=sort_keys,
+                sort_dirs=sort_dirs, columns=columns)
+            yield chunk
+            if len(chunk) < chunk_limit:
+                return
+            marker = chunk[-1].uuid
+            if limit is not None:
+                limit -= len(chunk)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False):
+    def get_by_host(cls, context, host, expected_attrs=None, use_slave=False,
+                    columns=None):
+        """Get the instances of a host.
+
+        If columns lists fields of Instance, only those are loaded from
+        the instances table and the others are lazy-loaded.
+        """
+        columns = _expected_columns(columns)
         db_inst_list = db.instance_get_all_by_host(
             context, host, columns_to_join=_expected_cols(expected_attrs),
-            use_slave=use_slave)
+            use_slave=use_slave, columns=columns)
         return _make_instance_list(context, cls(), db_inst_list,
-                                   expected_attrs)
+                                   expected_attrs, columns=columns)
 
     @base.remotable_classmethod
     def get_by_host_and_node(cls, context, host, node, expected_attrs=None):
@@ -1218,6 +1380,69 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
     def get_by_security_group(cls, context, security_group):
         return cls.get_by_security_group_id(context, security_group.id)
 
+    @base.remotable
+    def save_all(self, context, expected_vm_state=None,
+                 expected_task_state=None):
+        """Save the updates of all the instances of the list at once.
+
+        The object fields of each instance are saved as by Instance.save()
+        and the columns of all the instances are updated in one transaction.
+        If expected_vm_state or expected_task_state is provided, it is
+        checked against the in-database copy of each instance, and an
+        instance in another state is not updated and keeps its changes,
+        whereas the other instances are updated.
+
+        :param:context: Security context
+        :param:expected_vm_state: Optional tuple of valid vm states for the
+        instances to be in
+        :param:expected_task_state: Optional tuple of valid task states for
+        the instances to be in
+        :returns: A dict of the reasons why instances were not updated, by
+                  instance uuid.
+        """
+        conflicts = {}
+        if cells_opts.get_cell_type() == 'api':
+            # NOTE: The updates from the API cell are sent to the child
+            # cells instance by instance.
+            for instance in self:
+                try:
+                    instance.save(expected_vm_state=expected_vm_state,
+                                  expected_task_state=expected_task_state)
+                except (exception.InstanceNotFound,
+                        exception.UnexpectedTaskStateError,
+                        exception.UnexpectedVMStateError,
+                        exception.InstanceExists) as e:
+                    conflicts[instance.uuid] = e.format_message()
+            return conflicts
+
+        updates_by_uuid = {}
+        expected_attrs_by_uuid = {}
+        for instance in self:
+            updates = instance._save_updates(context, expected_vm_state,
+                                             expected_task_state)
+            if updates:
+                updates_by_uuid[instance.uuid] = updates
+                expected_attrs_by_uuid[instance.uuid] = (
+                    instance._save_expected_attrs())
+        if not updates_by_uuid:
+            return conflicts
+
+        columns_to_join = set()
+        for expected_attrs in expected_attrs_by_uuid.values():
+            columns_to_join.update(_expected_cols(expected_attrs) or [])
+        updated, db_conflicts = db.instance_bulk_update(
+            context, updates_by_uuid, columns_to_join=list(columns_to_join))
+
+        for instance in self:
+            if instance.uuid in updated:
+                old_ref, inst_ref = updated[instance.uuid]
+                instance._save_updated(context, old_ref, inst_ref,
+                                       expected_attrs_by_uuid[instance.uuid])
+            elif instance.uuid in db_conflicts:
+                conflicts[instance.uuid] = (
+                    db_conflicts[instance.uuid].format_message())
+        return conflicts
+
     def fill_faults(self):
         """Batch query the database for our instances' faults.
 
@@ -96,18 +96,22 @@ class InstanceAction(base.NovaPersistentObject, base.NovaObject,
 class InstanceActionList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     #              InstanceAction <= version 1.1
-    VERSION = '1.0'
+    # Version 1.1: Added limit and marker to get_by_instance_uuid
+    VERSION = '1.1'
     fields = {
         'objects': fields.ListOfObjectsField('InstanceAction'),
         }
     child_versions = {
         '1.0': '1.1',
         # NOTE(danms): InstanceAction was at 1.1 before we added this
+        '1.1': '1.1',
         }
 
     @base.remotable_classmethod
-    def get_by_instance_uuid(cls, context, instance_uuid):
-        db_actions = db.actions_get(context, instance_uuid)
+    def get_by_instance_uuid(cls, context, instance_uuid, limit=None,
+                             marker=None):
+        db_actions = db.actions_get(context, instance_uuid, limit=limit,
+                                    marker=marker)
         return base.obj_make_list(context, cls(), InstanceAction, db_actions)
 
 
@@ -84,7 +84,9 @@ class MigrationList(base.ObjectListBase, base.NovaObject):
     # Version 1.0: Initial version
     #              Migration <= 1.1
     # Version 1.1: Added use_slave to get_unconfirmed_by_dest_compute
-    VERSION = '1.1'
+    # Version 1.2: Added limit, marker, sort_keys and sort_dirs to
+    #              get_by_filters
+    VERSION = '1.2'
 
     fields = {
         'objects': fields.ListOfObjectsField('Migration'),
@@ -93,6 +95,7 @@ class MigrationList(base.ObjectListBase, base.NovaObject):
         '1.0': '1.1',
         # NOTE(danms): Migration was at 1.1 before we added this
         '1.1': '1.1',
+        '1.2': '1.1',
         }
 
     @base.remotable_classmethod
@@ -111,7 +114,10 @@ class MigrationList(base.ObjectListBase, base.NovaObject):
                                   db_migrations)
 
     @base.remotable_classmethod
-    def get_by_filters(cls, context, filters):
-        db_migrations = db.migration_get_all_by_filters(context, filters)
+    def get_by_filters(cls, context, filters, limit=None, marker=None,
+                       sort_keys=None, sort_dirs=None):
+        db_migrations = db.migration_get_all_by_filters(
+            context, filters, limit=limit, marker=marker,
+            sort_keys=sort_keys, sort_dirs=sort_dirs)
         return base.obj_make_list(context, cls(context), objects.Migration,
                                   db_migrations)
@@ -63,6 +63,10 @@ class PciAddress(object):
         self.func = ANY
         self.is_physical_function = is_physical_function
         self._init_address_fields(pci_addr)
+        # The fields to match, None matching any value
+        self._fields = tuple(None if field == ANY else field
+                             for field in (self.domain, self.bus,
+                                           self.slot, self.func))
 
     def _check_physical_function(self):
         if ANY in (self.domain, self.bus, self.slot, self.func):
@@ -109,20 +113,16 @@ class PciAddress(object):
         if self.is_physical_function:
             if not pci_phys_addr:
                 return False
-            domain, bus, slot, func = (
+            return self.match_fields(
                 utils.get_pci_address_fields(pci_phys_addr))
-            return (self.domain == domain and self.bus == bus and
-                    self.slot == slot and self.func == func)
-        else:
-            domain, bus, slot, func = (
-                utils.get_pci_address_fields(pci_addr))
-            conditions = [
-                self.domain in (ANY, domain),
-                self.bus in (ANY, bus),
-                self.slot in (ANY, slot),
-                self.func in (ANY, func)
-            ]
-            return all(conditions)
+        return self.match_fields(utils.get_pci_address_fields(pci_addr))
+
+    def match_fields(self, address_fields):
+        """Match the (domain, bus, slot, func) fields of an address."""
+        for field, value in zip(self._fields, address_fields):
+            if field is not None and field != value:
+                return False
+        return True
 
 
 class PciDeviceSpec(object):
@@ -156,13 +156,10 @@ class PciDeviceSpec(object):
         self.address = PciAddress(self.address, pf)
 
     def match(self, dev_dict):
-        conditions = [
-            self.vendor_id in (ANY, dev_dict['vendor_id']),
-            self.product_id in (ANY, dev_dict['product_id']),
-            self.address.match(dev_dict['address'],
-                dev_dict.get('phys_function'))
-            ]
-        return all(conditions)
+        return (self.vendor_id in (ANY, dev_dict['vendor_id']) and
+                self.product_id in (ANY, dev_dict['product_id']) and
+                self.address.match(dev_dict['address'],
+                                   dev_dict.get('phys_function')))
 
     def match_pci_obj(self, pci_obj):
         if pci_obj.extra_info:
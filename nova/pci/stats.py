@@ -14,7 +14,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import copy
+import collections
 
 from oslo_log import log as logging
 
@@ -59,20 +59,32 @@ class PciDeviceStats(object):
         self.pools = [pci_pool.to_dict()
                       for pci_pool in stats] if stats else []
         self.pools.sort(self.pool_cmp)
+        self._index_pools()
 
-    def _equal_properties(self, dev, entry, matching_keys):
-        return all(dev.get(prop) == entry.get(prop)
-                   for prop in matching_keys)
+    @staticmethod
+    def _pool_properties(pool):
+        return frozenset((k, v) for k, v in pool.iteritems()
+                         if k not in ('count', 'devices'))
+
+    def _index_pools(self):
+        """Index the pools by their keys and by each of their properties.
+
+        The pools are looked up for every device added or removed and for
+        every request of every instance on every host by the scheduler, so
+        they are indexed rather than scanned. The index has to be rebuilt
+        whenever a pool is added or removed.
+        """
+        self._pools_by_properties = {}
+        self._pools_by_property = collections.defaultdict(list)
+        for pool in self.pools:
+            properties = self._pool_properties(pool)
+            self._pools_by_properties.setdefault(properties, pool)
+            for prop in properties:
+                self._pools_by_property[prop].append(pool)
 
     def _find_pool(self, dev_pool):
         """Return the first pool that matches dev."""
-        for pool in self.pools:
-            pool_keys = pool.copy()
-            del pool_keys['count']
-            del pool_keys['devices']
-            if (len(pool_keys.keys()) == len(dev_pool.keys()) and
-                self._equal_properties(dev_pool, pool_keys, dev_pool.keys())):
-                return pool
+        return self._pools_by_properties.get(frozenset(dev_pool.iteritems()))
 
     def _create_pool_keys_from_dev(self, dev):
         """create a stats pool dict that this dev is supposed to be part of
@@ -101,6 +113,7 @@ class PciDeviceStats(object):
                 dev_pool['devices'] = []
                 self.pools.append(dev_pool)
                 self.pools.sort(self.pool_cmp)
+                self._index_pools()
                 pool = dev_pool
             pool['count'] += 1
             pool['devices'].append(dev)
@@ -109,14 +122,14 @@ class PciDeviceStats(object):
     def _decrease_pool_count(pool_list, pool, count=1):
         """Decrement pool's size by count.
 
-        If pool becomes empty, remove pool from pool_list.
+        If pool becomes empty, remove pool from pool_list and return the
+        count left to decrement, or None if the pool was not emptied.
         """
         if pool['count'] > count:
             pool['count'] -= count
-            count = 0
-        else:
-            count -= pool['count']
-            pool_list.remove(pool)
+            return None
+        count -= pool['count']
+        pool_list.remove(pool)
         return count
 
     def remove_device(self, dev):
@@ -128,7 +141,8 @@ class PciDeviceStats(object):
                 raise exception.PciDevicePoolEmpty(
                     compute_node_id=dev.compute_node_id, address=dev.address)
             pool['devices'].remove(dev)
-            self._decrease_pool_count(self.pools, pool)
+            if self._decrease_pool_count(self.pools, pool) is not None:
+                self._index_pools()
 
     def get_free_devs(self):
         free_devs = []
@@ -143,7 +157,7 @@ class PciDeviceStats(object):
             spec = request.spec
             # For now, keep the same algorithm as during scheduling:
             # a spec may be able to match multiple pools.
-            pools = self._filter_pools_for_spec(self.pools, spec)
+            pools = self._filter_pools_for_spec(spec)
             if numa_cells:
                 pools = self._filter_pools_for_numa_cells(pools, numa_cells)
             # Failed to allocate the required number of devices
@@ -174,9 +188,27 @@ class PciDeviceStats(object):
                     break
         return alloc_devices
 
-    @staticmethod
-    def _filter_pools_for_spec(pools, request_specs):
-        return [pool for pool in pools
+    def _filter_pools_for_spec(self, request_specs):
+        """Return the pools matching any of the specs, in the pools order."""
+        if len(request_specs) != 1:
+            return [pool for pool in self.pools
+                    if utils.pci_device_prop_match(pool, request_specs)]
+        spec = request_specs[0]
+        # Only the pools having the least common of the properties of the
+        # spec need to be matched against it
+        candidates = self.pools
+        for prop in spec.iteritems():
+            # NOTE: a spec matches the pools without a property it
+            # requires to be None
+            if prop[1] is None:
+                continue
+            try:
+                pools = self._pools_by_property.get(prop, [])
+            except TypeError:
+                continue
+            if len(pools) < len(candidates):
+                candidates = pools
+        return [pool for pool in candidates
                 if utils.pci_device_prop_match(pool, request_specs)]
 
     @staticmethod
@@ -191,19 +223,28 @@ class PciDeviceStats(object):
                                 pool, [{'numa_node': cell}])
                                               for cell in numa_cells)]
 
-    def _apply_request(self, pools, request, numa_cells=None):
+    def _apply_request(self, counts, request, numa_cells=None):
+        """Apply a request to the counts of the pools.
+
+        :param counts: dict of the counts left in the pools, by the id of
+                       the pools, which is updated if the request can be met
+        :returns: whether the request could be met
+        """
         count = request.count
-        matching_pools = self._filter_pools_for_spec(pools, request.spec)
+        matching_pools = self._filter_pools_for_spec(request.spec)
         if numa_cells:
             matching_pools = self._filter_pools_for_numa_cells(matching_pools,
                                                           numa_cells)
-        if sum([pool['count'] for pool in matching_pools]) < count:
+        free = [(pool, counts.get(id(pool), pool['count']))
+                for pool in matching_pools]
+        if sum(pool_count for pool, pool_count in free) < count:
             return False
-        else:
-            for pool in matching_pools:
-                count = self._decrease_pool_count(pools, pool, count)
-                if not count:
-                    break
+        for pool, pool_count in free:
+            consumed = min(pool_count, count)
+            counts[id(pool)] = pool_count - consumed
+            count -= consumed
+            if not count:
+                break
         return True
 
     def support_requests(self, requests, numa_cells=None):
@@ -217,9 +258,11 @@ class PciDeviceStats(object):
         """
         # note (yjiang5): this function has high possibility to fail,
         # so no exception should be triggered for performance reason.
-        pools = copy.deepcopy(self.pools)
-        return all([self._apply_request(pools, r, numa_cells)
-                        for r in requests])
+        # NOTE: the requests are applied to counts of the pools rather
+        # than to a copy of the pools and their devices.
+        counts = {}
+        return all(self._apply_request(counts, r, numa_cells)
+                   for r in requests)
 
     def apply_requests(self, requests, numa_cells=None):
         """Apply PCI requests to the PCI stats.
@@ -229,9 +272,16 @@ class PciDeviceStats(object):
         If numa_cells is provided then only devices contained in
         those nodes are considered.
         """
-        if not all([self._apply_request(self.pools, r, numa_cells)
-                                            for r in requests]):
+        counts = {}
+        if not all(self._apply_request(counts, r, numa_cells)
+                   for r in requests):
             raise exception.PciDeviceRequestFailed(requests=requests)
+        for pool in list(self.pools):
+            if id(pool) in counts:
+                pool['count'] = counts[id(pool)]
+                if not pool['count']:
+                    self.pools.remove(pool)
+        self._index_pools()
 
     @staticmethod
     def pool_cmp(dev1, dev2):
@@ -248,3 +298,4 @@ class PciDeviceStats(object):
     def clear(self):
         """Clear all the stats maintained."""
         self.pools = []
+        self._index_pools()
@@ -21,6 +21,7 @@ from oslo_serialization import jsonutils
 from nova import exception
 from nova.i18n import _
 from nova.pci import devspec
+from nova.pci import utils
 
 pci_opts = [cfg.MultiStrOpt('pci_passthrough_whitelist',
                             default=[],
@@ -89,24 +90,83 @@ class PciHostDevicesWhiteList(object):
             self.specs = self._parse_white_list_from_config(whitelist_spec)
         else:
             self.specs = []
+        self._compile()
+
+    def _compile(self):
+        """Index the specs by their vendor and product ids.
+
+        The specs matching the ids of a device are the ones indexed by
+        these ids or by wildcards, so only those are matched against the
+        address of the device, in the order they were configured in.
+        """
+        self._specs_by_ids = {}
+        for spec in self.specs:
+            self._specs_by_ids.setdefault(
+                (spec.vendor_id, spec.product_id), []).append(spec)
+        self._candidates = {}
+
+    def _candidate_specs(self, vendor_id, product_id):
+        ids = (vendor_id, product_id)
+        specs = self._candidates.get(ids)
+        if specs is None:
+            specs = []
+            for key in ((vendor_id, product_id),
+                        (vendor_id, devspec.ANY),
+                        (devspec.ANY, product_id),
+                        (devspec.ANY, devspec.ANY)):
+                specs.extend(self._specs_by_ids.get(key, []))
+            if len(specs) > 1:
+                specs.sort(key=self.specs.index)
+            self._candidates[ids] = specs
+        return specs
+
+    def _match(self, vendor_id, product_id, address, phys_function):
+        specs = self._candidate_specs(vendor_id, product_id)
+        if not specs:
+            return
+        address_fields = utils.get_pci_address_fields(address)
+        phys_fields = None
+        for spec in specs:
+            if spec.address.is_physical_function:
+                if not phys_function:
+                    continue
+                if phys_fields is None:
+                    phys_fields = utils.get_pci_address_fields(phys_function)
+                if spec.address.match_fields(phys_fields):
+                    return spec
+            elif spec.address.match_fields(address_fields):
+                return spec
 
     def device_assignable(self, dev):
         """Check if a device can be assigned to a guest.
 
         :param dev: A dictionary describing the device properties
         """
-        for spec in self.specs:
-            if spec.match(dev):
-                return spec
+        return self._match(dev['vendor_id'], dev['product_id'],
+                           dev['address'], dev.get('phys_function'))
 
     def get_devspec(self, pci_dev):
-        for spec in self.specs:
-            if spec.match_pci_obj(pci_dev):
-                return spec
+        if pci_dev.extra_info:
+            phys_function = pci_dev.extra_info.get('phys_function')
+        else:
+            phys_function = None
+        return self._match(pci_dev.vendor_id, pci_dev.product_id,
+                           pci_dev.address, phys_function)
+
+
+# The last parsed pci_passthrough_whitelist config and its white list
+_white_list = (None, None)
 
 
 def get_pci_devices_filter():
-    return PciHostDevicesWhiteList(CONF.pci_passthrough_whitelist)
+    global _white_list
+
+    spec = tuple(CONF.pci_passthrough_whitelist)
+    parsed_spec, white_list = _white_list
+    if white_list is None or parsed_spec != spec:
+        white_list = PciHostDevicesWhiteList(CONF.pci_passthrough_whitelist)
+        _white_list = (spec, white_list)
+    return white_list
 
 
 def get_pci_device_devspec(pci_dev):
@@ -57,5 +57,8 @@ class SchedulerClient(object):
     def delete_aggregate(self, context, aggregate):
         self.queryclient.delete_aggregate(context, aggregate)
 
+    def get_profiling_stats(self, context, host=None):
+        return self.queryclient.get_profiling_stats(context, host=host)
+
     def update_resource_stats(self, context, name, stats):
         self.reportclient.update_resource_stats(context, name, stats)
@@ -49,3 +49,11 @@ class SchedulerQueryClient(object):
         :type aggregate: :class:`nova.objects.Aggregate`
         """
         self.scheduler_rpcapi.delete_aggregate(context, aggregate)
+
+    def get_profiling_stats(self, context, host=None):
+        """Returns the rolling statistics of the time spent and hosts
+        handled by each filter and weigher of a scheduler.
+
+        :param host: Scheduler host to ask, any of them if not set
+        """
+        return self.scheduler_rpcapi.get_profiling_stats(context, host=host)
@@ -44,10 +44,35 @@ filter_scheduler_opts = [
                     'chosen from. A value of 1 chooses the '
                     'first host returned by the weighing functions. '
                     'This value must be at least 1. Any value less than 1 '
-                    'will be ignored, and 1 will be used instead')
+                    'will be ignored, and 1 will be used instead'),
+    cfg.BoolOpt('scheduler_batch_placement',
+                default=False,
+                help='When a request asks for multiple instances, filter '
+                     'and weigh all the hosts only once, and then only '
+                     'filter and weigh again the host picked for the '
+                     'previous instance. All the hosts are filtered again '
+                     'when a filter says consuming a host can change its '
+                     'result for the others. Weighers must weigh each host '
+                     'independently from the other hosts.'),
+    cfg.BoolOpt('scheduler_optimistic_claims',
+                default=False,
+                help='Claim the resources of each selected host on its '
+                     'compute node record, the update only succeeding if '
+                     'the record did not change since the host was last '
+                     'refreshed. On a conflict, like another scheduler '
+                     'worker claiming the same host, the host is refreshed '
+                     'and another selection is made locally, instead of '
+                     'the instance being rescheduled by the compute node.'),
+    cfg.IntOpt('scheduler_claim_retries',
+               default=10,
+               help='Number of conflicting claims tolerated for each '
+                    'instance before giving up on it, when optimistic '
+                    'claims are enabled.'),
 ]
 
 CONF.register_opts(filter_scheduler_opts)
+CONF.import_opt('scheduler_profiling_notifications',
+                'nova.scheduler.profiling')
 
 
 class FilterScheduler(driver.Scheduler):
@@ -63,8 +88,19 @@ class FilterScheduler(driver.Scheduler):
                            dict(request_spec=request_spec))
 
         num_instances = request_spec['num_instances']
-        selected_hosts = self._schedule(context, request_spec,
-                                        filter_properties)
+        profiler = self.host_manager.profiler
+        if profiler is None:
+            selected_hosts = self._schedule(context, request_spec,
+                                            filter_properties)
+        else:
+            with profiler.profile_request() as profile:
+                selected_hosts = self._schedule(context, request_spec,
+                                                filter_properties)
+            if CONF.scheduler_profiling_notifications:
+                self.notifier.info(context,
+                                   'scheduler.select_destinations.profile',
+                                   dict(request_spec=request_spec,
+                                        profile=profile.to_dict()))
 
         # Couldn't fulfill the request_spec
         if len(selected_hosts) < num_instances:
@@ -108,8 +144,6 @@ class FilterScheduler(driver.Scheduler):
         instance_properties = request_spec['instance_properties']
         instance_type = request_spec.get("instance_type", None)
 
-        update_group_hosts = filter_properties.get('group_updated', False)
-
         config_options = self._get_configuration_options()
 
         filter_properties.update({'context': context,
@@ -130,47 +164,199 @@ class FilterScheduler(driver.Scheduler):
         # are being scanned in a filter or weighing function.
         hosts = self._get_all_host_states(elevated)
 
-        selected_hosts = []
         num_instances = request_spec.get('num_instances', 1)
+        if CONF.scheduler_batch_placement and num_instances > 1:
+            return self._schedule_batched(elevated, hosts,
+                                          instance_properties,
+                                          filter_properties, num_instances)
+
+        selected_hosts = []
         for num in xrange(num_instances):
-            # Filter local hosts based on requirements ...
-            hosts = self.host_manager.get_filtered_hosts(hosts,
-                    filter_properties, index=num)
-            if not hosts:
+            hosts, chosen_host = self._choose_host(elevated, hosts,
+                    instance_properties, filter_properties, num)
+            if chosen_host is None:
                 # Can't get any more locally.
                 break
+            selected_hosts.append(chosen_host)
+
+            # Now consume the resources so the filter/weights
+            # will change for the next instance.
+            self._consume_host(chosen_host.obj, instance_properties,
+                               filter_properties)
+        return selected_hosts
+
+    def _choose_host(self, context, hosts, instance_properties,
+                     filter_properties, index):
+        """Filter and weigh the hosts for the "index-th" instance of a
+        request and choose one of the best, claiming it when optimistic
+        claims are enabled.
 
+        Returns the hosts passing the filters, and the chosen WeighedHost
+        or None if no host could be chosen.
+        """
+        # Filter local hosts based on requirements ...
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=index)
+        conflicts = 0
+        while hosts:
             LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
 
+            scheduler_host_subset_size = self._get_host_subset_size()
+
+            # Only the subset the host is chosen from needs to be sorted
             weighed_hosts = self.host_manager.get_weighed_hosts(hosts,
-                    filter_properties)
+                    filter_properties, limit=scheduler_host_subset_size)
 
             LOG.debug("Weighed %(hosts)s", {'hosts': weighed_hosts})
 
-            scheduler_host_subset_size = CONF.scheduler_host_subset_size
             if scheduler_host_subset_size > len(weighed_hosts):
                 scheduler_host_subset_size = len(weighed_hosts)
-            if scheduler_host_subset_size < 1:
-                scheduler_host_subset_size = 1
 
             chosen_host = random.choice(
                 weighed_hosts[0:scheduler_host_subset_size])
             LOG.debug("Selected host: %(host)s", {'host': chosen_host})
+            if self._claim_host(context, chosen_host.obj,
+                                instance_properties):
+                return hosts, chosen_host
+
+            conflicts += 1
+            if conflicts > CONF.scheduler_claim_retries:
+                break
+            if not self._host_passes(chosen_host.obj, filter_properties,
+                                     index):
+                hosts = [host for host in hosts
+                         if host is not chosen_host.obj]
+        return hosts, None
+
+    def _schedule_batched(self, context, hosts, instance_properties,
+                          filter_properties, num_instances):
+        """Select hosts for multiple instances like _schedule() does, but
+        only filtering and weighing all the hosts once.
+
+        The weighed hosts are kept in a heap. Once a host was picked and
+        consumed for an instance, only that host is filtered and weighed
+        again for the next one, as the results of the filters and the raw
+        weights of the other hosts didn't change. All the hosts are only
+        filtered again when a filter says they are all dirty, like the
+        group affinity filter once the first host of the group is picked.
+        """
+        hosts = self.host_manager.get_filtered_hosts(hosts,
+                filter_properties, index=0)
+        if not hosts:
+            return []
+
+        LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+
+        heap = self.host_manager.get_weighed_host_heap(hosts,
+                filter_properties)
+        scheduler_host_subset_size = self._get_host_subset_size()
+
+        selected_hosts = []
+        for num in xrange(num_instances):
+            chosen_host = self._pop_host(context, heap,
+                    scheduler_host_subset_size, instance_properties,
+                    filter_properties, num)
+            if chosen_host is None:
+                # Can't get any more locally.
+                break
             selected_hosts.append(chosen_host)
 
-            # Now consume the resources so the filter/weights
-            # will change for the next instance.
-            chosen_host.obj.consume_from_instance(instance_properties)
-            if update_group_hosts is True:
-                # NOTE(sbauza): Group details are serialized into a list now
-                # that they are populated by the conductor, we need to
-                # deserialize them
-                if isinstance(filter_properties['group_hosts'], list):
-                    filter_properties['group_hosts'] = set(
-                        filter_properties['group_hosts'])
-                filter_properties['group_hosts'].add(chosen_host.obj.host)
+            # NOTE: Filters have to be asked before consuming, as the
+            # consumption updates the group hosts.
+            all_dirty = self.host_manager.all_hosts_dirty_on_consume(
+                filter_properties, num + 1)
+            self._consume_host(chosen_host.obj, instance_properties,
+                               filter_properties)
+            if num == num_instances - 1:
+                break
+
+            if all_dirty:
+                hosts = self.host_manager.get_filtered_hosts(heap.objs(),
+                        filter_properties, index=num + 1) or []
+                LOG.debug("Filtered %(hosts)s", {'hosts': hosts})
+                heap.retain(hosts)
+                passes = any(host is chosen_host.obj for host in hosts)
+            else:
+                passes = bool(self.host_manager.get_filtered_hosts(
+                        [chosen_host.obj], filter_properties,
+                        index=num + 1))
+            if passes:
+                heap.reweigh(chosen_host.obj)
+            else:
+                heap.discard(chosen_host.obj)
         return selected_hosts
 
+    def _pop_host(self, context, heap, scheduler_host_subset_size,
+                  instance_properties, filter_properties, index):
+        """Take one of the best hosts out of a heap of weighed hosts for the
+        "index-th" instance of a request, claiming it when optimistic claims
+        are enabled.
+
+        Returns the chosen WeighedHost, or None if no host could be chosen.
+        """
+        conflicts = 0
+        while heap:
+            best_hosts = heap.pop(scheduler_host_subset_size)
+            LOG.debug("Weighed %(hosts)s", {'hosts': best_hosts})
+            chosen_host = random.choice(best_hosts)
+            for weighed_host in best_hosts:
+                if weighed_host is not chosen_host:
+                    heap.push(weighed_host)
+            LOG.debug("Selected host: %(host)s", {'host': chosen_host})
+            if self._claim_host(context, chosen_host.obj,
+                                instance_properties):
+                return chosen_host
+
+            conflicts += 1
+            if self._host_passes(chosen_host.obj, filter_properties, index):
+                heap.reweigh(chosen_host.obj)
+            else:
+                heap.discard(chosen_host.obj)
+            if conflicts > CONF.scheduler_claim_retries:
+                break
+        return None
+
+    def _claim_host(self, context, host_state, instance_properties):
+        """Claim the resources of an instance on a chosen host, if
+        optimistic claims are enabled. Returns False on a conflict, once the
+        host was refreshed.
+        """
+        if not CONF.scheduler_optimistic_claims:
+            return True
+        return self.host_manager.claim_host(context, host_state,
+                                            instance_properties)
+
+    def _host_passes(self, host_state, filter_properties, index):
+        """Return True if a host refreshed after a conflicting claim is still
+        known and still passes the filters for the "index-th" instance.
+        """
+        host_manager = self.host_manager
+        state_key = (host_state.host, host_state.nodename)
+        if host_manager.host_state_map.get(state_key) is not host_state:
+            return False
+        return bool(host_manager.get_filtered_hosts([host_state],
+                filter_properties, index=index))
+
+    def _get_host_subset_size(self):
+        """Return the number of best hosts a host is chosen from."""
+        scheduler_host_subset_size = CONF.scheduler_host_subset_size
+        if scheduler_host_subset_size < 1:
+            scheduler_host_subset_size = 1
+        return scheduler_host_subset_size
+
+    def _consume_host(self, host_state, instance_properties,
+                      filter_properties):
+        """Consume the resources of a host picked for an instance."""
+        host_state.consume_from_instance(instance_properties)
+        if filter_properties.get('group_updated', False) is True:
+            # NOTE(sbauza): Group details are serialized into a list now
+            # that they are populated by the conductor, we need to
+            # deserialize them
+            if isinstance(filter_properties['group_hosts'], list):
+                filter_properties['group_hosts'] = set(
+                    filter_properties['group_hosts'])
+            filter_properties['group_hosts'].add(host_state.host)
+
     def _get_all_host_states(self, context):
         """Template method, so a subclass can implement caching."""
         return self.host_manager.get_all_host_states(context)
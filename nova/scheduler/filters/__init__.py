@@ -17,11 +17,18 @@
 Scheduler host filters
 """
 
+import operator
+
 from nova import filters
 
 
 class BaseHostFilter(filters.BaseFilter):
     """Base class for host filters."""
+
+    # NOTE: host_passes() only looks at one host. Filters overriding
+    # filter_all() must unset this if they look at the other hosts.
+    stateless = True
+
     def _filter_one(self, obj, filter_properties):
         """Return True if the object passes the filter, otherwise False."""
         return self.host_passes(obj, filter_properties)
@@ -38,6 +45,18 @@ class HostFilterHandler(filters.BaseFilterHandler):
         super(HostFilterHandler, self).__init__(BaseHostFilter)
 
 
+class HostFilterResultCache(filters.FilterResultCache):
+    """Cache of the results of cacheable filters for each HostState."""
+    def __init__(self, max_size):
+        super(HostFilterResultCache, self).__init__(
+            operator.attrgetter('host', 'nodename'), max_size)
+
+
+class HostFilterOrder(filters.FilterOrder):
+    """Order of the host filters adapted to their cost and selectivity."""
+    pass
+
+
 def all_filters():
     """Return a list of filter classes found in this directory.
 
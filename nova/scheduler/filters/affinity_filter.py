@@ -144,6 +144,12 @@ class _GroupAffinityFilter(AffinityFilter):
         # No groups configured
         return True
 
+    def dirty_on_consume(self, filter_properties):
+        # The first host picked for the group becomes the only one passing
+        policies = filter_properties.get('group_policies', [])
+        return (self.policy_name in policies and
+                not filter_properties.get('group_hosts'))
+
 
 class ServerGroupAffinityFilter(_GroupAffinityFilter):
     def __init__(self):
@@ -39,6 +39,14 @@ class AggregateImagePropertiesIsolation(filters.BaseHostFilter):
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
 
+    # The aggregates of a host don't change between requests
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        spec = filter_properties.get('request_spec', {})
+        image_props = spec.get('image', {}).get('properties', {})
+        return utils.fingerprint(image_props)
+
     def host_passes(self, host_state, filter_properties):
         """Checks a host in an aggregate that metadata key/value match
         with image properties.
@@ -32,6 +32,15 @@ class AggregateInstanceExtraSpecsFilter(filters.BaseHostFilter):
     # Aggregate data and instance type does not change within a request
     run_filter_once_per_request = True
 
+    # The aggregates of a host don't change between requests
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if 'extra_specs' not in instance_type:
+            return None
+        return utils.fingerprint(instance_type['extra_specs'])
+
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can create instance_type
 
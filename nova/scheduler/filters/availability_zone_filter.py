@@ -36,6 +36,14 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
     # Availability zones do not change within a request
     run_filter_once_per_request = True
 
+    # The aggregates of a host don't change between requests
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        spec = filter_properties.get('request_spec', {})
+        props = spec.get('instance_properties', {})
+        return props.get('availability_zone') or None
+
     def host_passes(self, host_state, filter_properties):
         spec = filter_properties.get('request_spec', {})
         props = spec.get('instance_properties', {})
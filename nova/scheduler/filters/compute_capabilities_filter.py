@@ -19,6 +19,7 @@ import six
 
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
+from nova.scheduler.filters import utils
 
 
 LOG = logging.getLogger(__name__)
@@ -30,6 +31,25 @@ class ComputeCapabilitiesFilter(filters.BaseHostFilter):
     # Instance type and host capabilities do not change within a request
     run_filter_once_per_request = True
 
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        instance_type = filter_properties.get('instance_type')
+        if 'extra_specs' not in instance_type:
+            return None
+        for key in instance_type['extra_specs']:
+            scope = key.split(':')
+            if len(scope) > 1:
+                if scope[0] != "capabilities":
+                    continue
+                else:
+                    del scope[0]
+            # Extra specs can also match the resources of the host, which
+            # change between requests
+            if scope[0] not in utils.CAPABILITY_ATTRS:
+                return None
+        return utils.fingerprint(instance_type['extra_specs'])
+
     def _get_capabilities(self, host_state, scope):
         cap = host_state
         for index in range(0, len(scope)):
@@ -41,6 +41,16 @@ class ImagePropertiesFilter(filters.BaseHostFilter):
     # a request
     run_filter_once_per_request = True
 
+    # The supported instances of a host don't change between requests
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        spec = filter_properties.get('request_spec', {})
+        image_props = spec.get('image', {}).get('properties', {})
+        return tuple(image_props.get(key) for key in
+                     ('architecture', 'hypervisor_type', 'vm_mode',
+                      'hypervisor_version_requires'))
+
     def _instance_supported(self, host_state, image_props,
                             hypervisor_version):
         img_arch = image_props.get('architecture', None)
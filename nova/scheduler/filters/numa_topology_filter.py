@@ -11,6 +11,7 @@
 #    under the License.
 
 from oslo_config import cfg
+import six
 
 from nova.scheduler import filters
 from nova.virt import hardware
@@ -23,37 +24,88 @@ CONF.import_opt('ram_allocation_ratio', 'nova.scheduler.filters.ram_filter')
 class NUMATopologyFilter(filters.BaseHostFilter):
     """Filter on requested NUMA topology."""
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        # NOTE: The requested topology is only built once per request, and
+        # the hosts reporting the same NUMA topology share its fit.
+        requested_topology = self._requested_topology(filter_properties)
+        fits = {}
+        for host_state in filter_obj_list:
+            if self._host_passes(host_state, filter_properties,
+                                 requested_topology, fits):
+                yield host_state
+
     def host_passes(self, host_state, filter_properties):
-        ram_ratio = CONF.ram_allocation_ratio
-        cpu_ratio = CONF.cpu_allocation_ratio
+        return self._host_passes(host_state, filter_properties,
+                                 self._requested_topology(filter_properties),
+                                 {})
+
+    @staticmethod
+    def _requested_topology(filter_properties):
         request_spec = filter_properties.get('request_spec', {})
         instance = request_spec.get('instance_properties', {})
-        requested_topology = hardware.instance_topology_from_instance(instance)
-        host_topology, _fmt = hardware.host_topology_and_format_from_host(
-                host_state)
+        return hardware.instance_topology_from_instance(instance)
+
+    def _host_passes(self, host_state, filter_properties, requested_topology,
+                     fits):
+        """Fit the requested topology onto the host
+
+        :param fits: the host topologies, limits and fitted instance
+                     topologies found so far, by serialized host topology
+        """
+        if not requested_topology:
+            return True
         pci_requests = filter_properties.get('pci_requests')
         if pci_requests:
             pci_requests = pci_requests.requests
-        if requested_topology and host_topology:
-            limit_cells = []
-            for cell in host_topology.cells:
-                max_cell_memory = int(cell.memory * ram_ratio)
-                max_cell_cpu = len(cell.cpuset) * cpu_ratio
-                limit_cells.append(hardware.VirtNUMATopologyCellLimit(
-                    cell.id, cell.cpuset, cell.memory,
-                    max_cell_cpu, max_cell_memory))
-            limits = hardware.VirtNUMALimitTopology(cells=limit_cells)
-            instance_topology = (hardware.numa_fit_instance_to_host(
+
+        key = host_state.numa_topology
+        if not isinstance(key, six.string_types):
+            key = None
+        if key in fits:
+            host_topology, limits, instance_topology = fits[key]
+        else:
+            host_topology, _fmt = hardware.host_topology_and_format_from_host(
+                    host_state)
+            limits = instance_topology = None
+            if host_topology:
+                limits = self._limits(host_topology)
+                if host_state.numa_capacities is None:
+                    host_state.numa_capacities = (
+                        hardware.numa_cell_capacities(host_topology))
+                if not pci_requests:
+                    instance_topology = hardware.numa_fit_instance_to_host(
                         host_topology, requested_topology,
                         limits_topology=limits,
-                        pci_requests=pci_requests,
-                        pci_stats=host_state.pci_stats))
-            if not instance_topology:
-                return False
-            host_state.limits['numa_topology'] = limits.to_json()
-            host_state.instance_numa_topology = instance_topology
-            return True
-        elif requested_topology:
+                        cell_capacities=host_state.numa_capacities)
+            if key is not None:
+                fits[key] = (host_topology, limits, instance_topology)
+        if not host_topology:
             return False
-        else:
-            return True
+
+        if pci_requests:
+            # NOTE: The PCI devices differ from a host to another, so the
+            # fit can't be shared.
+            instance_topology = hardware.numa_fit_instance_to_host(
+                    host_topology, requested_topology,
+                    limits_topology=limits,
+                    pci_requests=pci_requests,
+                    pci_stats=host_state.pci_stats,
+                    cell_capacities=host_state.numa_capacities)
+        if not instance_topology:
+            return False
+        host_state.limits['numa_topology'] = limits.to_json()
+        host_state.instance_numa_topology = instance_topology
+        return True
+
+    @staticmethod
+    def _limits(host_topology):
+        ram_ratio = CONF.ram_allocation_ratio
+        cpu_ratio = CONF.cpu_allocation_ratio
+        limit_cells = []
+        for cell in host_topology.cells:
+            max_cell_memory = int(cell.memory * ram_ratio)
+            max_cell_cpu = len(cell.cpuset) * cpu_ratio
+            limit_cells.append(hardware.VirtNUMATopologyCellLimit(
+                cell.id, cell.cpuset, cell.memory,
+                max_cell_cpu, max_cell_memory))
+        return hardware.VirtNUMALimitTopology(cells=limit_cells)
@@ -50,6 +50,12 @@ class AggregateTypeAffinityFilter(filters.BaseHostFilter):
     # Aggregate data does not change within a request
     run_filter_once_per_request = True
 
+    # The aggregates of a host don't change between requests
+    cacheable = True
+
+    def cache_key(self, filter_properties):
+        return filter_properties.get('instance_type')['name']
+
     def host_passes(self, host_state, filter_properties):
         instance_type = filter_properties.get('instance_type')
 
@@ -17,34 +17,114 @@
 import collections
 
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 
 from nova.i18n import _LI
 
 LOG = logging.getLogger(__name__)
 
 
+# Attributes of a HostState describing what the host is rather than the
+# resources it has available, which can only change when the compute node is
+# updated. The stats of the compute node are left out, as they hold the
+# number of instances and I/O operations which change with every build.
+CAPABILITY_ATTRS = ('host', 'nodename', 'host_ip', 'hypervisor_type',
+                    'hypervisor_version', 'hypervisor_hostname', 'cpu_info',
+                    'supported_instances')
+
+
+def capabilities(host_state):
+    """Returns the values of the capability attributes of a host."""
+    return [getattr(host_state, attr, None) for attr in CAPABILITY_ATTRS]
+
+
+def fingerprint(value):
+    """Returns a hashable fingerprint of a JSON-like value, to be used as
+    the cache key of a filter.
+    """
+    return jsonutils.dumps(value, sort_keys=True)
+
+
+class AggregateMetadata(object):
+    """Metadata of the aggregates of a host, merged on the first lookup so
+    that the next ones don't scan the aggregates.
+
+    The HostManager keeps one for each host until the aggregates of the
+    host change. The sets and dicts returned are shared and must not be
+    modified.
+    """
+
+    def __init__(self, aggregates):
+        self._aggregates = aggregates
+        self._values = None
+        self._metadata = None
+        # Merged metadata of the aggregates with each key, computed once
+        # asked for
+        self._metadata_by_key = {}
+
+    def _merge(self):
+        values = collections.defaultdict(set)
+        metadata = collections.defaultdict(set)
+        for aggr in self._aggregates:
+            for k, v in aggr.metadata.iteritems():
+                values[k].add(v)
+                metadata[k].update(value.strip() for value in v.split(','))
+        self._values = dict(values)
+        self._metadata = dict(metadata)
+
+    @property
+    def values(self):
+        """Dict of the set of the values of each key, as set on the
+        aggregates.
+        """
+        if self._values is None:
+            self._merge()
+        return self._values
+
+    @property
+    def metadata(self):
+        """Dict of the set of the values of each key, split on commas."""
+        if self._metadata is None:
+            self._merge()
+        return self._metadata
+
+    def get(self, key=None):
+        """Returns the merged metadata of all the aggregates, or of the
+        aggregates with the given key.
+        """
+        if key is None:
+            return self.metadata
+        if key not in self.metadata:
+            return {}
+        metadata = self._metadata_by_key.get(key)
+        if metadata is None:
+            metadata = AggregateMetadata(
+                [aggr for aggr in self._aggregates
+                 if key in aggr.metadata]).metadata
+            self._metadata_by_key[key] = metadata
+        return metadata
+
+
+def _aggregate_metadata(host_state):
+    metadata = getattr(host_state, 'aggregate_metadata', None)
+    if metadata is None:
+        # Not maintained by a HostManager
+        metadata = AggregateMetadata(host_state.aggregates)
+    return metadata
+
+
 def aggregate_values_from_key(host_state, key_name):
     """Returns a set of values based on a metadata key for a specific host."""
-    aggrlist = host_state.aggregates
-    aggregate_vals = set()
-    for aggr in aggrlist:
-        if key_name in aggr.metadata:
-            aggregate_vals.add(aggr.metadata[key_name])
-    return aggregate_vals
+    return set(_aggregate_metadata(host_state).values.get(key_name, ()))
 
 
 def aggregate_metadata_get_by_host(host_state, key=None):
-    """Returns a dict of all metadata for a specific host."""
-    aggrlist = host_state.aggregates
-    metadata = collections.defaultdict(set)
-    for aggr in aggrlist:
-        if key is not None and key not in aggr.metadata:
-            continue
-        for k, v in aggr.metadata.iteritems():
-            values = v.split(',')
-            for value in values:
-                metadata[k].add(value.strip())
-    return metadata
+    """Returns a dict of all metadata for a specific host.
+
+    If a key is given, only the aggregates with that key are considered.
+    The dict is shared and must not be modified.
+    """
+    return _aggregate_metadata(host_state).get(key)
 
 
 def validate_num_values(vals, default=None, cast_to=int, based_on=min):
@@ -25,6 +25,7 @@ from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
+import six
 
 from nova.compute import task_states
 from nova.compute import vm_states
@@ -34,6 +35,8 @@ from nova.i18n import _, _LI, _LW
 from nova import objects
 from nova.pci import stats as pci_stats
 from nova.scheduler import filters
+from nova.scheduler.filters import utils as filters_utils
+from nova.scheduler import profiling
 from nova.scheduler import weights
 from nova.virt import hardware
 
@@ -60,6 +63,22 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.IntOpt('scheduler_filter_cache_size',
+               default=256,
+               help='Maximum number of results of the filters only '
+                    'depending on the static attributes of a host, like '
+                    'its aggregates or capabilities, which are cached for '
+                    'each host. The cached results of a host are dropped '
+                    'when its capabilities or any aggregate change. A '
+                    'value less than 1 disables the cache.'),
+    cfg.BoolOpt('scheduler_adaptive_filter_order',
+                default=False,
+                help='Reorder the filters at runtime so that the ones '
+                     'measured as cheap and rejecting many hosts run '
+                     'first. Only the filters which look at each host '
+                     'independently are moved, so the filtered hosts are '
+                     'the same as with the order given in '
+                     'scheduler_default_filters or in the request.'),
     ]
 
 CONF = cfg.CONF
@@ -68,6 +87,14 @@ CONF.register_opts(host_manager_opts)
 LOG = logging.getLogger(__name__)
 
 
+def _compute_node_stamp(compute):
+    """Returns the naive UTC time a compute node record last changed."""
+    stamp = compute.updated_at or compute.created_at
+    if stamp is not None:
+        stamp = timeutils.normalize_time(stamp)
+    return stamp
+
+
 class ReadOnlyDict(UserDict.IterableUserDict):
     """A read-only dict."""
     def __init__(self, source=None):
@@ -119,6 +146,9 @@ class HostState(object):
         self.vcpus_total = 0
         self.vcpus_used = 0
         self.numa_topology = None
+        # Free resources of each NUMA cell, see
+        # hardware.numa_cell_capacities(), computed when first needed
+        self.numa_capacities = None
         self.instance_numa_topology = None
 
         # Additional host information from the compute node stats:
@@ -139,8 +169,14 @@ class HostState(object):
         # Generic metrics from compute nodes
         self.metrics = {}
 
-        # List of aggregates the host belongs to
+        # List of aggregates the host belongs to, and their merged metadata
         self.aggregates = []
+        self.aggregate_metadata = None
+
+        # ID and resource usage of the compute node record the host was last
+        # refreshed from or claimed on, which a claim expects to be unchanged
+        self.compute_id = None
+        self.compute_usage = None
 
         self.updated = None
         if compute:
@@ -170,11 +206,22 @@ class HostState(object):
             else:
                 LOG.warning(_LW("Metric name unknown of %r"), item)
 
+    def update_compute_usage(self, compute):
+        """Update the resource usage of the compute node record the next
+        claim expects from a ComputeNode object.
+        """
+        if compute.obj_attr_is_set('id'):
+            self.compute_id = compute.id
+        self.compute_usage = {'free_ram_mb': compute.free_ram_mb,
+                              'free_disk_gb': compute.free_disk_gb,
+                              'vcpus_used': compute.vcpus_used}
+
     def update_from_compute_node(self, compute):
         """Update information about a host from a ComputeNode object."""
         if (self.updated and compute.updated_at
                 and self.updated > compute.updated_at):
             return
+        self.update_compute_usage(compute)
         all_ram_mb = compute.memory_mb
 
         # Assume virtual size is all consumed by instances if use qcow2 disk.
@@ -202,6 +249,7 @@ class HostState(object):
         self.vcpus_used = compute.vcpus_used
         self.updated = compute.updated_at
         self.numa_topology = compute.numa_topology
+        self.numa_capacities = None
         self.instance_numa_topology = None
         if compute.pci_device_pools is not None:
             self.pci_stats = pci_stats.PciDeviceStats(
@@ -268,7 +316,12 @@ class HostState(object):
         # Calculate the numa usage
         instance['numa_topology'] = self.instance_numa_topology
         updated_numa_topology = hardware.get_host_numa_usage_from_instance(
-                self, instance)
+                self, instance, never_serialize_result=True)
+        if updated_numa_topology is not None:
+            self.numa_capacities = hardware.numa_cell_capacities(
+                updated_numa_topology)
+            if isinstance(self.numa_topology, six.string_types):
+                updated_numa_topology = updated_numa_topology._to_json()
         self.numa_topology = updated_numa_topology
 
         vm_state = instance.get('vm_state', vm_states.BUILDING)
@@ -311,6 +364,29 @@ class HostManager(object):
         # Dict of set of aggregate IDs keyed by the name of the host belonging
         # to those aggregates
         self.host_aggregates_map = collections.defaultdict(set)
+        # Tuple of the list of aggregates and their AggregateMetadata keyed
+        # by host name, built when first needed
+        self._host_aggregates = {}
+        # Last seen change time of the compute node behind each HostState,
+        # only tracked by the incremental refresh and the reconciliation
+        self._compute_node_stamps = {}
+        # Results of the cacheable filters for each host
+        self.filter_cache = None
+        if CONF.scheduler_filter_cache_size > 0:
+            self.filter_cache = filters.HostFilterResultCache(
+                CONF.scheduler_filter_cache_size)
+        # Measured cost and selectivity of the filters
+        self.filter_order = None
+        if CONF.scheduler_adaptive_filter_order:
+            self.filter_order = filters.HostFilterOrder()
+        # Timings of the filters and weighers
+        self.profiler = None
+        if CONF.scheduler_profiling_window > 0:
+            self.profiler = profiling.SchedulerProfiler(
+                CONF.scheduler_profiling_window)
+        # Number of successful and conflicting claims of compute nodes
+        self.claims = 0
+        self.claim_conflicts = 0
         self._init_aggregates()
 
     def _init_aggregates(self):
@@ -330,24 +406,80 @@ class HostManager(object):
             self._update_aggregate(aggregates)
 
     def _update_aggregate(self, aggregate):
+        self._invalidate_filter_cache()
         self.aggs_by_id[aggregate.id] = aggregate
         for host in aggregate.hosts:
             self.host_aggregates_map[host].add(aggregate.id)
         # Refreshing the mapping dict to remove all hosts that are no longer
         # part of the aggregate
+        removed_hosts = []
         for host in self.host_aggregates_map:
             if (aggregate.id in self.host_aggregates_map[host]
                     and host not in aggregate.hosts):
                 self.host_aggregates_map[host].remove(aggregate.id)
+                removed_hosts.append(host)
+        self._invalidate_host_aggregates(aggregate.hosts + removed_hosts)
 
     def delete_aggregate(self, aggregate):
         """Deletes internal HostManager information about a specific aggregate.
         """
+        self._invalidate_filter_cache()
         if aggregate.id in self.aggs_by_id:
             del self.aggs_by_id[aggregate.id]
         for host in aggregate.hosts:
             if aggregate.id in self.host_aggregates_map[host]:
                 self.host_aggregates_map[host].remove(aggregate.id)
+        self._invalidate_host_aggregates(aggregate.hosts)
+
+    def _invalidate_host_aggregates(self, hosts):
+        """Drop the aggregates and merged metadata of hosts, once their
+        aggregates changed.
+        """
+        for host in hosts:
+            self._host_aggregates.pop(host, None)
+
+    def _get_host_aggregates(self, host):
+        """Returns the list of the aggregates of a host and their
+        AggregateMetadata.
+        """
+        host_aggregates = self._host_aggregates.get(host)
+        if host_aggregates is None:
+            aggregates = [self.aggs_by_id[agg_id] for agg_id in
+                          self.host_aggregates_map[host]]
+            host_aggregates = (aggregates,
+                               filters_utils.AggregateMetadata(aggregates))
+            self._host_aggregates[host] = host_aggregates
+        return host_aggregates
+
+    def _invalidate_filter_cache(self, host_state=None):
+        """Drop the cached filter results of a host, or of all the hosts."""
+        if self.filter_cache is not None:
+            self.filter_cache.invalidate(host_state)
+
+    def get_filter_cache_stats(self):
+        """Returns the number of hits and misses of the filter cache."""
+        if self.filter_cache is None:
+            return {'hits': 0, 'misses': 0}
+        return {'hits': self.filter_cache.hits,
+                'misses': self.filter_cache.misses}
+
+    def get_claim_stats(self):
+        """Returns the number of successful and conflicting claims."""
+        return {'claims': self.claims, 'conflicts': self.claim_conflicts}
+
+    def get_profiling_stats(self):
+        """Returns the rolling statistics of the time spent and hosts
+        handled by each filter and weigher, and the hits and misses of the
+        filter cache, or None if neither is enabled.
+        """
+        if self.profiler is None and self.filter_cache is None:
+            return None
+        stats = {}
+        if self.profiler is not None:
+            stats = self.profiler.get_stats()
+        if self.filter_cache is not None:
+            stats['filter_cache'] = self.get_filter_cache_stats()
+        return stats
 
     def _choose_host_filters(self, filter_cls_names):
         """Since the caller may specify which filters to use we need
@@ -448,12 +580,76 @@ class HostManager(object):
             hosts = name_to_cls_map.itervalues()
 
         return self.filter_handler.get_filtered_objects(filters,
-                hosts, filter_properties, index)
+                hosts, filter_properties, index, cache=self.filter_cache,
+                profiler=self.profiler, order=self.filter_order)
+
+    def all_hosts_dirty_on_consume(self, filter_properties, index,
+                                   filter_class_names=None):
+        """Return True if all the hosts must be filtered again for the
+        "index-th" instance, instead of only the one consumed for the
+        previous instance.
+        """
+        if filter_class_names is None:
+            filters = self.default_filters
+        else:
+            filters = self._choose_host_filters(filter_class_names)
+        return self.filter_handler.all_dirty_on_consume(filters,
+                filter_properties, index)
 
-    def get_weighed_hosts(self, hosts, weight_properties):
-        """Weigh the hosts."""
+    def get_weighed_hosts(self, hosts, weight_properties, limit=None):
+        """Weigh the hosts, only returning the limit best ones if set."""
         return self.weight_handler.get_weighed_objects(self.weighers,
-                hosts, weight_properties)
+                hosts, weight_properties, limit=limit, profiler=self.profiler)
+
+    def get_weighed_host_heap(self, hosts, weight_properties):
+        """Weigh the hosts into a heap which can weigh them one by one."""
+        return self.weight_handler.get_weighed_heap(self.weighers,
+                hosts, weight_properties, profiler=self.profiler)
+
+    def claim_host(self, context, host_state, instance):
+        """Claims the resources of an instance on the compute node record of
+        a host, unless the record changed since the host was refreshed.
+
+        Returns True once claimed. On a conflict, the host is refreshed from
+        the record so that it can be filtered again, and False is returned.
+        A host whose record is gone is removed. Hosts which were not built
+        from a compute node record, like ironic nodes, are not claimed.
+        """
+        if host_state.compute_id is None:
+            return True
+        compute = objects.ComputeNode(context, id=host_state.compute_id,
+                                      **host_state.compute_usage)
+        state_key = (host_state.host, host_state.nodename)
+        try:
+            compute.claim(instance['memory_mb'],
+                          instance['root_gb'] + instance['ephemeral_gb'],
+                          instance['vcpus'])
+            self.claims += 1
+            host_state.update_compute_usage(compute)
+            return True
+        except exception.ComputeHostClaimConflict:
+            self.claim_conflicts += 1
+            LOG.debug("Conflict claiming %(host)s:%(node)s, refreshing it",
+                      {'host': host_state.host, 'node': host_state.nodename})
+            try:
+                compute = objects.ComputeNode.get_by_id(context,
+                                                        host_state.compute_id)
+            except exception.ComputeHostNotFound:
+                compute = None
+        except exception.ComputeHostNotFound:
+            compute = None
+
+        if compute is None:
+            if self.host_state_map.get(state_key) is host_state:
+                self._remove_host_states([state_key])
+            return False
+        capabilities = filters_utils.capabilities(host_state)
+        # Local consumptions are newer than the record, drop them
+        host_state.updated = None
+        host_state.update_from_compute_node(compute)
+        if filters_utils.capabilities(host_state) != capabilities:
+            self._invalidate_filter_cache(host_state)
+        return False
 
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
@@ -461,11 +657,101 @@ class HostManager(object):
         in HostState are pre-populated and adjusted based on data in the db.
         """
 
-        service_refs = {service.host: service
-                        for service in objects.ServiceList.get_by_binary(
-                            context, 'nova-compute')}
+        service_refs = self._get_compute_service_refs(context)
         # Get resource usage across the available compute nodes:
         compute_nodes = objects.ComputeNodeList.get_all(context)
+        seen_nodes = self._update_host_states(compute_nodes, service_refs)
+
+        # remove compute nodes from host_state_map if they are not active
+        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+        self._remove_host_states(dead_nodes)
+
+        return self.host_state_map.itervalues()
+
+    def get_host_states_changed_since(self, context, since):
+        """Returns a list of HostStates like get_all_host_states(), but
+        only refreshes the compute nodes created, updated or deleted since
+        the given datetime watermark.
+
+        Services are still loaded in full as their heartbeats touch every
+        row anyway, while the compute node rows carrying the resource
+        usage and the JSON blobs are only fetched when they changed.
+        """
+        service_refs = self._get_compute_service_refs(context)
+        compute_nodes = objects.ComputeNodeList.get_all_changed_since(context,
+                                                                      since)
+        live_nodes = [compute for compute in compute_nodes
+                      if not compute.deleted]
+        deleted_nodes = set((compute.host, compute.hypervisor_hostname)
+                            for compute in compute_nodes if compute.deleted)
+        seen_nodes = self._update_host_states(live_nodes, service_refs)
+        for compute in live_nodes:
+            state_key = (compute.host, compute.hypervisor_hostname)
+            if state_key in seen_nodes:
+                self._compute_node_stamps[state_key] = _compute_node_stamp(
+                    compute)
+
+        dead_nodes = (deleted_nodes - seen_nodes) & set(self.host_state_map)
+        for state_key, host_state in self.host_state_map.iteritems():
+            if state_key in seen_nodes or state_key in dead_nodes:
+                continue
+            service = service_refs.get(host_state.host)
+            if service:
+                self._refresh_host_state(host_state, service)
+            else:
+                dead_nodes.add(state_key)
+        self._remove_host_states(dead_nodes)
+
+        return self.host_state_map.itervalues()
+
+    def reconcile_host_states(self, context, since=None):
+        """Reloads all the HostStates from the db and reports how far the
+        ones maintained by get_host_states_changed_since() had drifted.
+
+        :param since: the watermark the next incremental refresh would have
+                      used; compute node changes older than it should have
+                      already been seen and count as drift
+        :returns: dict with the number of 'added', 'removed' and 'stale'
+                  compute nodes found by the reload
+        """
+        drift = {'added': 0, 'removed': 0, 'stale': 0}
+        service_refs = self._get_compute_service_refs(context)
+        compute_nodes = objects.ComputeNodeList.get_all(context)
+        if since is not None:
+            for compute in compute_nodes:
+                state_key = (compute.host, compute.hypervisor_hostname)
+                stamp = _compute_node_stamp(compute)
+                if stamp is None or stamp >= since:
+                    continue
+                if state_key not in self.host_state_map:
+                    if compute.host in service_refs:
+                        drift['added'] += 1
+                elif self._compute_node_stamps.get(state_key) != stamp:
+                    drift['stale'] += 1
+
+        seen_nodes = self._update_host_states(compute_nodes, service_refs)
+        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
+        if since is not None:
+            drift['removed'] = len(dead_nodes)
+        self._remove_host_states(dead_nodes)
+
+        self._compute_node_stamps = {}
+        for compute in compute_nodes:
+            state_key = (compute.host, compute.hypervisor_hostname)
+            if state_key in seen_nodes:
+                self._compute_node_stamps[state_key] = _compute_node_stamp(
+                    compute)
+        return drift
+
+    def _get_compute_service_refs(self, context):
+        return {service.host: service
+                for service in objects.ServiceList.get_by_binary(
+                    context, 'nova-compute')}
+
+    def _update_host_states(self, compute_nodes, service_refs):
+        """Updates or creates the HostStates of the given compute nodes and
+        returns the set of their keys, skipping nodes without a service.
+        """
         seen_nodes = set()
         for compute in compute_nodes:
             service = service_refs.get(compute.host)
@@ -480,25 +766,29 @@ class HostManager(object):
             state_key = (host, node)
             host_state = self.host_state_map.get(state_key)
             if host_state:
+                capabilities = filters_utils.capabilities(host_state)
                 host_state.update_from_compute_node(compute)
+                if filters_utils.capabilities(host_state) != capabilities:
+                    self._invalidate_filter_cache(host_state)
             else:
                 host_state = self.host_state_cls(host, node, compute=compute)
                 self.host_state_map[state_key] = host_state
-            # We force to update the aggregates info each time a new request
-            # comes in, because some changes on the aggregates could have been
-            # happening after setting this field for the first time
-            host_state.aggregates = [self.aggs_by_id[agg_id] for agg_id in
-                                     self.host_aggregates_map[
-                                         host_state.host]]
-            host_state.update_service(dict(service.iteritems()))
+            self._refresh_host_state(host_state, service)
             seen_nodes.add(state_key)
-
-        # remove compute nodes from host_state_map if they are not active
-        dead_nodes = set(self.host_state_map.keys()) - seen_nodes
-        for state_key in dead_nodes:
+        return seen_nodes
+
+    def _refresh_host_state(self, host_state, service):
+        # We force to update the aggregates info each time a new request
+        # comes in, because some changes on the aggregates could have been
+        # happening after setting this field for the first time
+        host_state.aggregates, host_state.aggregate_metadata = (
+            self._get_host_aggregates(host_state.host))
+        host_state.update_service(dict(service.iteritems()))
+
+    def _remove_host_states(self, state_keys):
+        for state_key in state_keys:
             host, node = state_key
             LOG.info(_LI("Removing dead compute node %(host)s:%(node)s "
                          "from scheduler"), {'host': host, 'node': node})
-            del self.host_state_map[state_key]
-
-        return self.host_state_map.itervalues()
+            self._invalidate_filter_cache(self.host_state_map.pop(state_key))
+            self._compute_node_stamps.pop(state_key, None)
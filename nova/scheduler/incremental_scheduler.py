@@ -0,0 +1,95 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_utils import timeutils
+
+from nova.i18n import _LW
+from nova.scheduler import filter_scheduler
+
+incremental_scheduler_opts = [
+    cfg.IntOpt('scheduler_reconcile_interval',
+               default=600,
+               help='Interval in seconds between two full reloads of the '
+                    'compute nodes by the IncrementalScheduler, which '
+                    'otherwise only fetches the compute nodes that changed '
+                    'since its previous request. A value less than 1 '
+                    'disables the periodic reconciliation.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(incremental_scheduler_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+class IncrementalScheduler(filter_scheduler.FilterScheduler):
+    """Scheduler keeping a long-lived host state map up to date by only
+    fetching the compute nodes which changed since its last request.
+
+    The FilterScheduler reloads every compute node on each request,
+    which is a lot of DB work on large deployments. This scheduler
+    remembers when it last polled the compute nodes and, on the next
+    request, only fetches the rows created, updated or deleted since
+    then, using their updated_at timestamps as a watermark. Services
+    are still loaded in full each time, so hosts going down or being
+    disabled are seen as quickly as with the FilterScheduler.
+
+    As the watermark relies on timestamps written by other hosts, a
+    clock skew or a long running transaction could make a change go
+    unnoticed. To bound that, the periodic task fully reloads the
+    compute nodes every scheduler_reconcile_interval seconds and warns
+    about any drift it finds between the incremental view and the DB.
+
+    Like the CachingScheduler, each scheduler worker has its own copy
+    of the host states, so running multiple schedulers will still cause
+    more retries.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(IncrementalScheduler, self).__init__(*args, **kwargs)
+        # Start time of the last poll of the compute nodes, used as the
+        # watermark of the next one
+        self.last_poll = None
+        self.last_reconcile = None
+
+    def run_periodic_tasks(self, context):
+        """Called from a periodic tasks in the manager."""
+        interval = CONF.scheduler_reconcile_interval
+        if interval < 1 and self.last_reconcile is not None:
+            return
+        if (self.last_reconcile is None or
+                timeutils.is_older_than(self.last_reconcile, interval)):
+            self._reconcile(context.elevated())
+
+    def _reconcile(self, context):
+        start = timeutils.utcnow()
+        drift = self.host_manager.reconcile_host_states(context,
+                                                        self.last_poll)
+        if any(drift.values()):
+            LOG.warning(_LW("Incremental host states had drifted from the "
+                            "database: %(added)d compute nodes were missing, "
+                            "%(removed)d were gone and %(stale)d were out of "
+                            "date"), drift)
+        self.last_poll = start
+        self.last_reconcile = start
+
+    def _get_all_host_states(self, context):
+        """Called from the filter scheduler, in a template pattern."""
+        if self.last_poll is None:
+            # NOTE: We only get here when a scheduler request comes in
+            # before the first run of the periodic task.
+            self._reconcile(context)
+        since = self.last_poll
+        self.last_poll = timeutils.utcnow()
+        return self.host_manager.get_host_states_changed_since(context, since)
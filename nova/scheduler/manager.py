@@ -55,7 +55,7 @@ QUOTAS = quota.QUOTAS
 class SchedulerManager(manager.Manager):
     """Chooses a host to run instances on."""
 
-    target = messaging.Target(version='4.1')
+    target = messaging.Target(version='4.2')
 
     def __init__(self, scheduler_driver=None, *args, **kwargs):
         if not scheduler_driver:
@@ -105,6 +105,15 @@ class SchedulerManager(manager.Manager):
         # NOTE(sbauza): We're dropping the user context now as we don't need it
         self.driver.host_manager.delete_aggregate(aggregate)
 
+    def get_profiling_stats(self, ctxt):
+        """Returns the rolling statistics of the time spent and hosts
+        handled by each filter and weigher, and the hits and misses of the
+        filter cache, or None if neither the profiling nor the cache is
+        enabled.
+        """
+        return jsonutils.to_primitive(
+            self.driver.host_manager.get_profiling_stats())
+
 
 class _SchedulerManagerV3Proxy(object):
 
@@ -0,0 +1,177 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Profiling of the filters and weighers run by the scheduler.
+
+For each select_destinations() call, the wall time spent in each filter and
+weigher and the number of hosts they got and returned are recorded, and
+folded into rolling histograms covering the last requests. This tells which
+filters are expensive and which ones are selective, so that operators can
+order them with the cheap and selective ones first.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+from oslo_config import cfg
+
+profiling_opts = [
+    cfg.IntOpt('scheduler_profiling_window',
+               default=0,
+               help='Number of requests kept in the rolling histograms of '
+                    'the time spent and hosts handled by each scheduler '
+                    'filter and weigher. A value less than 1 disables the '
+                    'profiling.'),
+    cfg.BoolOpt('scheduler_profiling_notifications',
+                default=False,
+                help='Send a scheduler.select_destinations.profile '
+                     'notification with the profile of each request when '
+                     'the profiling is enabled.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(profiling_opts)
+
+FILTER = 'filter'
+WEIGHER = 'weigher'
+
+PERCENTILES = (50, 90, 99)
+
+
+class RollingHistogram(object):
+    """Distribution of the last samples of a value."""
+
+    def __init__(self, window):
+        self._samples = collections.deque(maxlen=window)
+
+    def add(self, value):
+        self._samples.append(value)
+
+    def summary(self):
+        """Returns the count, min, max, mean and percentiles of the
+        samples.
+        """
+        samples = sorted(self._samples)
+        count = len(samples)
+        summary = {'count': count}
+        if not count:
+            return summary
+        summary['min'] = samples[0]
+        summary['max'] = samples[-1]
+        summary['mean'] = float(sum(samples)) / count
+        for percentile in PERCENTILES:
+            index = min(count - 1, int(count * percentile / 100.0))
+            summary['p%d' % percentile] = samples[index]
+        return summary
+
+
+class RequestProfile(object):
+    """Time spent and hosts handled by each filter and weigher for one
+    request, summed over the instances of the request.
+    """
+
+    def __init__(self):
+        self.elapsed = 0.0
+        # [elapsed, hosts in, hosts out] keyed by (kind, name), in the order
+        # the filters and weighers first ran
+        self.steps = collections.OrderedDict()
+
+    def record(self, kind, name, elapsed, hosts_in, hosts_out):
+        step = self.steps.setdefault((kind, name), [0.0, 0, 0])
+        step[0] += elapsed
+        step[1] += hosts_in
+        step[2] += hosts_out
+
+    def to_dict(self):
+        return {'elapsed': self.elapsed,
+                'steps': [{'kind': kind, 'name': name, 'elapsed': elapsed,
+                           'hosts_in': hosts_in, 'hosts_out': hosts_out}
+                          for (kind, name), (elapsed, hosts_in, hosts_out)
+                          in self.steps.iteritems()]}
+
+
+class SchedulerProfiler(object):
+    """Aggregates the profiles of the requests into rolling histograms.
+
+    Filter and weigher handlers call record() after each step. The steps
+    recorded while in a profile_request() block are summed up into one
+    profile for the request, as the same filters run for each instance.
+    The current request is tracked per thread, which with eventlet means
+    per greenthread.
+    """
+
+    def __init__(self, window):
+        self._window = window
+        self._local = threading.local()
+        self._requests = RollingHistogram(window)
+        # Dict of dict of RollingHistograms, keyed by (kind, name) then by
+        # metric name
+        self._histograms = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def profile_request(self):
+        """Context manager profiling one request, yielding its
+        RequestProfile.
+        """
+        profile = RequestProfile()
+        self._local.profile = profile
+        start = time.time()
+        try:
+            yield profile
+        finally:
+            profile.elapsed = time.time() - start
+            self._local.profile = None
+            self._add(profile)
+
+    def record(self, kind, name, elapsed, hosts_in, hosts_out):
+        """Record one run of a filter or weigher."""
+        profile = getattr(self._local, 'profile', None)
+        if profile is not None:
+            profile.record(kind, name, elapsed, hosts_in, hosts_out)
+        else:
+            # Not called while handling a request, count it alone
+            profile = RequestProfile()
+            profile.record(kind, name, elapsed, hosts_in, hosts_out)
+            self._add_steps(profile)
+
+    def _add(self, profile):
+        self._requests.add(profile.elapsed)
+        self._add_steps(profile)
+
+    def _add_steps(self, profile):
+        for key, (elapsed, hosts_in, hosts_out) in profile.steps.iteritems():
+            histograms = self._histograms.get(key)
+            if histograms is None:
+                histograms = self._histograms[key] = {
+                    metric: RollingHistogram(self._window)
+                    for metric in ('elapsed', 'hosts_in', 'hosts_out',
+                                   'pass_rate')}
+            histograms['elapsed'].add(elapsed)
+            histograms['hosts_in'].add(hosts_in)
+            histograms['hosts_out'].add(hosts_out)
+            if hosts_in:
+                histograms['pass_rate'].add(float(hosts_out) / hosts_in)
+
+    def get_stats(self):
+        """Returns the summaries of the histograms of the requests, and of
+        each filter and weigher.
+        """
+        stats = {'requests': {'elapsed': self._requests.summary()},
+                 'filters': {}, 'weighers': {}}
+        for (kind, name), histograms in self._histograms.iteritems():
+            section = stats['filters' if kind == FILTER else 'weighers']
+            section[name] = {metric: histogram.summary()
+                             for metric, histogram in histograms.iteritems()}
+        return stats
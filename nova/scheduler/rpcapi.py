@@ -88,6 +88,7 @@ class SchedulerAPI(object):
 
         * 4.0 - Removed backwards compat for Icehouse
         * 4.1 - Add update_aggregates() and delete_aggregate()
+        * 4.2 - Add get_profiling_stats()
 
 
     '''
@@ -123,3 +124,9 @@ class SchedulerAPI(object):
         # NOTE(sbauza): Yes, it's a fanout, we need to update all schedulers
         cctxt = self.client.prepare(fanout=True, version='4.1')
         cctxt.cast(ctxt, 'delete_aggregate', aggregate=aggregate)
+
+    def get_profiling_stats(self, ctxt, host=None):
+        # NOTE: Each scheduler has its own statistics, so a host can be given
+        # to ask a specific one.
+        cctxt = self.client.prepare(server=host, version='4.2')
+        return cctxt.call(ctxt, 'get_profiling_stats')
@@ -39,6 +39,7 @@ CONF.register_opts(io_ops_weight_opts)
 
 class IoOpsWeigher(weights.BaseHostWeigher):
     minval = 0
+    vectorized = True
 
     def weight_multiplier(self):
         """Override the weight multiplier."""
@@ -49,3 +50,6 @@ class IoOpsWeigher(weights.BaseHostWeigher):
         to be the default.
         """
         return host_state.num_io_ops
+
+    def weigh_all_vectorized(self, columns, weight_properties):
+        return list(columns['num_io_ops'])
@@ -68,6 +68,8 @@ CONF.register_opts(metrics_weight_opts, group='metrics')
 
 
 class MetricsWeigher(weights.BaseHostWeigher):
+    vectorized = True
+
     def __init__(self):
         self._parse_setting()
 
@@ -81,6 +83,12 @@ class MetricsWeigher(weights.BaseHostWeigher):
         """Override the weight multiplier."""
         return CONF.metrics.weight_multiplier
 
+    def weigh_all_vectorized(self, columns, weight_properties):
+        if not self.setting:
+            # Nothing to weigh, all the hosts are equal
+            return [0.0] * len(columns)
+        return None
+
     def _weigh_object(self, host_state, weight_properties):
         value = 0.0
 
@@ -36,7 +36,7 @@ class ServerActionsSampleJsonTest(api_sample_base.ApiSampleTestBaseV3):
         def fake_instance_action_get_by_request_id(context, uuid, request_id):
             return copy.deepcopy(self.actions[uuid][request_id])
 
-        def fake_server_actions_get(context, uuid):
+        def fake_server_actions_get(context, uuid, limit=None, marker=None):
             return [copy.deepcopy(value) for value in
                     self.actions[uuid].itervalues()]
 
@@ -161,7 +161,7 @@ class InstanceActionsTestV21(test.NoDBTestCase):
         policy.set_rules(rules)
 
     def test_list_actions(self):
-        def fake_get_actions(context, uuid):
+        def fake_get_actions(context, uuid, limit=None, marker=None):
             actions = []
             for act in self.fake_actions[uuid].itervalues():
                 action = models.InstanceAction()
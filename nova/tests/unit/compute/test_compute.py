@@ -6196,9 +6196,12 @@ class ComputeTestCase(BaseTestCase):
                 'get_nw_info': 0, 'expected_instance': None}
 
         def fake_instance_get_all_by_host(context, host,
-                                          columns_to_join, use_slave=False):
+                                          columns_to_join, use_slave=False,
+                                          columns=None):
             call_info['get_all_by_host'] += 1
             self.assertEqual([], columns_to_join)
+            self.assertEqual(['id', 'task_state', 'uuid', 'vm_state'],
+                             columns)
             return instances[:]
 
         def fake_instance_get_by_uuid(context, instance_uuid,
@@ -6347,7 +6350,8 @@ class ComputeTestCase(BaseTestCase):
                        task_states.REBOOTING, task_states.REBOOT_STARTED,
                        task_states.REBOOT_PENDING]}
         get.assert_called_once_with(ctxt, filters,
-                                    expected_attrs=[], use_slave=True)
+                                    expected_attrs=[], use_slave=True,
+                                    columns=['updated_at'])
 
     def test_poll_unconfirmed_resizes(self):
         instances = [
@@ -6508,7 +6512,8 @@ class ComputeTestCase(BaseTestCase):
                                             marker=None,
                                             columns_to_join=[],
                                             use_slave=True,
-                                            limit=None)
+                                            limit=None,
+                                            columns=None)
             self.assertThat(conductor_instance_update.mock_calls,
                             testtools_matchers.HasLength(len(old_instances)))
             self.assertThat(node_is_available.mock_calls,
@@ -9756,8 +9761,9 @@ class ComputeAPITestCase(BaseTestCase):
         migration = test_migration.fake_db_migration(uuid="1234")
         filters = {'host': 'host1'}
         self.mox.StubOutWithMock(db, "migration_get_all_by_filters")
-        db.migration_get_all_by_filters(self.context,
-                                        filters).AndReturn([migration])
+        db.migration_get_all_by_filters(
+            self.context, filters, limit=None, marker=None, sort_keys=None,
+            sort_dirs=None).AndReturn([migration])
         self.mox.ReplayAll()
 
         migrations = self.compute_api.get_migrations(self.context,
@@ -9855,12 +9861,15 @@ class ComputeAPIIpFilterTestCase(BaseTestCase):
 
     def test_ip_filtering_no_limit_to_db(self):
         c = context.get_admin_context()
-        # Limit is not supplied to the DB when using an IP filter
-        with mock.patch('nova.objects.InstanceList.get_by_filters') as m_get:
-            self.compute_api.get_all(c, search_opts={'ip': '.10'}, limit=1)
-            self.assertEqual(1, m_get.call_count)
-            kwargs = m_get.call_args[1]
-            self.assertIsNone(kwargs['limit'])
+        # The instances are iterated over when using an IP filter
+        instances = self._get_ip_filtering_instances()
+        with mock.patch('nova.objects.InstanceList.iter_by_filters',
+                        return_value=iter(instances)) as m_iter:
+            insts = self.compute_api.get_all(c, search_opts={'ip': '192.16'},
+                                             limit=1, want_objects=True)
+            self.assertEqual(1, m_iter.call_count)
+            self.assertNotIn('limit', m_iter.call_args[1])
+        self.assertEqual([1], [inst.id for inst in insts])
 
     def test_ip_filtering_pass_limit_to_db(self):
         c = context.get_admin_context()
@@ -265,6 +265,128 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertFalse(self.admin_context,
                          "_reschedule_or_error called with admin context")
 
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db',
+                       return_value=[])
+    @mock.patch.object(manager.ComputeManager, '_get_resource_tracker')
+    def test_update_available_resource_single_node(self, mock_get_rt,
+                                                   mock_get_nodes):
+        self.compute.driver = mock.Mock()
+        self.compute.driver.get_available_nodes.return_value = ['node1']
+        with mock.patch.object(
+                self.compute, '_update_available_resource_of_nodes') as (
+                    mock_update_nodes):
+            self.compute.update_available_resource(self.context)
+        rt = mock_get_rt.return_value
+        rt.update_available_resource.assert_called_once_with(self.context)
+        self.assertFalse(mock_update_nodes.called)
+
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db',
+                       return_value=[])
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_update_available_resource_multiple_nodes(self, mock_get_insts,
+                                                      mock_get_nodes):
+        self.flags(max_concurrent_resource_updates=2)
+        self.compute.driver = mock.Mock()
+        self.compute.driver.get_available_nodes.return_value = [
+            'node1', 'node2', 'node3']
+        rts = {nodename: mock.Mock() for nodename in ['node1', 'node2',
+                                                       'node3']}
+        rts['node2'].update_available_resource.side_effect = (
+            test.TestingException())
+        instances = [fake_instance.fake_instance_obj(self.context,
+                                                     node=nodename)
+                     for nodename in ['node1', 'node3', 'node1', 'other']]
+
+        def fake_get_by_host(*args, **kwargs):
+            # The changes made before the fetch are forgotten
+            for rt in rts.values():
+                rt.forget_changes.assert_called_once_with()
+            return instances
+
+        mock_get_insts.side_effect = fake_get_by_host
+        migrations = [
+            {'source_compute': self.compute.host, 'source_node': 'node1',
+             'dest_compute': self.compute.host, 'dest_node': 'node2'},
+            {'source_compute': self.compute.host, 'source_node': 'node3',
+             'dest_compute': 'other', 'dest_node': 'node1'},
+            {'source_compute': 'other', 'source_node': 'node2',
+             'dest_compute': self.compute.host, 'dest_node': 'node3'}]
+
+        with contextlib.nested(
+            mock.patch.object(self.compute, '_get_resource_tracker',
+                              side_effect=rts.get),
+            mock.patch.object(self.compute.conductor_api,
+                              'migration_get_in_progress_by_host',
+                              return_value=migrations)
+        ) as (mock_get_rt, mock_get_migrations):
+            self.compute.update_available_resource(self.context)
+
+        mock_get_insts.assert_called_once_with(
+            self.context, self.compute.host,
+            expected_attrs=['system_metadata', 'numa_topology'])
+        mock_get_migrations.assert_called_once_with(
+            self.context, self.compute.host)
+        rts['node1'].update_available_resource.assert_called_once_with(
+            self.context, instances=[instances[0], instances[2]],
+            migrations=[migrations[0]])
+        rts['node2'].update_available_resource.assert_called_once_with(
+            self.context, instances=[], migrations=[migrations[0]])
+        rts['node3'].update_available_resource.assert_called_once_with(
+            self.context, instances=[instances[1]],
+            migrations=migrations[1:])
+        self.assertEqual(rts, self.compute._resource_tracker_dict)
+
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db',
+                       return_value=[])
+    @mock.patch.object(objects.InstanceList, 'get_by_host')
+    def test_update_available_resource_multiple_nodes_no_audit(
+            self, mock_get_insts, mock_get_nodes):
+        self.compute.driver = mock.Mock()
+        self.compute.driver.get_available_nodes.return_value = [
+            'node1', 'node2']
+        rts = {nodename: mock.Mock() for nodename in ['node1', 'node2']}
+        for rt in rts.values():
+            rt._audit_due.return_value = False
+
+        with contextlib.nested(
+            mock.patch.object(self.compute, '_get_resource_tracker',
+                              side_effect=rts.get),
+            mock.patch.object(self.compute.conductor_api,
+                              'migration_get_in_progress_by_host')
+        ) as (mock_get_rt, mock_get_migrations):
+            self.compute.update_available_resource(self.context)
+
+        self.assertFalse(mock_get_insts.called)
+        self.assertFalse(mock_get_migrations.called)
+        for rt in rts.values():
+            self.assertFalse(rt.forget_changes.called)
+            rt.update_available_resource.assert_called_once_with(
+                self.context, instances=None, migrations=None)
+
+    @mock.patch.object(manager.ComputeManager, '_get_compute_nodes_in_db',
+                       return_value=[])
+    @mock.patch.object(objects.InstanceList, 'get_by_host', return_value=[])
+    def test_update_available_resource_multiple_nodes_old_conductor(
+            self, mock_get_insts, mock_get_nodes):
+        self.compute.driver = mock.Mock()
+        self.compute.driver.get_available_nodes.return_value = [
+            'node1', 'node2']
+        rts = {nodename: mock.Mock() for nodename in ['node1', 'node2']}
+
+        with contextlib.nested(
+            mock.patch.object(self.compute, '_get_resource_tracker',
+                              side_effect=rts.get),
+            mock.patch.object(self.compute.conductor_api,
+                              'migration_get_in_progress_by_host',
+                              return_value=None)
+        ) as (mock_get_rt, mock_get_migrations):
+            self.compute.update_available_resource(self.context)
+
+        # The resource trackers fetch the migrations of their node
+        for rt in rts.values():
+            rt.update_available_resource.assert_called_once_with(
+                self.context, instances=[], migrations=None)
+
     def test_allocate_network_fails(self):
         self.flags(network_allocate_retries=0)
 
@@ -396,7 +518,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             context.get_admin_context().AndReturn(fake_context)
             db.instance_get_all_by_host(
                     fake_context, our_host, columns_to_join=['info_cache'],
-                    use_slave=False
+                    use_slave=False, columns=None
                     ).AndReturn(startup_instances)
             if defer_iptables_apply:
                 self.compute.driver.filter_defer_apply_on()
@@ -478,7 +600,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         context.get_admin_context().AndReturn(fake_context)
         db.instance_get_all_by_host(fake_context, our_host,
                                     columns_to_join=['info_cache'],
-                                    use_slave=False
+                                    use_slave=False, columns=None
                                     ).AndReturn([])
         self.compute.init_virt_events()
 
@@ -1052,7 +1174,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                           inst in driver_instances]},
                 'created_at', 'desc', columns_to_join=None,
                 limit=None, marker=None,
-                use_slave=True).AndReturn(
+                use_slave=True, columns=None).AndReturn(
                         driver_instances)
 
         self.mox.ReplayAll()
@@ -1105,7 +1227,7 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
                 fake_context, filters,
                 'created_at', 'desc', columns_to_join=None,
                 limit=None, marker=None,
-                use_slave=True).AndReturn(all_instances)
+                use_slave=True, columns=None).AndReturn(all_instances)
 
         self.mox.ReplayAll()
 
@@ -1270,13 +1392,6 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
             def __getitem__(self, name):
                 return getattr(self, name)
 
-            def save(self):
-                pass
-
-        class FakeInstanceList(object):
-            def get_by_filters(self, *args, **kwargs):
-                return []
-
         a = FakeInstance('123', 'apple', {'clean_attempts': '100'})
         b = FakeInstance('456', 'orange', {'clean_attempts': '3'})
         c = FakeInstance('789', 'banana', {})
@@ -1297,6 +1412,9 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.compute.driver.delete_instance_files(
             mox.IgnoreArg()).AndReturn(False)
 
+        self.mox.StubOutWithMock(self.compute, '_save_clean_attempts')
+        self.compute._save_clean_attempts({}, [b, c])
+
         self.mox.ReplayAll()
 
         self.compute._run_pending_deletes({})
@@ -1307,6 +1425,74 @@ class ComputeManagerUnitTestCase(test.NoDBTestCase):
         self.assertFalse(c.cleaned)
         self.assertEqual('1', c.system_metadata['clean_attempts'])
 
+    def _fake_deleted_instances(self, count):
+        return [fake_instance.fake_instance_obj(
+                    self.context, system_metadata={'clean_attempts': '1'},
+                    expected_attrs=['system_metadata'])
+                for i in range(count)]
+
+    @mock.patch.object(manager, '_CLEAN_ATTEMPTS_BATCH_SIZE', 2)
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_run_pending_deletes_batches(self, mock_get):
+        instances = self._fake_deleted_instances(3)
+        mock_get.return_value = instances
+        saved = []
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'delete_instance_files',
+                              return_value=True),
+            mock.patch.object(self.compute, '_save_clean_attempts',
+                              side_effect=lambda context, instances:
+                                  saved.append(list(instances)))
+        ):
+            self.compute._run_pending_deletes(self.context)
+        self.assertEqual([instances[:2], instances[2:]], saved)
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_run_pending_deletes_driver_error(self, mock_get):
+        instances = self._fake_deleted_instances(2)
+        mock_get.return_value = instances
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'delete_instance_files',
+                              side_effect=[True, test.TestingException()]),
+            mock.patch.object(objects.InstanceList, 'save_all',
+                              return_value={})
+        ) as (mock_delete, mock_save):
+            self.assertRaises(test.TestingException,
+                              self.compute._run_pending_deletes, self.context)
+        # The attempt before the error is saved
+        mock_save.assert_called_once_with()
+        self.assertTrue(instances[0].cleaned)
+        self.assertEqual('2', instances[0].system_metadata['clean_attempts'])
+        self.assertEqual('1', instances[1].system_metadata['clean_attempts'])
+
+    @mock.patch.object(objects.InstanceList, 'get_by_filters')
+    def test_run_pending_deletes_driver_and_save_error(self, mock_get):
+        mock_get.return_value = self._fake_deleted_instances(2)
+
+        with contextlib.nested(
+            mock.patch.object(self.compute.driver, 'delete_instance_files',
+                              side_effect=[True, test.TestingException()]),
+            mock.patch.object(objects.InstanceList, 'save_all',
+                              side_effect=exception.NovaException())
+        ):
+            # The error of the driver is raised
+            self.assertRaises(test.TestingException,
+                              self.compute._run_pending_deletes, self.context)
+
+    def test_save_clean_attempts(self):
+        instances = self._fake_deleted_instances(2)
+        with contextlib.nested(
+            mock.patch.object(objects.InstanceList, 'save_all',
+                              return_value={instances[1].uuid: 'conflict'}),
+            mock.patch.object(manager.LOG, 'warning')
+        ) as (mock_save, mock_warning):
+            self.compute._save_clean_attempts(self.context, instances)
+        mock_save.assert_called_once_with()
+        self.assertEqual(1, mock_warning.call_count)
+        self.assertEqual('no', self.context.read_deleted)
+
     def test_attach_interface_failure(self):
         # Test that the fault methods are invoked when an attach fails
         db_instance = fake_instance.fake_db_instance()
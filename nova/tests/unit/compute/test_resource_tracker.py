@@ -15,6 +15,8 @@
 
 """Tests for compute resource tracking."""
 
+import contextlib
+import datetime
 import uuid
 
 import mock
@@ -37,6 +39,7 @@ from nova import test
 from nova.tests.unit.compute.monitors import test_monitors
 from nova.tests.unit.objects import test_migration
 from nova.tests.unit.pci import fakes as pci_fakes
+from nova import utils
 from nova.virt import driver
 from nova.virt import hardware
 
@@ -742,13 +745,54 @@ class SchedulerClientTrackerTestCase(BaseTrackerTestCase):
         values = {'stats': {}, 'foo': 'bar', 'baz_count': 0}
         self.tracker._update(self.context, values)
 
-        expected = {'stats': '{}', 'foo': 'bar', 'baz_count': 0,
-                    'id': 1}
+        # The stats did not change since the tracker was initialized
+        expected = {'foo': 'bar', 'baz_count': 0, 'id': 1}
         self.tracker.scheduler_client.update_resource_stats.\
             assert_called_once_with(self.context,
                                     ("fakehost", "fakenode"),
                                     expected)
 
+    def test_update_resource_changed_fields(self):
+        writes = self.tracker.compute_node_writes
+        skipped = self.tracker.compute_node_writes_skipped
+        update_resource_stats = \
+            self.tracker.scheduler_client.update_resource_stats
+
+        self.tracker._update(self.context, dict(self.tracker.compute_node))
+        self.assertFalse(update_resource_stats.called)
+
+        values = dict(self.tracker.compute_node,
+                      numa_topology=None, metrics='[{"name": "cpu"}]')
+        self.tracker._update(self.context, values)
+        update_resource_stats.assert_called_once_with(
+            self.context, ("fakehost", "fakenode"),
+            {'numa_topology': None, 'metrics': '[{"name": "cpu"}]', 'id': 1})
+        self.assertEqual('[{"name": "cpu"}]',
+                         self.tracker.compute_node['metrics'])
+
+        update_resource_stats.reset_mock()
+        self.tracker._update(self.context, values)
+        self.assertFalse(update_resource_stats.called)
+        self.assertEqual(writes + 1, self.tracker.compute_node_writes)
+        self.assertEqual(skipped + 2,
+                         self.tracker.compute_node_writes_skipped)
+
+    def test_update_resource_failed_write(self):
+        update_resource_stats = \
+            self.tracker.scheduler_client.update_resource_stats
+        update_resource_stats.side_effect = test.TestingException()
+        values = dict(self.tracker.compute_node, metrics='[{"name": "cpu"}]')
+        self.assertRaises(test.TestingException,
+                          self.tracker._update, self.context, dict(values))
+
+        # The changes which failed to be written are sent again
+        update_resource_stats.reset_mock()
+        update_resource_stats.side_effect = None
+        self.tracker._update(self.context, dict(values))
+        update_resource_stats.assert_called_once_with(
+            self.context, ("fakehost", "fakenode"),
+            {'metrics': '[{"name": "cpu"}]', 'id': 1})
+
 
 class TrackerPciStatsTestCase(BaseTrackerTestCase):
 
@@ -1524,19 +1568,52 @@ class ComputeMonitorTestCase(BaseTestCase):
 
 class TrackerPeriodicTestCase(BaseTrackerTestCase):
 
+    def setUp(self):
+        # NOTE: The audits are timed, so do not depend on a time override
+        # left by another test.
+        self.useFixture(test.TimeOverride())
+        super(TrackerPeriodicTestCase, self).setUp()
+
     def test_periodic_status_update(self):
         # verify update called on instantiation
         self.assertEqual(1, self.update_call_count)
 
-        # verify update not called if no change to resources
-        self.tracker.update_available_resource(self.context)
-        self.assertEqual(1, self.update_call_count)
+        # verify only the usage is written if no change to resources
+        update_resource_stats = \
+            self.tracker.scheduler_client.update_resource_stats
+        with mock.patch.object(self.tracker.scheduler_client,
+                               'update_resource_stats',
+                               side_effect=update_resource_stats) as update:
+            self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self.assertEqual(set(resource_tracker.CLAIMED_USAGE) | set(['id']),
+                         set(update.call_args[0][2]))
 
         # verify update is called when resources change
         driver = self.tracker.driver
         driver.memory_mb += 1
+        with mock.patch.object(self.tracker.scheduler_client,
+                               'update_resource_stats',
+                               side_effect=update_resource_stats) as update:
+            self.tracker.update_available_resource(self.context)
+        self.assertEqual(3, self.update_call_count)
+        self.assertIn('memory_mb', update.call_args[0][2])
+
+    def test_audit_drops_scheduler_claims(self):
+        # The scheduler claims resources for an instance which never
+        # reaches the node
+        self.compute.update({'free_ram_mb': FAKE_VIRT_MEMORY_MB - 512,
+                             'memory_mb_used': 512,
+                             'free_disk_gb': FAKE_VIRT_LOCAL_GB - 1,
+                             'local_gb_used': 1,
+                             'vcpus_used': 1})
+
         self.tracker.update_available_resource(self.context)
-        self.assertEqual(2, self.update_call_count)
+        self.assertEqual(FAKE_VIRT_MEMORY_MB, self.compute['free_ram_mb'])
+        self.assertEqual(0, self.compute['memory_mb_used'])
+        self.assertEqual(FAKE_VIRT_LOCAL_GB, self.compute['free_disk_gb'])
+        self.assertEqual(0, self.compute['local_gb_used'])
+        self.assertEqual(0, self.compute['vcpus_used'])
 
     def test_update_available_resource_calls_locked_inner(self):
         @mock.patch.object(self.tracker, 'driver')
@@ -1544,14 +1621,208 @@ class TrackerPeriodicTestCase(BaseTrackerTestCase):
                            '_update_available_resource')
         @mock.patch.object(self.tracker, '_verify_resources')
         @mock.patch.object(self.tracker, '_report_hypervisor_resource_view')
-        def _test(mock_rhrv, mock_vr, mock_uar, mock_driver):
+        @mock.patch.object(self.tracker, '_get_host_metrics')
+        @mock.patch.object(self.tracker.conductor_api,
+                           'migration_get_in_progress_by_host_and_node')
+        @mock.patch.object(objects.InstanceList, 'get_by_host_and_node')
+        def _test(mock_get_insts, mock_get_migrations, mock_metrics,
+                  mock_rhrv, mock_vr, mock_uar, mock_driver):
             resources = {'there is someone in my head': 'but it\'s not me'}
             mock_driver.get_available_resource.return_value = resources
             self.tracker.update_available_resource(self.context)
-            mock_uar.assert_called_once_with(self.context, resources)
+            mock_uar.assert_called_once_with(
+                self.context, resources, mock_get_insts.return_value,
+                mock_get_migrations.return_value, mock_metrics.return_value)
 
         _test()
 
+    def test_lock_per_node(self):
+        with mock.patch.object(utils, 'synchronized',
+                               return_value=lambda f: f) as synchronized:
+            self.tracker.update_usage(self.context,
+                                      self._fake_instance(stash=False))
+        synchronized.assert_called_once_with('compute_resources-fakenode')
+
+    def _fetch_instances_and(self, action):
+        """Run an action while the audit fetches the instances."""
+        get_by_host_and_node = objects.InstanceList.get_by_host_and_node
+
+        def fake_get_by_host_and_node(*args, **kwargs):
+            instances = get_by_host_and_node(*args, **kwargs)
+            action()
+            return instances
+
+        return mock.patch.object(objects.InstanceList, 'get_by_host_and_node',
+                                 side_effect=fake_get_by_host_and_node)
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_audit_keeps_claims_made_while_fetching(self, mock_get):
+        flavor = self._fake_flavor_create()
+        claim_mem = flavor['memory_mb'] + FAKE_VIRT_MEMORY_OVERHEAD
+        instance = self._fake_instance(flavor=flavor, task_state=None)
+
+        with self._fetch_instances_and(
+                lambda: self.tracker.instance_claim(self.context, instance,
+                                                    self.limits)):
+            self.tracker.update_available_resource(self.context)
+        self._assert(claim_mem, 'memory_mb_used')
+        self.assertIn(instance['uuid'], self.tracker.tracked_instances)
+        self.assertEqual({}, self.tracker._changed_instances)
+
+        # The next audit finds the claimed instance
+        self.tracker.update_available_resource(self.context)
+        self._assert(claim_mem, 'memory_mb_used')
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_audit_drops_aborts_made_while_fetching(self, mock_get):
+        instance = self._fake_instance(task_state=None)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+
+        with self._fetch_instances_and(
+                lambda: self.tracker.abort_instance_claim(self.context,
+                                                          instance)):
+            self.tracker.update_available_resource(self.context)
+        self._assert(0, 'memory_mb_used')
+        self.assertNotIn(instance['uuid'], self.tracker.tracked_instances)
+
+    def test_audit_fetches_migrations_again_after_resize(self):
+        def fake_get_migrations(*args):
+            # A resize is claimed while the migrations are fetched
+            self.tracker._migrations_changed = (
+                mock_get_migrations.call_count == 1)
+            return []
+
+        with mock.patch.object(self.tracker.conductor_api,
+                               'migration_get_in_progress_by_host_and_node',
+                               side_effect=fake_get_migrations) as (
+                mock_get_migrations):
+            self.tracker.update_available_resource(self.context)
+            self.assertEqual(2, mock_get_migrations.call_count)
+            self.assertFalse(self.tracker._migrations_changed)
+
+            self.tracker.update_available_resource(self.context)
+            self.assertEqual(3, mock_get_migrations.call_count)
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_update_available_resource_prefetched(self, mock_get):
+        flavor = self._fake_flavor_create()
+        claim_mem = flavor['memory_mb'] + FAKE_VIRT_MEMORY_OVERHEAD
+        instance = objects.Instance._from_db_object(
+            self.context, objects.Instance(),
+            self._fake_instance(flavor=flavor, task_state=None),
+            expected_attrs=['system_metadata'])
+
+        with contextlib.nested(
+            mock.patch.object(objects.InstanceList, 'get_by_host_and_node'),
+            mock.patch.object(db, 'migration_get_in_progress_by_host_and_node')
+        ) as (mock_get_insts, mock_get_migrations):
+            self.tracker.update_available_resource(
+                self.context, instances=[instance], migrations=[])
+        self.assertFalse(mock_get_insts.called)
+        self.assertFalse(mock_get_migrations.called)
+        self._assert(claim_mem, 'memory_mb_used')
+        self.assertEqual([instance['uuid']],
+                         list(self.tracker.tracked_instances))
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_update_available_resource_prefetched_after_delete(self,
+                                                               mock_get):
+        flavor = self._fake_flavor_create()
+        claim_mem = flavor['memory_mb'] + FAKE_VIRT_MEMORY_OVERHEAD
+        db_instance = self._fake_instance(flavor=flavor, task_state=None)
+        instance = objects.Instance._from_db_object(
+            self.context, objects.Instance(), db_instance,
+            expected_attrs=['system_metadata'])
+        self.tracker.instance_claim(self.context, db_instance, self.limits)
+        self.tracker.abort_instance_claim(self.context, db_instance)
+
+        # The instances are fetched after the delete, finding the instance
+        self.tracker.forget_changes()
+        self.tracker.update_available_resource(
+            self.context, instances=[instance], migrations=[])
+        self._assert(claim_mem, 'memory_mb_used')
+        self.assertEqual([instance['uuid']],
+                         list(self.tracker.tracked_instances))
+
+    def test_periodic_audit_interval(self):
+        self.flags(resource_audit_interval=600)
+        self.assertIsNotNone(self.tracker.last_audit)
+        driver = self.tracker.driver
+        driver.memory_mb += 1
+
+        with mock.patch.object(self.tracker, '_get_host_metrics',
+                               return_value=[]) as get_metrics:
+            self.tracker.update_available_resource(self.context)
+        get_metrics.assert_called_once_with(self.context,
+                                            self.tracker.nodename)
+        # The usage is not audited before the interval
+        self.assertEqual(1, self.update_call_count)
+        self._assert(FAKE_VIRT_MEMORY_MB, 'memory_mb')
+
+        self.tracker.last_audit = timeutils.utcnow() - datetime.timedelta(
+            seconds=601)
+        self.tracker.update_available_resource(self.context)
+        self.assertEqual(2, self.update_call_count)
+        self._assert(FAKE_VIRT_MEMORY_MB + 1, 'memory_mb')
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_periodic_audit_interval_claims(self, mock_get):
+        self.flags(resource_audit_interval=600)
+        flavor = self._fake_flavor_create()
+        claim_mem = flavor['memory_mb'] + FAKE_VIRT_MEMORY_OVERHEAD
+        instance = self._fake_instance(flavor=flavor, task_state=None)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        self._assert(claim_mem, 'memory_mb_used')
+
+        with mock.patch.object(self.tracker,
+                               '_update_usage_from_instances') as update:
+            self.tracker.update_available_resource(self.context)
+        self.assertFalse(update.called)
+        self._assert(claim_mem, 'memory_mb_used')
+
+        instance['vm_state'] = vm_states.DELETED
+        self.tracker.update_usage(self.context, instance)
+        self._assert(0, 'memory_mb_used')
+
+    @mock.patch('nova.objects.InstancePCIRequests.get_by_instance_uuid',
+                return_value=objects.InstancePCIRequests(requests=[]))
+    def test_audit_reports_drift(self, mock_get):
+        flavor = self._fake_flavor_create()
+        claim_mem = flavor['memory_mb'] + FAKE_VIRT_MEMORY_OVERHEAD
+        instance = self._fake_instance(flavor=flavor, task_state=None)
+        self.tracker.instance_claim(self.context, instance, self.limits)
+        # The instance is gone without the tracker being told
+        del self._instances[instance['uuid']]
+
+        with mock.patch.object(resource_tracker.LOG, 'info') as log:
+            self.tracker.update_available_resource(self.context)
+        self._assert(0, 'memory_mb_used')
+        self.assertIn({'node': self.tracker.nodename,
+                       'last_audit': mock.ANY,
+                       'drift': {'memory_mb_used': -claim_mem,
+                                 'local_gb_used': -(flavor['root_gb'] +
+                                                    flavor['ephemeral_gb']),
+                                 'vcpus_used': -flavor['vcpus'],
+                                 'running_vms': -1}},
+                      [call[0][1] for call in log.call_args_list
+                       if len(call[0]) > 1])
+
+    def test_audit_no_drift(self):
+        with mock.patch.object(self.tracker, '_report_drift',
+                               return_value={}) as report_drift:
+            self.tracker.update_available_resource(self.context)
+        report_drift.assert_called_once_with({'memory_mb_used': 0,
+                                              'local_gb_used': 0,
+                                              'vcpus_used': 0,
+                                              'running_vms': 0})
+        self.assertEqual({}, self.tracker._report_drift(
+            report_drift.call_args[0][0]))
+
 
 class StatsDictTestCase(BaseTrackerTestCase):
     """Test stats handling for a virt driver that provides
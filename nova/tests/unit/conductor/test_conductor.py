@@ -151,6 +151,15 @@ class _BaseTestCase(object):
             self.context, 'fake-host', 'fake-node')
         self.assertEqual(result, 'fake-result')
 
+    def test_migration_get_in_progress_by_host(self):
+        self.mox.StubOutWithMock(db, 'migration_get_in_progress_by_host')
+        db.migration_get_in_progress_by_host(
+            self.context, 'fake-host').AndReturn('fake-result')
+        self.mox.ReplayAll()
+        result = self.conductor.migration_get_in_progress_by_host(
+            self.context, 'fake-host')
+        self.assertEqual(result, 'fake-result')
+
     def test_aggregate_metadata_get_by_host(self):
         self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
         db.aggregate_metadata_get_by_host(self.context, 'host',
@@ -873,6 +882,15 @@ class ConductorRPCAPITestCase(_BaseTestCase, test.TestCase):
         self.conductor.security_groups_trigger_handler(self.context,
                                                        'event', ['arg'])
 
+    def test_migration_get_in_progress_by_host_old_conductor(self):
+        self.flags(conductor='2.1', group='upgrade_levels')
+        self.conductor = conductor_rpcapi.ConductorAPI()
+        with mock.patch.object(db,
+                               'migration_get_in_progress_by_host') as get:
+            self.assertIsNone(self.conductor.migration_get_in_progress_by_host(
+                self.context, 'fake-host'))
+        self.assertFalse(get.called)
+
     @mock.patch.object(db, 'service_update')
     @mock.patch('oslo.messaging.RPCClient.prepare')
     def test_service_update_time_big(self, mock_prepare, mock_update):
@@ -243,6 +243,65 @@ class UnsupportedDbRegexpTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def test_instance_get_all_by_filters_chunked(self, mock_get_regexp):
+        for i in range(5):
+            self.create_instance_with_args(display_name='test%d' % i,
+                                           metadata={'index': str(i)})
+        self.create_instance_with_args(display_name='other')
+        filters = {'display_name': '%test%'}
+        sort_keys = ['display_name']
+        sort_dirs = ['asc']
+        expected = [inst['uuid'] for inst in
+                    db.instance_get_all_by_filters_sort(
+                        self.context, filters, sort_keys=sort_keys,
+                        sort_dirs=sort_dirs)]
+
+        for chunk_size in range(1, 7):
+            for limit, marker in ((None, None), (3, None),
+                                  (None, expected[0]), (2, expected[1])):
+                start = expected.index(marker) + 1 if marker else 0
+                stop = start + limit if limit else None
+                chunks = list(db.instance_get_all_by_filters_chunked(
+                    self.context, filters, chunk_size, limit=limit,
+                    marker=marker, sort_keys=sort_keys, sort_dirs=sort_dirs))
+                self.assertEqual(expected[start:stop],
+                                 [inst['uuid'] for chunk in chunks
+                                  for inst in chunk])
+                for chunk in chunks:
+                    self.assertTrue(0 < len(chunk) <= chunk_size)
+                    for inst in chunk:
+                        self.assertEqual(
+                            inst['display_name'][-1],
+                            inst['metadata'][0]['value'])
+
+    def test_instance_get_all_by_filters_chunked_columns(self,
+                                                        mock_get_regexp):
+        uuids = [self.create_instance_with_args(
+                    display_name='test%d' % i)['uuid'] for i in range(3)]
+        chunks = list(db.instance_get_all_by_filters_chunked(
+            self.context, {}, 2, sort_keys=['display_name'],
+            sort_dirs=['asc'], columns=['id', 'uuid']))
+        self.assertEqual(uuids, [inst['uuid'] for chunk in chunks
+                                 for inst in chunk])
+        # The sort keys are loaded to fetch the next chunk
+        self.assertEqual('test0', chunks[0][0]['display_name'])
+        self.assertNotIn('vm_state', chunks[0][0])
+
+    def test_instance_get_all_by_filters_chunked_deleted_marker(self,
+            mock_get_regexp):
+        uuids = [self.create_instance_with_args(
+                    display_name='test%d' % i)['uuid'] for i in range(4)]
+        chunks = db.instance_get_all_by_filters_chunked(
+            self.context, {'deleted': False}, 2, sort_keys=['display_name'],
+            sort_dirs=['asc'])
+        self.assertEqual(uuids[:2],
+                         [inst['uuid'] for inst in next(chunks)])
+        # The last instance of the chunk is deleted before the next chunk
+        db.instance_destroy(self.context, uuids[1])
+        self.assertEqual(uuids[2:],
+                         [inst['uuid'] for inst in next(chunks)])
+        self.assertRaises(StopIteration, next, chunks)
+
     def _assert_equals_inst_order(self, correct_order, filters,
                                   sort_keys=None, sort_dirs=None,
                                   limit=None, marker=None,
@@ -1059,7 +1118,8 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
             columns_to_join='columns', use_slave=True)
         mock_get_all_filters_sort.assert_called_once_with(ctxt, {'foo': 'bar'},
             limit=100, marker='uuid', columns_to_join='columns',
-            use_slave=True, sort_keys=['sort_key'], sort_dirs=['sort_dir'])
+            use_slave=True, sort_keys=['sort_key'], sort_dirs=['sort_dir'],
+            columns=None)
 
     def test_instance_get_all_by_filters_sort_key_invalid(self):
         '''InvalidSortKey raised if an invalid key is given.'''
@@ -1179,6 +1239,69 @@ class ProcessSortParamTestCase(test.TestCase):
                               dirs)
 
 
+class PaginateQueryTestCase(test.TestCase):
+
+    def setUp(self):
+        super(PaginateQueryTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        for host in ('host1', 'host2'):
+            for vm_state in (vm_states.ACTIVE, vm_states.STOPPED):
+                for _i in range(2):
+                    db.instance_create(self.ctxt, {'host': host,
+                                                   'vm_state': vm_state})
+
+    def _query(self):
+        return sqlalchemy_api.model_query(self.ctxt, models.Instance)
+
+    def test_paginate_query(self):
+        sort_keys = ['host', 'vm_state', 'id']
+        for sort_dirs in ([dir1, dir2, dir3]
+                          for dir1 in ('asc', 'desc')
+                          for dir2 in ('asc', 'desc')
+                          for dir3 in ('asc', 'desc')):
+            expected = sqlalchemy_api._paginate_query(
+                self._query(), models.Instance, None, sort_keys,
+                sort_dirs=sort_dirs).all()
+            self.assertEqual(8, len(expected))
+            result = []
+            marker = None
+            while True:
+                page = sqlalchemy_api._paginate_query(
+                    self._query(), models.Instance, 3, sort_keys,
+                    marker=marker, sort_dirs=sort_dirs).all()
+                result.extend(page)
+                if len(page) < 3:
+                    break
+                marker = page[-1]
+            self.assertEqual([instance.id for instance in expected],
+                             [instance.id for instance in result])
+            for instance1, instance2 in zip(expected, expected[1:]):
+                key1 = tuple(instance1[key] for key in sort_keys)
+                key2 = tuple(instance2[key] for key in sort_keys)
+                for value1, value2, sort_dir in zip(key1, key2, sort_dirs):
+                    if value1 != value2:
+                        self.assertEqual(sort_dir == 'asc', value1 < value2)
+                        break
+
+    def test_paginate_query_leading_range(self):
+        marker = self._query().first()
+        query = sqlalchemy_api._paginate_query(
+            self._query(), models.Instance, 2, ['created_at', 'id'],
+            marker=marker, sort_dirs=['desc', 'desc'])
+        self.assertIn('instances.created_at <= ', str(query))
+
+    def test_paginate_query_invalid_sort_key(self):
+        self.assertRaises(db_exc.InvalidSortKey,
+                          sqlalchemy_api._paginate_query, self._query(),
+                          models.Instance, None, ['id', 'foo'])
+
+    def test_paginate_query_invalid_sort_dir(self):
+        self.assertRaises(ValueError,
+                          sqlalchemy_api._paginate_query, self._query(),
+                          models.Instance, None, ['host', 'id'],
+                          sort_dirs=['asc', 'up'])
+
+
 class MigrationTestCase(test.TestCase):
 
     def setUp(self):
@@ -1244,6 +1367,16 @@ class MigrationTestCase(test.TestCase):
         self.assertEqual(3, len(migrations))
         self._assert_in_progress(migrations)
 
+    def test_in_progress_host2(self):
+        migrations = db.migration_get_in_progress_by_host(self.ctxt, 'host2')
+        # 2 as dest, 2 as source, whatever their nodes
+        self.assertEqual(4, len(migrations))
+        self._assert_in_progress(migrations)
+        self.assertEqual(set(['a', 'b']),
+                         set(migration['source_node']
+                             for migration in migrations
+                             if migration['source_compute'] == 'host2'))
+
     def test_instance_join(self):
         migrations = db.migration_get_in_progress_by_host_and_node(self.ctxt,
                 'host2', 'b')
@@ -1260,6 +1393,38 @@ class MigrationTestCase(test.TestCase):
             hosts = [migration['source_compute'], migration['dest_compute']]
             self.assertIn(filters["host"], hosts)
 
+    def test_get_migrations_by_filters_paginated(self):
+        filters = {"status": "migrating"}
+        expected = db.migration_get_all_by_filters(
+            self.ctxt, filters, sort_keys=['id'], sort_dirs=['asc'])
+        self.assertEqual(5, len(expected))
+        self.assertEqual(sorted(migration['id'] for migration in expected),
+                         [migration['id'] for migration in expected])
+        page1 = db.migration_get_all_by_filters(
+            self.ctxt, filters, limit=3, sort_keys=['id'], sort_dirs=['asc'])
+        page2 = db.migration_get_all_by_filters(
+            self.ctxt, filters, limit=3, marker=page1[-1]['id'],
+            sort_keys=['id'], sort_dirs=['asc'])
+        self.assertEqual([migration['id'] for migration in expected],
+                         [migration['id'] for migration in page1 + page2])
+
+    def test_get_migrations_by_filters_newest_first(self):
+        migrations = db.migration_get_all_by_filters(self.ctxt, {})
+        self.assertEqual(
+            sorted((migration['id'] for migration in migrations),
+                   reverse=True),
+            [migration['id'] for migration in migrations])
+
+    def test_get_migrations_by_filters_marker_not_found(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.migration_get_all_by_filters, self.ctxt, {},
+                          marker=1234)
+
+    def test_get_migrations_by_filters_sort_key_invalid(self):
+        self.assertRaises(exception.InvalidSortKey,
+                          db.migration_get_all_by_filters, self.ctxt, {},
+                          sort_keys=['foo'])
+
     def test_only_admin_can_get_all_migrations_by_filters(self):
         user_ctxt = context.RequestContext(user_id=None, project_id=None,
                                    is_admin=False, read_deleted="no",
@@ -2029,6 +2194,25 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         instances = db.instance_get_all_by_filters(self.ctxt, {}, limit=0)
         self.assertEqual([], instances)
 
+    def test_instance_get_all_by_filters_columns(self):
+        instance = self.create_instance_with_args(metadata={'foo': 'bar'})
+        result = db.instance_get_all_by_filters(
+            self.ctxt, {}, columns_to_join=['metadata'],
+            columns=['id', 'uuid', 'vm_state'])
+        self.assertEqual(1, len(result))
+        self.assertEqual(instance['vm_state'], result[0]['vm_state'])
+        self.assertEqual('bar', result[0]['metadata'][0]['value'])
+        self.assertNotIn('host', result[0])
+
+    def test_instance_get_all_by_host_columns(self):
+        instance = self.create_instance_with_args()
+        self.create_instance_with_args(host='host2')
+        result = db.instance_get_all_by_host(
+            self.ctxt, 'h1', columns=['id', 'uuid', 'task_state'])
+        self.assertEqual([instance['uuid']], [inst['uuid'] for inst in result])
+        self.assertEqual(instance['task_state'], result[0]['task_state'])
+        self.assertNotIn('host', result[0])
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
@@ -2474,6 +2658,47 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self.assertEqual('building', old_ref['vm_state'])
         self.assertEqual('needscoffee', new_ref['vm_state'])
 
+    def test_instance_bulk_update(self):
+        instance1 = self.create_instance_with_args(task_state=None)
+        instance2 = self.create_instance_with_args(
+            task_state=task_states.DELETING)
+        instance3 = self.create_instance_with_args(task_state=None)
+        missing_uuid = str(stdlib_uuid.uuid4())
+        values = {'task_state': task_states.REBOOTING,
+                  'expected_task_state': [None]}
+        updated, conflicts = db.instance_bulk_update(
+            self.ctxt, {instance1['uuid']: values,
+                        instance2['uuid']: values,
+                        instance3['uuid']: {'metadata': {'mk1': 'mv3'}},
+                        missing_uuid: values,
+                        'fake-uuid': values})
+
+        self.assertEqual(set([instance1['uuid'], instance3['uuid']]),
+                         set(updated))
+        old_ref, new_ref = updated[instance1['uuid']]
+        self.assertIsNone(old_ref['task_state'])
+        self.assertEqual(task_states.REBOOTING, new_ref['task_state'])
+        old_ref, new_ref = updated[instance3['uuid']]
+        self.assertEqual({'mk1': 'mv3'},
+                         utils.metadata_to_dict(new_ref['metadata']))
+
+        self.assertEqual(set([instance2['uuid'], missing_uuid, 'fake-uuid']),
+                         set(conflicts))
+        self.assertIsInstance(conflicts[instance2['uuid']],
+                              exception.UnexpectedDeletingTaskStateError)
+        self.assertIsInstance(conflicts[missing_uuid],
+                              exception.InstanceNotFound)
+        self.assertIsInstance(conflicts['fake-uuid'], exception.InvalidUUID)
+
+        self.assertEqual(task_states.REBOOTING,
+                         db.instance_get_by_uuid(
+                             self.ctxt, instance1['uuid'])['task_state'])
+        self.assertEqual(task_states.DELETING,
+                         db.instance_get_by_uuid(
+                             self.ctxt, instance2['uuid'])['task_state'])
+        # The values are not changed by the update
+        self.assertEqual([None], values['expected_task_state'])
+
     def test_instance_update_and_get_original_metadata(self):
         instance = self.create_instance_with_args()
         columns_to_join = ['metadata']
@@ -3069,6 +3294,27 @@ class InstanceActionTestCase(test.TestCase, ModelsObjectComparatorMixin):
 
         self._assertEqualOrderedListOfObjects([action2, action1], actions)
 
+    def test_instance_actions_get_paginated(self):
+        """Ensure the actions are paginated after the marker."""
+        uuid1 = str(stdlib_uuid.uuid4())
+        action_values = self._create_action_values(uuid1)
+        expected = []
+        for i in range(5):
+            action_values['request_id'] = 'req-%d' % i
+            expected.insert(0, db.action_start(self.ctxt, action_values))
+
+        page1 = db.actions_get(self.ctxt, uuid1, limit=3)
+        page2 = db.actions_get(self.ctxt, uuid1, limit=3,
+                               marker=page1[-1]['request_id'])
+        self.assertEqual(3, len(page1))
+        self.assertEqual(2, len(page2))
+        self._assertEqualOrderedListOfObjects(expected, page1 + page2)
+
+    def test_instance_actions_get_marker_not_found(self):
+        self.assertRaises(exception.MarkerNotFound,
+                          db.actions_get, self.ctxt,
+                          str(stdlib_uuid.uuid4()), marker='req-fake')
+
     def test_instance_action_get_by_instance_and_action(self):
         """Ensure we can get an action by instance UUID and action id."""
         ctxt2 = context.get_admin_context()
@@ -6548,6 +6794,32 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = jsonutils.loads(node['stats'])
         self.assertEqual(self.stats, new_stats)
 
+    def test_compute_node_get_all_changed_since(self):
+        before = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, before)
+        self.assertEqual([self.item['id']], [node['id'] for node in nodes])
+
+        after = timeutils.utcnow() + datetime.timedelta(seconds=10)
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, after)
+        self.assertEqual([], nodes)
+
+    def test_compute_node_get_all_changed_since_updated(self):
+        since = timeutils.utcnow() + datetime.timedelta(seconds=10)
+        with mock.patch.object(timeutils, 'utcnow',
+                return_value=since + datetime.timedelta(seconds=1)):
+            db.compute_node_update(self.ctxt, self.item['id'],
+                                   {'vcpus_used': 1})
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertEqual(1, nodes[0]['vcpus_used'])
+
+    def test_compute_node_get_all_changed_since_deleted(self):
+        since = timeutils.utcnow() - datetime.timedelta(seconds=10)
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        nodes = db.compute_node_get_all_changed_since(self.ctxt, since)
+        self.assertEqual(1, len(nodes))
+        self.assertTrue(nodes[0]['deleted'])
+
     def test_compute_node_get_all_deleted_compute_node(self):
         # Create a service and compute node and ensure we can find its stats;
         # delete the service and compute node when done and loop again
@@ -6717,6 +6989,37 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         new_stats = jsonutils.loads(item_updated['stats'])
         self.assertEqual(stats, new_stats)
 
+    def test_compute_node_claim(self):
+        expected = {'free_ram_mb': 1024, 'free_disk_gb': 2048,
+                    'vcpus_used': 0}
+        item = db.compute_node_claim(self.ctxt, self.item['id'], expected,
+                                     512, 10, 1)
+        self.assertEqual(512, item['free_ram_mb'])
+        self.assertEqual(512, item['memory_mb_used'])
+        self.assertEqual(2038, item['free_disk_gb'])
+        self.assertEqual(10, item['local_gb_used'])
+        self.assertEqual(1, item['vcpus_used'])
+        self.assertIsNotNone(item['updated_at'])
+
+    def test_compute_node_claim_conflict(self):
+        # Another claim went through since the usage was read
+        expected = {'free_ram_mb': 1024, 'free_disk_gb': 2048,
+                    'vcpus_used': 0}
+        db.compute_node_claim(self.ctxt, self.item['id'], expected,
+                              512, 10, 1)
+        self.assertRaises(exception.ComputeHostClaimConflict,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          expected, 512, 10, 1)
+        item = db.compute_node_get(self.ctxt, self.item['id'])
+        self.assertEqual(512, item['free_ram_mb'])
+        self.assertEqual(1, item['vcpus_used'])
+
+    def test_compute_node_claim_not_found(self):
+        db.compute_node_delete(self.ctxt, self.item['id'])
+        self.assertRaises(exception.ComputeHostNotFound,
+                          db.compute_node_claim, self.ctxt, self.item['id'],
+                          {'free_ram_mb': 1024}, 512, 10, 1)
+
     def test_compute_node_delete(self):
         compute_node_id = self.item['id']
         db.compute_node_delete(self.ctxt, compute_node_id)
@@ -7891,6 +8194,103 @@ class ArchiveTestCase(test.TestCase):
         si_rows = self.conn.execute(qsi).fetchall()
         self.assertEqual(len(siim_rows) + len(si_rows), 8)
 
+    def _create_instance_id_mappings(self, deleted):
+        ids = []
+        for uuidstr, is_deleted in zip(self.uuidstrs, deleted):
+            ins_stmt = self.instance_id_mappings.insert().values(
+                uuid=uuidstr, deleted=1 if is_deleted else 0)
+            ids.append(self.conn.execute(ins_stmt).inserted_primary_key[0])
+        return ids
+
+    def _get_instance_id_mappings(self, table):
+        query = sql.select([table.c.uuid]).where(
+            table.c.uuid.in_(self.uuidstrs))
+        return set(row[0] for row in self.conn.execute(query))
+
+    def test_archive_deleted_rows_keeps_live_rows(self):
+        self._create_instance_id_mappings([True, False, True])
+        db.archive_deleted_rows_for_table(self.context,
+                                          "instance_id_mappings")
+        self.assertEqual(set([self.uuidstrs[1]]),
+                         self._get_instance_id_mappings(
+                             self.instance_id_mappings))
+        self.assertEqual(set([self.uuidstrs[0], self.uuidstrs[2]]),
+                         self._get_instance_id_mappings(
+                             self.shadow_instance_id_mappings))
+
+    @mock.patch('time.sleep')
+    def test_archive_deleted_rows_in_chunks(self, mock_sleep):
+        self._create_instance_id_mappings([True] * 5)
+        progress = mock.Mock()
+        num = db.archive_deleted_rows_for_table(
+            self.context, "instance_id_mappings", chunk_size=2,
+            chunk_sleep=0.5, progress=progress)
+        self.assertEqual(5, num)
+        self.assertEqual([mock.call("instance_id_mappings", 2),
+                          mock.call("instance_id_mappings", 2),
+                          mock.call("instance_id_mappings", 1)],
+                         progress.call_args_list)
+        self.assertEqual(3, mock_sleep.call_args_list.count(mock.call(0.5)))
+        self.assertEqual(set(), self._get_instance_id_mappings(
+            self.instance_id_mappings))
+
+    def test_archive_deleted_rows_checkpoint(self):
+        ids = self._create_instance_id_mappings([True, False, True, True])
+        checkpoint = {}
+        num = db.archive_deleted_rows(self.context, max_rows=2,
+                                      chunk_size=1, checkpoint=checkpoint)
+        self.assertEqual(2, num)
+        self.assertEqual({'marker': ids[2], 'done': False},
+                         checkpoint["instance_id_mappings"])
+        # The run resumes after the checkpoint, then archives the rows
+        # deleted behind it meanwhile
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.id == ids[1]).\
+                values(deleted=1)
+        self.conn.execute(update_statement)
+        num = db.archive_deleted_rows(self.context, checkpoint=checkpoint)
+        self.assertEqual(2, num)
+        self.assertEqual({'marker': None, 'done': True},
+                         checkpoint["instance_id_mappings"])
+        self.assertEqual(set(), self._get_instance_id_mappings(
+            self.instance_id_mappings))
+        # The tables done are skipped
+        num = db.archive_deleted_rows(self.context, checkpoint=checkpoint)
+        self.assertEqual(0, num)
+        self.assertTrue(all(state['done']
+                            for state in checkpoint.values()))
+
+    def test_archive_deleted_rows_workers(self):
+        self._create_instance_id_mappings([True, True, False])
+        for uuidstr in self.uuidstrs[:3]:
+            ins_stmt = self.instances.insert().values(uuid=uuidstr,
+                                                      deleted=1)
+            self.conn.execute(ins_stmt)
+        num = db.archive_deleted_rows(self.context, max_rows=3,
+                                      chunk_size=1, workers=4)
+        self.assertEqual(3, num)
+        num = db.archive_deleted_rows(self.context, workers=4)
+        self.assertEqual(2, num)
+
+    def test_archive_tables_reflected_once(self):
+        sqlalchemy_api._ARCHIVE_TABLES.clear()
+        with mock.patch.object(sqlalchemy_api, 'Table',
+                               wraps=sqlalchemy_api.Table) as mock_table:
+            db.archive_deleted_rows_for_table(self.context, "consoles")
+            db.archive_deleted_rows_for_table(self.context, "consoles")
+        self.assertEqual(2, mock_table.call_count)
+
+    def test_archive_table_groups(self):
+        groups = sqlalchemy_api._archive_table_groups(
+            ["console_pools", "consoles", "instances", "instance_metadata",
+             "instance_id_mappings"])
+        levels = {tablename: level
+                  for level, group in enumerate(groups)
+                  for tablename in group}
+        self.assertLess(levels["consoles"], levels["console_pools"])
+        self.assertLess(levels["instance_metadata"], levels["instances"])
+        self.assertEqual(0, levels["instance_id_mappings"])
+
 
 class InstanceGroupDBApiTestCase(test.TestCase, ModelsObjectComparatorMixin):
     def setUp(self):
@@ -831,6 +831,17 @@ class NovaMigrationsCheckers(test_migrations.ModelsMigrationsSync,
         self.assertIndexNotExists(engine, 'fixed_ips',
                                   'fixed_ips_deleted_allocated_updated_at_idx')
 
+    def _check_278(self, engine, data):
+        self.assertIndexMembers(
+            engine, 'instances',
+            'instances_project_id_deleted_created_at_id_idx',
+            ['project_id', 'deleted', 'created_at', 'id'])
+
+    def _post_downgrade_278(self, engine):
+        self.assertIndexNotExists(
+            engine, 'instances',
+            'instances_project_id_deleted_created_at_id_idx')
+
 
 class TestNovaMigrationsSQLite(NovaMigrationsCheckers,
                                test_base.DbTestCase,
@@ -21,6 +21,7 @@ from nova import exception
 from nova import objects
 from nova.objects import compute_node
 from nova.objects import hv_spec
+from nova.objects import pci_device_pool
 from nova.objects import service
 from nova.tests.unit import fake_pci_device_pools
 from nova.tests.unit.objects import test_objects
@@ -274,6 +275,24 @@ class _TestComputeNodeObject(object):
                          subs=self.subs(),
                          comparators=self.comparators())
 
+    def test_save_pci_device_pools(self):
+        self.mox.StubOutWithMock(db, 'compute_node_update')
+        db.compute_node_update(
+            self.context, 123,
+            {
+                'pci_stats': jsonutils.dumps(
+                    [fake_pci_device_pools.fake_pool.to_dict()]),
+            }).AndReturn(fake_compute_node)
+        self.mox.ReplayAll()
+        compute = compute_node.ComputeNode(context=self.context)
+        compute.id = 123
+        compute.pci_device_pools = fake_pci_device_pools.fake_pool_list
+        compute.save()
+        pools = pci_device_pool.from_pci_stats(
+            jsonutils.dumps([fake_pci_device_pools.fake_pool.to_dict()]))
+        self.assertEqual(fake_pci_device_pools.fake_pool.to_dict(),
+                         pools[0].to_dict())
+
     def test_recreate_fails(self):
         self.mox.StubOutWithMock(db, 'compute_node_create')
         db.compute_node_create(self.context, {'service_id': 456}).AndReturn(
@@ -324,6 +343,21 @@ class _TestComputeNodeObject(object):
         compute.id = 123
         compute.destroy()
 
+    def test_claim(self):
+        self.mox.StubOutWithMock(db, 'compute_node_claim')
+        db.compute_node_claim(
+            self.context, 123,
+            {'free_ram_mb': 1024, 'free_disk_gb': 10, 'vcpus_used': 1},
+            512, 5, 2).AndReturn(fake_compute_node)
+        self.mox.ReplayAll()
+        compute = compute_node.ComputeNode(context=self.context, id=123,
+                                           free_ram_mb=1024, free_disk_gb=10,
+                                           vcpus_used=1)
+        compute.claim(512, 5, 2)
+        self.compare_obj(compute, fake_compute_node,
+                         subs=self.subs(),
+                         comparators=self.comparators())
+
     def test_service(self):
         self.mox.StubOutWithMock(service.Service, 'get_by_id')
         service.Service.get_by_id(self.context, 456).AndReturn('my-service')
@@ -346,6 +380,18 @@ class _TestComputeNodeObject(object):
                          subs=self.subs(),
                          comparators=self.comparators())
 
+    @mock.patch('nova.db.compute_node_get_all_changed_since')
+    def test_get_all_changed_since(self, cn_get_all_changed_since):
+        cn_get_all_changed_since.return_value = [fake_compute_node]
+        since = NOW.replace(microsecond=123)
+        computes = compute_node.ComputeNodeList.get_all_changed_since(
+            self.context, since)
+        self.assertEqual(1, len(computes))
+        self.compare_obj(computes[0], fake_compute_node,
+                         subs=self.subs(),
+                         comparators=self.comparators())
+        cn_get_all_changed_since.assert_called_once_with(self.context, since)
+
     def test_get_by_hypervisor(self):
         self.mox.StubOutWithMock(db, 'compute_node_search_by_hypervisor')
         db.compute_node_search_by_hypervisor(self.context, 'hyper').AndReturn(
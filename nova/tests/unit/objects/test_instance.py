@@ -1026,6 +1026,67 @@ class _TestInstanceObject(object):
         self.assertEqual(fake_fault['id'], fault.id)
         self.assertNotIn('metadata', inst.obj_what_changed())
 
+    @mock.patch.object(objects.Instance, 'get_by_uuid')
+    def test_load_columns(self, mock_get):
+        def fake_get(context, uuid, expected_attrs):
+            self.assertEqual('yes', context.read_deleted)
+            return fake_instance.fake_instance_obj(
+                self.context, host='foo', vm_state='active', task_state=None)
+
+        mock_get.side_effect = fake_get
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(),
+            {'id': 1, 'uuid': 'fake-uuid', 'task_state': 'rebooting',
+             'deleted': 0},
+            columns=['id', 'task_state', 'uuid'])
+        self.assertFalse(inst.obj_attr_is_set('host'))
+        self.assertEqual('foo', inst.host)
+        self.assertEqual('active', inst.vm_state)
+        self.assertEqual('rebooting', inst.task_state)
+        mock_get.assert_called_once_with(self.context, uuid='fake-uuid',
+                                         expected_attrs=[])
+        self.assertEqual('no', self.context.read_deleted)
+        self.assertEqual(set(), inst.obj_what_changed())
+        self.assertIsNone(inst._loaded_columns)
+
+    def test_load_columns_kept_by_copies(self):
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(), {'id': 1, 'uuid': 'fake-uuid'},
+            columns=['id', 'uuid'])
+        primitive = inst.obj_to_primitive()
+        self.assertEqual(['id', 'uuid'],
+                         instance.Instance.obj_from_primitive(
+                             primitive)._loaded_columns)
+        self.assertEqual(['id', 'uuid'], inst.obj_clone()._loaded_columns)
+
+    def test_load_columns_not_kept_by_full_copies(self):
+        inst = fake_instance.fake_instance_obj(self.context)
+        primitive = inst.obj_to_primitive()
+        self.assertIsNone(instance.Instance.obj_from_primitive(
+            primitive)._loaded_columns)
+
+    @mock.patch.object(objects.Instance, 'get_by_uuid')
+    def test_load_column_not_from_db(self, mock_get):
+        inst = instance.Instance(context=self.context, id=1,
+                                 uuid='fake-uuid')
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'host')
+        self.assertFalse(mock_get.called)
+
+    @mock.patch.object(objects.Instance, 'get_by_uuid')
+    def test_load_column_uuid(self, mock_get):
+        inst = instance.Instance._from_db_object(
+            self.context, instance.Instance(), {'id': 1},
+            columns=['id'])
+        self.assertRaises(exception.ObjectActionError,
+                          inst.obj_load_attr, 'uuid')
+        self.assertFalse(mock_get.called)
+
+    def test_from_db_object_missing_column(self):
+        self.assertRaises(KeyError, instance.Instance._from_db_object,
+                          self.context, instance.Instance(),
+                          {'id': 1, 'uuid': 'fake-uuid'})
+
     def test_get_with_extras(self):
         pci_requests = objects.InstancePCIRequests(requests=[
             objects.InstancePCIRequest(count=123, spec=[])])
@@ -1218,7 +1279,8 @@ class _TestInstanceListObject(object):
         db.instance_get_all_by_filters(self.context, {'foo': 'bar'}, 'uuid',
                                        'asc', limit=None, marker=None,
                                        columns_to_join=['metadata'],
-                                       use_slave=False).AndReturn(fakes)
+                                       use_slave=False,
+                                       columns=None).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
             self.context, {'foo': 'bar'}, 'uuid', 'asc',
@@ -1237,7 +1299,8 @@ class _TestInstanceListObject(object):
                                             columns_to_join=['metadata'],
                                             use_slave=False,
                                             sort_keys=['uuid'],
-                                            sort_dirs=['asc']).AndReturn(fakes)
+                                            sort_dirs=['asc'],
+                                            columns=None).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
             self.context, {'foo': 'bar'}, expected_attrs=['metadata'],
@@ -1260,7 +1323,8 @@ class _TestInstanceListObject(object):
             limit=100, marker='uuid', use_slave=True)
         mock_get_by_filters.assert_called_once_with(
             self.context, {'foo': 'bar'}, 'key', 'dir', limit=100,
-            marker='uuid', columns_to_join=None, use_slave=True)
+            marker='uuid', columns_to_join=None, use_slave=True,
+            columns=None)
         self.assertEqual(0, mock_get_by_filters_sort.call_count)
 
     @mock.patch.object(db, 'instance_get_all_by_filters_sort')
@@ -1277,7 +1341,8 @@ class _TestInstanceListObject(object):
         mock_get_by_filters_sort.assert_called_once_with(
             self.context, {'foo': 'bar'}, limit=100,
             marker='uuid', columns_to_join=None, use_slave=True,
-            sort_keys=['key1', 'key2'], sort_dirs=['dir1', 'dir2'])
+            sort_keys=['key1', 'key2'], sort_dirs=['dir1', 'dir2'],
+            columns=None)
         self.assertEqual(0, mock_get_by_filters.call_count)
 
     def test_get_all_by_filters_works_for_cleaned(self):
@@ -1290,7 +1355,8 @@ class _TestInstanceListObject(object):
                                        {'deleted': True, 'cleaned': False},
                                        'uuid', 'asc', limit=None, marker=None,
                                        columns_to_join=['metadata'],
-                                       use_slave=False).AndReturn(
+                                       use_slave=False,
+                                       columns=None).AndReturn(
                                            [fakes[1]])
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_filters(
@@ -1308,7 +1374,8 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
         db.instance_get_all_by_host(self.context, 'foo',
                                     columns_to_join=None,
-                                    use_slave=False).AndReturn(fakes)
+                                    use_slave=False,
+                                    columns=None).AndReturn(fakes)
         self.mox.ReplayAll()
         inst_list = instance.InstanceList.get_by_host(self.context, 'foo')
         for i in range(0, len(fakes)):
@@ -1318,6 +1385,26 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.obj_what_changed(), set())
         self.assertRemotes()
 
+    def test_get_by_host_columns(self):
+        fakes = [self.fake_instance(1), self.fake_instance(2)]
+        columns = ['id', 'task_state', 'uuid']
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(
+            self.context, 'foo', columns_to_join=[], use_slave=False,
+            columns=columns).AndReturn(
+                [{column: fake[column] for column in columns}
+                 for fake in fakes])
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(
+            self.context, 'foo', expected_attrs=[], columns=['task_state'])
+        for i in range(0, len(fakes)):
+            self.assertEqual(fakes[i]['uuid'], inst_list.objects[i].uuid)
+            self.assertEqual(fakes[i]['task_state'],
+                             inst_list.objects[i].task_state)
+            self.assertFalse(inst_list.objects[i].obj_attr_is_set('host'))
+            self.assertEqual(columns, inst_list.objects[i]._loaded_columns)
+        self.assertRemotes()
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
@@ -1399,7 +1486,7 @@ class _TestInstanceListObject(object):
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
         db.instance_get_all_by_host(self.context, 'host',
                                     columns_to_join=[],
-                                    use_slave=False
+                                    use_slave=False, columns=None
                                     ).AndReturn(fake_insts)
         db.instance_fault_get_by_instance_uuids(
             self.context, [x['uuid'] for x in fake_insts]
@@ -1413,6 +1500,79 @@ class _TestInstanceListObject(object):
                          dict(instances[0].fault.iteritems()))
         self.assertIsNone(instances[1].fault)
 
+    def _get_instance_list(self, db_insts):
+        insts = [instance.Instance._from_db_object(
+                     self.context, instance.Instance(), db_inst)
+                 for db_inst in db_insts]
+        for inst in insts:
+            inst.obj_reset_changes()
+        inst_list = instance.InstanceList(objects=insts)
+        inst_list._context = self.context
+        return inst_list
+
+    @mock.patch.object(notifications, 'send_update')
+    @mock.patch.object(db, 'instance_bulk_update')
+    def test_save_all(self, mock_update, mock_send):
+        self.flags(enable=False, group='cells')
+        db_insts = [self.fake_instance(i, {'uuid': 'fake-uuid%d' % i,
+                                           'task_state': None})
+                    for i in range(3)]
+        inst_list = self._get_instance_list(db_insts)
+        inst_list[0].task_state = 'foo'
+        inst_list[1].task_state = 'foo'
+        conflict = exception.UnexpectedTaskStateError(actual='bar',
+                                                      expected=[None])
+        mock_update.return_value = (
+            {'fake-uuid0': (db_insts[0],
+                            dict(db_insts[0], task_state='foo'))},
+            {'fake-uuid1': conflict})
+
+        conflicts = inst_list.save_all(expected_task_state=[None])
+
+        self.assertEqual({'fake-uuid1': conflict.format_message()},
+                         conflicts)
+        expected_updates = {'task_state': 'foo',
+                            'expected_task_state': [None]}
+        mock_update.assert_called_once_with(
+            self.context, {'fake-uuid0': expected_updates,
+                           'fake-uuid1': expected_updates},
+            columns_to_join=mock.ANY)
+        self.assertEqual(1, mock_send.call_count)
+        self.assertEqual('foo', inst_list[0].task_state)
+        # NOTE(danms): Ignore flavor migrations for the moment
+        self.assertEqual(set(),
+                         inst_list[0].obj_what_changed() - set(['flavor']))
+        self.assertIn('task_state', inst_list[1].obj_what_changed())
+        self.assertEqual(set(),
+                         inst_list[2].obj_what_changed() - set(['flavor']))
+
+    @mock.patch.object(db, 'instance_bulk_update')
+    def test_save_all_no_updates(self, mock_update):
+        inst_list = self._get_instance_list([self.fake_instance(1)])
+        self.assertEqual({}, inst_list.save_all())
+        self.assertFalse(mock_update.called)
+
+    @mock.patch('nova.cells.opts.get_cell_type', return_value='api')
+    @mock.patch.object(instance.Instance, 'save')
+    @mock.patch.object(db, 'instance_bulk_update')
+    def test_save_all_in_api_cell(self, mock_update, mock_save,
+                                  mock_cell_type):
+        db_insts = [self.fake_instance(i, {'uuid': 'fake-uuid%d' % i})
+                    for i in range(2)]
+        inst_list = self._get_instance_list(db_insts)
+        conflict = exception.UnexpectedVMStateError(actual='bar',
+                                                    expected=['foo'])
+        mock_save.side_effect = [None, conflict]
+
+        conflicts = inst_list.save_all(expected_vm_state=['foo'])
+
+        self.assertEqual({'fake-uuid1': conflict.format_message()},
+                         conflicts)
+        mock_save.assert_called_with(expected_vm_state=['foo'],
+                                     expected_task_state=None)
+        self.assertEqual(2, mock_save.call_count)
+        self.assertFalse(mock_update.called)
+
     def test_fill_faults(self):
         self.mox.StubOutWithMock(db, 'instance_fault_get_by_instance_uuids')
 
@@ -1473,12 +1633,44 @@ class _TestInstanceListObject(object):
 
 class TestInstanceListObject(test_objects._LocalTest,
                              _TestInstanceListObject):
-    pass
+    @mock.patch.object(db, 'instance_get_all_by_filters_chunked')
+    def test_iter_by_filters(self, mock_get_chunked):
+        fakes = [self.fake_instance(i, updates={'uuid': 'uuid%d' % i})
+                 for i in range(3)]
+        mock_get_chunked.return_value = iter([fakes[:2], fakes[2:]])
+        instances = instance.InstanceList.iter_by_filters(
+            self.context, {'foo': 'bar'}, expected_attrs=['metadata'],
+            chunk_size=2)
+        self.assertFalse(mock_get_chunked.called)
+
+        self.assertEqual(['uuid0', 'uuid1', 'uuid2'],
+                         [inst.uuid for inst in instances])
+        mock_get_chunked.assert_called_once_with(
+            self.context, {'foo': 'bar'}, 2, limit=None, marker=None,
+            columns_to_join=['metadata'], use_slave=False,
+            sort_keys=['created_at'], sort_dirs=['desc'], columns=None)
 
 
 class TestRemoteInstanceListObject(test_objects._RemoteTest,
                                    _TestInstanceListObject):
-    pass
+    @mock.patch.object(db, 'instance_get_all_by_filters_sort')
+    def test_iter_by_filters(self, mock_get_sort):
+        fakes = [self.fake_instance(i, updates={'uuid': 'uuid%d' % i})
+                 for i in range(5)]
+        mock_get_sort.side_effect = [fakes[:2], fakes[2:4]]
+        instances = instance.InstanceList.iter_by_filters(
+            self.context, {'foo': 'bar'}, limit=4, marker='marker',
+            chunk_size=2)
+
+        self.assertEqual(['uuid0', 'uuid1', 'uuid2', 'uuid3'],
+                         [inst.uuid for inst in instances])
+        self.assertEqual(
+            [mock.call(mock.ANY, {'foo': 'bar'}, limit=2, marker=marker,
+                       columns_to_join=None, use_slave=False,
+                       sort_keys=['created_at'], sort_dirs=['desc'],
+                       columns=None)
+             for marker in ('marker', 'uuid1')],
+            mock_get_sort.call_args_list)
 
 
 class TestInstanceObjectMisc(test.NoDBTestCase):
@@ -1487,6 +1679,12 @@ class TestInstanceObjectMisc(test.NoDBTestCase):
         self.assertEqual(['bar'], instance._expected_cols(['foo', 'bar']))
         self.assertIsNone(instance._expected_cols(None))
 
+    def test_expected_columns(self):
+        self.flags(instance_name_template='%(hostname)s-%(metadata)s')
+        self.assertEqual(['hostname', 'id', 'uuid', 'vm_state'],
+                         instance._expected_columns(['vm_state']))
+        self.assertIsNone(instance._expected_columns(None))
+
     def test_expected_cols_extra(self):
         self.assertEqual(['metadata', 'extra', 'extra.numa_topology'],
                          instance._expected_cols(['metadata',
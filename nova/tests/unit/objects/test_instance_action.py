@@ -171,7 +171,19 @@ class _TestInstanceActionObject(object):
             self.context, 'fake-uuid')
         for index, action in enumerate(obj_list):
             self.compare_obj(action, fake_actions[index])
-        mock_get.assert_called_once_with(self.context, 'fake-uuid')
+        mock_get.assert_called_once_with(self.context, 'fake-uuid',
+                                         limit=None, marker=None)
+
+    @mock.patch.object(db, 'actions_get')
+    def test_get_list_paginated(self, mock_get):
+        fake_actions = [dict(fake_action, id=1234)]
+        mock_get.return_value = fake_actions
+        obj_list = instance_action.InstanceActionList.get_by_instance_uuid(
+            self.context, 'fake-uuid', limit=1, marker='fake-request')
+        self.assertEqual(1, len(obj_list))
+        self.compare_obj(obj_list[0], fake_actions[0])
+        mock_get.assert_called_once_with(self.context, 'fake-uuid',
+                                         limit=1, marker='fake-request')
 
 
 class TestInstanceActionObject(test_objects._LocalTest,
@@ -166,13 +166,31 @@ class _TestMigrationObject(object):
         self.mox.StubOutWithMock(
             db, 'migration_get_all_by_filters')
         filters = {'foo': 'bar'}
-        db.migration_get_all_by_filters(ctxt, filters).AndReturn(db_migrations)
+        db.migration_get_all_by_filters(
+            ctxt, filters, limit=None, marker=None, sort_keys=None,
+            sort_dirs=None).AndReturn(db_migrations)
         self.mox.ReplayAll()
         migrations = migration.MigrationList.get_by_filters(ctxt, filters)
         self.assertEqual(2, len(migrations))
         for index, db_migration in enumerate(db_migrations):
             self.compare_obj(migrations[index], db_migration)
 
+    def test_get_by_filters_paginated(self):
+        ctxt = context.get_admin_context()
+        db_migrations = [fake_db_migration()]
+        self.mox.StubOutWithMock(
+            db, 'migration_get_all_by_filters')
+        filters = {'foo': 'bar'}
+        db.migration_get_all_by_filters(
+            ctxt, filters, limit=1, marker=456, sort_keys=['updated_at'],
+            sort_dirs=['asc']).AndReturn(db_migrations)
+        self.mox.ReplayAll()
+        migrations = migration.MigrationList.get_by_filters(
+            ctxt, filters, limit=1, marker=456, sort_keys=['updated_at'],
+            sort_dirs=['asc'])
+        self.assertEqual(1, len(migrations))
+        self.compare_obj(migrations[0], db_migrations[0])
+
 
 class TestMigrationObject(test_objects._LocalTest,
                           _TestMigrationObject):
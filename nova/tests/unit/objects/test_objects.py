@@ -1194,8 +1194,8 @@ object_data = {
     'BandwidthUsageList': '1.2-5b564cbfd5ae6e106443c086938e7602',
     'BlockDeviceMapping': '1.8-c53f09c7f969e0222d9f6d67a950a08e',
     'BlockDeviceMappingList': '1.9-0faaeebdca213010c791bc37a22546e3',
-    'ComputeNode': '1.10-70202a38b858977837b313d94475a26b',
-    'ComputeNodeList': '1.10-4ae1f844c247029fbcdb5fdccbe9e619',
+    'ComputeNode': '1.11-351cf9ac2da93ccee057371d3a3a1b30',
+    'ComputeNodeList': '1.12-40c6887ee35b19008bc94636eea36dea',
     'DNSDomain': '1.0-5bdc288d7c3b723ce86ede998fd5c9ba',
     'DNSDomainList': '1.0-cfb3e7e82be661501c31099523154db4',
     'EC2InstanceMapping': '1.0-627baaf4b12c9067200979bdc4558a99',
@@ -1212,14 +1212,14 @@ object_data = {
     'InstanceAction': '1.1-6b1d0a6dbd522b5a83c20757ec659663',
     'InstanceActionEvent': '1.1-42dbdba74bd06e0619ca75cd3397cd1b',
     'InstanceActionEventList': '1.0-1d5cc958171d6ce07383c2ad6208318e',
-    'InstanceActionList': '1.0-368410fdb8d69ae20c495308535d6266',
+    'InstanceActionList': '1.1-f01c4df3385c1e39bd075442edb5fd6f',
     'InstanceExternalEvent': '1.0-f1134523654407a875fd59b80f759ee7',
     'InstanceFault': '1.2-313438e37e9d358f3566c85f6ddb2d3e',
     'InstanceFaultList': '1.1-aeb598ffd0cd6aa61fca7adf0f5e900d',
     'InstanceGroup': '1.9-95ece99f092e8f4f88327cdbb44162c9',
     'InstanceGroupList': '1.6-c6b78f3c9d9080d33c08667e80589817',
     'InstanceInfoCache': '1.5-ef64b604498bfa505a8c93747a9d8b2f',
-    'InstanceList': '1.15-20d822b2abb0051d72f81ed686a79e5b',
+    'InstanceList': '1.17-54f20c842780a5bfc3f7e05a68aba7d5',
     'InstanceNUMACell': '1.2-5d2dfa36e9ecca9b63f24bf3bc958ea4',
     'InstanceNUMATopology': '1.1-86b95d263c4c68411d44c6741b8d2bb0',
     'InstancePCIRequest': '1.1-e082d174f4643e5756ba098c47c1510f',
@@ -1227,7 +1227,7 @@ object_data = {
     'KeyPair': '1.2-adf0be7b68e0b9f1ec011e23a9761354',
     'KeyPairList': '1.1-152dc1efcc46014cc10656a0d0ac5bb0',
     'Migration': '1.1-67c47726c2c71422058cd9d149d6d3ed',
-    'MigrationList': '1.1-8c5f678edc72a592d591a13b35e54353',
+    'MigrationList': '1.2-dd538c18447229c844bb31fab18ae615',
     'MyObj': '1.6-d657ff98bce311e7925cb28f1423a8c2',
     'MyOwnedObject': '1.0-0f3d6c028543d7f3715d121db5b8e298',
     'Network': '1.2-2ea21ede5e45bb80e7b7ac7106915c4e',
@@ -1248,8 +1248,8 @@ object_data = {
     'SecurityGroupList': '1.0-528e6448adfeeb78921ebeda499ab72f',
     'SecurityGroupRule': '1.1-a9175baf7664439af1a16c2010b55576',
     'SecurityGroupRuleList': '1.1-667fca3a9928f23d2d10e61962c55f3c',
-    'Service': '1.11-2b157261ffa37b3d2675b39b6c29ce07',
-    'ServiceList': '1.9-54656820acc49b3cc0eb57b2a684b84a',
+    'Service': '1.12-2b157261ffa37b3d2675b39b6c29ce07',
+    'ServiceList': '1.10-15338ee1affe868479d2deba306cfd33',
     'Tag': '1.0-a11531f4e4e3166eef6243d6d58a18bd',
     'TagList': '1.0-e89bf8c8055f1f1d654fb44f0abf1f53',
     'TestSubclassedObject': '1.6-4bf996f4a200eba7dcb649cd790babca',
@@ -1285,7 +1285,7 @@ object_relationships = {
     'NUMACell': {'NUMAPagesTopology': '1.0'},
     'NUMATopology': {'NUMACell': '1.2'},
     'SecurityGroupRule': {'SecurityGroup': '1.1'},
-    'Service': {'ComputeNode': '1.10'},
+    'Service': {'ComputeNode': '1.11'},
     'TestSubclassedObject': {'MyOwnedObject': '1.0'},
     'VirtCPUModel': {'VirtCPUFeature': '1.0', 'VirtCPUTopology': '1.0'},
 }
@@ -132,6 +132,50 @@ class PciDeviceStatsTestCase(test.NoDBTestCase):
             self.pci_stats.apply_requests,
             pci_requests_multiple)
 
+    def test_apply_requests_failed_leaves_pools(self):
+        self.assertRaises(exception.PciDeviceRequestFailed,
+            self.pci_stats.apply_requests,
+            pci_requests_multiple)
+        self.assertEqual(3, len(self.pci_stats.pools))
+        self.assertEqual(set([1, 2]),
+                         set([d['count'] for d in self.pci_stats]))
+
+    def test_support_requests_same_pool(self):
+        requests = [objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': 'v1'}]),
+                    objects.InstancePCIRequest(count=1,
+                        spec=[{'vendor_id': 'v1', 'product_id': 'p1'}])]
+        self.assertTrue(self.pci_stats.support_requests(requests))
+        requests.append(objects.InstancePCIRequest(count=1,
+                            spec=[{'product_id': 'p1'}]))
+        self.assertFalse(self.pci_stats.support_requests(requests))
+
+    def test_filter_pools_for_spec(self):
+        self.assertEqual(
+            ['v1'], [pool['vendor_id'] for pool in
+                     self.pci_stats._filter_pools_for_spec(
+                         [{'vendor_id': 'v1', 'product_id': 'p1'}])])
+        self.assertEqual(
+            [], self.pci_stats._filter_pools_for_spec(
+                [{'vendor_id': 'v1', 'product_id': 'p2'}]))
+        self.assertEqual(
+            ['v3'], [pool['vendor_id'] for pool in
+                     self.pci_stats._filter_pools_for_spec(
+                         [{'numa_node': None}])])
+        self.assertEqual(
+            set(['v1', 'v2']), set([pool['vendor_id'] for pool in
+                                    self.pci_stats._filter_pools_for_spec(
+                                        [{'vendor_id': 'v1'},
+                                         {'vendor_id': 'v2'}])]))
+        self.assertEqual(3, len(self.pci_stats._filter_pools_for_spec([{}])))
+
+    def test_clear(self):
+        self.pci_stats.clear()
+        self.assertEqual([], self.pci_stats._filter_pools_for_spec(
+            [{'vendor_id': 'v1'}]))
+        self.assertRaises(exception.PciDevicePoolEmpty,
+                          self.pci_stats.remove_device, self.fake_dev_1)
+
     def test_consume_requests(self):
         devs = self.pci_stats.consume_requests(pci_requests)
         self.assertEqual(2, len(devs))
@@ -13,6 +13,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
+
+from nova import objects
 from nova.pci import whitelist
 from nova import test
 
@@ -70,3 +73,46 @@ class PciHostDevicesWhiteListTestCase(test.NoDBTestCase):
         self.flags(pci_passthrough_whitelist=[white_list_1])
         pci_filter = whitelist.get_pci_devices_filter()
         self.assertIsNotNone(pci_filter.device_assignable(dev_dict))
+
+    def test_get_pci_devices_filter_parsed_once(self):
+        white_list_1 = '{"product_id":"0001", "vendor_id":"8086"}'
+        self.flags(pci_passthrough_whitelist=[white_list_1])
+        pci_filter = whitelist.get_pci_devices_filter()
+        self.assertIs(pci_filter, whitelist.get_pci_devices_filter())
+
+        white_list_2 = '{"product_id":"0002", "vendor_id":"8086"}'
+        self.flags(pci_passthrough_whitelist=[white_list_2])
+        pci_filter = whitelist.get_pci_devices_filter()
+        self.assertIsNone(pci_filter.device_assignable(dev_dict))
+
+    def test_device_assignable_first_matching_spec(self):
+        white_list = ['{"vendor_id":"8086", "address":"*:00:0b.*", '
+                      '"physical_network":"net1"}',
+                      '{"product_id":"*", "physical_network":"net2"}',
+                      '{"product_id":"0001", "vendor_id":"8086", '
+                      '"physical_network":"net3"}']
+        parsed = whitelist.PciHostDevicesWhiteList(white_list)
+        self.assertEqual({'physical_network': 'net2'},
+                         parsed.device_assignable(dev_dict).get_tags())
+        dev_dict1 = dict(dev_dict, address='0000:00:0b.1')
+        self.assertEqual({'physical_network': 'net1'},
+                         parsed.device_assignable(dev_dict1).get_tags())
+
+    def test_device_assignable_physical_function(self):
+        white_list = '{"address":"0000:00:0a.0"}'
+        with mock.patch('nova.pci.utils.is_physical_function',
+                        return_value=True):
+            parsed = whitelist.PciHostDevicesWhiteList([white_list])
+        self.assertIsNotNone(parsed.device_assignable(dev_dict))
+        dev_dict1 = dict(dev_dict, phys_function=None)
+        self.assertIsNone(parsed.device_assignable(dev_dict1))
+        dev_dict2 = dict(dev_dict, phys_function='0000:00:0b.0')
+        self.assertIsNone(parsed.device_assignable(dev_dict2))
+
+    def test_get_devspec(self):
+        white_list = '{"product_id":"0001", "vendor_id":"8086"}'
+        parsed = whitelist.PciHostDevicesWhiteList([white_list])
+        pci_dev = objects.PciDevice.create(dict(dev_dict))
+        self.assertIs(parsed.specs[0], parsed.get_devspec(pci_dev))
+        pci_dev.product_id = '0002'
+        self.assertIsNone(parsed.get_devspec(pci_dev))
@@ -238,3 +238,18 @@ class TestGroupAffinityFilter(test.NoDBTestCase):
     def test_group_affinity_filter_fails(self):
         self._test_group_affinity_filter_fails(
                 affinity_filter.ServerGroupAffinityFilter(), 'affinity')
+
+    def test_group_affinity_filter_dirty_on_consume(self):
+        filt_cls = affinity_filter.ServerGroupAffinityFilter()
+        self.assertFalse(filt_cls.dirty_on_consume({}))
+        filter_properties = {'group_policies': ['affinity'],
+                             'group_hosts': []}
+        self.assertTrue(filt_cls.dirty_on_consume(filter_properties))
+        filter_properties['group_hosts'] = ['host1']
+        self.assertFalse(filt_cls.dirty_on_consume(filter_properties))
+
+    def test_group_anti_affinity_filter_dirty_on_consume(self):
+        filt_cls = affinity_filter.ServerGroupAntiAffinityFilter()
+        filter_properties = {'group_policies': ['anti-affinity'],
+                             'group_hosts': []}
+        self.assertFalse(filt_cls.dirty_on_consume(filter_properties))
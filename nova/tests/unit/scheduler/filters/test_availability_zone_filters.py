@@ -52,3 +52,9 @@ class TestAvailabilityZoneFilter(test.NoDBTestCase):
         request = self._make_zone_request('bad')
         host = fakes.FakeHostState('host1', 'node1', {})
         self.assertFalse(self.filt_cls.host_passes(host, request))
+
+    def test_availability_zone_filter_cache_key(self, agg_mock):
+        self.assertEqual('nova', self.filt_cls.cache_key(
+            self._make_zone_request('nova')))
+        self.assertIsNone(self.filt_cls.cache_key(
+            self._make_zone_request(None)))
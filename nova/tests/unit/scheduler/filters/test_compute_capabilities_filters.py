@@ -119,3 +119,26 @@ class TestComputeCapabilitiesFilter(test.NoDBTestCase):
             especs={'opt1:a': '1', 'capabilities:opt1:b:aa': '2',
                     'trust:trusted_host': 'true'},
             passes=True)
+
+    def test_compute_filter_cache_key(self):
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        self.assertIsNone(self.filt_cls.cache_key(filter_properties))
+
+        especs = {'capabilities:cpu_info:vendor': 'Intel',
+                  'hypervisor_type': 'QEMU',
+                  'other:free_ram_mb': '>= 1'}
+        filter_properties = {'instance_type': {'memory_mb': 1024,
+                                               'extra_specs': especs}}
+        key = self.filt_cls.cache_key(filter_properties)
+        self.assertIsNotNone(key)
+        filter_properties = {'instance_type': {'memory_mb': 2048,
+                                               'extra_specs': dict(especs)}}
+        self.assertEqual(key, self.filt_cls.cache_key(filter_properties))
+
+    def test_compute_filter_cache_key_resources(self):
+        for key in ('capabilities:free_ram_mb', 'capabilities:stats:foo',
+                    'num_instances'):
+            especs = {key: '>= 1024'}
+            filter_properties = {'instance_type': {'memory_mb': 1024,
+                                                   'extra_specs': especs}}
+            self.assertIsNone(self.filt_cls.cache_key(filter_properties))
@@ -187,3 +187,14 @@ class TestImagePropsFilter(test.NoDBTestCase):
                         'hypervisor_version': hypervisor_version}
         host = fakes.FakeHostState('host1', 'node1', capabilities)
         self.assertTrue(self.filt_cls.host_passes(host, filter_properties))
+
+    def test_image_properties_filter_cache_key(self):
+        img_props = {'properties': {'architecture': arch.X86_64,
+                                    'hypervisor_type': hv_type.KVM,
+                                    'foo': 'bar'}}
+        filter_properties = {'request_spec': {'image': img_props}}
+        key = self.filt_cls.cache_key(filter_properties)
+        img_props['properties']['foo'] = 'baz'
+        self.assertEqual(key, self.filt_cls.cache_key(filter_properties))
+        img_props['properties']['vm_mode'] = vm_mode.HVM
+        self.assertNotEqual(key, self.filt_cls.cache_key(filter_properties))
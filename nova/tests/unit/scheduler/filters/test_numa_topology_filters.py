@@ -157,3 +157,90 @@ class TestNUMATopologyFilter(test.NoDBTestCase):
         self.assertEqual(limits_topology.cells[1].cpu_limit, 42)
         self.assertEqual(limits_topology.cells[0].memory_limit, 665)
         self.assertEqual(limits_topology.cells[1].memory_limit, 665)
+
+    def _filter_properties(self, cells=2):
+        instance_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=0, cpuset=set([1]), memory=512),
+                   objects.InstanceNUMACell(id=1, cpuset=set([3]), memory=512)
+               ][:cells])
+        instance = fake_instance.fake_instance_obj(mock.sentinel.ctx)
+        instance.numa_topology = instance_topology
+        return {
+            'request_spec': {
+                'instance_properties': jsonutils.to_primitive(
+                    obj_base.obj_to_primitive(instance))}}
+
+    @mock.patch.object(hardware, 'numa_fit_instance_to_host',
+                       wraps=hardware.numa_fit_instance_to_host)
+    def test_numa_topology_filter_all_identical_hosts(self, mock_fit):
+        filter_properties = self._filter_properties()
+        used_topology = hardware.numa_usage_from_instances(
+            fakes.NUMA_TOPOLOGY, [objects.InstanceNUMATopology(cells=[
+                objects.InstanceNUMACell(id=0, cpuset=set([1, 2]),
+                                         memory=512)])])
+        hosts = [fakes.FakeHostState(
+                     'host%d' % i, 'node',
+                     {'numa_topology': fakes.NUMA_TOPOLOGY._to_json(),
+                      'pci_stats': None})
+                 for i in range(3)]
+        hosts.append(fakes.FakeHostState(
+            'host3', 'node', {'numa_topology': used_topology._to_json(),
+                              'pci_stats': None}))
+        passed = list(self.filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(hosts[:3], passed)
+        self.assertEqual(2, mock_fit.call_count)
+        self.assertIsNotNone(hosts[2].instance_numa_topology)
+        self.assertIn('numa_topology', hosts[2].limits)
+        self.assertIsNone(hosts[3].instance_numa_topology)
+
+    @mock.patch.object(hardware, 'numa_fit_instance_to_host',
+                       wraps=hardware.numa_fit_instance_to_host)
+    def test_numa_topology_filter_all_pci_requests(self, mock_fit):
+        filter_properties = self._filter_properties()
+        filter_properties['pci_requests'] = objects.InstancePCIRequests(
+            requests=[objects.InstancePCIRequest(
+                count=1, spec=[{'vendor_id': '8086'}])])
+        hosts = []
+        for i, supported in enumerate([False, True]):
+            pci_stats = mock.Mock()
+            pci_stats.support_requests.return_value = supported
+            hosts.append(fakes.FakeHostState(
+                'host%d' % i, 'node',
+                {'numa_topology': fakes.NUMA_TOPOLOGY._to_json(),
+                 'pci_stats': pci_stats}))
+        passed = list(self.filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(hosts[1:], passed)
+        self.assertEqual(2, mock_fit.call_count)
+
+    @mock.patch.object(hardware, 'host_topology_and_format_from_host')
+    def test_numa_topology_filter_all_no_numa_instance(self, mock_host):
+        instance = fake_instance.fake_instance_obj(mock.sentinel.ctx)
+        instance.numa_topology = None
+        filter_properties = {
+            'request_spec': {
+                'instance_properties': jsonutils.to_primitive(
+                    obj_base.obj_to_primitive(instance))}}
+        hosts = [fakes.FakeHostState(
+                     'host%d' % i, 'node',
+                     {'numa_topology': fakes.NUMA_TOPOLOGY._to_json()})
+                 for i in range(2)]
+        passed = list(self.filt_cls.filter_all(hosts, filter_properties))
+        self.assertEqual(hosts, passed)
+        self.assertFalse(mock_host.called)
+
+    def test_numa_topology_filter_placement_policy(self):
+        self.flags(numa_placement_policy='pack')
+        host = fakes.FakeHostState('host1', 'node1',
+                                   {'numa_topology': fakes.NUMA_TOPOLOGY,
+                                    'pci_stats': None})
+        self.assertTrue(self.filt_cls.host_passes(host,
+                                                  self._filter_properties()))
+        self.assertEqual(hardware.numa_cell_capacities(fakes.NUMA_TOPOLOGY),
+                         host.numa_capacities)
+
+        host.numa_capacities = [hardware.NUMACellCapacity(2, 2, 512, 0),
+                                hardware.NUMACellCapacity(1, 1, 256, 0)]
+        self.assertTrue(self.filt_cls.host_passes(
+            host, self._filter_properties(cells=1)))
+        self.assertEqual([1], [cell.id for cell in
+                               host.instance_numa_topology.cells])
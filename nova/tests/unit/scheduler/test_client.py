@@ -99,6 +99,12 @@ class SchedulerQueryClientTestCase(test.NoDBTestCase):
         mock_delete_agg.assert_called_once_with(
             self.context, aggregate)
 
+    @mock.patch.object(scheduler_rpcapi.SchedulerAPI, 'get_profiling_stats')
+    def test_get_profiling_stats(self, mock_get_stats):
+        result = self.client.get_profiling_stats(self.context, host='host')
+        mock_get_stats.assert_called_once_with(self.context, host='host')
+        self.assertEqual(mock_get_stats.return_value, result)
+
 
 class SchedulerClientTestCase(test.NoDBTestCase):
 
@@ -160,6 +166,13 @@ class SchedulerClientTestCase(test.NoDBTestCase):
         mock_delete_agg.assert_called_once_with(
             'context', aggregate)
 
+    @mock.patch.object(scheduler_query_client.SchedulerQueryClient,
+                       'get_profiling_stats')
+    def test_get_profiling_stats(self, mock_get_stats):
+        result = self.client.get_profiling_stats('context')
+        mock_get_stats.assert_called_once_with('context', host=None)
+        self.assertEqual(mock_get_stats.return_value, result)
+
     @mock.patch.object(scheduler_report_client.SchedulerReportClient,
                        'update_resource_stats')
     def test_update_resource_stats(self, mock_update_resource_stats):
@@ -16,11 +16,14 @@
 Tests For Filter Scheduler.
 """
 
+import contextlib
+
 import mock
 
 from nova import exception
 from nova.scheduler import filter_scheduler
 from nova.scheduler import host_manager
+from nova.scheduler import profiling
 from nova.scheduler import utils as scheduler_utils
 from nova.scheduler import weights
 from nova.tests.unit.scheduler import fakes
@@ -51,7 +54,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, profiler=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return [weights.WeighedHost(host_state, self.next_weight)]
@@ -141,8 +145,13 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                             instance_type={})
         filter_properties = {}
         self.mox.ReplayAll()
-        hosts = self.driver._schedule(self.context, request_spec,
-                filter_properties=filter_properties)
+        hm = self.driver.host_manager
+        with mock.patch.object(hm, 'get_weighed_hosts',
+                               wraps=hm.get_weighed_hosts) as mock_weigh:
+            hosts = self.driver._schedule(self.context, request_spec,
+                    filter_properties=filter_properties)
+            # only the subset needs to be weighed and sorted
+            self.assertEqual(2, mock_weigh.call_args[1]['limit'])
 
         # one host should be chosen
         self.assertEqual(len(hosts), 1)
@@ -200,7 +209,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 50
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, profiler=None):
             this_weight = self.next_weight
             self.next_weight = 0
             host_state = hosts[0]
@@ -250,7 +260,8 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         selected_hosts = []
         selected_nodes = []
 
-        def _fake_weigh_objects(_self, functions, hosts, options):
+        def _fake_weigh_objects(_self, functions, hosts, options,
+                                limit=None, profiler=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             selected_hosts.append(host_state.host)
@@ -295,6 +306,34 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                  dict(request_spec=request_spec))]
             self.assertEqual(expected, mock_info.call_args_list)
 
+    @mock.patch.object(filter_scheduler.FilterScheduler, '_schedule')
+    def test_select_destinations_profile_notification(self, mock_schedule):
+        self.flags(scheduler_profiling_notifications=True)
+        self.driver.host_manager.profiler = profiling.SchedulerProfiler(10)
+
+        def fake_schedule(context, request_spec, filter_properties):
+            self.driver.host_manager.profiler.record(
+                profiling.FILTER, 'RamFilter', 0.5, 4, 2)
+            return [mock.Mock()]
+
+        mock_schedule.side_effect = fake_schedule
+        with mock.patch.object(self.driver.notifier, 'info') as mock_info:
+            request_spec = {'num_instances': 1}
+
+            self.driver.select_destinations(self.context, request_spec, {})
+
+            self.assertEqual(3, mock_info.call_count)
+            args = mock_info.call_args_list[1][0]
+            self.assertEqual('scheduler.select_destinations.profile', args[1])
+            self.assertEqual([{'kind': 'filter', 'name': 'RamFilter',
+                               'elapsed': 0.5, 'hosts_in': 4,
+                               'hosts_out': 2}],
+                             args[2]['profile']['steps'])
+        stats = self.driver.host_manager.get_profiling_stats()
+        self.assertEqual(1, stats['requests']['elapsed']['count'])
+        self.assertEqual(0.5,
+                         stats['filters']['RamFilter']['pass_rate']['mean'])
+
     def test_select_destinations_no_valid_host(self):
 
         def _return_no_host(*args, **kwargs):
@@ -318,3 +357,138 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                 # Make sure that we provided a reason why NoValidHost.
                 self.assertIn('reason', e.kwargs)
                 self.assertTrue(len(e.kwargs['reason']) > 0)
+
+    def _schedule_fake_hosts(self, num_instances, filter_properties,
+                             batched):
+        self.flags(scheduler_batch_placement=batched,
+                   scheduler_default_filters=[
+                       'RamFilter', 'ServerGroupAntiAffinityFilter',
+                       'ServerGroupAffinityFilter'])
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            driver = filter_scheduler.FilterScheduler()
+        host_states = [
+            fakes.FakeHostState('host%d' % i, 'node%d' % i,
+                                {'free_ram_mb': ram,
+                                 'total_usable_ram_mb': ram,
+                                 'free_disk_mb': 10240,
+                                 'num_io_ops': io_ops})
+            for i, (ram, io_ops) in enumerate([(2048, 0), (4096, 3),
+                                               (1024, 1), (4096, 0),
+                                               (3072, 2)])]
+        instance_properties = {'project_id': 1,
+                               'root_gb': 1,
+                               'memory_mb': 1024,
+                               'ephemeral_gb': 0,
+                               'vcpus': 1,
+                               'os_type': 'Linux',
+                               'uuid': 'fake-uuid'}
+        request_spec = dict(instance_properties=instance_properties,
+                            instance_type={'memory_mb': 1024},
+                            num_instances=num_instances)
+        hm = driver.host_manager
+        with contextlib.nested(
+            mock.patch.object(driver, '_get_all_host_states',
+                              return_value=iter(host_states)),
+            mock.patch.object(hm, 'get_filtered_hosts',
+                              wraps=hm.get_filtered_hosts),
+            mock.patch.object(hm, 'get_weighed_hosts',
+                              wraps=hm.get_weighed_hosts),
+            mock.patch('nova.db.instance_extra_get_by_instance_uuid',
+                       return_value={'numa_topology': None,
+                                     'pci_requests': None})
+        ) as (mock_get_hosts, mock_filter, mock_weigh, mock_get_extra):
+            selected = driver._schedule(self.context, request_spec,
+                                        filter_properties)
+        return ([(host.obj.host, host.weight) for host in selected],
+                mock_filter.call_args_list, mock_weigh.called)
+
+    def test_schedule_batched(self):
+        expected = self._schedule_fake_hosts(10, {}, False)[0]
+        self.assertEqual(10, len(expected))
+
+        selected, filter_calls, weighed = self._schedule_fake_hosts(10, {},
+                                                                    True)
+        self.assertEqual(expected, selected)
+        # All the hosts are only filtered once, and never weighed as a list
+        for call in filter_calls[1:]:
+            self.assertEqual(1, len(call[0][0]))
+        self.assertFalse(weighed)
+
+    def test_schedule_batched_not_enough_hosts(self):
+        expected = self._schedule_fake_hosts(100, {}, False)[0]
+        self.assertTrue(0 < len(expected) < 100)
+        selected = self._schedule_fake_hosts(100, {}, True)[0]
+        self.assertEqual(expected, selected)
+
+    def _schedule_claim_conflict(self, batched):
+        expected = self._schedule_fake_hosts(1, {}, batched)[0]
+
+        self.flags(scheduler_optimistic_claims=True)
+        with mock.patch.object(host_manager.HostManager, 'claim_host',
+                               side_effect=[False, True]) as mock_claim:
+            selected = self._schedule_fake_hosts(1, {}, batched)[0]
+        self.assertEqual(2, mock_claim.call_count)
+        # The conflicting host is gone, the next best one was claimed
+        self.assertNotEqual(expected, selected)
+        self.assertEqual(1, len(selected))
+
+    def test_schedule_claim_conflict(self):
+        self._schedule_claim_conflict(False)
+
+    def test_schedule_batched_claim_conflict(self):
+        self._schedule_claim_conflict(True)
+
+    def test_schedule_claim_retries(self):
+        self.flags(scheduler_optimistic_claims=True,
+                   scheduler_claim_retries=1)
+        for batched in (False, True):
+            with mock.patch.object(host_manager.HostManager, 'claim_host',
+                                   return_value=False) as mock_claim:
+                selected = self._schedule_fake_hosts(1, {}, batched)[0]
+            self.assertEqual([], selected)
+            self.assertEqual(2, mock_claim.call_count)
+
+    def test_host_passes_after_conflict(self):
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            driver = filter_scheduler.FilterScheduler()
+        hm = driver.host_manager
+        host_state = fakes.FakeHostState('host1', 'node1', {})
+        with mock.patch.object(hm, 'get_filtered_hosts',
+                               return_value=[host_state]) as mock_filter:
+            # Removed by the host manager
+            self.assertFalse(driver._host_passes(host_state, {}, 0))
+            self.assertFalse(mock_filter.called)
+
+            hm.host_state_map[('host1', 'node1')] = host_state
+            self.assertTrue(driver._host_passes(host_state, {}, 0))
+            mock_filter.assert_called_once_with([host_state], {}, index=0)
+
+    def test_schedule_batched_anti_affinity(self):
+        def _filter_properties():
+            return {'group_updated': True, 'group_hosts': [],
+                    'group_policies': ['anti-affinity']}
+
+        expected = self._schedule_fake_hosts(10, _filter_properties(),
+                                             False)[0]
+        self.assertEqual(5, len(expected))
+        selected, filter_calls, weighed = self._schedule_fake_hosts(
+            10, _filter_properties(), True)
+        self.assertEqual(expected, selected)
+        for call in filter_calls[1:]:
+            self.assertEqual(1, len(call[0][0]))
+
+    def test_schedule_batched_affinity(self):
+        def _filter_properties():
+            return {'group_updated': True, 'group_hosts': [],
+                    'group_policies': ['affinity']}
+
+        expected = self._schedule_fake_hosts(10, _filter_properties(),
+                                             False)[0]
+        selected, filter_calls, weighed = self._schedule_fake_hosts(
+            10, _filter_properties(), True)
+        self.assertEqual(expected, selected)
+        self.assertEqual(1, len(set(host for host, weight in selected)))
+        # All the hosts are filtered again once the first one is picked
+        self.assertEqual(5, len(filter_calls[1][0][0]))
+        for call in filter_calls[2:]:
+            self.assertEqual(1, len(call[0][0]))
@@ -16,10 +16,14 @@ Tests For Scheduler Host Filters.
 """
 
 import inspect
+import itertools
 import sys
 
+import mock
+
 from nova import filters
 from nova import loadables
+from nova.scheduler import profiling
 from nova import test
 
 
@@ -199,3 +203,222 @@ class FiltersTestCase(test.NoDBTestCase):
                                                      filter_objs_initial,
                                                      filter_properties)
         self.assertIsNone(result)
+
+    def test_get_filtered_objects_profiler(self):
+        class EvenFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                return obj % 2 == 0
+
+        class NoneFilter(filters.BaseFilter):
+            def _filter_one(self, obj, filter_properties):
+                return False
+
+        class NeverRunFilter(filters.BaseFilter):
+            pass
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        profiler = mock.Mock()
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        result = filter_handler.get_filtered_objects(
+            [EvenFilter(), NoneFilter(), NeverRunFilter()], range(10), {},
+            profiler=profiler)
+        self.assertEqual([], result)
+        self.assertEqual([mock.call(profiling.FILTER, 'EvenFilter',
+                                    mock.ANY, 10, 5),
+                          mock.call(profiling.FILTER, 'NoneFilter',
+                                    mock.ANY, 5, 0)],
+                         profiler.record.call_args_list)
+
+    def test_get_filtered_objects_profiler_stop_filtering(self):
+        class StopFilter(filters.BaseFilter):
+            def filter_all(self, filter_obj_list, filter_properties):
+                return None
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        profiler = mock.Mock()
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        result = filter_handler.get_filtered_objects(
+            [StopFilter()], range(10), {}, profiler=profiler)
+        self.assertIsNone(result)
+        profiler.record.assert_called_once_with(
+            profiling.FILTER, 'StopFilter', mock.ANY, 10, 0)
+
+    def test_all_dirty_on_consume(self):
+        class DirtyFilter(filters.BaseFilter):
+            def dirty_on_consume(self, filter_properties):
+                return filter_properties['dirty']
+
+        class SecondOnlyFilter(filters.BaseFilter):
+            def run_filter_for_index(self, index):
+                return index == 1
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        filt1 = Filter1()
+        filt1.run_filter_once_per_request = True
+
+        self.assertFalse(filter_handler.all_dirty_on_consume(
+            [filt1, Filter2()], {}, 1))
+        self.assertFalse(filter_handler.all_dirty_on_consume(
+            [DirtyFilter()], {'dirty': False}, 1))
+        self.assertTrue(filter_handler.all_dirty_on_consume(
+            [DirtyFilter()], {'dirty': True}, 1))
+        # Only asked when run for the index
+        dirty_filter = DirtyFilter()
+        dirty_filter.run_filter_once_per_request = True
+        self.assertFalse(filter_handler.all_dirty_on_consume(
+            [dirty_filter], {'dirty': True}, 1))
+        # A filter starting to run has to filter all the objects
+        self.assertTrue(filter_handler.all_dirty_on_consume(
+            [SecondOnlyFilter()], {}, 1))
+        self.assertFalse(filter_handler.all_dirty_on_consume(
+            [SecondOnlyFilter()], {}, 2))
+
+    def test_filter_order(self):
+        class CheapFilter(filters.BaseFilter):
+            stateless = True
+
+        class SelectiveFilter(filters.BaseFilter):
+            stateless = True
+
+        class UselessFilter(filters.BaseFilter):
+            stateless = True
+
+        class StatefulFilter(filters.BaseFilter):
+            pass
+
+        class UnmeasuredFilter(filters.BaseFilter):
+            stateless = True
+
+        cheap, selective, useless, stateful, unmeasured = (
+            CheapFilter(), SelectiveFilter(), UselessFilter(),
+            StatefulFilter(), UnmeasuredFilter())
+        order = filters.FilterOrder(decay=0.5)
+        order.record(cheap, 1.0, 100, 50)
+        order.record(selective, 4.0, 100, 10)
+        order.record(useless, 0.0, 100, 100)
+        order.record(stateful, 0.0, 100, 0)
+        # Ignored, nothing to measure
+        order.record(unmeasured, 0.0, 0, 0)
+
+        # Ranks are 0.02 for cheap and 0.044 for selective
+        self.assertEqual([cheap, selective],
+                         order.order([selective, cheap]))
+        # Filters are only moved between stateful ones
+        self.assertEqual(
+            [unmeasured, cheap, useless, stateful, cheap, selective],
+            order.order([useless, unmeasured, cheap, stateful, selective,
+                         cheap]))
+
+        # Selective gets cheaper, moving averages are updated
+        order.record(selective, 0.0, 100, 10)
+        order.record(selective, 0.0, 100, 10)
+        self.assertEqual([selective, cheap],
+                         order.order([cheap, selective]))
+
+    @mock.patch.object(filters, 'time')
+    def test_get_filtered_objects_order(self, mock_time):
+        # Each filter takes one second
+        mock_time.time.side_effect = itertools.count()
+        ran = []
+
+        class NotZeroFilter(filters.BaseFilter):
+            stateless = True
+
+            def _filter_one(self, obj, filter_properties):
+                ran.append(self)
+                return obj != 0
+
+        class ThirdFilter(filters.BaseFilter):
+            stateless = True
+
+            def _filter_one(self, obj, filter_properties):
+                ran.append(self)
+                return obj % 3 == 0
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        not_zero, third = NotZeroFilter(), ThirdFilter()
+        order = filters.FilterOrder()
+        for i in range(3):
+            del ran[:]
+            result = filter_handler.get_filtered_objects(
+                [not_zero, third], range(20), {}, order=order)
+            self.assertEqual([3, 6, 9, 12, 15, 18], result)
+        # The third filter rejects more objects for the same cost, so it
+        # ends up first
+        self.assertEqual([third] * 20 + [not_zero] * 7, ran)
+
+    def test_filter_result_cache(self):
+        calls = []
+
+        class CachedFilter(filters.BaseFilter):
+            cacheable = True
+
+            def cache_key(self, filter_properties):
+                return filter_properties.get('key')
+
+            def _filter_one(self, obj, filter_properties):
+                calls.append(obj)
+                return obj % filter_properties['mod'] == 0
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        cache = filters.FilterResultCache(lambda obj: obj, 2)
+        filt = CachedFilter()
+        objs = range(6)
+
+        result = filter_handler.get_filtered_objects(
+            [filt], objs, {'key': 'two', 'mod': 2}, cache=cache)
+        self.assertEqual([0, 2, 4], result)
+        self.assertEqual(objs, calls)
+        self.assertEqual((0, 6), (cache.hits, cache.misses))
+
+        del calls[:]
+        result = filter_handler.get_filtered_objects(
+            [filt], objs, {'key': 'two', 'mod': 2}, cache=cache)
+        self.assertEqual([0, 2, 4], result)
+        self.assertEqual([], calls)
+        self.assertEqual((6, 6), (cache.hits, cache.misses))
+
+        # Other requests and invalidated objects are filtered again
+        cache.invalidate(3)
+        result = filter_handler.get_filtered_objects(
+            [filt], objs, {'key': 'three', 'mod': 3}, cache=cache)
+        self.assertEqual([0, 3], result)
+        self.assertEqual(objs, calls)
+        del calls[:]
+        result = filter_handler.get_filtered_objects(
+            [filt], objs, {'key': 'two', 'mod': 2}, cache=cache)
+        self.assertEqual([0, 2, 4], result)
+        self.assertEqual([3], calls)
+
+        # Requests without a cache key don't use the cache
+        del calls[:]
+        cache.invalidate()
+        result = filter_handler.get_filtered_objects(
+            [filt], objs, {'key': None, 'mod': 2}, cache=cache)
+        self.assertEqual([0, 2, 4], result)
+        self.assertEqual(objs, calls)
+        self.assertEqual((11, 13), (cache.hits, cache.misses))
+
+    def test_filter_result_cache_max_size(self):
+        class CachedFilter(filters.BaseFilter):
+            cacheable = True
+
+            def cache_key(self, filter_properties):
+                return filter_properties['key']
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        filter_handler = filters.BaseFilterHandler(filters.BaseFilter)
+        cache = filters.FilterResultCache(lambda obj: obj, 2)
+        for key in range(3):
+            filter_handler.get_filtered_objects(
+                [CachedFilter()], ['obj'], {'key': key}, cache=cache)
+        self.assertEqual(1, len(cache._results['obj']))
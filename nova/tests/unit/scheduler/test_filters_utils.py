@@ -93,3 +93,32 @@ class UtilsTestCase(test.NoDBTestCase):
         metadata = utils.aggregate_metadata_get_by_host(host_state, 'k3')
 
         self.assertEqual({}, metadata)
+
+    def test_aggregate_metadata_get_by_host_indexed(self):
+        aggregates = _AGGREGATE_FIXTURES + [
+            objects.Aggregate(id=4, name='baz', hosts=['fake-host'],
+                              metadata={'k1': '10', 'k3': '11'})]
+        host_state = fakes.FakeHostState(
+            'fake', 'node', {'aggregates': aggregates,
+                             'aggregate_metadata':
+                                 utils.AggregateMetadata(aggregates)})
+
+        metadata = utils.aggregate_metadata_get_by_host(host_state, 'k3')
+        # Only the aggregates with the key
+        self.assertEqual({'k1': set(['10']), 'k3': set(['11'])}, metadata)
+        self.assertIs(metadata,
+                      utils.aggregate_metadata_get_by_host(host_state, 'k3'))
+        self.assertEqual(set(['1', '3', '6', '7', '10']),
+                         utils.aggregate_metadata_get_by_host(
+                             host_state)['k1'])
+        self.assertEqual({}, utils.aggregate_metadata_get_by_host(host_state,
+                                                                  'k4'))
+        self.assertEqual(set(['1', '3', '6,7', '10']),
+                         utils.aggregate_values_from_key(host_state, 'k1'))
+
+    def test_aggregate_metadata_lazy(self):
+        aggregate = objects.Aggregate(id=1, hosts=['fake-host'])
+        metadata = utils.AggregateMetadata([aggregate])
+        # Nothing is read until a lookup
+        aggregate.metadata = {'k1': '1'}
+        self.assertEqual({'k1': set(['1'])}, metadata.get())
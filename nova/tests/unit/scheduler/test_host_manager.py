@@ -17,9 +17,12 @@ Tests For HostManager
 """
 
 import collections
+import contextlib
+import datetime
 
 import mock
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 import six
 
 from nova.compute import task_states
@@ -33,6 +36,7 @@ from nova import test
 from nova.tests.unit import matchers
 from nova.tests.unit.scheduler import fakes
 from nova import utils
+from nova.virt import hardware
 
 
 class FakeFilterClass1(filters.BaseHostFilter):
@@ -110,6 +114,125 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual({'fake-host': set([])},
                          self.host_manager.host_aggregates_map)
 
+    def test_update_aggregates_invalidates_filter_cache(self):
+        self.host_manager.filter_cache.invalidate = mock.Mock()
+        fake_agg = objects.Aggregate(id=1, hosts=['fake-host'])
+        self.host_manager.update_aggregates([fake_agg])
+        self.host_manager.filter_cache.invalidate.assert_called_once_with(
+            None)
+
+        self.host_manager.filter_cache.invalidate.reset_mock()
+        self.host_manager.delete_aggregate(fake_agg)
+        self.host_manager.filter_cache.invalidate.assert_called_once_with(
+            None)
+
+    def test_filter_cache_disabled(self):
+        self.flags(scheduler_filter_cache_size=0)
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            hm = host_manager.HostManager()
+        self.assertIsNone(hm.filter_cache)
+        hm.update_aggregates([objects.Aggregate(id=1, hosts=[])])
+        self.assertEqual({'hits': 0, 'misses': 0},
+                         hm.get_filter_cache_stats())
+
+    def test_adaptive_filter_order(self):
+        self.assertIsNone(self.host_manager.filter_order)
+
+        self.flags(scheduler_adaptive_filter_order=True)
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            hm = host_manager.HostManager()
+        with mock.patch.object(hm.filter_handler,
+                               'get_filtered_objects') as mock_filter:
+            hm.get_filtered_hosts(self.fake_hosts, {})
+            mock_filter.assert_called_once_with(
+                hm.default_filters, self.fake_hosts, {}, 0,
+                cache=hm.filter_cache, profiler=None, order=hm.filter_order)
+        self.assertIsInstance(hm.filter_order, filters.HostFilterOrder)
+
+    def test_profiling(self):
+        self.assertIsNone(self.host_manager.profiler)
+        self.assertEqual({'filter_cache': {'hits': 0, 'misses': 0}},
+                         self.host_manager.get_profiling_stats())
+
+        self.flags(scheduler_profiling_window=10)
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            hm = host_manager.HostManager()
+        hm.get_filtered_hosts(self.fake_hosts, {})
+        stats = hm.get_profiling_stats()
+        self.assertEqual(
+            8, stats['filters']['FakeFilterClass1']['hosts_in']['max'])
+        self.assertEqual({'hits': 0, 'misses': 0}, stats['filter_cache'])
+
+    def test_profiling_disabled(self):
+        self.flags(scheduler_filter_cache_size=0)
+        with mock.patch.object(host_manager.HostManager, '_init_aggregates'):
+            hm = host_manager.HostManager()
+        self.assertIsNone(hm.get_profiling_stats())
+
+    def _claim_host_state(self):
+        host_state = host_manager.HostState(
+            'host1', 'node1', compute=fakes.COMPUTE_NODES[0])
+        self.host_manager.host_state_map = {('host1', 'node1'): host_state}
+        instance = dict(memory_mb=256, root_gb=1, ephemeral_gb=1, vcpus=1)
+        return host_state, instance
+
+    def test_claim_host(self):
+        host_state, instance = self._claim_host_state()
+
+        def fake_claim(compute, memory_mb, local_gb, vcpus):
+            self.assertEqual(1, compute.id)
+            self.assertEqual(512, compute.free_ram_mb)
+            self.assertEqual((256, 2, 1), (memory_mb, local_gb, vcpus))
+            compute.free_ram_mb -= memory_mb
+            compute.free_disk_gb -= local_gb
+            compute.vcpus_used += vcpus
+
+        with mock.patch.object(objects.ComputeNode, 'claim', fake_claim):
+            self.assertTrue(self.host_manager.claim_host(
+                'fake-context', host_state, instance))
+
+        self.assertEqual({'free_ram_mb': 256, 'free_disk_gb': 510,
+                          'vcpus_used': 2}, host_state.compute_usage)
+        # The local consumption is left to the scheduler
+        self.assertEqual(512, host_state.free_ram_mb)
+        self.assertEqual({'claims': 1, 'conflicts': 0},
+                         self.host_manager.get_claim_stats())
+
+    @mock.patch.object(objects.ComputeNode, 'get_by_id')
+    @mock.patch.object(objects.ComputeNode, 'claim',
+                       side_effect=exception.ComputeHostClaimConflict(
+                           compute_id=1))
+    def test_claim_host_conflict(self, mock_claim, mock_get):
+        host_state, instance = self._claim_host_state()
+        host_state.consume_from_instance(instance)
+        compute = fakes.COMPUTE_NODES[0].obj_clone()
+        compute.free_ram_mb = 128
+        mock_get.return_value = compute
+
+        self.assertFalse(self.host_manager.claim_host(
+            'fake-context', host_state, instance))
+
+        mock_get.assert_called_once_with('fake-context', 1)
+        self.assertEqual(128, host_state.free_ram_mb)
+        self.assertEqual(128, host_state.compute_usage['free_ram_mb'])
+        self.assertEqual({'claims': 0, 'conflicts': 1},
+                         self.host_manager.get_claim_stats())
+
+    @mock.patch.object(objects.ComputeNode, 'claim',
+                       side_effect=exception.ComputeHostNotFound(host=1))
+    def test_claim_host_gone(self, mock_claim):
+        host_state, instance = self._claim_host_state()
+        self.assertFalse(self.host_manager.claim_host(
+            'fake-context', host_state, instance))
+        self.assertEqual({}, self.host_manager.host_state_map)
+
+    @mock.patch.object(objects.ComputeNode, 'claim')
+    def test_claim_host_without_compute_node(self, mock_claim):
+        host_state = host_manager.HostState('host1', 'node1')
+        self.assertTrue(self.host_manager.claim_host(
+            'fake-context', host_state, {}))
+        self.assertFalse(mock_claim.called)
+
     def test_delete_aggregate(self):
         fake_agg = objects.Aggregate(id=1, hosts=['fake-host'])
         self.host_manager.host_aggregates_map = collections.defaultdict(
@@ -120,6 +243,35 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual({'fake-host': set([])},
                          self.host_manager.host_aggregates_map)
 
+    def test_host_aggregates_cached(self):
+        fake_agg = objects.Aggregate(id=1, hosts=['fake-host'],
+                                     metadata={'k1': 'v1'})
+        self.host_manager.update_aggregates([fake_agg])
+        host_state = host_manager.HostState('fake-host', 'fake-node')
+        service = objects.Service(host='fake-host')
+
+        self.host_manager._refresh_host_state(host_state, service)
+        self.assertEqual([fake_agg], host_state.aggregates)
+        aggregate_metadata = host_state.aggregate_metadata
+        self.assertEqual({'k1': set(['v1'])}, aggregate_metadata.get())
+        self.host_manager._refresh_host_state(host_state, service)
+        self.assertIs(aggregate_metadata, host_state.aggregate_metadata)
+
+        # Changing the aggregate drops the merged metadata of its hosts
+        fake_agg = objects.Aggregate(id=1, hosts=['fake-host'],
+                                     metadata={'k1': 'v2'})
+        self.host_manager.update_aggregates([fake_agg])
+        self.host_manager._refresh_host_state(host_state, service)
+        self.assertEqual({'k1': set(['v2'])},
+                         host_state.aggregate_metadata.get())
+
+        # So does removing the host from the aggregate
+        fake_agg = objects.Aggregate(id=1, hosts=[], metadata={'k1': 'v2'})
+        self.host_manager.update_aggregates([fake_agg])
+        self.host_manager._refresh_host_state(host_state, service)
+        self.assertEqual([], host_state.aggregates)
+        self.assertEqual({}, host_state.aggregate_metadata.get())
+
     def test_choose_host_filters_not_found(self):
         self.assertRaises(exception.SchedulerHostFilterNotFound,
                           self.host_manager._choose_host_filters,
@@ -419,6 +571,134 @@ class HostManagerTestCase(test.NoDBTestCase):
         host_state = self.host_manager.host_state_map[('fake', 'fake')]
         self.assertEqual([], host_state.aggregates)
 
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all_changed_since')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_get_host_states_changed_since(self, svc_get_by_binary,
+                                           cn_get_changed, update_from_cn):
+        now = timeutils.utcnow()
+        svc_get_by_binary.return_value = [objects.Service(host='host1'),
+                                          objects.Service(host='host2'),
+                                          objects.Service(host='host4')]
+        cn_get_changed.return_value = [
+            objects.ComputeNode(host='host1', hypervisor_hostname='node1',
+                                updated_at=now, created_at=now,
+                                deleted=False),
+            objects.ComputeNode(host='host2', hypervisor_hostname='node2',
+                                updated_at=now, created_at=now,
+                                deleted=True)]
+        unchanged_state = host_manager.HostState('host4', 'node4')
+        self.host_manager.host_state_map = {
+            ('host1', 'node1'): host_manager.HostState('host1', 'node1'),
+            ('host2', 'node2'): host_manager.HostState('host2', 'node2'),
+            # Service is gone
+            ('host3', 'node3'): host_manager.HostState('host3', 'node3'),
+            ('host4', 'node4'): unchanged_state,
+        }
+        self.host_manager.aggs_by_id = {1: objects.Aggregate(id=1)}
+        self.host_manager.host_aggregates_map = collections.defaultdict(
+            set, {'host4': set([1])})
+
+        host_states = list(self.host_manager.get_host_states_changed_since(
+            'fake-context', now))
+
+        cn_get_changed.assert_called_once_with('fake-context', now)
+        self.assertEqual(set([('host1', 'node1'), ('host4', 'node4')]),
+                         set(self.host_manager.host_state_map))
+        self.assertEqual(2, len(host_states))
+        # Only the changed compute node is refreshed
+        self.assertEqual(1, update_from_cn.call_count)
+        self.assertEqual([self.host_manager.aggs_by_id[1]],
+                         unchanged_state.aggregates)
+        self.assertEqual('host4', unchanged_state.service['host'])
+        self.assertEqual({('host1', 'node1'): timeutils.normalize_time(now)},
+                         self.host_manager._compute_node_stamps)
+
+    def test_update_host_states_invalidates_filter_cache(self):
+        service_refs = {'host1': objects.Service(host='host1')}
+        compute = objects.ComputeNode(host='host1',
+                                      hypervisor_hostname='node1')
+        host_state = host_manager.HostState('host1', 'node1')
+        self.host_manager.host_state_map = {('host1', 'node1'): host_state}
+
+        def _update(compute):
+            host_state.hypervisor_version = compute.hypervisor_version
+            host_state.stats = compute.stats
+
+        with contextlib.nested(
+            mock.patch.object(host_state, 'update_from_compute_node',
+                              side_effect=_update),
+            mock.patch.object(self.host_manager.filter_cache, 'invalidate')
+        ) as (mock_update, mock_invalidate):
+            compute.hypervisor_version = 1000
+            compute.stats = {'num_instances': '1'}
+            self.host_manager._update_host_states([compute], service_refs)
+            mock_invalidate.assert_called_once_with(host_state)
+
+            mock_invalidate.reset_mock()
+            self.host_manager._update_host_states([compute], service_refs)
+            self.assertFalse(mock_invalidate.called)
+
+            # The stats change with every build, the cache is kept
+            compute.stats = {'num_instances': '2'}
+            self.host_manager._update_host_states([compute], service_refs)
+            self.assertFalse(mock_invalidate.called)
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_reconcile_host_states(self, svc_get_by_binary, cn_get_all,
+                                   update_from_cn):
+        since = timeutils.utcnow()
+        old = since - datetime.timedelta(minutes=5)
+        svc_get_by_binary.return_value = [objects.Service(host='host1'),
+                                          objects.Service(host='host2'),
+                                          objects.Service(host='host3')]
+        cn_get_all.return_value = [
+            # Changed before the watermark without being seen
+            objects.ComputeNode(host='host1', hypervisor_hostname='node1',
+                                updated_at=old, created_at=old),
+            # Missing from the host states
+            objects.ComputeNode(host='host2', hypervisor_hostname='node2',
+                                updated_at=None, created_at=old),
+            # Changed after the watermark, not a drift
+            objects.ComputeNode(host='host3', hypervisor_hostname='node3',
+                                updated_at=since, created_at=old)]
+        self.host_manager.host_state_map = {
+            ('host1', 'node1'): host_manager.HostState('host1', 'node1'),
+            ('host3', 'node3'): host_manager.HostState('host3', 'node3'),
+            ('host4', 'node4'): host_manager.HostState('host4', 'node4'),
+        }
+        self.host_manager._compute_node_stamps = {
+            ('host1', 'node1'): old - datetime.timedelta(minutes=1),
+            ('host3', 'node3'): old}
+
+        drift = self.host_manager.reconcile_host_states('fake-context', since)
+
+        self.assertEqual({'added': 1, 'removed': 1, 'stale': 1}, drift)
+        self.assertEqual(set([('host1', 'node1'), ('host2', 'node2'),
+                              ('host3', 'node3')]),
+                         set(self.host_manager.host_state_map))
+        self.assertEqual({('host1', 'node1'): old, ('host2', 'node2'): old,
+                          ('host3', 'node3'): since},
+                         self.host_manager._compute_node_stamps)
+
+    @mock.patch.object(host_manager.HostState, 'update_from_compute_node')
+    @mock.patch.object(objects.ComputeNodeList, 'get_all')
+    @mock.patch.object(objects.ServiceList, 'get_by_binary')
+    def test_reconcile_host_states_first_load(self, svc_get_by_binary,
+                                              cn_get_all, update_from_cn):
+        now = timeutils.utcnow()
+        svc_get_by_binary.return_value = [objects.Service(host='host1')]
+        cn_get_all.return_value = [
+            objects.ComputeNode(host='host1', hypervisor_hostname='node1',
+                                updated_at=now, created_at=now)]
+
+        drift = self.host_manager.reconcile_host_states('fake-context')
+
+        self.assertEqual({'added': 0, 'removed': 0, 'stale': 0}, drift)
+        self.assertIn(('host1', 'node1'), self.host_manager.host_state_map)
+
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
@@ -606,7 +886,9 @@ class HostStateTestCase(test.NoDBTestCase):
 
     @mock.patch('nova.virt.hardware.get_host_numa_usage_from_instance')
     def test_stat_consumption_from_instance(self, numa_usage_mock):
-        numa_usage_mock.return_value = 'fake-consumed-once'
+        consumed_once = fakes.NUMA_TOPOLOGY.obj_clone()
+        consumed_twice = fakes.NUMA_TOPOLOGY.obj_clone()
+        numa_usage_mock.return_value = consumed_once
         host = host_manager.HostState("fakehost", "fakenode")
         host.instance_numa_topology = 'fake-instance-topology'
 
@@ -615,11 +897,12 @@ class HostStateTestCase(test.NoDBTestCase):
                         task_state=task_states.SCHEDULING, os_type='Linux',
                         uuid='fake-uuid', numa_topology=None)
         host.consume_from_instance(instance)
-        numa_usage_mock.assert_called_once_with(host, instance)
-        self.assertEqual('fake-consumed-once', host.numa_topology)
+        numa_usage_mock.assert_called_once_with(host, instance,
+                                                never_serialize_result=True)
+        self.assertEqual(consumed_once, host.numa_topology)
         self.assertEqual('fake-instance-topology', instance['numa_topology'])
 
-        numa_usage_mock.return_value = 'fake-consumed-twice'
+        numa_usage_mock.return_value = consumed_twice
         instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=0, vcpus=0,
                         project_id='12345', vm_state=vm_states.PAUSED,
                         task_state=None, os_type='Linux',
@@ -630,8 +913,27 @@ class HostStateTestCase(test.NoDBTestCase):
         self.assertEqual(2, host.num_instances)
         self.assertEqual(1, host.num_io_ops)
         self.assertEqual(2, numa_usage_mock.call_count)
-        self.assertEqual(((host, instance),), numa_usage_mock.call_args)
-        self.assertEqual('fake-consumed-twice', host.numa_topology)
+        self.assertEqual(((host, instance), {'never_serialize_result': True}),
+                         numa_usage_mock.call_args)
+        self.assertEqual(consumed_twice, host.numa_topology)
+        self.assertEqual(hardware.numa_cell_capacities(consumed_twice),
+                         host.numa_capacities)
+
+    def test_numa_consumption_from_instance(self):
+        host = host_manager.HostState("fakehost", "fakenode")
+        host.numa_topology = fakes.NUMA_TOPOLOGY._to_json()
+        host.numa_capacities = 'fake-capacities'
+        host.instance_numa_topology = objects.InstanceNUMATopology(
+            cells=[objects.InstanceNUMACell(id=1, cpuset=set([1]),
+                                            memory=256)])
+        instance = dict(root_gb=0, ephemeral_gb=0, memory_mb=0, vcpus=0,
+                        project_id='12345', vm_state=vm_states.BUILDING,
+                        task_state=task_states.SCHEDULING, os_type='Linux',
+                        uuid='fake-uuid', numa_topology=None)
+        host.consume_from_instance(instance)
+        self.assertIsInstance(host.numa_topology, six.string_types)
+        self.assertEqual([(2, 2, 512, 0), (1, 2, 256, 0)],
+                         host.numa_capacities)
 
     def test_resources_consumption_from_compute_node(self):
         metrics = [
@@ -683,5 +985,7 @@ class HostStateTestCase(test.NoDBTestCase):
             stats=None, pci_device_pools=None)
         host = host_manager.HostState("fakehost", "fakenode")
         host.instance_numa_topology = 'fake-instance-topology'
+        host.numa_capacities = 'fake-capacities'
         host.update_from_compute_node(compute)
         self.assertIsNone(host.instance_numa_topology)
+        self.assertIsNone(host.numa_capacities)
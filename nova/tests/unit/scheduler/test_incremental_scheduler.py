@@ -0,0 +1,121 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import datetime
+
+import mock
+from oslo_utils import timeutils
+
+from nova.scheduler import incremental_scheduler
+from nova.tests.unit.scheduler import test_scheduler
+
+
+class IncrementalSchedulerTestCase(test_scheduler.SchedulerTestCase):
+    """Test case for Incremental Scheduler."""
+
+    driver_cls = incremental_scheduler.IncrementalScheduler
+
+    def setUp(self):
+        super(IncrementalSchedulerTestCase, self).setUp()
+        timeutils.set_time_override(datetime.datetime(2015, 3, 1, 12, 0, 0))
+        self.addCleanup(timeutils.clear_time_override)
+
+    @property
+    def now(self):
+        return timeutils.utcnow()
+
+    def _advance(self, seconds):
+        timeutils.advance_time_seconds(seconds)
+
+    @mock.patch.object(incremental_scheduler.LOG, 'warning')
+    def test_run_periodic_tasks_reconciles(self, mock_warning):
+        context = mock.Mock()
+        with mock.patch.object(self.driver.host_manager,
+                               'reconcile_host_states') as mock_reconcile:
+            mock_reconcile.return_value = {'added': 0, 'removed': 0,
+                                           'stale': 0}
+            self.driver.run_periodic_tasks(context)
+
+            mock_reconcile.assert_called_once_with(
+                context.elevated.return_value, None)
+        self.assertEqual(self.now, self.driver.last_poll)
+        self.assertEqual(self.now, self.driver.last_reconcile)
+        self.assertFalse(mock_warning.called)
+
+    def test_run_periodic_tasks_waits_for_interval(self):
+        self.flags(scheduler_reconcile_interval=600)
+        self.driver.last_reconcile = self.now
+        self._advance(300)
+        with mock.patch.object(self.driver.host_manager,
+                               'reconcile_host_states') as mock_reconcile:
+            self.driver.run_periodic_tasks(mock.Mock())
+            self.assertFalse(mock_reconcile.called)
+
+            self._advance(301)
+            mock_reconcile.return_value = {}
+            self.driver.run_periodic_tasks(mock.Mock())
+            self.assertTrue(mock_reconcile.called)
+
+    def test_run_periodic_tasks_disabled(self):
+        self.flags(scheduler_reconcile_interval=0)
+        self.driver.last_reconcile = self.now
+        self._advance(3600)
+        with mock.patch.object(self.driver.host_manager,
+                               'reconcile_host_states') as mock_reconcile:
+            self.driver.run_periodic_tasks(mock.Mock())
+            self.assertFalse(mock_reconcile.called)
+
+    @mock.patch.object(incremental_scheduler.LOG, 'warning')
+    def test_reconcile_warns_on_drift(self, mock_warning):
+        last_poll = self.now
+        self.driver.last_poll = last_poll
+        self._advance(60)
+        with mock.patch.object(self.driver.host_manager,
+                               'reconcile_host_states') as mock_reconcile:
+            mock_reconcile.return_value = {'added': 1, 'removed': 0,
+                                           'stale': 2}
+            self.driver._reconcile(self.context)
+
+            mock_reconcile.assert_called_once_with(self.context, last_poll)
+        self.assertTrue(mock_warning.called)
+        self.assertEqual(self.now, self.driver.last_poll)
+
+    def test_get_all_host_states_first_request_reconciles(self):
+        hm = self.driver.host_manager
+        with contextlib.nested(
+            mock.patch.object(hm, 'reconcile_host_states',
+                              return_value={}),
+            mock.patch.object(hm, 'get_host_states_changed_since',
+                              return_value=['host_state'])
+        ) as (mock_reconcile, mock_changed):
+            result = self.driver._get_all_host_states(self.context)
+
+            mock_reconcile.assert_called_once_with(self.context, None)
+            mock_changed.assert_called_once_with(self.context, self.now)
+        self.assertEqual(['host_state'], result)
+
+    def test_get_all_host_states_uses_watermark(self):
+        hm = self.driver.host_manager
+        last_poll = self.now
+        self.driver.last_poll = last_poll
+        self._advance(5)
+        with contextlib.nested(
+            mock.patch.object(hm, 'reconcile_host_states'),
+            mock.patch.object(hm, 'get_host_states_changed_since',
+                              return_value=['host_state'])
+        ) as (mock_reconcile, mock_changed):
+            self.driver._get_all_host_states(self.context)
+
+            self.assertFalse(mock_reconcile.called)
+            mock_changed.assert_called_once_with(self.context, last_poll)
+        self.assertEqual(self.now, self.driver.last_poll)
@@ -0,0 +1,96 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For Scheduler Profiling.
+"""
+
+import mock
+
+from nova.scheduler import profiling
+from nova import test
+
+
+class RollingHistogramTestCase(test.NoDBTestCase):
+
+    def test_empty(self):
+        histogram = profiling.RollingHistogram(10)
+        self.assertEqual({'count': 0}, histogram.summary())
+
+    def test_summary(self):
+        histogram = profiling.RollingHistogram(100)
+        for value in range(100, 0, -1):
+            histogram.add(value)
+        self.assertEqual({'count': 100, 'min': 1, 'max': 100, 'mean': 50.5,
+                          'p50': 51, 'p90': 91, 'p99': 100},
+                         histogram.summary())
+
+    def test_window(self):
+        histogram = profiling.RollingHistogram(2)
+        for value in (10, 1, 2):
+            histogram.add(value)
+        summary = histogram.summary()
+        self.assertEqual(2, summary['count'])
+        self.assertEqual(2, summary['max'])
+
+
+class SchedulerProfilerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(SchedulerProfilerTestCase, self).setUp()
+        self.profiler = profiling.SchedulerProfiler(10)
+
+    @mock.patch('time.time', side_effect=[10.0, 12.0])
+    def test_profile_request(self, mock_time):
+        with self.profiler.profile_request() as profile:
+            # Same filter run for two instances of the request
+            self.profiler.record(profiling.FILTER, 'RamFilter', 0.25, 10, 5)
+            self.profiler.record(profiling.FILTER, 'RamFilter', 0.25, 5, 5)
+            self.profiler.record(profiling.WEIGHER, 'RAMWeigher', 0.5, 5, 5)
+
+        self.assertEqual(2.0, profile.elapsed)
+        self.assertEqual(
+            {'elapsed': 2.0,
+             'steps': [{'kind': 'filter', 'name': 'RamFilter',
+                        'elapsed': 0.5, 'hosts_in': 15, 'hosts_out': 10},
+                       {'kind': 'weigher', 'name': 'RAMWeigher',
+                        'elapsed': 0.5, 'hosts_in': 5, 'hosts_out': 5}]},
+            profile.to_dict())
+
+        stats = self.profiler.get_stats()
+        self.assertEqual(1, stats['requests']['elapsed']['count'])
+        self.assertEqual(2.0, stats['requests']['elapsed']['max'])
+        ram_filter = stats['filters']['RamFilter']
+        self.assertEqual(1, ram_filter['elapsed']['count'])
+        self.assertEqual(0.5, ram_filter['elapsed']['max'])
+        self.assertEqual(15, ram_filter['hosts_in']['max'])
+        self.assertEqual(10.0 / 15, ram_filter['pass_rate']['max'])
+        self.assertEqual(['RAMWeigher'], stats['weighers'].keys())
+
+    def test_profile_request_error(self):
+        def fail():
+            with self.profiler.profile_request():
+                self.profiler.record(profiling.FILTER, 'RamFilter', 0.1, 2, 0)
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        stats = self.profiler.get_stats()
+        self.assertEqual(1, stats['requests']['elapsed']['count'])
+        self.assertEqual(0, stats['filters']['RamFilter']['pass_rate']['max'])
+
+    def test_record_outside_request(self):
+        self.profiler.record(profiling.FILTER, 'RamFilter', 0.1, 0, 0)
+        stats = self.profiler.get_stats()
+        self.assertEqual(0, stats['requests']['elapsed']['count'])
+        ram_filter = stats['filters']['RamFilter']
+        self.assertEqual(1, ram_filter['elapsed']['count'])
+        # No pass rate without any host
+        self.assertEqual(0, ram_filter['pass_rate']['count'])
@@ -37,6 +37,7 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         expected_retval = 'foo' if rpc_method == 'call' else None
         expected_version = kwargs.pop('version', None)
         expected_fanout = kwargs.pop('fanout', None)
+        expected_server = kwargs.pop('server', None)
         expected_kwargs = kwargs.copy()
 
         self.mox.StubOutWithMock(rpcapi, 'client')
@@ -47,6 +48,9 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
         prepare_kwargs = {}
         if expected_fanout:
             prepare_kwargs['fanout'] = True
+        if expected_server:
+            prepare_kwargs['server'] = expected_server
+            kwargs['host'] = expected_server
         if expected_version:
             prepare_kwargs['version'] = expected_version
         rpcapi.client.prepare(**prepare_kwargs).AndReturn(rpcapi.client)
@@ -80,3 +84,8 @@ class SchedulerRpcAPITestCase(test.NoDBTestCase):
                 aggregate='aggregate',
                 version='4.1',
                 fanout=True)
+
+    def test_get_profiling_stats(self):
+        self._test_scheduler_api('get_profiling_stats', rpc_method='call',
+                version='4.2',
+                server='fake_host')
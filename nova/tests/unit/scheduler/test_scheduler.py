@@ -72,6 +72,16 @@ class SchedulerManagerTestCase(test.NoDBTestCase):
             self.manager.delete_aggregate(None, aggregate='agg')
             delete_aggregate.assert_called_once_with('agg')
 
+    def test_get_profiling_stats(self):
+        stats = {'requests': {'elapsed': {'count': 0}},
+                 'filters': {}, 'weighers': {}}
+        with mock.patch.object(self.manager.driver.host_manager,
+                               'get_profiling_stats',
+                               return_value=stats) as get_profiling_stats:
+            result = self.manager.get_profiling_stats(None)
+            get_profiling_stats.assert_called_once_with()
+        self.assertEqual(stats, result)
+
 
 class SchedulerV3PassthroughTestCase(test.NoDBTestCase):
     def setUp(self):
@@ -65,6 +65,19 @@ class MetricsWeigherTestCase(test.NoDBTestCase):
         self.assertEqual(expected_weight, weighed_host.weight)
         self.assertEqual(expected_host, weighed_host.obj.host)
 
+    def test_no_setting(self):
+        self.flags(weight_setting=[], group='metrics')
+        self.weighers[0]._parse_setting()
+        hostinfo_list = self._get_all_hosts()
+        self.stubs.Set(self.weighers[0], '_weigh_object',
+                       lambda *args: self.fail('should not be called'))
+        weighed = self.weight_handler.get_weighed_objects(self.weighers,
+                hostinfo_list, {})
+        self.assertEqual([0.0] * len(hostinfo_list),
+                         [w.weight for w in weighed])
+        self.assertEqual(['host%d' % i for i in range(1, 7)],
+                         [w.obj.host for w in weighed])
+
     def test_single_resource(self):
         # host1: foo=512
         # host2: foo=1024
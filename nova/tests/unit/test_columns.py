@@ -0,0 +1,46 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For columnar views.
+"""
+
+from nova import columns
+from nova import test
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        for key, value in kwargs.iteritems():
+            setattr(self, key, value)
+
+
+class ObjectColumnsTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ObjectColumnsTestCase, self).setUp()
+        self.objs = [FakeObject(name='obj%d' % i, value=i) for i in range(4)]
+        self.columns = columns.ObjectColumns(iter(self.objs))
+
+    def test_len(self):
+        self.assertEqual(4, len(self.columns))
+        self.assertEqual(self.objs, self.columns.objs)
+
+    def test_getitem(self):
+        self.assertEqual([0, 1, 2, 3], self.columns['value'])
+
+    def test_getitem_is_cached(self):
+        column = self.columns['value']
+        self.objs[0].value = 42
+        self.assertIs(column, self.columns['value'])
+        self.assertEqual(0, self.columns['value'][0])
+
+    def test_getitem_unknown_attribute(self):
+        self.assertRaises(AttributeError, self.columns.__getitem__, 'foo')
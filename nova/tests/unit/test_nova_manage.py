@@ -13,11 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
 import StringIO
 import sys
 
 import fixtures
 import mock
+from oslo_serialization import jsonutils
 
 from nova.cmd import manage
 from nova import context
@@ -341,12 +343,12 @@ class VmCommandsTestCase(test.TestCase):
     def test_list_without_host(self):
         output = StringIO.StringIO()
         sys.stdout = output
-        with mock.patch.object(objects.InstanceList, 'get_by_filters') as get:
-            get.return_value = objects.InstanceList(
-                objects=[fake_instance.fake_instance_obj(
-                    context.get_admin_context(), host='foo-host',
-                    instance_type=self.fake_flavor,
-                    expected_attrs=('flavor'))])
+        with mock.patch.object(objects.InstanceList,
+                               'iter_by_filters') as get:
+            get.return_value = iter([fake_instance.fake_instance_obj(
+                context.get_admin_context(), host='foo-host',
+                instance_type=self.fake_flavor,
+                expected_attrs=('flavor'))])
             self.commands.list()
 
         sys.stdout = sys.__stdout__
@@ -383,6 +385,55 @@ class DBCommandsTestCase(test.TestCase):
     def test_archive_deleted_rows_negative(self):
         self.assertEqual(1, self.commands.archive_deleted_rows(-1))
 
+    def test_archive_deleted_rows_invalid_chunk_size(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(
+            None, chunk_size=0))
+
+    def test_archive_deleted_rows_invalid_workers(self):
+        self.assertEqual(1, self.commands.archive_deleted_rows(
+            None, workers=0))
+
+    @staticmethod
+    def _fake_archive_deleted_rows(context, max_rows, chunk_size=None,
+                                   chunk_sleep=None, workers=None,
+                                   checkpoint=None, progress=None):
+        checkpoint['consoles'] = {'marker': 3, 'done': max_rows is None}
+        progress('consoles', 2)
+        progress('consoles', 1)
+        checkpoint['instances'] = {'marker': 7, 'done': max_rows is None}
+        progress('instances', 4)
+        return 7
+
+    @mock.patch('time.time', side_effect=[10.0, 12.0])
+    def test_archive_deleted_rows_verbose(self, mock_time):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        with mock.patch.object(db, 'archive_deleted_rows',
+                               side_effect=self._fake_archive_deleted_rows):
+            self.commands.archive_deleted_rows(None, verbose=True)
+        output = sys.stdout.getvalue().splitlines()
+        self.assertEqual(['consoles', '3'], output[1].split())
+        self.assertEqual(['instances', '4'], output[2].split())
+        self.assertEqual("Archived 7 rows in 2.0 seconds, "
+                         "3.5 rows per second", output[3])
+
+    def test_archive_deleted_rows_checkpoint(self):
+        checkpoint = os.path.join(self.useFixture(fixtures.TempDir()).path,
+                                  'checkpoint')
+        with mock.patch.object(db, 'archive_deleted_rows',
+                               side_effect=self._fake_archive_deleted_rows
+                               ) as mock_archive:
+            self.commands.archive_deleted_rows(10, checkpoint=checkpoint)
+            with open(checkpoint) as f:
+                self.assertEqual({'consoles': {'marker': 3, 'done': False},
+                                  'instances': {'marker': 7, 'done': False}},
+                                 jsonutils.load(f))
+            self.commands.archive_deleted_rows(None, checkpoint=checkpoint)
+        self.assertEqual({'consoles': {'marker': 3, 'done': True},
+                          'instances': {'marker': 7, 'done': True}},
+                         mock_archive.call_args[1]['checkpoint'])
+        self.assertFalse(os.path.exists(checkpoint))
+
     @mock.patch.object(migration, 'db_null_instance_uuid_scan',
                        return_value={'foo': 0})
     def test_null_instance_uuid_scan_no_records_found(self, mock_scan):
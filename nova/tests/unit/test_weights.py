@@ -16,6 +16,10 @@
 Tests For weights.
 """
 
+import mock
+
+from nova import loadables
+from nova.scheduler import profiling
 from nova import test
 from nova import weights
 
@@ -51,3 +55,145 @@ class TestWeigher(test.NoDBTestCase):
         for seq, result, minval, maxval in map_:
             ret = weights.normalize(seq, minval=minval, maxval=maxval)
             self.assertEqual(tuple(ret), result)
+
+    def test_get_weighed_objects_vectorized(self):
+        class Obj(object):
+            def __init__(self, value):
+                self.value = value
+
+        class VectorizedWeigher(weights.BaseWeigher):
+            vectorized = True
+
+            def _weigh_object(self, obj, weight_properties):
+                raise AssertionError()
+
+            def weigh_all_vectorized(self, columns, weight_properties):
+                return list(columns['value'])
+
+        class FallbackWeigher(VectorizedWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return -obj.value
+
+            def weigh_all_vectorized(self, columns, weight_properties):
+                return None
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        objs = [Obj(value) for value in (2, 4, 0)]
+        handler = weights.BaseWeightHandler(weights.BaseWeigher)
+        weigher = VectorizedWeigher()
+        weighed = handler.get_weighed_objects([weigher], objs, {})
+        self.assertEqual([4, 2, 0], [w.obj.value for w in weighed])
+        self.assertEqual([1.0, 0.5, 0.0], [w.weight for w in weighed])
+        self.assertEqual(0, weigher.minval)
+        self.assertEqual(4, weigher.maxval)
+
+        weighed = handler.get_weighed_objects(
+            [VectorizedWeigher(), FallbackWeigher()], objs, {})
+        self.assertEqual([1.0, 1.0, 1.0], [w.weight for w in weighed])
+
+    def test_get_weighed_objects_limit(self):
+        class Obj(object):
+            def __init__(self, name, value):
+                self.name = name
+                self.value = value
+
+        class ValueWeigher(weights.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj.value
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        objs = [Obj(name, value) for name, value in
+                (('a', 1), ('b', 3), ('c', 2), ('d', 3), ('e', 0))]
+        handler = weights.BaseWeightHandler(weights.BaseWeigher)
+        weighers = [ValueWeigher()]
+
+        weighed = handler.get_weighed_objects(weighers, objs, {})
+        self.assertEqual(['b', 'd', 'c', 'a', 'e'],
+                         [w.obj.name for w in weighed])
+        for limit in range(6):
+            limited = handler.get_weighed_objects(weighers, objs, {},
+                                                  limit=limit)
+            self.assertEqual([(w.obj, w.weight) for w in weighed[:limit]],
+                             [(w.obj, w.weight) for w in limited])
+
+    def test_get_weighed_objects_profiler(self):
+        class ValueWeigher(weights.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        handler = weights.BaseWeightHandler(weights.BaseWeigher)
+        profiler = mock.Mock()
+        handler.get_weighed_objects([ValueWeigher()], [1, 2, 3], {},
+                                    profiler=profiler)
+        profiler.record.assert_called_once_with(
+            profiling.WEIGHER, 'ValueWeigher', mock.ANY, 3, 3)
+
+    def test_get_weighed_heap(self):
+        class Obj(object):
+            def __init__(self, name, value):
+                self.name = name
+                self.value = value
+
+        class ValueWeigher(weights.BaseWeigher):
+            def _weigh_object(self, obj, weight_properties):
+                return obj.value
+
+        class SquareWeigher(weights.BaseWeigher):
+            vectorized = True
+
+            def weight_multiplier(self):
+                return -0.5
+
+            def _weigh_object(self, obj, weight_properties):
+                raise AssertionError()
+
+            def weigh_all_vectorized(self, columns, weight_properties):
+                return [value ** 2 for value in columns['value']]
+
+        def _weighed(weighed_objs):
+            return [(w.obj.name, w.weight) for w in weighed_objs]
+
+        self.stubs.Set(loadables.BaseLoader, '__init__',
+                       lambda *args, **kwargs: None)
+        objs = [Obj(name, value) for name, value in
+                (('a', 1), ('b', 3), ('c', 2), ('d', 3), ('e', 0))]
+        handler = weights.BaseWeightHandler(weights.BaseWeigher)
+        weighers = [ValueWeigher(), SquareWeigher()]
+
+        heap = handler.get_weighed_heap(weighers, objs, {})
+        self.assertEqual(5, len(heap))
+        expected = handler.get_weighed_objects(weighers, objs, {})
+        best = heap.pop(2)
+        self.assertEqual(_weighed(expected[:2]), _weighed(best))
+        self.assertEqual(3, len(heap))
+        self.assertEqual(objs, heap.objs())
+
+        # Changing the weight of an object within the bounds
+        heap.push(best[1])
+        best[0].obj.value = 1
+        heap.reweigh(best[0].obj)
+        expected = handler.get_weighed_objects(weighers, objs, {})
+        self.assertEqual(_weighed(expected), _weighed(heap.pop(5)))
+
+        # Changing the bounds of the weighers
+        for weighed_obj in expected[1:]:
+            heap.push(weighed_obj)
+        expected[0].obj.value = -2
+        heap.reweigh(expected[0].obj)
+        self.assertEqual(-2, weighers[0].minval)
+        expected = handler.get_weighed_objects(weighers, objs, {})
+        self.assertEqual(_weighed(expected), _weighed(heap.pop(5)))
+
+        for weighed_obj in expected[1:]:
+            heap.push(weighed_obj)
+        heap.discard(expected[0].obj)
+        heap.retain(objs[1:4])
+        members = [obj for obj in objs[1:4] if obj is not expected[0].obj]
+        self.assertEqual(members, heap.objs())
+        self.assertEqual(len(members), len(heap))
+        self.assertEqual(_weighed(w for w in expected if w.obj in members),
+                         _weighed(heap.pop(5)))
@@ -12,6 +12,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import collections
+import itertools
+import random
 import uuid
 
 import mock
@@ -81,11 +84,38 @@ class CpuSetTestCase(test.NoDBTestCase):
         cpuset_ids = hw.get_vcpu_pin_set()
         self.assertEqual(set([1, 3, 5]), cpuset_ids)
 
+    def test_get_vcpu_pin_set_parsed_once(self):
+        self.flags(vcpu_pin_set="1-3")
+        with mock.patch.object(hw, 'parse_cpu_spec',
+                               wraps=hw.parse_cpu_spec) as parse:
+            cpuset_ids = hw.get_vcpu_pin_set()
+            cpuset_ids.add(4)
+            self.assertEqual(set([1, 2, 3]), hw.get_vcpu_pin_set())
+            self.assertEqual(1, parse.call_count)
+            self.flags(vcpu_pin_set="5")
+            self.assertEqual(set([5]), hw.get_vcpu_pin_set())
+            self.assertEqual(2, parse.call_count)
+
     def test_parse_cpu_spec_none_returns_none(self):
-        self.flags(vcpu_pin_set=None)
         cpuset_ids = hw.get_vcpu_pin_set()
         self.assertIsNone(cpuset_ids)
 
+    def test_cpu_mask(self):
+        self.assertEqual(0, hw.cpu_mask(set()))
+        self.assertEqual(0b100101, hw.cpu_mask(set([0, 2, 5])))
+        self.assertEqual(1 << 255 | 1, hw.cpu_mask([255, 0]))
+
+    def test_cpu_mask_count(self):
+        self.assertEqual(0, hw.cpu_mask_count(0))
+        self.assertEqual(3, hw.cpu_mask_count(0b100101))
+        self.assertEqual(256, hw.cpu_mask_count((1 << 256) - 1))
+
+    def test_cpu_mask_to_list(self):
+        self.assertEqual([], hw.cpu_mask_to_list(0))
+        self.assertEqual([0, 2, 5], hw.cpu_mask_to_list(0b100101))
+        self.assertEqual([0, 2], hw.cpu_mask_to_list(0b100101, 2))
+        self.assertEqual([0, 255], hw.cpu_mask_to_list(1 << 255 | 1))
+
     def test_parse_cpu_spec_valid_syntax_works(self):
         cpuset_ids = hw.parse_cpu_spec("1")
         self.assertEqual(set([1]), cpuset_ids)
@@ -796,6 +826,68 @@ class VCPUTopologyTest(test.NoDBTestCase):
             self.assertEqual(topo_test["expect"][1], topology.cores)
             self.assertEqual(topo_test["expect"][2], topology.threads)
 
+    def test_divisors(self):
+        self.assertEqual([1, 2, 3, 4, 6, 12], hw._divisors(12, 12))
+        self.assertEqual([1, 2, 4], hw._divisors(16, 5))
+        self.assertEqual([1, 3, 9], hw._divisors(9, 10))
+        self.assertEqual([1], hw._divisors(7, 1))
+
+    def test_possible_topologies_enumerate_factorizations(self):
+        for vcpus in range(1, 49):
+            for maxthreads in (1, 2, 4):
+                maximum = objects.VirtCPUTopology(sockets=8, cores=16,
+                                                  threads=maxthreads)
+                expected = [(s, c, t)
+                            for s in range(1, 9)
+                            for c in range(1, 17)
+                            for t in range(1, maxthreads + 1)
+                            if s * c * t == vcpus]
+                if not expected:
+                    self.assertRaises(
+                        exception.ImageVCPULimitsRangeImpossible,
+                        hw._get_possible_cpu_topologies,
+                        vcpus, maximum, True, None)
+                    continue
+                actual = [(topology.sockets, topology.cores, topology.threads)
+                          for topology in hw._get_possible_cpu_topologies(
+                              vcpus, maximum, True, None)]
+                self.assertEqual(sorted(expected), sorted(actual))
+
+    @mock.patch.object(hw, '_cpu_topologies_cache',
+                       collections.OrderedDict())
+    def test_desirable_topologies_cached(self):
+        flavor = objects.Flavor(vcpus=8, memory_mb=2048,
+                                extra_specs={"hw:cpu_sockets": "2"})
+        with mock.patch.object(hw, '_get_possible_cpu_topologies',
+                               wraps=hw._get_possible_cpu_topologies
+                               ) as possible:
+            first = hw._get_desirable_cpu_topologies(flavor, {})
+            second = hw._get_desirable_cpu_topologies(flavor, {})
+            best = hw.get_best_cpu_topology(flavor, {})
+            self.assertEqual(1, possible.call_count)
+
+            hw._get_desirable_cpu_topologies(flavor, {}, allow_threads=False)
+            self.assertEqual(2, possible.call_count)
+
+        self.assertEqual([(t.sockets, t.cores, t.threads) for t in first],
+                         [(t.sockets, t.cores, t.threads) for t in second])
+        self.assertEqual((2, 4, 1), (best.sockets, best.cores, best.threads))
+        # The callers get their own topologies
+        self.assertIsNot(first[0], second[0])
+
+    @mock.patch.object(hw, '_CPU_TOPOLOGIES_CACHE_SIZE', 2)
+    @mock.patch.object(hw, '_cpu_topologies_cache',
+                       collections.OrderedDict())
+    def test_desirable_topologies_cache_evicts_least_recently_used(self):
+        flavors = [objects.Flavor(vcpus=vcpus, memory_mb=2048, extra_specs={})
+                   for vcpus in (2, 4, 8)]
+        hw.get_best_cpu_topology(flavors[0], {})
+        hw.get_best_cpu_topology(flavors[1], {})
+        hw.get_best_cpu_topology(flavors[0], {})
+        hw.get_best_cpu_topology(flavors[2], {})
+
+        self.assertEqual([2, 8], [key[0] for key in hw._cpu_topologies_cache])
+
 
 class NUMATopologyTest(test.NoDBTestCase):
 
@@ -1475,6 +1567,273 @@ class VirtNUMAHostTopologyTestCase(test.NoDBTestCase):
             self.assertIsNone(fitted_instance1)
 
 
+class NUMAFitSearchTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(NUMAFitSearchTestCase, self).setUp()
+        self.random = random.Random(42)
+
+    def _host(self, nodes, pinned=False):
+        cells = []
+        for node in range(nodes):
+            cpus = range(node * 4, node * 4 + 4)
+            siblings = []
+            if self.random.random() < 0.5:
+                siblings = [set(cpus[:2]), set(cpus[2:])]
+            used_cpus = set()
+            if pinned:
+                used_cpus = set(self.random.sample(
+                    cpus, self.random.randint(0, 3)))
+            memory_usage = self.random.choice([0, 1024, 2048, 3072])
+            cells.append(objects.NUMACell(
+                id=node, cpuset=set(cpus), memory=4096,
+                cpu_usage=self.random.randint(0, 6),
+                memory_usage=memory_usage, siblings=siblings,
+                pinned_cpus=used_cpus,
+                mempages=[
+                    objects.NUMAPagesTopology(size_kb=4, total=1048576,
+                                              used=memory_usage * 256),
+                    objects.NUMAPagesTopology(
+                        size_kb=2048, total=self.random.choice([0, 1024]),
+                        used=0)]))
+        return objects.NUMATopology(cells=cells)
+
+    def _limits(self, host):
+        return hw.VirtNUMALimitTopology(cells=[
+            hw.VirtNUMATopologyCellLimit(
+                cell.id, cell.cpuset, cell.memory,
+                cpu_limit=len(cell.cpuset) * 2, memory_limit=cell.memory)
+            for cell in host.cells])
+
+    def _instance(self, nodes, pinned=False):
+        cells = []
+        for node in range(nodes):
+            vcpus = self.random.choice([1, 2, 4])
+            cell = objects.InstanceNUMACell(
+                id=node, cpuset=set(range(node * 4, node * 4 + vcpus)),
+                memory=self.random.choice([512, 1024, 2048]),
+                pagesize=self.random.choice([None, hw.MEMPAGES_ANY]))
+            if pinned:
+                cell.cpu_pinning = {}
+                if vcpus > 1 and self.random.random() < 0.5:
+                    cell.cpu_topology = objects.VirtCPUTopology(
+                        sockets=1, cores=vcpus / 2, threads=2)
+            cells.append(cell)
+        return objects.InstanceNUMATopology(cells=cells)
+
+    def _permutations_fit(self, host, instance, limits=None):
+        limit_cells = [None] * len(host) if limits is None else limits.cells
+        for perm in itertools.permutations(zip(host.cells, limit_cells),
+                                           len(instance)):
+            cells = []
+            for (host_cell, limit_cell), instance_cell in zip(
+                    perm, instance.cells):
+                got_cell = hw._numa_fit_instance_cell(
+                    host_cell, hw._numa_copy_instance_cell(instance_cell),
+                    limit_cell)
+                if got_cell is None:
+                    break
+                cells.append(got_cell)
+            if len(cells) == len(instance):
+                return cells
+
+    @staticmethod
+    def _cell_fields(cell):
+        cpu_topology = cell.cpu_topology
+        if cpu_topology is not None:
+            cpu_topology = (cpu_topology.sockets, cpu_topology.cores,
+                            cpu_topology.threads)
+        return (cell.id, cell.cpuset, cell.memory, cell.pagesize,
+                cell.cpu_pinning, cpu_topology)
+
+    def _assertSameFit(self, expected_cells, fitted):
+        if expected_cells is None:
+            self.assertIsNone(fitted)
+        else:
+            self.assertIsNotNone(fitted)
+            self.assertEqual(map(self._cell_fields, expected_cells),
+                             map(self._cell_fields, fitted.cells))
+
+    def test_same_fit_as_permutations(self):
+        fitted_count = 0
+        for i in range(150):
+            host_nodes = self.random.choice([2, 4, 8])
+            instance_nodes = self.random.randint(1, min(host_nodes, 4))
+            pinned = self.random.random() < 0.5
+            host = self._host(host_nodes, pinned)
+            instance = self._instance(instance_nodes, pinned)
+            limits = None
+            if self.random.random() < 0.5:
+                limits = self._limits(host)
+            expected_cells = self._permutations_fit(host, instance, limits)
+            fitted = hw.numa_fit_instance_to_host(host, instance, limits)
+            self._assertSameFit(expected_cells, fitted)
+            fitted_count += fitted is not None
+        # Both outcomes have to be covered for the comparison to be useful
+        self.assertTrue(0 < fitted_count < 150)
+
+    def test_instance_topology_untouched(self):
+        host = self._host(4, pinned=True)
+        instance = self._instance(2, pinned=True)
+        before = map(self._cell_fields, instance.cells)
+        hw.numa_fit_instance_to_host(host, instance)
+        self.assertEqual(before, map(self._cell_fields, instance.cells))
+
+    def test_cells_fitted_once(self):
+        host = objects.NUMATopology(cells=[
+            objects.NUMACell(id=i, cpuset=set([i]), memory=1024,
+                             cpu_usage=0, memory_usage=0, mempages=[],
+                             siblings=[], pinned_cpus=set())
+            for i in range(4)])
+        instance = objects.InstanceNUMATopology(cells=[
+            objects.InstanceNUMACell(id=i, cpuset=set([i]), memory=512)
+            for i in range(3)])
+        pci_stats = stats.PciDeviceStats()
+        with mock.patch.object(pci_stats, 'support_requests',
+                               return_value=False) as support_requests:
+            with mock.patch.object(hw, '_numa_fit_instance_cell',
+                                   wraps=hw._numa_fit_instance_cell) as fit:
+                fitted = hw.numa_fit_instance_to_host(
+                    host, instance, pci_requests=['fake'],
+                    pci_stats=pci_stats)
+        self.assertIsNone(fitted)
+        self.assertEqual(24, support_requests.call_count)
+        self.assertEqual(12, fit.call_count)
+
+    def test_pci_requests_checked_in_order(self):
+        host = objects.NUMATopology(cells=[
+            objects.NUMACell(id=i, cpuset=set([i]), memory=1024,
+                             cpu_usage=0, memory_usage=0, mempages=[],
+                             siblings=[], pinned_cpus=set())
+            for i in range(3)])
+        instance = objects.InstanceNUMATopology(cells=[
+            objects.InstanceNUMACell(id=0, cpuset=set([0]), memory=512),
+            objects.InstanceNUMACell(id=1, cpuset=set([1]), memory=512)])
+        pci_stats = stats.PciDeviceStats()
+        with mock.patch.object(pci_stats, 'support_requests',
+                               side_effect=[False, False, True]):
+            fitted = hw.numa_fit_instance_to_host(
+                host, instance, pci_requests=['fake'], pci_stats=pci_stats)
+        self.assertEqual([1, 0], [cell.id for cell in fitted.cells])
+
+    def test_no_fit_without_pci_stats(self):
+        host = self._host(2)
+        instance = self._instance(1)
+        self.assertIsNone(hw.numa_fit_instance_to_host(
+            host, instance, pci_requests=['fake']))
+
+    def _fits(self, matrix):
+        fits = lambda row, column: matrix[row][column]
+        fits.rows = len(matrix)
+        fits.columns = range(len(matrix[0]))
+        return fits
+
+    def test_fit_permutations_order(self):
+        fits = self._fits([['fit'] * 3] * 2)
+        self.assertEqual(map(list, itertools.permutations(range(3), 2)),
+                         list(hw._numa_fit_permutations(fits)))
+
+    def test_fit_permutations_pruned(self):
+        fits = self._fits([['fit', 'fit', 'fit'],
+                           ['fit', None, None],
+                           [None, 'fit', 'fit']])
+        self.assertEqual([[1, 0, 2], [2, 0, 1]],
+                         list(hw._numa_fit_permutations(fits)))
+        fits = self._fits([['fit', 'fit', 'fit'],
+                           ['fit', None, None],
+                           ['fit', None, None]])
+        self.assertEqual([], list(hw._numa_fit_permutations(fits)))
+
+
+class NUMAPlacementPolicyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(NUMAPlacementPolicyTestCase, self).setUp()
+        self.host = objects.NUMATopology(cells=[
+            objects.NUMACell(id=0, cpuset=set([0, 1, 2, 3]), memory=2048,
+                             cpu_usage=1, memory_usage=512, siblings=[],
+                             pinned_cpus=set(), mempages=[]),
+            objects.NUMACell(id=1, cpuset=set([4, 5, 6, 7]), memory=2048,
+                             cpu_usage=3, memory_usage=1024, siblings=[],
+                             pinned_cpus=set([4, 5]), mempages=[]),
+            objects.NUMACell(id=2, cpuset=set([8, 9, 10, 11]), memory=2048,
+                             cpu_usage=0, memory_usage=0, siblings=[],
+                             pinned_cpus=set(), mempages=[
+                objects.NUMAPagesTopology(size_kb=4, total=262144,
+                                          used=0),
+                objects.NUMAPagesTopology(size_kb=2048, total=512,
+                                          used=256)])])
+
+    def _instance(self, pinned=False):
+        cell = objects.InstanceNUMACell(id=0, cpuset=set([0]), memory=512)
+        if pinned:
+            cell.cpu_pinning = {}
+        return objects.InstanceNUMATopology(cells=[cell])
+
+    def test_numa_cell_capacities(self):
+        self.assertEqual([(3, 4, 1536, 0), (1, 2, 1024, 0),
+                          (4, 4, 2048, 524288)],
+                         hw.numa_cell_capacities(self.host))
+
+    def test_numa_cell_capacities_unset_fields(self):
+        host = objects.NUMATopology(cells=[
+            objects.NUMACell(id=0, cpuset=set([0, 1]), memory=1024)])
+        self.assertEqual([(2, 2, 1024, 0)], hw.numa_cell_capacities(host))
+
+    def test_cell_order(self):
+        capacities = hw.numa_cell_capacities(self.host)
+        for policy, pinned, order in [('none', False, None),
+                                      ('pack', False, [1, 0, 2]),
+                                      ('pack', True, [1, 0, 2]),
+                                      ('spread', False, [2, 0, 1]),
+                                      ('pinned-pack', True, [1, 0, 2]),
+                                      ('pinned-pack', False, [2, 0, 1])]:
+            self.flags(numa_placement_policy=policy)
+            self.assertEqual(order, hw._numa_cell_order(
+                capacities, self._instance(pinned)))
+
+    def test_cell_order_pinned_cpus(self):
+        self.host.cells[0].pinned_cpus = set([0, 1, 2])
+        capacities = hw.numa_cell_capacities(self.host)
+        self.flags(numa_placement_policy='pack')
+        self.assertEqual([1, 0, 2], hw._numa_cell_order(
+            capacities, self._instance()))
+        self.assertEqual([0, 1, 2], hw._numa_cell_order(
+            capacities, self._instance(pinned=True)))
+
+    def _fitted_cell_ids(self, instance, **kwargs):
+        fitted = hw.numa_fit_instance_to_host(self.host, instance, **kwargs)
+        return [cell.id for cell in fitted.cells]
+
+    def test_fit_none(self):
+        self.assertEqual([0], self._fitted_cell_ids(self._instance()))
+
+    def test_fit_pack(self):
+        self.flags(numa_placement_policy='pack')
+        self.assertEqual([1], self._fitted_cell_ids(self._instance()))
+        instance = self._instance(pinned=True)
+        instance.cells[0].cpuset = set([0, 1, 2])
+        self.assertEqual([0], self._fitted_cell_ids(instance))
+
+    def test_fit_spread(self):
+        self.flags(numa_placement_policy='spread')
+        self.assertEqual([2], self._fitted_cell_ids(self._instance()))
+
+    def test_fit_pinned_pack(self):
+        self.flags(numa_placement_policy='pinned-pack')
+        self.assertEqual([1], self._fitted_cell_ids(
+            self._instance(pinned=True)))
+        self.assertEqual([2], self._fitted_cell_ids(self._instance()))
+
+    def test_fit_cell_capacities(self):
+        self.flags(numa_placement_policy='pack')
+        capacities = [(0, 0, 0, 0), (9, 9, 9, 9), (5, 5, 5, 5)]
+        capacities = [hw.NUMACellCapacity(*capacity)
+                      for capacity in capacities]
+        with mock.patch.object(hw, 'numa_cell_capacities') as capacities_mock:
+            self.assertEqual([0], self._fitted_cell_ids(
+                self._instance(), cell_capacities=capacities))
+        self.assertFalse(capacities_mock.called)
+
+
 class NumberOfSerialPortsTest(test.NoDBTestCase):
     def test_flavor(self):
         flavor = objects.Flavor(vcpus=8, memory_mb=2048,
@@ -1820,6 +2179,33 @@ class _CPUPinningTestCaseBase(object):
 
 
 class CPUPinningCellTestCase(test.NoDBTestCase, _CPUPinningTestCaseBase):
+    def test_get_pinning_lowest_free_cpus(self):
+        host_pin = objects.NUMACell(id=0, cpuset=set([0, 64, 128, 192]),
+                                    memory=2048, memory_usage=0,
+                                    siblings=[set([0, 64, 128, 192])],
+                                    mempages=[], pinned_cpus=set([64]))
+        inst_pin = objects.InstanceNUMACell(cpuset=set([0, 1]),
+                                            memory=2048)
+
+        inst_pin = hw._numa_fit_instance_cell_with_pinning(host_pin, inst_pin)
+        self.assertEqual({0: 0, 1: 128}, inst_pin.cpu_pinning)
+        got_topo = objects.VirtCPUTopology(sockets=1, cores=1, threads=2)
+        self.assertEqualTopology(got_topo, inst_pin.cpu_topology)
+
+    def test_get_pinning_many_siblings(self):
+        siblings = [set([i, i + 128]) for i in range(128)]
+        host_pin = objects.NUMACell(id=0, cpuset=set(range(256)),
+                                    memory=2048, memory_usage=0,
+                                    siblings=siblings, mempages=[],
+                                    pinned_cpus=set(range(0, 256, 3)))
+        inst_pin = objects.InstanceNUMACell(cpuset=set(range(8)),
+                                            memory=2048)
+
+        inst_pin = hw._numa_fit_instance_cell_with_pinning(host_pin, inst_pin)
+        self.assertInstanceCellPinned(inst_pin)
+        self.assertEqual([2, 130, 5, 133, 8, 136, 11, 139],
+                         [inst_pin.cpu_pinning[vcpu] for vcpu in range(8)])
+
     def test_get_pinning_inst_too_large_cpu(self):
         host_pin = objects.NUMACell(id=0, cpuset=set([0, 1, 2]),
                                     memory=2048, memory_usage=0, siblings=[],
@@ -32,8 +32,22 @@ virt_cpu_opts = [
                'For example, "4-12,^8,15"'),
 ]
 
+virt_numa_opts = [
+    cfg.StrOpt('numa_placement_policy',
+               default='none',
+               choices=('none', 'pack', 'spread', 'pinned-pack'),
+               help='Order in which the NUMA cells of a host are tried when '
+                    'fitting an instance with a NUMA topology. "none" tries '
+                    'them in the order of their ids, "pack" fills the cells '
+                    'with the least free resources first, "spread" the '
+                    'ones with the most free resources first, and '
+                    '"pinned-pack" packs the instances with pinned CPUs and '
+                    'spreads the others'),
+]
+
 CONF = cfg.CONF
 CONF.register_opts(virt_cpu_opts)
+CONF.register_opts(virt_numa_opts)
 
 LOG = logging.getLogger(__name__)
 
@@ -42,19 +56,28 @@ MEMPAGES_LARGE = -2
 MEMPAGES_ANY = -3
 
 
+# The last parsed vcpu_pin_set config and its CPU indexes
+_vcpu_pin_set = (None, None)
+
+
 def get_vcpu_pin_set():
     """Parsing vcpu_pin_set config.
 
     Returns a set of pcpu ids can be used by instances.
     """
+    global _vcpu_pin_set
+
     if not CONF.vcpu_pin_set:
         return None
 
-    cpuset_ids = parse_cpu_spec(CONF.vcpu_pin_set)
+    spec, cpuset_ids = _vcpu_pin_set
+    if spec != CONF.vcpu_pin_set:
+        cpuset_ids = frozenset(parse_cpu_spec(CONF.vcpu_pin_set))
+        _vcpu_pin_set = (CONF.vcpu_pin_set, cpuset_ids)
     if not cpuset_ids:
         raise exception.Invalid(_("No CPUs available after parsing %r") %
                                 CONF.vcpu_pin_set)
-    return cpuset_ids
+    return set(cpuset_ids)
 
 
 def parse_cpu_spec(spec):
@@ -401,6 +424,20 @@ def _get_cpu_topology_constraints(flavor, image_meta):
                                     threads=maxthreads))
 
 
+def _divisors(number, limit):
+    """Get the divisors of a number up to a limit, in ascending order"""
+    small = []
+    large = []
+    i = 1
+    while i * i <= number:
+        if number % i == 0:
+            small.append(i)
+            if i * i != number:
+                large.append(number // i)
+        i += 1
+    return [divisor for divisor in small + large[::-1] if divisor <= limit]
+
+
 def _get_possible_cpu_topologies(vcpus, maxtopology,
                                  allow_threads, specified_threads):
     """Get a list of possible topologies for a vCPU count
@@ -439,30 +476,22 @@ def _get_possible_cpu_topologies(vcpus, maxtopology,
               {"vcpus": vcpus, "maxsockets": maxsockets,
                "maxcores": maxcores, "maxthreads": maxthreads})
 
-    def _get_topology_for_vcpus(vcpus, sockets, cores, threads):
-        if threads * cores * sockets == vcpus:
-            return objects.VirtCPUTopology(sockets=sockets,
-                                           cores=cores,
-                                           threads=threads)
-
     # Figure out all possible topologies that match
     # the required vcpus count and satisfy the declared
-    # limits. If the total vCPU count were very high
-    # it might be more efficient to factorize the vcpu
-    # count and then only iterate over its factors, but
-    # that's overkill right now
+    # limits, iterating only over the divisors of the
+    # vcpu count
     possible = []
-    for s in range(1, maxsockets + 1):
-        for c in range(1, maxcores + 1):
+    for s in _divisors(vcpus, maxsockets):
+        for c in _divisors(vcpus // s, maxcores):
+            t = vcpus // (s * c)
             if specified_threads:
-                o = _get_topology_for_vcpus(vcpus, s, c, specified_threads)
-                if o is not None:
-                    possible.append(o)
-            else:
-                for t in range(1, maxthreads + 1):
-                    o = _get_topology_for_vcpus(vcpus, s, c, t)
-                    if o is not None:
-                        possible.append(o)
+                if t != specified_threads:
+                    continue
+            elif t > maxthreads:
+                continue
+            possible.append(objects.VirtCPUTopology(sockets=s,
+                                                    cores=c,
+                                                    threads=t))
 
     # We want to
     #  - Minimize threads (ie larger sockets * cores is best)
@@ -528,23 +557,23 @@ def _threads_requested_by_user(flavor, image_meta):
     return False
 
 
-def _get_desirable_cpu_topologies(flavor, image_meta, allow_threads=True,
-                                  numa_topology=None):
-    """Get desired CPU topologies according to settings
+# The least recently used sorted topologies are evicted from the cache past
+# this number of entries
+_CPU_TOPOLOGIES_CACHE_SIZE = 256
+# The sorted (sockets, cores, threads) of the topologies for the
+# constraints of the guests
+_cpu_topologies_cache = collections.OrderedDict()
 
-    :param flavor: Flavor object to query extra specs from
-    :param image_meta: ImageMeta object to query properties from
-    :param allow_threads: if the hypervisor supports CPU threads
-    :param numa_topology: InstanceNUMATopology object that may contain
-                          additional topology constraints (such as threading
-                          information) that we should consider
 
-    Look at the properties set in the flavor extra specs and
-    the image metadata and build up a list of all possible
-    valid CPU topologies that can be used in the guest. Then
-    return this list sorted in order of preference.
+def _get_desirable_cpu_topology_values(flavor, image_meta, allow_threads,
+                                       numa_topology):
+    """Get the desired CPU topologies as (sockets, cores, threads) tuples
 
-    :returns: sorted list of nova.objects.VirtCPUTopology instances
+    See _get_desirable_cpu_topologies(). The topologies are cached by
+    the constraints they were computed from, the least recently used
+    being evicted first.
+
+    :returns: sorted tuple of (sockets, cores, threads) tuples
     """
 
     LOG.debug("Getting desirable topologies for flavor %(flavor)s "
@@ -567,15 +596,54 @@ def _get_desirable_cpu_topologies(flavor, image_meta, allow_threads=True,
                                             min_requested_threads)
             specified_threads = max(1, min_requested_threads)
 
-    possible = _get_possible_cpu_topologies(flavor.vcpus,
-                                            maximum,
-                                            allow_threads,
-                                            specified_threads)
-    desired = _sort_possible_cpu_topologies(possible, preferred)
+    # NOTE: the sorted topologies only depend on these, so they are
+    # cached rather than enumerated and scored for every guest
+    key = (flavor.vcpus,
+           maximum.sockets, maximum.cores, maximum.threads,
+           preferred.sockets, preferred.cores, preferred.threads,
+           bool(allow_threads), specified_threads)
+    desired = _cpu_topologies_cache.pop(key, None)
+    if desired is None:
+        possible = _get_possible_cpu_topologies(flavor.vcpus,
+                                                maximum,
+                                                allow_threads,
+                                                specified_threads)
+        desired = tuple((topology.sockets, topology.cores, topology.threads)
+                        for topology in
+                        _sort_possible_cpu_topologies(possible, preferred))
+        if len(_cpu_topologies_cache) >= _CPU_TOPOLOGIES_CACHE_SIZE:
+            _cpu_topologies_cache.popitem(last=False)
+    # Most recently used last
+    _cpu_topologies_cache[key] = desired
 
     return desired
 
 
+def _get_desirable_cpu_topologies(flavor, image_meta, allow_threads=True,
+                                  numa_topology=None):
+    """Get desired CPU topologies according to settings
+
+    :param flavor: Flavor object to query extra specs from
+    :param image_meta: ImageMeta object to query properties from
+    :param allow_threads: if the hypervisor supports CPU threads
+    :param numa_topology: InstanceNUMATopology object that may contain
+                          additional topology constraints (such as threading
+                          information) that we should consider
+
+    Look at the properties set in the flavor extra specs and
+    the image metadata and build up a list of all possible
+    valid CPU topologies that can be used in the guest. Then
+    return this list sorted in order of preference.
+
+    :returns: sorted list of nova.objects.VirtCPUTopology instances
+    """
+
+    return [objects.VirtCPUTopology(sockets=sockets, cores=cores,
+                                    threads=threads)
+            for sockets, cores, threads in _get_desirable_cpu_topology_values(
+                flavor, image_meta, allow_threads, numa_topology)]
+
+
 def get_best_cpu_topology(flavor, image_meta, allow_threads=True,
                           numa_topology=None):
     """Get best CPU topology according to settings
@@ -595,8 +663,10 @@ def get_best_cpu_topology(flavor, image_meta, allow_threads=True,
     :returns: a nova.objects.VirtCPUTopology instance for best topology
     """
 
-    return _get_desirable_cpu_topologies(flavor, image_meta,
-                                         allow_threads, numa_topology)[0]
+    sockets, cores, threads = _get_desirable_cpu_topology_values(
+        flavor, image_meta, allow_threads, numa_topology)[0]
+    return objects.VirtCPUTopology(sockets=sockets, cores=cores,
+                                   threads=threads)
 
 
 class VirtNUMATopologyCell(object):
@@ -708,10 +778,44 @@ def _numa_cell_supports_pagesize_request(host_cell, inst_cell):
         return verify_pagesizes(host_cell, inst_cell, [inst_cell.pagesize])
 
 
+def cpu_mask(cpuset):
+    """Return the bitmask of a set of CPU indexes
+
+    :param cpuset: set (or list) of CPU indexes
+
+    :returns: an integer with the bit of each CPU index set
+    """
+    mask = 0
+    for cpu in cpuset:
+        mask |= 1 << cpu
+    return mask
+
+
+def cpu_mask_count(mask):
+    """Return the number of CPUs in a CPU bitmask"""
+    return bin(mask).count('1')
+
+
+def cpu_mask_to_list(mask, count=None):
+    """Return the CPU indexes of a CPU bitmask
+
+    :param mask: bitmask of CPU indexes
+    :param count: maximum number of CPU indexes to return
+
+    :returns: a sorted list of the lowest CPU indexes of the mask
+    """
+    cpus = []
+    while mask and count != len(cpus):
+        lowest = mask & -mask
+        cpus.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return cpus
+
+
 def _pack_instance_onto_cores(available_siblings, instance_cell, host_cell_id):
     """Pack an instance onto a set of siblings
 
-    :param available_siblings: list of sets of CPU id's - available
+    :param available_siblings: list of bitmasks of CPU id's - available
                                siblings per core
     :param instance_cell: An instance of objects.InstanceNUMACell describing
                           the pinning requirements of the instance
@@ -726,42 +830,48 @@ def _pack_instance_onto_cores(available_siblings, instance_cell, host_cell_id):
     those of the host when the pinning takes effect.
     """
 
-    # We build up a data structure 'can_pack' that answers the question:
-    # 'Given the number of threads I want to pack, give me a list of all
-    # the available sibling sets that can accommodate it'
-    can_pack = collections.defaultdict(list)
-    for sib in available_siblings:
-        for threads_no in range(1, len(sib) + 1):
-            can_pack[threads_no].append(sib)
+    # We count, for every number of threads to pack, how many of the
+    # available sibling sets can accommodate it, which is all we need to
+    # know whether the instance can be packed with that many threads per
+    # core.
+    counts = [cpu_mask_count(sib) for sib in available_siblings]
+    can_pack = [0] * (max(counts or [0]) + 1)
+    for count in counts:
+        can_pack[count] += 1
+    for threads_no in range(len(can_pack) - 2, 0, -1):
+        can_pack[threads_no] += can_pack[threads_no + 1]
+
+    instance_siblings = instance_cell.siblings
 
-    def _can_pack_instance_cell(instance_cell, threads_per_core, cores_list):
+    def _can_pack_instance_cell(instance_cell, threads_per_core, cores_no):
         """Determines if instance cell can fit an avail set of cores."""
 
-        if threads_per_core * len(cores_list) < len(instance_cell):
+        if threads_per_core * cores_no < len(instance_cell):
             return False
-        if instance_cell.siblings:
+        if instance_siblings:
             return instance_cell.cpu_topology.threads <= threads_per_core
         else:
             return len(instance_cell) % threads_per_core == 0
 
-    # We iterate over the can_pack dict in descending order of cores that
-    # can be packed - an attempt to get even distribution over time
-    for cores_per_sib, sib_list in sorted(
-            (t for t in can_pack.items()), reverse=True):
+    # We iterate over the number of threads that can be packed per core in
+    # descending order - an attempt to get even distribution over time
+    for cores_per_sib in range(len(can_pack) - 1, 0, -1):
         if _can_pack_instance_cell(instance_cell,
-                                   cores_per_sib, sib_list):
-            sliced_sibs = map(lambda s: list(s)[:cores_per_sib], sib_list)
-            if instance_cell.siblings:
-                pinning = zip(itertools.chain(*instance_cell.siblings),
-                              itertools.chain(*sliced_sibs))
+                                   cores_per_sib, can_pack[cores_per_sib]):
+            sliced_sibs = (cpu_mask_to_list(sib, cores_per_sib)
+                           for sib, count in zip(available_siblings, counts)
+                           if count >= cores_per_sib)
+            if instance_siblings:
+                pinning = zip(itertools.chain(*instance_siblings),
+                              itertools.chain.from_iterable(sliced_sibs))
             else:
                 pinning = zip(sorted(instance_cell.cpuset),
-                              itertools.chain(*sliced_sibs))
+                              itertools.chain.from_iterable(sliced_sibs))
 
             topology = (instance_cell.cpu_topology or
-                        objects.VirtCPUTopology(sockets=1,
-                                                cores=len(sliced_sibs),
-                                                threads=cores_per_sib))
+                        objects.VirtCPUTopology(
+                            sockets=1, cores=can_pack[cores_per_sib],
+                            threads=cores_per_sib))
             instance_cell.pin_vcpus(*pinning)
             instance_cell.cpu_topology = topology
             instance_cell.id = host_cell_id
@@ -779,36 +889,43 @@ def _numa_fit_instance_cell_with_pinning(host_cell, instance_cell):
     :returns: objects.InstanceNUMACell instance with pinning information,
               or None if instance cannot be pinned to the given host
     """
-    if (host_cell.avail_cpus < len(instance_cell.cpuset) or
+    free_cpus = cpu_mask(host_cell.cpuset) & ~cpu_mask(host_cell.pinned_cpus)
+    if (cpu_mask_count(free_cpus) < len(instance_cell.cpuset) or
         host_cell.avail_memory < instance_cell.memory):
         # If we do not have enough CPUs available or not enough memory
         # on the host cell, we quit early (no oversubscription).
         return
 
     if host_cell.siblings:
+        free_siblings = [cpu_mask(sibling_set) & free_cpus
+                         for sibling_set in host_cell.siblings]
         # Instance requires hyperthreading in it's topology
         if instance_cell.cpu_topology and instance_cell.siblings:
-            return _pack_instance_onto_cores(host_cell.free_siblings,
+            return _pack_instance_onto_cores(free_siblings,
                                              instance_cell, host_cell.id)
 
         else:
             # Try to pack the instance cell in one core
-            largest_free_sibling_set = sorted(
-                host_cell.free_siblings, key=len)[-1]
-            if (len(instance_cell.cpuset) <=
-                    len(largest_free_sibling_set)):
+            largest_free_sibling_set = 0
+            largest_count = 0
+            for sibling_set in free_siblings:
+                count = cpu_mask_count(sibling_set)
+                if count >= largest_count:
+                    largest_free_sibling_set = sibling_set
+                    largest_count = count
+            if len(instance_cell.cpuset) <= largest_count:
                 return _pack_instance_onto_cores(
                     [largest_free_sibling_set], instance_cell, host_cell.id)
 
             # We can't to pack it onto one core so try with avail siblings
             else:
                 return _pack_instance_onto_cores(
-                    host_cell.free_siblings, instance_cell, host_cell.id)
+                    free_siblings, instance_cell, host_cell.id)
     else:
         # Straightforward to pin to available cpus when there is no
         # hyperthreading on the host
         return _pack_instance_onto_cores(
-            [host_cell.free_cpus], instance_cell, host_cell.id)
+            [free_cpus], instance_cell, host_cell.id)
 
 
 def _numa_fit_instance_cell(host_cell, instance_cell, limit_cell=None):
@@ -1125,9 +1242,160 @@ class VirtNUMALimitTopology(VirtNUMATopology):
     cell_class = VirtNUMATopologyCellLimit
 
 
+def _numa_copy_instance_cell(instance_cell):
+    """Return an independent copy of an objects.InstanceNUMACell"""
+    cpu_topology = instance_cell.cpu_topology
+    if cpu_topology is not None:
+        cpu_topology = objects.VirtCPUTopology(sockets=cpu_topology.sockets,
+                                               cores=cpu_topology.cores,
+                                               threads=cpu_topology.threads)
+    cpu_pinning = instance_cell.cpu_pinning
+    if cpu_pinning is not None:
+        cpu_pinning = dict(cpu_pinning)
+    new_cell = objects.InstanceNUMACell(cpuset=set(instance_cell.cpuset),
+                                        memory=instance_cell.memory,
+                                        pagesize=instance_cell.pagesize,
+                                        cpu_topology=cpu_topology,
+                                        cpu_pinning=cpu_pinning)
+    if instance_cell.obj_attr_is_set('id'):
+        new_cell.id = instance_cell.id
+    return new_cell
+
+
+def _numa_fit_permutations(fits):
+    """Yield the host cells which fit all the instance cells
+
+    :param fits: a _NUMACellFits of the instance cells on the host cells
+
+    The lists of host cell indexes are yielded in the order
+    itertools.permutations() yields the permutations of fits.columns,
+    without going through the permutations starting with an instance cell
+    that doesn't fit.
+    """
+    used = set()
+    chosen = []
+
+    def search(row):
+        if row == fits.rows:
+            yield list(chosen)
+            return
+        for column in fits.columns:
+            if column in used or fits(row, column) is None:
+                continue
+            used.add(column)
+            chosen.append(column)
+            for assignment in search(row + 1):
+                yield assignment
+            chosen.pop()
+            used.discard(column)
+
+    return search(0)
+
+
+class _NUMACellFits(object):
+    """Lazily computed matrix of the fits of instance cells on host cells
+
+    Each instance cell is fitted at most once onto each host cell, on a
+    copy of it so that a fit doesn't depend on the ones tried before.
+    """
+
+    def __init__(self, host_cells, limit_cells, instance_cells,
+                 columns=None):
+        """:param columns: the indexes of the host cells, in the order in
+                           which they are tried
+        """
+        self.host_cells = host_cells
+        self.limit_cells = limit_cells
+        self.instance_cells = instance_cells
+        self.rows = len(instance_cells)
+        if columns is None:
+            columns = range(len(host_cells))
+        self.columns = columns
+        self._fits = {}
+        self._copies = {}
+
+    def __call__(self, row, column):
+        try:
+            return self._fits[row, column]
+        except KeyError:
+            instance_cell = self._copies.pop(row, None)
+            if instance_cell is None:
+                instance_cell = _numa_copy_instance_cell(
+                    self.instance_cells[row])
+            fitted_cell = _numa_fit_instance_cell(
+                self.host_cells[column], instance_cell,
+                self.limit_cells[column])
+            # NOTE: A cell is only modified when it fits, unless pinning it
+            # succeeded and its page size didn't fit, so the copies of the
+            # other cells can be used again.
+            if not (fitted_cell or instance_cell.cpu_pinning_requested):
+                self._copies[row] = instance_cell
+            self._fits[row, column] = fitted_cell
+            return fitted_cell
+
+
+NUMACellCapacity = collections.namedtuple(
+    'NUMACellCapacity', ['cpus', 'pinnable_cpus', 'memory', 'hugepages'])
+
+
+def numa_cell_capacities(host_topology):
+    """Return the free resources of each cell of a host NUMA topology
+
+    :param host_topology: objects.NUMATopology of the host
+
+    :returns: a list of NUMACellCapacity with the number of unused and of
+              unpinned CPUs, the free memory in MiB and the free memory in
+              huge pages in KiB of each cell
+    """
+    def get(cell, name, default):
+        return getattr(cell, name) if cell.obj_attr_is_set(name) else default
+
+    capacities = []
+    for cell in host_topology.cells:
+        pinnable_cpus = len(cell.cpuset) - len(get(cell, 'pinned_cpus', ()))
+        hugepages = 0
+        mempages = get(cell, 'mempages', [])
+        if mempages:
+            smallest = min(pages.size_kb for pages in mempages)
+            hugepages = sum((pages.total - pages.used) * pages.size_kb
+                            for pages in mempages
+                            if pages.size_kb != smallest)
+        capacities.append(NUMACellCapacity(
+            cpus=len(cell.cpuset) - get(cell, 'cpu_usage', 0),
+            pinnable_cpus=pinnable_cpus,
+            memory=cell.memory - get(cell, 'memory_usage', 0),
+            hugepages=hugepages))
+    return capacities
+
+
+def _numa_cell_order(capacities, instance_topology):
+    """Order the host cells according to the NUMA placement policy
+
+    :param capacities: list of NUMACellCapacity of the host cells
+    :param instance_topology: objects.InstanceNUMATopology to be fitted
+
+    :returns: the indexes of the host cells in the order they are to be
+              tried, or None to try them in their own order
+    """
+    policy = CONF.numa_placement_policy
+    pinned = instance_topology.cpu_pinning_requested
+    if policy == 'pinned-pack':
+        policy = 'pack' if pinned else 'spread'
+    if policy not in ('pack', 'spread'):
+        return None
+
+    def free(index):
+        capacity = capacities[index]
+        cpus = capacity.pinnable_cpus if pinned else capacity.cpus
+        return cpus, capacity.memory, capacity.hugepages
+
+    return sorted(range(len(capacities)), key=free,
+                  reverse=policy == 'spread')
+
+
 def numa_fit_instance_to_host(
         host_topology, instance_topology, limits_topology=None,
-        pci_requests=None, pci_stats=None):
+        pci_requests=None, pci_stats=None, cell_capacities=None):
     """Fit the instance topology onto the host topology given the limits
 
     :param host_topology: objects.NUMATopology object to fit an instance on
@@ -1135,43 +1403,52 @@ def numa_fit_instance_to_host(
     :param limits_topology: VirtNUMALimitTopology that defines limits
     :param pci_requests: instance pci_requests
     :param pci_stats: pci_stats for the host
+    :param cell_capacities: numa_cell_capacities() of the host topology,
+                            computed when needed if not given
 
     Given a host and instance topology and optionally limits - this method
     will attempt to fit instance cells onto all permutations of host cells
     by calling the _numa_fit_instance_cell method, and return a new
     InstanceNUMATopology with it's cell ids set to host cell id's of
     the first successful permutation, or None.
+
+    Each instance cell is fitted at most once per host cell, on a copy of
+    it, and the permutations starting with a cell which doesn't fit are
+    skipped altogether. The instance topology is left untouched.
+
+    The permutations are ordered by the NUMA placement policy, so that the
+    first one which fits is also the preferred one.
     """
     if (not (host_topology and instance_topology) or
         len(host_topology) < len(instance_topology)):
         return
+    if pci_requests and pci_stats is None:
+        return
+
+    if limits_topology is None:
+        limits_topology_cells = itertools.repeat(None, len(host_topology))
     else:
-        if limits_topology is None:
-            limits_topology_cells = itertools.repeat(
-                None, len(host_topology))
-        else:
-            limits_topology_cells = limits_topology.cells
-        # TODO(ndipanov): We may want to sort permutations differently
-        # depending on whether we want packing/spreading over NUMA nodes
-        for host_cell_perm in itertools.permutations(
-                zip(host_topology.cells, limits_topology_cells),
-                len(instance_topology)
-        ):
-            cells = []
-            for (host_cell, limit_cell), instance_cell in zip(
-                    host_cell_perm, instance_topology.cells):
-                got_cell = _numa_fit_instance_cell(
-                    host_cell, instance_cell, limit_cell)
-                if got_cell is None:
-                    break
-                cells.append(got_cell)
-            if len(cells) == len(host_cell_perm):
-                if not pci_requests:
-                    return objects.InstanceNUMATopology(cells=cells)
-                elif ((pci_stats is not None) and
-                    pci_stats.support_requests(pci_requests,
-                                                     cells)):
-                    return objects.InstanceNUMATopology(cells=cells)
+        limits_topology_cells = limits_topology.cells
+    host_cells, limit_cells = [], []
+    for host_cell, limit_cell in zip(host_topology.cells,
+                                     limits_topology_cells):
+        host_cells.append(host_cell)
+        limit_cells.append(limit_cell)
+    columns = None
+    if CONF.numa_placement_policy != 'none':
+        if cell_capacities is None:
+            cell_capacities = numa_cell_capacities(host_topology)
+        columns = _numa_cell_order(cell_capacities[:len(host_cells)],
+                                   instance_topology)
+    fits = _NUMACellFits(host_cells, limit_cells, instance_topology.cells,
+                         columns)
+
+    for assignment in _numa_fit_permutations(fits):
+        cells = [fits(row, column) for row, column in enumerate(assignment)]
+        if not pci_requests:
+            return objects.InstanceNUMATopology(cells=cells)
+        elif pci_stats.support_requests(pci_requests, cells):
+            return objects.InstanceNUMATopology(cells=cells)
 
 
 def _numa_pagesize_usage_from_cell(hostcell, instancecell, sign):
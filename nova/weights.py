@@ -18,10 +18,14 @@ Pluggable Weighing support
 """
 
 import abc
+import heapq
+import time
 
 import six
 
+from nova import columns as columns_mod
 from nova import loadables
+from nova.scheduler import profiling
 
 
 def normalize(weight_list, minval=None, maxval=None):
@@ -76,6 +80,9 @@ class BaseWeigher(object):
     minval = None
     maxval = None
 
+    # Set to true in a subclass implementing weigh_all_vectorized()
+    vectorized = False
+
     def weight_multiplier(self):
         """How weighted this weigher should be.
 
@@ -97,47 +104,211 @@ class BaseWeigher(object):
         just return a list of weights.
         """
         # Calculate the weights
-        weights = []
-        for obj in weighed_obj_list:
-            weight = self._weigh_object(obj.obj, weight_properties)
-
-            # Record the min and max values if they are None. If they anything
-            # but none we assume that the weigher has set them
-            if self.minval is None:
-                self.minval = weight
-            if self.maxval is None:
-                self.maxval = weight
+        weights = [self._weigh_object(obj.obj, weight_properties)
+                   for obj in weighed_obj_list]
+        self._record_bounds(weights)
+        return weights
 
-            if weight < self.minval:
-                self.minval = weight
-            elif weight > self.maxval:
-                self.maxval = weight
+    def weigh_all_vectorized(self, columns, weight_properties):
+        """Weigh all the objects at once.
 
-            weights.append(weight)
+        Only called when the vectorized attribute is set. Override in a
+        subclass which can compute the list of weights from the columns of
+        an ObjectColumns view of the objects. Return None to fall back to
+        weigh_objects().
+        """
+        return None
+
+    def _record_bounds(self, weights):
+        """Record the min and max values of the weights."""
+        if not weights:
+            return
+        minval = min(weights)
+        maxval = max(weights)
+
+        # Record the min and max values if they are None. If they anything
+        # but none we assume that the weigher has set them
+        if self.minval is None or minval < self.minval:
+            self.minval = minval
+        if self.maxval is None or maxval > self.maxval:
+            self.maxval = maxval
+
+
+class WeighedObjectHeap(object):
+    """Objects ordered by weight, which can be weighed again one by one.
+
+    Meant to pick the best objects one at a time while consuming them,
+    without weighing all the objects again after each pick: only the
+    consumed object is weighed again, and the weights of the other objects
+    are only combined again from their raw weights when the normalization
+    bounds of a weigher changed. This relies on the weight given by a
+    weigher to an object only depending on that object, which is the case
+    unless the weigher overrides weigh_objects().
+
+    The objects are ordered like get_weighed_objects() would, so ties are
+    broken by their position in the original list. Objects taken out with
+    pop() stay members of the heap until they are put back with push() or
+    reweigh(), or dropped with discard() or retain().
+
+    Built by BaseWeightHandler.get_weighed_heap().
+    """
 
-        return weights
+    def __init__(self, handler, weighers, objs, weighing_properties,
+                 profiler=None):
+        self._handler = handler
+        self._weighers = weighers
+        self._weighing_properties = weighing_properties
+        self._profiler = profiler
+        self._objs = list(objs)
+        self._positions = {id(obj): i for i, obj in enumerate(self._objs)}
+        # Raw weights given by each weigher, indexed like self._objs
+        self._raw_weights, self._totals = handler._weigh(
+            weighers, self._objs, weighing_properties, profiler)
+        self._members = set(six.moves.range(len(self._objs)))
+        self._heap = [(-total, i) for i, total in enumerate(self._totals)]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        """Return the number of objects which can be popped."""
+        return len(self._heap)
+
+    def objs(self):
+        """Return the member objects, in their original order."""
+        return [self._objs[i] for i in sorted(self._members)]
+
+    def pop(self, count=1):
+        """Take out and return up to count best WeighedObjects."""
+        weighed_objs = []
+        while self._heap and len(weighed_objs) < count:
+            i = heapq.heappop(self._heap)[1]
+            weighed_objs.append(self._handler.object_class(self._objs[i],
+                                                           self._totals[i]))
+        return weighed_objs
+
+    def push(self, weighed_obj):
+        """Put back a popped object, with its weight unchanged."""
+        i = self._positions[id(weighed_obj.obj)]
+        heapq.heappush(self._heap, (-self._totals[i], i))
+
+    def reweigh(self, obj):
+        """Weigh a popped object again and put it back."""
+        i = self._positions[id(obj)]
+        bounds = [(weigher.minval, weigher.maxval)
+                  for weigher in self._weighers]
+        raw_weights, totals = self._handler._weigh(
+            self._weighers, [obj], self._weighing_properties, self._profiler)
+        for weights, weight in six.moves.zip(self._raw_weights, raw_weights):
+            weights[i] = weight[0]
+        self._totals[i] = totals[0]
+        if bounds != [(weigher.minval, weigher.maxval)
+                      for weigher in self._weighers]:
+            # The normalized weights of all the objects changed
+            self._totals = self._handler._combine(self._weighers,
+                                                  self._raw_weights)
+            self._heap = [(-self._totals[j], j) for _, j in self._heap]
+            heapq.heapify(self._heap)
+        heapq.heappush(self._heap, (-self._totals[i], i))
+
+    def discard(self, obj):
+        """Drop a popped object."""
+        self._members.discard(self._positions[id(obj)])
+
+    def retain(self, objs):
+        """Drop the members which are not in objs."""
+        keep = set(self._positions[id(obj)] for obj in objs)
+        self._members &= keep
+        self._heap = [entry for entry in self._heap if entry[1] in keep]
+        heapq.heapify(self._heap)
 
 
 class BaseWeightHandler(loadables.BaseLoader):
     object_class = WeighedObject
 
-    def get_weighed_objects(self, weighers, obj_list, weighing_properties):
-        """Return a sorted (descending), normalized list of WeighedObjects."""
-
-        if not obj_list:
-            return []
+    def _weigh(self, weighers, objs, weighing_properties, profiler=None):
+        """Weigh a list of objects.
 
-        weighed_objs = [self.object_class(obj, 0.0) for obj in obj_list]
+        Return the list of the raw weights given by each weigher and the
+        list of the normalized weights combined for each object. If a
+        profiler is given, the time spent in each weigher is recorded in it.
+        """
+        totals = [0.0] * len(objs)
+        raw_weights = []
+        # Columnar view of objs, only built for vectorized weighers
+        columns = None
+        # Only built for the weighers which are not vectorized
+        weighed_objs = None
         for weigher in weighers:
-            weights = weigher.weigh_objects(weighed_objs, weighing_properties)
-
-            # Normalize the weights
-            weights = normalize(weights,
-                                minval=weigher.minval,
-                                maxval=weigher.maxval)
+            start = time.time()
+            weights = None
+            if weigher.vectorized:
+                if columns is None:
+                    columns = columns_mod.ObjectColumns(objs)
+                weights = weigher.weigh_all_vectorized(columns,
+                                                       weighing_properties)
+                if weights is not None:
+                    weigher._record_bounds(weights)
+            if weights is None:
+                if weighed_objs is None:
+                    weighed_objs = [self.object_class(obj, 0.0)
+                                    for obj in objs]
+                for weighed_obj, total in six.moves.zip(weighed_objs, totals):
+                    weighed_obj.weight = total
+                weights = weigher.weigh_objects(weighed_objs,
+                                                weighing_properties)
+            raw_weights.append(weights)
+            totals = self._add_weights(totals, weigher, weights)
+            if profiler is not None:
+                profiler.record(profiling.WEIGHER, weigher.__class__.__name__,
+                                time.time() - start, len(objs), len(objs))
+        return raw_weights, totals
+
+    def _add_weights(self, totals, weigher, weights):
+        """Add the normalized weights given by a weigher to the totals."""
+        weights = normalize(weights,
+                            minval=weigher.minval,
+                            maxval=weigher.maxval)
+        multiplier = weigher.weight_multiplier()
+        return [total + multiplier * weight
+                for total, weight in six.moves.zip(totals, weights)]
+
+    def _combine(self, weighers, raw_weights):
+        """Combine again raw weights returned by _weigh()."""
+        totals = [0.0] * len(raw_weights[0]) if raw_weights else []
+        for weigher, weights in six.moves.zip(weighers, raw_weights):
+            totals = self._add_weights(totals, weigher, weights)
+        return totals
+
+    def get_weighed_objects(self, weighers, obj_list, weighing_properties,
+                            limit=None, profiler=None):
+        """Return a sorted (descending), normalized list of WeighedObjects.
+
+        The weights of all the objects are combined as plain lists, and
+        WeighedObjects are only built for the weighers which can't weigh
+        the objects in a vectorized way and for the returned objects. If
+        limit is set, only the limit best objects are returned, which saves
+        sorting the whole list. If a profiler is given, the time spent in
+        each weigher is recorded in it.
+        """
 
-            for i, weight in enumerate(weights):
-                obj = weighed_objs[i]
-                obj.weight += weigher.weight_multiplier() * weight
+        if not obj_list:
+            return []
 
-        return sorted(weighed_objs, key=lambda x: x.weight, reverse=True)
+        objs = list(obj_list)
+        totals = self._weigh(weighers, objs, weighing_properties,
+                             profiler)[1]
+
+        indexes = six.moves.range(len(objs))
+        if limit is not None and limit < len(objs):
+            # NOTE: nlargest() is stable like sorted() so that ties are
+            # broken the same way.
+            best = heapq.nlargest(max(limit, 0), indexes,
+                                  key=totals.__getitem__)
+        else:
+            best = sorted(indexes, key=totals.__getitem__, reverse=True)
+        return [self.object_class(objs[i], totals[i]) for i in best]
+
+    def get_weighed_heap(self, weighers, obj_list, weighing_properties,
+                         profiler=None):
+        """Return a WeighedObjectHeap of the objects."""
+        return WeighedObjectHeap(self, weighers, obj_list,
+                                 weighing_properties, profiler)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the pagination of the instances of a project.
+
+--rows instances of --projects projects are inserted in an in-memory sqlite
+database, with the indexes of the models, and the instances of one project
+are listed newest first, as the API lists them, in pages of --page-size
+instances:
+
+  * offset: each page skips the instances of the previous pages with an
+    OFFSET,
+  * disjunction: each page starts after the marker with the condition
+    (created_at < m1) OR (created_at = m1 AND id < m2), as built by the
+    paginate_query of oslo.db,
+  * keyset: each page starts after the marker with the condition of
+    nova.db.sqlalchemy.api._paginate_query, whose leading range on
+    created_at lets the database seek into the index
+    (project_id, deleted, created_at, id).
+
+The times are the mean milliseconds to fetch a page at each of the --depths
+offsets, and the seconds to page through all the instances of the project,
+which is skipped for offset as it grows with the square of the number of
+pages. The pages of each mode are checked against those of offset.
+
+Run like:
+
+    ./tools/keyset_pagination_benchmark.py --rows 1000000
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import sys
+import time
+import uuid
+
+from oslo_config import cfg
+from oslo_db.sqlalchemy import utils as sqlalchemyutils
+from oslo_log import log as logging
+
+from nova import config
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+
+CONF = cfg.CONF
+
+MODES = ('offset', 'disjunction', 'keyset')
+SORT_KEYS = ['created_at', 'id']
+SORT_DIRS = ['desc', 'desc']
+PROJECT = 'project-0'
+
+
+def populate(args):
+    """Insert the instances, several of them created in the same second."""
+    engine = db_api.get_engine()
+    table = models.Instance.__table__
+    start = datetime.datetime(2015, 1, 1)
+    batch = []
+    for i in range(args.rows):
+        batch.append({'uuid': str(uuid.uuid4()),
+                      'project_id': 'project-%d' % (i % args.projects),
+                      'user_id': 'benchmark',
+                      'deleted': 0,
+                      'created_at': start + datetime.timedelta(
+                          seconds=i // 3)})
+        if len(batch) == 10000:
+            engine.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        engine.execute(table.insert(), batch)
+
+
+def get_query(session):
+    return session.query(models.Instance.id, models.Instance.created_at).\
+        filter(models.Instance.project_id == PROJECT).\
+        filter(models.Instance.deleted == 0)
+
+
+def get_page(mode, session, args, offset, marker):
+    query = get_query(session)
+    if mode == 'offset':
+        query = query.order_by(models.Instance.created_at.desc(),
+                               models.Instance.id.desc()).\
+            offset(offset).limit(args.page_size)
+    elif mode == 'disjunction':
+        query = sqlalchemyutils.paginate_query(query, models.Instance,
+                                               args.page_size, SORT_KEYS,
+                                               marker=marker,
+                                               sort_dirs=SORT_DIRS)
+    else:
+        query = db_api._paginate_query(query, models.Instance,
+                                       args.page_size, SORT_KEYS,
+                                       marker=marker, sort_dirs=SORT_DIRS)
+    return query.all()
+
+
+def get_marker(session, offset):
+    """Get the instance before the page at the offset, if any."""
+    if offset == 0:
+        return None
+    return get_query(session).\
+        order_by(models.Instance.created_at.desc(),
+                 models.Instance.id.desc()).\
+        offset(offset - 1).first()
+
+
+def run(mode, session, args, expected):
+    times = []
+    for depth in args.depths:
+        marker = get_marker(session, depth)
+        # NOTE: Warm the caches of the database before timing.
+        get_page(mode, session, args, depth, marker)
+        start = time.time()
+        for i in range(args.repeat):
+            page = get_page(mode, session, args, depth, marker)
+        times.append((time.time() - start) * 1000.0 / args.repeat)
+        if [row.id for row in page] != expected[depth]:
+            sys.exit('%s: wrong page at depth %d' % (mode, depth))
+
+    if mode == 'offset':
+        return times, None
+    start = time.time()
+    rows = 0
+    marker = None
+    while True:
+        page = get_page(mode, session, args, None, marker)
+        rows += len(page)
+        if len(page) < args.page_size:
+            break
+        marker = page[-1]
+    duration = time.time() - start
+    if rows != expected['rows']:
+        sys.exit('%s: %d instances paged instead of %d' %
+                 (mode, rows, expected['rows']))
+    return times, duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--rows', type=int, default=1000000,
+                        help='Number of instances')
+    parser.add_argument('--projects', type=int, default=1,
+                        help='Number of projects of the instances')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='Number of instances per page')
+    parser.add_argument('--depths', type=int, nargs='+',
+                        default=[0, 10000, 100000, 500000, 990000],
+                        help='Offsets of the pages to time')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of times to fetch each page')
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]])
+    logging.setup(CONF, 'nova')
+    CONF.set_override('connection', 'sqlite://', group='database')
+    models.BASE.metadata.create_all(db_api.get_engine())
+
+    start = time.time()
+    populate(args)
+    print('%d instances inserted in %.1f s' % (args.rows, time.time() - start))
+
+    session = db_api.get_session()
+    rows = get_query(session).count()
+    args.depths = [depth for depth in args.depths if depth < rows]
+    expected = {'rows': rows}
+    for depth in args.depths:
+        expected[depth] = [row.id for row in get_page(
+            'offset', session, args, depth, None)]
+
+    print('%-12s %s %9s' % ('mode', ' '.join('%9s' % ('@%d' % depth)
+                                              for depth in args.depths),
+                            'all s'))
+    for mode in MODES:
+        times, duration = run(mode, session, args, expected)
+        print('%-12s %s %9s' % (mode, ' '.join('%9.1f' % ms for ms in times),
+                                '-' if duration is None
+                                else '%9.2f' % duration))
+
+
+if __name__ == '__main__':
+    main()
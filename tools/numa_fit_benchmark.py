@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Microbenchmark of the fitting of instance NUMA topologies onto hosts.
+
+numa_fit_instance_to_host() is run by the NUMATopologyFilter for every host
+of every request. The fleet is made of hosts with 2, 4 and 8 NUMA nodes of
+--cpus hyperthreaded CPUs each, some of them already used and pinned, drawn
+from --usages distinct host topologies. Requests with 1 to 4 NUMA nodes,
+with and without CPU pinning, are fitted onto every host of the fleet:
+
+  * perms: by the search over all the permutations of the host cells which
+    numa_fit_instance_to_host() used to do,
+  * pruned: by numa_fit_instance_to_host(),
+  * host_passes: by NUMATopologyFilter.host_passes(), which also loads the
+    host topology from its JSON for each host,
+  * filter_all: by NUMATopologyFilter.filter_all(), which shares the fit
+    between the hosts with the same topology.
+
+The times are in microseconds per host.
+
+Run like:
+
+    ./tools/numa_fit_benchmark.py --hosts 200 --usages 10
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import random
+import sys
+import time
+
+from nova import objects
+from nova.scheduler.filters import numa_topology_filter
+from nova.virt import hardware
+
+
+class FakeHostState(object):
+    def __init__(self, topology):
+        self.numa_topology = topology._to_json()
+        self.numa_capacities = None
+        self.pci_stats = None
+        self.limits = {}
+        self.instance_numa_topology = None
+
+
+def build_host(random_, nodes, cpus):
+    cells = []
+    for node in range(nodes):
+        cpuset = range(node * cpus, (node + 1) * cpus)
+        usage = random_.randint(0, cpus - 1)
+        cells.append(objects.NUMACell(
+            id=node, cpuset=set(cpuset), memory=cpus * 4096,
+            cpu_usage=usage, memory_usage=usage * 2048,
+            siblings=[set(cpuset[i:i + 2]) for i in range(0, cpus, 2)],
+            pinned_cpus=set(cpuset[:usage]),
+            mempages=[objects.NUMAPagesTopology(
+                size_kb=4, total=cpus * 1048576, used=usage * 524288)]))
+    return objects.NUMATopology(cells=cells)
+
+
+def build_instance(nodes, vcpus, pinned):
+    cells = []
+    for node in range(nodes):
+        cell = objects.InstanceNUMACell(
+            id=node, cpuset=set(range(node * vcpus, (node + 1) * vcpus)),
+            memory=vcpus * 1024)
+        if pinned:
+            cell.cpu_pinning = {}
+        cells.append(cell)
+    return objects.InstanceNUMATopology(cells=cells)
+
+
+def permutations_fit(host_topology, instance_topology):
+    """The search over all the permutations of host cells, for reference"""
+    for host_cell_perm in itertools.permutations(
+            host_topology.cells, len(instance_topology)):
+        cells = []
+        for host_cell, instance_cell in zip(host_cell_perm,
+                                            instance_topology.cells):
+            got_cell = hardware._numa_fit_instance_cell(
+                host_cell, instance_cell)
+            if got_cell is None:
+                break
+            cells.append(got_cell)
+        if len(cells) == len(instance_topology):
+            return objects.InstanceNUMATopology(cells=cells)
+
+
+def run(fit, hosts, instance):
+    fitted = 0
+    start = time.time()
+    for host in hosts:
+        if fit(host, instance) is not None:
+            fitted += 1
+    return (time.time() - start) * 1000000.0 / len(hosts), fitted
+
+
+def run_filter(hosts, instance, filter_all):
+    filt = numa_topology_filter.NUMATopologyFilter()
+    filter_properties = {
+        'request_spec': {'instance_properties': {'numa_topology': instance}}}
+    start = time.time()
+    if filter_all:
+        fitted = len(list(filt.filter_all(hosts, filter_properties)))
+    else:
+        fitted = len([host for host in hosts
+                      if filt.host_passes(host, filter_properties)])
+    return (time.time() - start) * 1000000.0 / len(hosts), fitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--hosts', type=int, default=200,
+                        help='Number of hosts per NUMA node count')
+    parser.add_argument('--cpus', type=int, default=8,
+                        help='Number of CPUs per host NUMA node')
+    parser.add_argument('--usages', type=int, default=10,
+                        help='Number of distinct host topologies')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    objects.register_all()
+    random_ = random.Random(args.seed)
+
+    print('%-5s %-5s %-6s %10s %10s %12s %10s %7s' %
+          ('host', 'guest', 'pinned', 'perms', 'pruned', 'host_passes',
+           'filter_all', 'fitted'))
+    for host_nodes in (2, 4, 8):
+        topologies = [build_host(random_, host_nodes, args.cpus)
+                      for i in range(args.usages)]
+        topologies = [random_.choice(topologies) for i in range(args.hosts)]
+        hosts = [FakeHostState(topology) for topology in topologies]
+        for instance_nodes in (1, 2, 4):
+            if instance_nodes > host_nodes:
+                continue
+            for pinned in (False, True):
+                instance = build_instance(instance_nodes, 4, pinned)
+                perms, fitted = run(permutations_fit, topologies,
+                                    instance.obj_clone())
+                pruned, pruned_fitted = run(
+                    hardware.numa_fit_instance_to_host, topologies, instance)
+                passes, passes_fitted = run_filter(hosts, instance, False)
+                filter_all, filter_fitted = run_filter(hosts, instance, True)
+                if fitted != pruned_fitted:
+                    sys.exit('Fitted %d hosts with the permutations and %d '
+                             'with numa_fit_instance_to_host()' %
+                             (fitted, pruned_fitted))
+                if passes_fitted != filter_fitted:
+                    sys.exit('%d hosts passed host_passes() and %d '
+                             'filter_all()' % (passes_fitted, filter_fitted))
+                print('%-5d %-5d %-6s %10.1f %10.1f %12.1f %10.1f %7d' %
+                      (host_nodes, instance_nodes, pinned, perms, pruned,
+                       passes, filter_all, fitted))
+
+
+if __name__ == '__main__':
+    main()
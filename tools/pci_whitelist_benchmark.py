@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Microbenchmark of the matching of PCI devices against the whitelist.
+
+The resource tracker checks every PCI device reported by the hypervisor
+against pci_passthrough_whitelist, and the PCI stats look up the whitelist
+spec of every device they add or remove. The host has --pfs physical
+functions of --vfs virtual functions each, of --products distinct products,
+and the whitelist has one spec per physical function, which whitelists the
+virtual functions of one of its slots by address, followed by one spec per
+product whitelisting the virtual functions of the first slots:
+
+  * linear: by matching every spec of the whitelist in turn, as
+    device_assignable() used to do,
+  * assignable: by PciHostDevicesWhiteList.device_assignable(),
+  * reparsed: by parsing the whitelist before looking up the spec of the
+    device, as get_pci_device_devspec() used to do,
+  * devspec: by get_pci_device_devspec().
+
+The times are in microseconds per device.
+
+Run like:
+
+    ./tools/pci_whitelist_benchmark.py --pfs 16 --vfs 128
+"""
+
+from __future__ import print_function
+
+import argparse
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_serialization import jsonutils
+
+from nova import objects
+from nova.pci import whitelist
+
+CONF = cfg.CONF
+
+
+def build_devices(pfs, vfs, products):
+    devices = []
+    for pf in range(pfs):
+        phys_function = '0000:%02x:00.0' % (pf + 1)
+        for vf in range(vfs):
+            devices.append({
+                'compute_node_id': 1,
+                'address': '0000:%02x:%02x.%x' % (pf + 1, vf // 8 + 1, vf % 8),
+                'vendor_id': '8086',
+                'product_id': '%04x' % (0x1520 + pf % products),
+                'status': 'available',
+                'dev_type': 'type-VF',
+                'phys_function': phys_function})
+    return devices
+
+
+def build_white_list(pfs, vfs, products):
+    white_list = []
+    for pf in range(pfs):
+        # The virtual functions of the slot in the middle of the physical
+        # function
+        white_list.append(jsonutils.dumps({
+            'vendor_id': '8086',
+            'product_id': '%04x' % (0x1520 + pf % products),
+            'address': '*:%02x:%02x.*' % (pf + 1, (vfs // 2) // 8),
+            'physical_network': 'physnet%d' % pf}))
+    for product in range(products):
+        white_list.append(jsonutils.dumps({
+            'vendor_id': '8086',
+            'product_id': '%04x' % (0x1520 + product),
+            'address': '*:*:01.*'}))
+    return white_list
+
+
+def linear(white_list, dev):
+    for spec in white_list.specs:
+        if spec.match(dev):
+            return spec
+
+
+def run(match, devices):
+    matched = []
+    start = time.time()
+    for dev in devices:
+        matched.append(match(dev))
+    return (time.time() - start) * 1000000.0 / len(devices), matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--pfs', type=int, default=16,
+                        help='Number of physical functions')
+    parser.add_argument('--vfs', type=int, default=128,
+                        help='Number of virtual functions per physical '
+                             'function')
+    parser.add_argument('--products', type=int, default=4,
+                        help='Number of distinct product ids')
+    args = parser.parse_args()
+
+    objects.register_all()
+    devices = build_devices(args.pfs, args.vfs, args.products)
+    white_list_spec = build_white_list(args.pfs, args.vfs, args.products)
+    CONF.set_override('pci_passthrough_whitelist', white_list_spec)
+    white_list = whitelist.PciHostDevicesWhiteList(white_list_spec)
+    pci_devs = [objects.PciDevice.create(dict(dev)) for dev in devices]
+
+    linear_time, linear_matched = run(
+        lambda dev: linear(white_list, dev), devices)
+    assignable_time, assignable_matched = run(
+        white_list.device_assignable, devices)
+    reparsed_time, reparsed_matched = run(
+        lambda dev: whitelist.PciHostDevicesWhiteList(
+            white_list_spec).get_devspec(dev), pci_devs)
+    devspec_time, devspec_matched = run(
+        whitelist.get_pci_device_devspec, pci_devs)
+
+    if linear_matched != assignable_matched:
+        sys.exit('device_assignable() did not match the same specs as the '
+                 'linear search')
+    tags = [spec and spec.get_tags() for spec in reparsed_matched]
+    if tags != [spec and spec.get_tags() for spec in devspec_matched]:
+        sys.exit('get_pci_device_devspec() did not match the same specs as '
+                 'the reparsed whitelist')
+
+    print('%d devices, %d whitelist specs, %d whitelisted devices' %
+          (len(devices), len(white_list.specs),
+           len([spec for spec in assignable_matched if spec])))
+    print('%10s %10s %10s %10s' %
+          ('linear', 'assignable', 'reparsed', 'devspec'))
+    print('%10.1f %10.1f %10.1f %10.1f' %
+          (linear_time, assignable_time, reparsed_time, devspec_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the resource claims of simultaneous builds on one host.
+
+--builds instances are claimed at once on one node of a resource tracker,
+while the periodic audit of the resources of the node runs back to back.
+The database is an in-memory sqlite database, the round trips to the
+conductor and the scheduler take --rpc-latency milliseconds, fetching the
+instances of the node for an audit takes --fetch-latency milliseconds and
+the virt driver reports the resources of the node in --driver-latency
+milliseconds:
+
+  * host-lock: the claims and the audits take one lock of the host, held
+    during the whole audit, as the COMPUTE_RESOURCE_SEMAPHORE used to be,
+  * node-lock: the claims and the audits lock the resources of the node
+    only while changing them, the audit fetching the instances, the
+    migrations and the resources of the node beforehand.
+
+The times are the mean, the 99th percentile and the maximum latencies of
+the claims in milliseconds, and the duration of the whole run in seconds.
+As the conductor is local, its database queries run in the process of the
+benchmark and bound the rate of the claims in both modes.
+The usage audited once all the claims are done is checked against the
+claimed instances.
+
+Run like:
+
+    ./tools/resource_claims_benchmark.py --builds 200
+"""
+
+from __future__ import print_function
+
+import eventlet
+eventlet.monkey_patch(os=False)
+
+import argparse
+import sys
+import time
+import uuid
+
+import eventlet.semaphore
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from nova.compute import resource_tracker
+from nova.compute import vm_states
+from nova import config
+from nova import context
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova import objects
+from nova import rpc
+from nova.virt import fake
+
+CONF = cfg.CONF
+
+MODES = ('host-lock', 'node-lock')
+
+
+class Latency(object):
+    """Delay the calls to an API as would a round trip to a service."""
+
+    def __init__(self, api, latency):
+        self._api = api
+        self._latency = latency / 1000.0
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            eventlet.sleep(self._latency)
+            return attr(*args, **kwargs)
+        return call
+
+
+class SlowDriver(fake.FakeDriver):
+    def __init__(self, latency):
+        super(SlowDriver, self).__init__(None)
+        self.latency = latency / 1000.0
+
+    def get_available_resource(self, nodename):
+        eventlet.sleep(self.latency)
+        resources = super(SlowDriver, self).get_available_resource(nodename)
+        # Leave room for all the builds
+        resources['memory_mb'] = resources['local_gb'] = 1 << 20
+        return resources
+
+
+def create_instance(ctxt):
+    instance = objects.Instance(context=ctxt, uuid=str(uuid.uuid4()),
+                                user_id=ctxt.user_id,
+                                project_id=ctxt.project_id,
+                                vm_state=vm_states.BUILDING,
+                                task_state=None, os_type='linux',
+                                instance_type_id=1, memory_mb=512,
+                                vcpus=1, root_gb=1, ephemeral_gb=0,
+                                system_metadata={})
+    instance.create()
+    instance.numa_topology = None
+    return instance
+
+
+def audit(ctxt, rt, args):
+    """Audit the resources of the node, as the compute manager does."""
+    eventlet.sleep(args.fetch_latency / 1000.0)
+    instances = objects.InstanceList.get_by_host_and_node(
+        ctxt, rt.host, rt.nodename,
+        expected_attrs=['system_metadata', 'numa_topology'])
+    migrations = rt.conductor_api.migration_get_in_progress_by_host_and_node(
+        ctxt, rt.host, rt.nodename)
+    rt.update_available_resource(ctxt, instances=instances,
+                                 migrations=migrations)
+
+
+def run(mode, ctxt, args):
+    rt = resource_tracker.ResourceTracker(CONF.host,
+                                          SlowDriver(args.driver_latency),
+                                          mode)
+    rt.conductor_api = Latency(rt.conductor_api, args.rpc_latency)
+    rt.scheduler_client = Latency(rt.scheduler_client, args.rpc_latency)
+    audit(ctxt, rt, args)
+    instances = [create_instance(ctxt) for i in range(args.builds)]
+
+    # NOTE: Without the host lock, the semaphore never blocks.
+    lock = eventlet.semaphore.Semaphore(
+        1 if mode == 'host-lock' else args.builds + 1)
+    latencies = []
+    audits = [0]
+    building = [True]
+
+    def _audit():
+        while building[0]:
+            with lock:
+                audit(ctxt, rt, args)
+            audits[0] += 1
+
+    def _build(instance):
+        start = time.time()
+        with lock:
+            rt.instance_claim(ctxt, instance)
+        latencies.append((time.time() - start) * 1000.0)
+
+    start = time.time()
+    auditor = eventlet.spawn(_audit)
+    pool = eventlet.GreenPool(args.builds)
+    for instance in instances:
+        pool.spawn_n(_build, instance)
+    pool.waitall()
+    building[0] = False
+    auditor.wait()
+    duration = time.time() - start
+
+    audit(ctxt, rt, args)
+    expected = CONF.reserved_host_memory_mb + sum(
+        instance.memory_mb for instance in instances)
+    if rt.compute_node['memory_mb_used'] != expected:
+        sys.exit('%s: %d MB of memory used instead of %d MB' %
+                 (mode, rt.compute_node['memory_mb_used'], expected))
+    latencies.sort()
+    return (audits[0], sum(latencies) / len(latencies),
+            latencies[int(len(latencies) * 0.99)], latencies[-1], duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--builds', type=int, default=200,
+                        help='Number of simultaneous builds')
+    parser.add_argument('--rpc-latency', type=float, default=5,
+                        help='Milliseconds per round trip to the conductor '
+                             'or the scheduler')
+    parser.add_argument('--fetch-latency', type=float, default=50,
+                        help='Milliseconds to fetch the instances of the '
+                             'node')
+    parser.add_argument('--driver-latency', type=float, default=1000,
+                        help='Milliseconds for the virt driver to report '
+                             'the resources of the node')
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]])
+    logging.setup(CONF, 'nova')
+    CONF.set_override('connection', 'sqlite://', group='database')
+    CONF.set_override('use_local', True, group='conductor')
+    CONF.set_override('rpc_backend', 'fake')
+    CONF.set_override('notification_driver', ['noop'])
+    rpc.init(CONF)
+    objects.register_all()
+    models.BASE.metadata.create_all(db_api.get_engine())
+
+    ctxt = context.get_admin_context()
+    ctxt.user_id = ctxt.project_id = 'benchmark'
+    objects.Service(context=ctxt, host=CONF.host, binary='nova-compute',
+                    topic=CONF.compute_topic).create()
+    fake.set_nodes(MODES)
+
+    print('%-10s %8s %8s %9s %9s %9s %9s' %
+          ('mode', 'builds', 'audits', 'mean ms', 'p99 ms', 'max ms',
+           'total s'))
+    for mode in MODES:
+        print('%-10s %8d %8d %9.1f %9.1f %9.1f %9.2f' %
+              ((mode, args.builds) + run(mode, ctxt, args)))
+
+
+if __name__ == '__main__':
+    main()
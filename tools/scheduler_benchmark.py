@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the schedulers against a synthetic fleet of compute nodes.
+
+The fleet is written to an in-memory sqlite database: one service and one
+compute node per host, with random usage, NUMA topologies, PCI device pools
+and availability zone aggregates. Each scheduler driver then runs the same
+mix of requests end to end, from select_destinations() down to the database
+queries, filters and weighers. Requests use several flavors, NUMA
+topologies, PCI devices, availability zones, server groups, forced hosts
+and multiple instances. No message bus or service is needed.
+
+Run like:
+
+    ./tools/scheduler_benchmark.py --hosts 10000 --requests 50
+
+The throughput, the p50 and p99 latencies and the growth of the resident
+memory of the process once each scheduler ran are reported. Options like
+--adaptive-filter-order or --batch-placement allow comparing the settings
+of the FilterScheduler.
+
+With --workers, the requests are spread over several instances of each
+scheduler, as with several nova-scheduler processes. The compute nodes only
+report the instances they got once every worker handled a request, so the
+workers of a round don't see each other's choices unless they claim them
+with --optimistic-claims. Each instance is then claimed against the actual
+usage of its host and the limits set by the filters, as the resource
+tracker does, and the instances which don't fit are counted as reschedules
+rather than sent to another host. The throughput is the one of all the
+workers running in parallel.
+"""
+
+from __future__ import print_function
+
+import argparse
+import collections
+import os
+import random
+import resource
+import sys
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+
+from nova import config
+from nova import context
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova import exception
+from nova import objects
+from nova import rpc
+from nova.scheduler import caching_scheduler
+from nova.scheduler import chance
+from nova.scheduler import filter_scheduler
+
+CONF = cfg.CONF
+CONF.import_opt('report_interval', 'nova.service')
+CONF.import_opt('compute_topic', 'nova.compute.rpcapi')
+CONF.import_opt('service_down_time', 'nova.service')
+
+SCHEDULERS = collections.OrderedDict([
+    ('filter', filter_scheduler.FilterScheduler),
+    ('caching', caching_scheduler.CachingScheduler),
+    ('chance', chance.ChanceScheduler),
+])
+
+FILTERS = ['RetryFilter', 'AvailabilityZoneFilter', 'RamFilter',
+           'CoreFilter', 'DiskFilter', 'ComputeFilter',
+           'ComputeCapabilitiesFilter', 'ImagePropertiesFilter',
+           'NUMATopologyFilter', 'PciPassthroughFilter',
+           'ServerGroupAntiAffinityFilter', 'ServerGroupAffinityFilter']
+
+FLAVORS = [
+    {'name': 'm1.small', 'memory_mb': 2048, 'vcpus': 1, 'root_gb': 20},
+    {'name': 'm1.medium', 'memory_mb': 4096, 'vcpus': 2, 'root_gb': 40},
+    {'name': 'm1.large', 'memory_mb': 8192, 'vcpus': 4, 'root_gb': 80},
+    {'name': 'm1.xlarge', 'memory_mb': 16384, 'vcpus': 8, 'root_gb': 160},
+]
+
+# Share of each kind of request in the mix
+REQUEST_MIX = 'plain=60,multi=10,zone=10,group=8,numa=5,pci=4,forced=3'
+
+PCI_SPEC = {'vendor_id': '8086', 'product_id': '1520'}
+
+HOST_RAM_MB = 131072
+HOST_VCPUS = 32
+HOST_DISK_GB = 2048
+NUMA_CELLS = 2
+
+
+def _numa_topology(rand):
+    cpus_per_cell = HOST_VCPUS // NUMA_CELLS
+    memory = HOST_RAM_MB // NUMA_CELLS
+    cells = []
+    for cell_id in range(NUMA_CELLS):
+        cpuset = set(range(cell_id * cpus_per_cell,
+                           (cell_id + 1) * cpus_per_cell))
+        cells.append(objects.NUMACell(
+            id=cell_id, cpuset=cpuset, memory=memory,
+            cpu_usage=rand.randint(0, cpus_per_cell),
+            memory_usage=rand.randint(0, memory),
+            pinned_cpus=set(), siblings=[], mempages=[]))
+    return objects.NUMATopology(cells=cells)._to_json()
+
+
+def build_fleet(engine, args):
+    """Write the services, compute nodes and aggregates of the fleet.
+
+    Return the list of the host names.
+    """
+    rand = random.Random(args.seed)
+    now = timeutils.utcnow()
+    hosts = ['compute%05d' % i for i in range(args.hosts)]
+    services = []
+    compute_nodes = []
+    for i, host in enumerate(hosts):
+        services.append({'id': i + 1, 'host': host, 'binary': 'nova-compute',
+                         'topic': CONF.compute_topic, 'report_count': 1,
+                         'disabled': rand.random() < args.disabled_ratio,
+                         'created_at': now, 'updated_at': now})
+        vcpus_used = rand.randint(0, HOST_VCPUS)
+        ram_used = rand.randint(0, HOST_RAM_MB)
+        disk_used = rand.randint(0, HOST_DISK_GB)
+        running_vms = rand.randint(0, 40)
+        numa_topology = None
+        if rand.random() < args.numa_ratio:
+            numa_topology = _numa_topology(rand)
+        # NOTE: PciPassthroughFilter fails on the hosts without any PCI
+        # device pool, so the other hosts have all their devices in use.
+        pci_count = 0
+        if rand.random() < args.pci_ratio:
+            pci_count = rand.randint(1, 8)
+        pci_stats = jsonutils.dumps([dict(PCI_SPEC, count=pci_count)])
+        compute_nodes.append({
+            'id': i + 1, 'service_id': i + 1, 'host': host,
+            'hypervisor_hostname': host, 'hypervisor_type': 'QEMU',
+            'hypervisor_version': 2001000, 'cpu_info': '{}',
+            'vcpus': HOST_VCPUS, 'vcpus_used': vcpus_used,
+            'memory_mb': HOST_RAM_MB, 'memory_mb_used': ram_used,
+            'free_ram_mb': HOST_RAM_MB - ram_used,
+            'local_gb': HOST_DISK_GB, 'local_gb_used': disk_used,
+            'free_disk_gb': HOST_DISK_GB - disk_used,
+            'disk_available_least': HOST_DISK_GB - disk_used,
+            'current_workload': 0, 'running_vms': running_vms,
+            'host_ip': '10.%d.%d.%d' % (i >> 16, (i >> 8) & 255, i & 255),
+            'supported_instances': jsonutils.dumps(
+                [['x86_64', 'qemu', 'hvm']]),
+            'stats': jsonutils.dumps({'num_instances': str(running_vms),
+                                      'io_workload': '0'}),
+            'numa_topology': numa_topology, 'pci_stats': pci_stats,
+            'created_at': now, 'updated_at': now})
+    engine.execute(models.Service.__table__.insert(), services)
+    engine.execute(models.ComputeNode.__table__.insert(), compute_nodes)
+
+    if args.zones:
+        aggregates = []
+        metadata = []
+        for i in range(args.zones):
+            aggregates.append({'id': i + 1, 'name': 'zone%d' % i,
+                               'created_at': now})
+            metadata.append({'aggregate_id': i + 1,
+                             'key': 'availability_zone',
+                             'value': 'zone%d' % i, 'created_at': now})
+        aggregate_hosts = [{'aggregate_id': i % args.zones + 1,
+                            'host': host, 'created_at': now}
+                           for i, host in enumerate(hosts)]
+        engine.execute(models.Aggregate.__table__.insert(), aggregates)
+        engine.execute(models.AggregateMetadata.__table__.insert(), metadata)
+        engine.execute(models.AggregateHost.__table__.insert(),
+                       aggregate_hosts)
+    return hosts
+
+
+class RequestMix(object):
+    """Generates the requests of the benchmark.
+
+    The hosts of the server groups are tracked here, as the conductor
+    fetches them before calling the scheduler.
+    """
+
+    def __init__(self, args, hosts):
+        self.rand = random.Random(args.seed)
+        self.hosts = hosts
+        self.zones = args.zones
+        shares = dict(item.split('=') for item in args.mix.split(','))
+        self.kinds = [kind for kind in sorted(shares) if int(shares[kind])]
+        self.shares = [int(shares[kind]) for kind in self.kinds]
+        policies = ['anti-affinity', 'affinity']
+        self.groups = [(policies[i % 2], set()) for i in range(args.groups)]
+        self.count = 0
+
+    def _kind(self):
+        value = self.rand.randint(1, sum(self.shares))
+        for kind, share in zip(self.kinds, self.shares):
+            value -= share
+            if value <= 0:
+                return kind
+
+    def next(self):
+        """Return the kind, request_spec and filter_properties of the next
+        request, and a callback to call with its destinations.
+        """
+        self.count += 1
+        kind = self._kind()
+        flavor = self.rand.choice(FLAVORS)
+        instance_type = dict(flavor, ephemeral_gb=0, swap=0, extra_specs={})
+        instance = {'uuid': 'fake-uuid-%d' % self.count,
+                    'project_id': 'fake-project', 'os_type': 'linux',
+                    'memory_mb': flavor['memory_mb'],
+                    'vcpus': flavor['vcpus'], 'root_gb': flavor['root_gb'],
+                    'ephemeral_gb': 0, 'numa_topology': None,
+                    'pci_requests': None}
+        request_spec = {'instance_properties': instance,
+                        'instance_type': instance_type,
+                        'image': {'properties': {}},
+                        'num_instances': 1}
+        filter_properties = {}
+        on_success = None
+
+        if kind == 'multi':
+            request_spec['num_instances'] = self.rand.randint(2, 5)
+        elif kind == 'zone' and self.zones:
+            instance['availability_zone'] = 'zone%d' % self.rand.randint(
+                0, self.zones - 1)
+        elif kind == 'group' and self.groups:
+            policy, group_hosts = self.rand.choice(self.groups)
+            request_spec['num_instances'] = self.rand.randint(1, 3)
+            filter_properties.update(group_updated=True,
+                                     group_policies=set([policy]),
+                                     group_hosts=set(group_hosts))
+
+            def on_success(dests):
+                group_hosts.update(dest['host'] for dest in dests)
+        elif kind == 'numa':
+            cpus = max(flavor['vcpus'] // 2, 1)
+            memory = flavor['memory_mb'] // 2
+            instance['numa_topology'] = objects.InstanceNUMATopology(
+                cells=[objects.InstanceNUMACell(
+                           id=0, cpuset=set(range(cpus)), memory=memory),
+                       objects.InstanceNUMACell(
+                           id=1, cpuset=set(range(cpus, 2 * cpus)),
+                           memory=memory)])
+        elif kind == 'pci':
+            filter_properties['pci_requests'] = objects.InstancePCIRequests(
+                requests=[objects.InstancePCIRequest(count=1,
+                                                     spec=[PCI_SPEC])])
+        elif kind == 'forced':
+            filter_properties['force_hosts'] = [self.rand.choice(self.hosts)]
+        return kind, request_spec, filter_properties, on_success
+
+
+class Computes(object):
+    """Actual usage of the compute nodes, as tracked by their resource
+    trackers.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        table = models.ComputeNode.__table__
+        self.usage = {}
+        for row in engine.execute(table.select()):
+            self.usage[row.host] = {'id': row.id,
+                                    'memory_mb': row.memory_mb,
+                                    'memory_mb_used': row.memory_mb_used,
+                                    'local_gb': row.local_gb,
+                                    'local_gb_used': row.local_gb_used,
+                                    'vcpus_used': row.vcpus_used}
+        self.changed = set()
+
+    def claim(self, dest, instance):
+        """Claim an instance on its destination, returning False if it
+        doesn't fit in the limits.
+        """
+        usage = self.usage[dest['host']]
+        limits = dest.get('limits') or {}
+        disk_gb = instance['root_gb'] + instance['ephemeral_gb']
+        for limit, used, requested in (
+                ('memory_mb', 'memory_mb_used', instance['memory_mb']),
+                ('disk_gb', 'local_gb_used', disk_gb),
+                ('vcpu', 'vcpus_used', instance['vcpus'])):
+            if (limits.get(limit) is not None and
+                    usage[used] + requested > limits[limit]):
+                return False
+        usage['memory_mb_used'] += instance['memory_mb']
+        usage['local_gb_used'] += disk_gb
+        usage['vcpus_used'] += instance['vcpus']
+        self.changed.add(dest['host'])
+        return True
+
+    def report(self):
+        """Write the usage of the compute nodes which got instances."""
+        table = models.ComputeNode.__table__
+        now = timeutils.utcnow()
+        for host in self.changed:
+            usage = self.usage[host]
+            self.engine.execute(
+                table.update().where(table.c.id == usage['id']).values(
+                    memory_mb_used=usage['memory_mb_used'],
+                    free_ram_mb=usage['memory_mb'] - usage['memory_mb_used'],
+                    local_gb_used=usage['local_gb_used'],
+                    free_disk_gb=usage['local_gb'] - usage['local_gb_used'],
+                    disk_available_least=(usage['local_gb'] -
+                                          usage['local_gb_used']),
+                    vcpus_used=usage['vcpus_used'],
+                    updated_at=now))
+        self.changed = set()
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+
+
+def rss_mb():
+    """Return the resident memory of the process."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError, ValueError):
+        # Peak rather than current memory, in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(scheduler_cls, args, hosts, engine):
+    """Send the requests to new workers of a scheduler.
+
+    Return the latency of each request, the number of failed requests by
+    kind, the number of instances placed and rescheduled and the number of
+    conflicting claims.
+    """
+    ctxt = context.get_admin_context()
+    workers = [scheduler_cls() for i in range(args.workers)]
+    # NOTE: Run by the manager when starting, fills the CachingScheduler
+    for worker in workers:
+        worker.run_periodic_tasks(ctxt)
+    computes = Computes(engine)
+    mix = RequestMix(args, hosts)
+    latencies = []
+    failures = collections.Counter()
+    placed = rescheduled = 0
+    for i in range(args.requests):
+        worker = workers[i % len(workers)]
+        kind, request_spec, filter_properties, on_success = mix.next()
+        start = time.time()
+        try:
+            dests = worker.select_destinations(ctxt, request_spec,
+                                               filter_properties)
+        except exception.NoValidHost:
+            failures[kind] += 1
+        else:
+            if on_success is not None:
+                on_success(dests)
+            for dest in dests:
+                if computes.claim(dest, request_spec['instance_properties']):
+                    placed += 1
+                else:
+                    rescheduled += 1
+        latencies.append(time.time() - start)
+        if (i + 1) % len(workers) == 0:
+            computes.report()
+            rounds = (i + 1) // len(workers)
+            if args.refresh_interval and not rounds % args.refresh_interval:
+                for worker in workers:
+                    worker.run_periodic_tasks(ctxt)
+    conflicts = sum(worker.host_manager.get_claim_stats()['conflicts']
+                    for worker in workers
+                    if hasattr(worker, 'host_manager'))
+    return latencies, failures, placed, rescheduled, conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--hosts', type=int, default=1000,
+                        help='number of compute nodes in the fleet')
+    parser.add_argument('--requests', type=int, default=100,
+                        help='number of requests sent to each scheduler')
+    parser.add_argument('--schedulers', default=','.join(SCHEDULERS),
+                        help='comma separated schedulers to run, among %s' %
+                             ', '.join(SCHEDULERS))
+    parser.add_argument('--mix', default=REQUEST_MIX,
+                        help='comma separated kind=share of the requests')
+    parser.add_argument('--zones', type=int, default=4,
+                        help='number of availability zone aggregates')
+    parser.add_argument('--groups', type=int, default=20,
+                        help='number of server groups')
+    parser.add_argument('--numa-ratio', type=float, default=0.3,
+                        help='share of the hosts with a NUMA topology')
+    parser.add_argument('--pci-ratio', type=float, default=0.1,
+                        help='share of the hosts with free PCI devices')
+    parser.add_argument('--disabled-ratio', type=float, default=0.0,
+                        help='share of the hosts with a disabled service, '
+                             'each of which gets a warning from the host '
+                             'manager on every request')
+    parser.add_argument('--filters', default=','.join(FILTERS),
+                        help='comma separated filters of the schedulers')
+    parser.add_argument('--adaptive-filter-order', action='store_true')
+    parser.add_argument('--batch-placement', action='store_true')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of workers of each scheduler')
+    parser.add_argument('--optimistic-claims', action='store_true')
+    parser.add_argument('--refresh-interval', type=int, default=10,
+                        help='rounds of requests between the refreshes of '
+                             'the CachingScheduler workers, 0 to never '
+                             'refresh them')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config.parse_args([sys.argv[0]])
+    logging.setup(CONF, 'nova')
+    CONF.set_override('connection', 'sqlite://', group='database')
+    # NOTE: The services never report in, keep them up during the benchmark
+    CONF.set_override('service_down_time', 86400)
+    CONF.set_override('rpc_backend', 'fake')
+    CONF.set_override('notification_driver', ['noop'])
+    CONF.set_override('scheduler_default_filters', args.filters.split(','))
+    CONF.set_override('scheduler_adaptive_filter_order',
+                      args.adaptive_filter_order)
+    CONF.set_override('scheduler_batch_placement', args.batch_placement)
+    CONF.set_override('scheduler_optimistic_claims', args.optimistic_claims)
+    rpc.init(CONF)
+    objects.register_all()
+
+    engine = db_api.get_engine()
+    models.BASE.metadata.create_all(engine)
+    base_rss = rss_mb()
+    start = time.time()
+    hosts = build_fleet(engine, args)
+    print('Built %d hosts in %.1f s, rss +%.0f MB' %
+          (args.hosts, time.time() - start, rss_mb() - base_rss))
+
+    print('%-10s %8s %7s %9s %9s %9s %9s %9s %9s' %
+          ('scheduler', 'requests', 'failed', 'req/s', 'p50 ms', 'p99 ms',
+           'resched %', 'conflicts', 'rss +MB'))
+    compute_table = models.ComputeNode.__table__
+    compute_rows = [dict(row) for row in engine.execute(
+        compute_table.select())]
+    for name in args.schedulers.split(','):
+        # Start each scheduler from the same usage of the compute nodes
+        engine.execute(compute_table.delete())
+        engine.execute(compute_table.insert(), compute_rows)
+        latencies, failures, placed, rescheduled, conflicts = run(
+            SCHEDULERS[name], args, hosts, engine)
+        failed = ', '.join('%s=%d' % item for item in sorted(failures.items()))
+        print('%-10s %8d %7d %9.1f %9.1f %9.1f %9.1f %9d %9.0f%s' %
+              (name, len(latencies), sum(failures.values()),
+               args.workers * len(latencies) / sum(latencies),
+               1000 * percentile(latencies, 50),
+               1000 * percentile(latencies, 99),
+               100.0 * rescheduled / max(placed + rescheduled, 1),
+               conflicts, rss_mb() - base_rss,
+               '  (%s)' % failed if failed else ''))
+
+
+if __name__ == '__main__':
+    main()